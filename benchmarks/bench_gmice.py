@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark the GMICE conversions. For each GMICE, report the time to
+convert an array of ground motions to MMI (with getMIfromGM) and an
+array of MMI to ground motions (with getGMfromMI) for each IMT, both
+with and without the distance and magnitude terms, and the time to
+convert one array of MMI to all of the GMICE's IMTs with one call to
+getGMsfromMI versus one call to getGMfromMI per IMT.
+
+Usage:
+
+    bench_gmice.py [-n NRUNS] [--size NELEMENTS]
+"""
+import time
+import argparse
+import statistics
+
+import numpy as np
+from openquake.hazardlib.imt import PGA, PGV, SA
+
+from shakelib.gmice.ak07 import AK07
+from shakelib.gmice.wald99 import Wald99
+from shakelib.gmice.wgrw12 import WGRW12
+
+GMICES = [WGRW12, AK07, Wald99]
+
+
+def get_imts(gmice):
+    imts = []
+    for gmice_imt in (PGA, PGV, SA):
+        if gmice_imt not in gmice.DEFINED_FOR_INTENSITY_MEASURE_TYPES:
+            continue
+        if gmice_imt == SA:
+            for period in sorted(gmice.DEFINED_FOR_SA_PERIODS):
+                imts.append(SA(period))
+        else:
+            imts.append(gmice_imt())
+    return imts
+
+
+def timeit(func, nruns):
+    times = []
+    for _ in range(nruns):
+        t1 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t1)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--nruns', type=int, default=3,
+                        help='Number of runs of each case (the median is '
+                             'reported).')
+    parser.add_argument('--size', type=int, default=10000000,
+                        help='Number of elements in the arrays.')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    amps = rng.uniform(np.log(1e-4), np.log(2.0), args.size)
+    mmi = rng.uniform(1.0, 10.0, args.size)
+    dists = rng.uniform(0.0, 500.0, args.size)
+    mag = 6.5
+
+    np.seterr(invalid='ignore')
+    print('%d elements' % args.size)
+    for gmice_class in GMICES:
+        gmice = gmice_class()
+        imts = get_imts(gmice)
+        print('\n%s' % gmice.getName())
+        print('%-10s %10s %10s %10s %10s' % ('IMT', 'GM->MI s',
+                                             '+dist s', 'MI->GM s',
+                                             '+dist s'))
+        for imt in imts:
+            results = (
+                timeit(lambda: gmice.getMIfromGM(amps, imt), args.nruns),
+                timeit(lambda: gmice.getMIfromGM(amps, imt, dists, mag),
+                       args.nruns),
+                timeit(lambda: gmice.getGMfromMI(mmi, imt), args.nruns),
+                timeit(lambda: gmice.getGMfromMI(mmi, imt, dists, mag),
+                       args.nruns))
+            print('%-10s %10.3f %10.3f %10.3f %10.3f' %
+                  ((str(imt),) + results))
+
+        def convert_each():
+            for imt in imts:
+                gmice.getGMfromMI(mmi, imt, dists, mag)
+
+        teach = timeit(convert_each, args.nruns)
+        tall = timeit(lambda: gmice.getGMsfromMI(mmi, imts, dists, mag),
+                      args.nruns)
+        print('MI->GM for %d IMTs: %.3f s one at a time, %.3f s in one '
+              'call' % (len(imts), teach, tall))
+
+
+if __name__ == '__main__':
+    main()
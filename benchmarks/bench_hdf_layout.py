@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Benchmark the HDF5 storage options of ShakeMapOutputContainer.setIMTGrids()
+and the windowed and decimated reads of getIMTGrids(). For each grid size
+and storage layout, report the time to write the mean and std grids, the
+file size, and the times to read the full grids, a window covering 1%
+of the grid, and a view decimated by 4.
+
+The grids are smooth fields with noise (roughly like ShakeMap output),
+so the compression ratios are meaningful.
+
+Usage:
+
+    bench_hdf_layout.py [-n NRUNS] [--sizes NCELLS [NCELLS ...]]
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+from mapio.geodict import GeoDict
+from mapio.grid2d import Grid2D
+
+from shakelib.utils.containers import ShakeMapOutputContainer
+
+LAYOUTS = [
+    ('gzip (default)', {}),
+    ('gzip-1', {'compression_opts': 1}),
+    ('shuffle+gzip-4', {'shuffle': True}),
+    ('shuffle+gzip-6', {'shuffle': True, 'compression_opts': 6}),
+    ('lzf', {'compression': 'lzf'}),
+    ('shuffle+lzf', {'compression': 'lzf', 'shuffle': True}),
+    ('shuffle+gzip-4 256x256', {'shuffle': True, 'chunks': (256, 256)}),
+    ('lzf 256x256', {'compression': 'lzf', 'chunks': (256, 256)}),
+    ('none', {'compression': False}),
+]
+
+
+def make_grids(ncells):
+    nx = int(np.sqrt(ncells))
+    ny = ncells // nx
+    dx = 0.01
+    geodict = GeoDict({'xmin': -120.0, 'xmax': -120.0 + (nx - 1) * dx,
+                       'ymin': 35.0, 'ymax': 35.0 + (ny - 1) * dx,
+                       'dx': dx, 'dy': dx, 'nx': nx, 'ny': ny})
+    x = np.linspace(-1, 1, nx)
+    y = np.linspace(-1, 1, ny)
+    xx, yy = np.meshgrid(x, y)
+    rng = np.random.RandomState(1234)
+    mean = -2.0 * np.sqrt(xx**2 + yy**2) + 0.05 * rng.randn(ny, nx)
+    std = 0.6 + 0.01 * rng.randn(ny, nx)
+    return Grid2D(mean, geodict), Grid2D(std, geodict.copy())
+
+
+def timeit(func, nruns):
+    times = []
+    for _ in range(nruns):
+        t1 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t1)
+    return statistics.median(times)
+
+
+def bench_layout(mean, std, options, nruns, tmpdir):
+    datafile = os.path.join(tmpdir, 'bench.hdf')
+
+    def write():
+        if os.path.isfile(datafile):
+            os.remove(datafile)
+        container = ShakeMapOutputContainer.create(datafile)
+        container.setIMTGrids('MMI', mean, {}, std, {}, 'Larger', **options)
+        container.close()
+
+    twrite = timeit(write, nruns)
+    size = os.path.getsize(datafile) / 1048576.0
+
+    gd = mean.getGeoDict()
+    xspan = (gd.xmax - gd.xmin) / 10
+    yspan = (gd.ymax - gd.ymin) / 10
+    cx = (gd.xmin + gd.xmax) / 2
+    cy = (gd.ymin + gd.ymax) / 2
+    bounds = (cx - xspan / 2, cx + xspan / 2, cy - yspan / 2, cy + yspan / 2)
+    container = ShakeMapOutputContainer.load(datafile)
+    tfull = timeit(lambda: container.getIMTGrids('MMI', 'Larger'), nruns)
+    twindow = timeit(lambda: container.getIMTGrids('MMI', 'Larger',
+                                                   bounds=bounds), nruns)
+    tdecimate = timeit(lambda: container.getIMTGrids('MMI', 'Larger',
+                                                     stride=4), nruns)
+    container.close()
+    os.remove(datafile)
+    return twrite, size, tfull, twindow, tdecimate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--nruns', type=int, default=3,
+                        help='Number of runs of each case (the median is '
+                             'reported).')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000000, 10000000],
+                        help='Grid sizes (number of cells).')
+    args = parser.parse_args()
+
+    header = '%-24s %9s %9s %9s %9s %9s' % ('layout', 'write s', 'MB',
+                                            'read s', 'window s',
+                                            'stride4 s')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for ncells in args.sizes:
+            mean, std = make_grids(ncells)
+            print('\n%d cells (%d x %d)' % (mean.getData().size,
+                                            mean.getGeoDict().ny,
+                                            mean.getGeoDict().nx))
+            print(header)
+            for name, options in LAYOUTS:
+                results = bench_layout(mean, std, options, args.nruns,
+                                       tmpdir)
+                print('%-24s %9.3f %9.1f %9.3f %9.3f %9.3f' %
+                      ((name,) + results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Benchmark the startup cost of the shake program's command table: the
+lazy registry (with and without its manifest) versus importing all of
+the coremods, which is what shake did before the registry existed. Each
+case runs in a fresh interpreter so that import costs are included.
+
+Usage:
+
+    bench_shake_startup.py [-n NRUNS] [--coremods PKG [PKG ...]]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+LAZY = '''
+import sys
+from shakemap.utils.registry import get_command_registry
+manifest = sys.argv[1] if sys.argv[1] != '-' else None
+classes = get_command_registry(sys.argv[2:], manifest)
+'''
+
+EAGER = '''
+import sys
+from shakemap.utils.registry import _find_modules, _inspect_module
+for modname, _ in _find_modules(sys.argv[2:]):
+    _inspect_module(modname)
+'''
+
+
+def run(code, manifest, coremods):
+    t1 = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code, manifest] + coremods,
+                   check=True)
+    return time.perf_counter() - t1
+
+
+def report(name, times):
+    print('%-28s median %7.3f s   min %7.3f s   max %7.3f s' %
+          (name, statistics.median(times), min(times), max(times)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--nruns', type=int, default=5,
+                        help='Number of runs of each case.')
+    parser.add_argument('--coremods', nargs='+',
+                        default=['shakemap.coremods'],
+                        help='The coremods packages to load.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manifest = os.path.join(tmpdir, 'manifest.json')
+        # The null interpreter startup, for reference
+        report('python startup',
+               [run('pass', '-', args.coremods)
+                for _ in range(args.nruns)])
+        report('registry (no manifest)',
+               [run(LAZY, '-', args.coremods)
+                for _ in range(args.nruns)])
+        run(LAZY, manifest, args.coremods)
+        report('registry (manifest)',
+               [run(LAZY, manifest, args.coremods)
+                for _ in range(args.nruns)])
+        report('import all coremods',
+               [run(EAGER, '-', args.coremods)
+                for _ in range(args.nruns)])
+
+
+if __name__ == '__main__':
+    main()
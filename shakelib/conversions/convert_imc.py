@@ -1,6 +1,10 @@
 # Standard library imports
 from abc import ABC, abstractmethod
 
+# Conversion paths by (converter class, imc_in, imc_out); the converters'
+# conversion graphs are class attributes that never change
+_CONVERSION_PATHS = {}
+
 
 class ComponentConverter(ABC):
     """Base class for implementing conversions between components."""
@@ -158,6 +162,30 @@ class ComponentConverter(ABC):
                 raise ValueError('No possible conversion between %r and %r.' %
                 (imc_in, imc_out))
 
+    def getCachedPath(self, imc_in, imc_out):
+        """
+        Return the shortest "path" (see getShortestPath) through the
+        class's conversion_graph from one IMC to another. Paths are
+        found once per process for each class and pair of IMCs.
+
+        Args:
+            imc_in (IMC): OpenQuake IMC type of the input amp array.
+            imc_out (IMC): Desired OpenQuake IMC type of the output amps.
+
+        Returns:
+            list: IMCs as a path for to convert one IMC to another.
+
+        Raises:
+            ValueError if no path is found.
+        """
+        key = (type(self), imc_in, imc_out)
+        path = _CONVERSION_PATHS.get(key)
+        if path is None:
+            path = tuple(self.getShortestPath(self.conversion_graph,
+                                              imc_in, imc_out))
+            _CONVERSION_PATHS[key] = path
+        return list(path)
+
     @abstractmethod
     def _verifyConversion(self, imc_in, imc_out=None):
         """
@@ -10,6 +10,56 @@ import numpy as np
 from shakelib.conversions.convert_imc import ComponentConverter
 
 
+# c12 = median ratio
+# c34 = std. of log ratio
+# R = ratio of sigma_pga values
+_PGA_PGV_COL_NAMES = ['c12', 'c34', 'R']
+_SA_COL_NAMES = ['c1', 'c2', 'c3', 'c4', 'R']
+
+# Dictionaries of constants
+_PGA_COEFFS = {
+    const.IMC.MEDIAN_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.01, 1.00]))),
+    const.IMC.GMRotI50:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.02, 1.00]))),
+    const.IMC.RotD50:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.02, 1.00]))),
+    const.IMC.RANDOM_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.07, 1.03]))),
+    const.IMC.HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.07, 1.03]))),
+    const.IMC.GREATER_OF_TWO_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.1, 0.05, 1.02])))}
+
+_PGV_COEFFS = {
+    const.IMC.MEDIAN_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.01, 1.00]))),
+    const.IMC.GMRotI50:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.02, 1.00]))),
+    const.IMC.RotD50:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.02, 1.00]))),
+    const.IMC.RANDOM_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.07, 1.03]))),
+    const.IMC.HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.0, 0.07, 1.03]))),
+    const.IMC.GREATER_OF_TWO_HORIZONTAL:
+        dict(list(zip(_PGA_PGV_COL_NAMES, [1.1, 0.05, 1.02])))}
+
+_SA_COEFFS = {
+    const.IMC.MEDIAN_HORIZONTAL:
+        dict(list(zip(_SA_COL_NAMES, [1.0, 1.0, 0.01, 0.02, 1.00]))),
+    const.IMC.GMRotI50:
+        dict(list(zip(_SA_COL_NAMES, [1.0, 1.0, 0.03, 0.04, 1.00]))),
+    const.IMC.RotD50:
+        dict(list(zip(_SA_COL_NAMES, [1.0, 1.0, 0.02, 0.03, 1.00]))),
+    const.IMC.RANDOM_HORIZONTAL:
+        dict(list(zip(_SA_COL_NAMES, [1.0, 1.0, 0.07, 0.11, 1.05]))),
+    const.IMC.HORIZONTAL:
+        dict(list(zip(_SA_COL_NAMES, [1.0, 1.0, 0.07, 0.11, 1.05]))),
+    const.IMC.GREATER_OF_TWO_HORIZONTAL:
+        dict(list(zip(_SA_COL_NAMES, [1.1, 1.2, 0.04, 0.07, 1.02])))}
+
+
 class BeyerBommer2006(ComponentConverter):
     """
     Implements conversion for various "Intensity Measure
@@ -54,111 +104,68 @@ class BeyerBommer2006(ComponentConverter):
         `[link] <http://www.bssaonline.org/content/96/4A/1512.short>`__
 
     """
+    # Possible conversions
+    conversion_graph = {
+        'Greater of two horizontal': set([
+            'Median horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Average Horizontal (RotD50)',
+            'Random horizontal',
+            'Horizontal',
+            'Average horizontal']),
+        'Median horizontal': set([
+            'Greater of two horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Average Horizontal (RotD50)',
+            'Random horizontal',
+            'Horizontal',
+            'Average horizontal']),
+        'Average Horizontal (GMRotI50)': set([
+            'Greater of two horizontal',
+            'Median horizontal',
+            'Average Horizontal (RotD50)',
+            'Random horizontal',
+            'Horizontal',
+            'Average horizontal']),
+        'Average Horizontal (RotD50)': set([
+            'Greater of two horizontal',
+            'Median horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Random horizontal',
+            'Horizontal',
+            'Average horizontal']),
+        'Random horizontal': set([
+            'Greater of two horizontal',
+            'Median horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Average Horizontal (RotD50)',
+            'Horizontal',
+            'Average horizontal']),
+        'Horizontal': set([
+            'Greater of two horizontal',
+            'Median horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Average Horizontal (RotD50)',
+            'Random horizontal',
+            'Average horizontal']),
+        'Average horizontal': set([
+            'Greater of two horizontal',
+            'Median horizontal',
+            'Average Horizontal (GMRotI50)',
+            'Average Horizontal (RotD50)',
+            'Random horizontal',
+            'Horizontal'])
+    }
+
     def __init__(self, imc_in, imc_out):
         super().__init__()
         self.imc_in = imc_in
         self.imc_out = imc_out
-        # c12 = median ratio
-        # c34 = std. of log ratio
-        # R = ratio of sigma_pga values
-        self.__pga_pgv_col_names = ['c12', 'c34', 'R']
-        self.__sa_col_names = ['c1', 'c2', 'c3', 'c4', 'R']
-        # Possible conversions
-        self.conversion_graph = {'Greater of two horizontal': set([
-                'Median horizontal',
-                'Average Horizontal (GMRotI50)',
-                'Average Horizontal (RotD50)',
-                'Random horizontal',
-                'Horizontal',
-                'Average horizontal']),
-         'Median horizontal': set([
-                'Greater of two horizontal',
-                'Average Horizontal (GMRotI50)',
-                'Average Horizontal (RotD50)',
-                'Random horizontal',
-                'Horizontal',
-                'Average horizontal']),
-         'Average Horizontal (GMRotI50)': set([
-                'Greater of two horizontal',
-                'Median horizontal',
-                'Average Horizontal (RotD50)',
-                'Random horizontal',
-                'Horizontal',
-                'Average horizontal']),
-         'Average Horizontal (RotD50)': set([
-                'Greater of two horizontal',
-                'Median horizontal',
-                'Average Horizontal (GMRotI50)',
-                'Random horizontal',
-                'Horizontal',
-                'Average horizontal']),
-         'Random horizontal': set([
-                'Greater of two horizontal',
-                'Median horizontal',
-                'Average Horizontal (GMRotI50)',
-                'Average Horizontal (RotD50)',
-                'Horizontal',
-                'Average horizontal']),
-        'Horizontal': set([
-               'Greater of two horizontal',
-               'Median horizontal',
-               'Average Horizontal (GMRotI50)',
-               'Average Horizontal (RotD50)',
-               'Random horizontal',
-               'Average horizontal']),
-        'Average horizontal': set([
-               'Greater of two horizontal',
-               'Median horizontal',
-               'Average Horizontal (GMRotI50)',
-               'Average Horizontal (RotD50)',
-               'Random horizontal',
-               'Horizontal']),}
         # Check if any imc values are unknown. If they are, convert
         # to AVERAGE_HORIZONTAL
         self.checkUnknown()
         # Get shortest conversion "path" between imc_in and imc_out
-        self.path = self.getShortestPath(self.conversion_graph,
-                self.imc_in, self.imc_out)
-        # Set dictionaries of constants
-        self.__pga_dict = {
-            const.IMC.MEDIAN_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.01, 1.00]))),
-            const.IMC.GMRotI50:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.02, 1.00]))),
-            const.IMC.RotD50:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.02, 1.00]))),
-            const.IMC.RANDOM_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.07, 1.03]))),
-            const.IMC.HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.07, 1.03]))),
-            const.IMC.GREATER_OF_TWO_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.1, 0.05, 1.02])))}
-        self.__pgv_dict = {
-            const.IMC.MEDIAN_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.01, 1.00]))),
-            const.IMC.GMRotI50:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.02, 1.00]))),
-            const.IMC.RotD50:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.02, 1.00]))),
-            const.IMC.RANDOM_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.07, 1.03]))),
-            const.IMC.HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.0, 0.07, 1.03]))),
-            const.IMC.GREATER_OF_TWO_HORIZONTAL:
-                dict(list(zip(self.__pga_pgv_col_names, [1.1, 0.05, 1.02])))}
-        self.__sa_dict = {
-            const.IMC.MEDIAN_HORIZONTAL:
-                dict(list(zip(self.__sa_col_names, [1.0, 1.0, 0.01, 0.02, 1.00]))),
-            const.IMC.GMRotI50:
-                dict(list(zip(self.__sa_col_names, [1.0, 1.0, 0.03, 0.04, 1.00]))),
-            const.IMC.RotD50:
-                dict(list(zip(self.__sa_col_names, [1.0, 1.0, 0.02, 0.03, 1.00]))),
-            const.IMC.RANDOM_HORIZONTAL:
-                dict(list(zip(self.__sa_col_names, [1.0, 1.0, 0.07, 0.11, 1.05]))),
-            const.IMC.HORIZONTAL:
-                dict(list(zip(self.__sa_col_names, [1.0, 1.0, 0.07, 0.11, 1.05]))),
-            const.IMC.GREATER_OF_TWO_HORIZONTAL:
-                dict(list(zip(self.__sa_col_names, [1.1, 1.2, 0.04, 0.07, 1.02])))}
+        self.path = self.getCachedPath(self.imc_in, self.imc_out)
 
     def convertAmpsOnce(self, imt, amps, rrups=None, mag=None):
         """
@@ -251,23 +258,23 @@ class BeyerBommer2006(ComponentConverter):
         self._verifyConversion(imc)
 
         if 'PGA' in imt:
-            return self.__pga_dict[imc]['c12']
+            return _PGA_COEFFS[imc]['c12']
         elif 'PGV' in imt:
-            return self.__pgv_dict[imc]['c12']
+            return _PGV_COEFFS[imc]['c12']
         elif 'SA' in imt:
             pp = imt.period
             if pp <= 0.15:
-                return self.__sa_dict[imc]['c1']
+                return _SA_COEFFS[imc]['c1']
             elif pp < 0.8:
-                c1 = self.__sa_dict[imc]['c1']
-                c2 = self.__sa_dict[imc]['c2']
+                c1 = _SA_COEFFS[imc]['c1']
+                c2 = _SA_COEFFS[imc]['c2']
                 return c1 + (c2 - c1) * np.log(pp / 0.15) / np.log(0.8 / 0.15)
             elif pp <= 5.0:
-                return self.__sa_dict[imc]['c2']
+                return _SA_COEFFS[imc]['c2']
             else:
                 # Not sure what's right here; should probably raise an error
                 # but for now let's just use c2
-                return self.__sa_dict[imc]['c2']
+                return _SA_COEFFS[imc]['c2']
         else:
             raise ValueError('unknown IMT %r' % imt)
 
@@ -296,27 +303,27 @@ class BeyerBommer2006(ComponentConverter):
         self._verifyConversion(imc)
 
         if 'PGA' in imt:
-            return self.__pga_dict[imc]['R'],\
-                self.__pga_dict[imc]['c34']
+            return _PGA_COEFFS[imc]['R'],\
+                _PGA_COEFFS[imc]['c34']
         elif 'PGV' in imt:
-            return self.__pgv_dict[imc]['R'],\
-                self.__pgv_dict[imc]['c34']
+            return _PGV_COEFFS[imc]['R'],\
+                _PGV_COEFFS[imc]['c34']
         elif 'SA' in imt:
-            R = self.__sa_dict[imc]['R']
+            R = _SA_COEFFS[imc]['R']
             pp = imt.period
             if pp <= 0.15:
-                return R, self.__sa_dict[imc]['c3']
+                return R, _SA_COEFFS[imc]['c3']
             elif pp < 0.8:
-                c3 = self.__sa_dict[imc]['c3']
-                c4 = self.__sa_dict[imc]['c4']
+                c3 = _SA_COEFFS[imc]['c3']
+                c4 = _SA_COEFFS[imc]['c4']
                 return R, c3 + (c4 - c3) * np.log(pp / 0.15) /\
                     np.log(0.8 / 0.15)
             elif pp <= 5.0:
-                return R, self.__sa_dict[imc]['c4']
+                return R, _SA_COEFFS[imc]['c4']
             else:
                 # Not sure what's right here; should probably raise an error
                 # but for now let's just use c4
-                return R, self.__sa_dict[imc]['c4']
+                return R, _SA_COEFFS[imc]['c4']
         else:
             raise ValueError('unknown IMT %r' % imt)
 
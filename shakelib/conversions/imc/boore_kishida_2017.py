@@ -3,6 +3,8 @@ Module implements BooreKishida2017 class to convert between various
 horizontal intensity measure components.
 """
 # Standard imports
+import csv
+import functools
 import glob
 import logging
 import os.path
@@ -12,11 +14,43 @@ import pkg_resources
 import numpy as np
 from openquake.hazardlib.const import IMC
 from openquake.hazardlib.imt import PGA, PGV
-import pandas as pd
 
 # Local imports
 from shakelib.conversions.convert_imc import ComponentConverter
 
+#
+# The coefficient tables, and the coefficients interpolated from them
+# for each IMT, are read and computed once per process and shared by
+# all of the converters (a MultiGMPE makes one for each of its GMPEs on
+# every call). They are never modified.
+#
+_IMT_PARAMS = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_files():
+    """Return the names of the Boore & Kishida coefficient files.
+    """
+    datadir = pkg_resources.resource_filename('shakelib.conversions.imc',
+                                              'data')
+    return tuple(glob.glob(os.path.join(datadir, '*.csv')))
+
+
+@functools.lru_cache(maxsize=None)
+def _load_table(filename):
+    """Read a coefficient file into a dictionary of column name: NumPy
+    array.
+    """
+    with open(filename, 'r') as f:
+        names = next(csv.reader(f))
+        data = np.loadtxt(f, delimiter=',', ndmin=2)
+    table = {}
+    for i, name in enumerate(names):
+        column = data[:, i]
+        column.flags.writeable = False
+        table[name] = column
+    return table
+
 
 class BooreKishida2017(ComponentConverter):
     """
@@ -54,53 +88,53 @@ class BooreKishida2017(ComponentConverter):
         horizontal component of motion. Bulletin of the Seismological Society
         of America, 96(4A), 1512-1522.
     """
+    # Possible conversions
+    conversion_graph = {
+        'Average Horizontal (RotD50)': set([
+            'Average Horizontal (GMRotI50)',
+            'Average horizontal',
+            'Horizontal Maximum Direction (RotD100)',
+            'Greater of two horizontal',
+            'Random horizontal',
+            'Horizontal',
+            'Median horizontal']),
+        'Average Horizontal (GMRotI50)': set([
+            'Average Horizontal (RotD50)',
+            'Greater of two horizontal']),
+        'Average horizontal': set([
+            'Average Horizontal (RotD50)',
+            'Greater of two horizontal']),
+        'Horizontal Maximum Direction (RotD100)': set([
+            'Average Horizontal (RotD50)',
+            'Greater of two horizontal']),
+        'Greater of two horizontal': set([
+            'Average Horizontal (RotD50)',
+            'Average Horizontal (GMRotI50)',
+            'Average horizontal',
+            'Horizontal Maximum Direction (RotD100)',
+            'Random horizontal',
+            'Horizontal',
+            'Median horizontal']),
+        'Horizontal': set([
+            'Greater of two horizontal',
+            'Average Horizontal (RotD50)']),
+        'Median horizontal': set([
+            'Greater of two horizontal',
+            'Average Horizontal (RotD50)']),
+        'Random horizontal': set([
+            'Greater of two horizontal',
+            'Average Horizontal (RotD50)'])
+    }
+
     def __init__(self, imc_in, imc_out):
         super().__init__()
         self.imc_in = imc_in
         self.imc_out = imc_out
-        # Possible conversions
-        self.conversion_graph = {
-            'Average Horizontal (RotD50)': set([
-                'Average Horizontal (GMRotI50)',
-                'Average horizontal',
-                'Horizontal Maximum Direction (RotD100)',
-                'Greater of two horizontal',
-                'Random horizontal',
-                'Horizontal',
-                'Median horizontal']),
-            'Average Horizontal (GMRotI50)': set([
-                'Average Horizontal (RotD50)',
-                'Greater of two horizontal']),
-            'Average horizontal': set([
-                'Average Horizontal (RotD50)',
-                'Greater of two horizontal']),
-            'Horizontal Maximum Direction (RotD100)': set([
-                'Average Horizontal (RotD50)',
-                'Greater of two horizontal']),
-            'Greater of two horizontal': set([
-                'Average Horizontal (RotD50)',
-                'Average Horizontal (GMRotI50)',
-                'Average horizontal',
-                'Horizontal Maximum Direction (RotD100)',
-                'Random horizontal',
-                'Horizontal',
-                'Median horizontal']),
-            'Horizontal': set([
-                'Greater of two horizontal',
-                'Average Horizontal (RotD50)']),
-            'Median horizontal': set([
-                'Greater of two horizontal',
-                'Average Horizontal (RotD50)']),
-            'Random horizontal': set([
-                'Greater of two horizontal',
-                'Average Horizontal (RotD50)'])
-        }
         # Check if any imc values are unknown. If they are, convert
         # to AVERAGE_HORIZONTAL
         self.checkUnknown()
         # Get shortest conversion "path" between imc_in and imc_out
-        self.path = self.getShortestPath(self.conversion_graph,
-                self.imc_in, self.imc_out)
+        self.path = self.getCachedPath(self.imc_in, self.imc_out)
 
     def convertAmpsOnce(self, imt, amps, rrups=None, mag=None):
         """
@@ -202,6 +236,24 @@ class BooreKishida2017(ComponentConverter):
         Returns:
             (float, float, float, float, float): Coeffients for conversion.
         """
+        key = (self.filename, imt)
+        try:
+            params = _IMT_PARAMS.get(key)
+        except TypeError:
+            # An unhashable IMT; it is handled (and rejected) below
+            key = None
+            params = None
+        if params is None:
+            params = self._interpParams(imt)
+            if key is not None:
+                _IMT_PARAMS[key] = params
+        return params
+
+    def _interpParams(self, imt):
+        """
+        Compute the (possibly interpolated) conversion parameters for
+        a given IMT from the coefficient table (see _getParamsFromIMT()).
+        """
         if imt == PGA():
             sigma = self.pars['sigma'][0]
             c0 = self.pars['c0smooth'][0]
@@ -240,9 +292,7 @@ class BooreKishida2017(ComponentConverter):
             string 'Null', then imc_in and imc_out evaluated to be the
             same.
         """
-        datadir = pkg_resources.resource_filename('shakelib.conversions.imc',
-                                                  'data')
-        conv_files = glob.glob(os.path.join(datadir, '*.csv'))
+        conv_files = _conversion_files()
         stub1 = BooreKishida2017._imcToFilestr(imc_in)
         stub2 = BooreKishida2017._imcToFilestr(imc_out)
         if stub1 == stub2:
@@ -312,9 +362,11 @@ class BooreKishida2017(ComponentConverter):
             raise ValueError("Can't find a conversion file for %s and %s" %
                              (imc_in, imc_out))
         self.forward = forward
+        self.filename = filename
         if filename == 'Null':
             # Null conversion -- imc_in and imc_out are either identical
             # or at least functionally equivalent
             self.pars = None
         else:
-            self.pars = pd.read_csv(filename)
+            # The table is read once per process; see _load_table()
+            self.pars = _load_table(filename)
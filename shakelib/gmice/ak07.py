@@ -70,6 +70,13 @@ class AK07(GMICE):
 
         self.DEFINED_FOR_SA_PERIODS = set([0.3, 1.0, 3.0])
 
+        #
+        # The lower and upper segments of the bi-linear fit
+        #
+        for imt, c in self._constants.items():
+            self._setSegments(imt, [c['T1']], [c['T2']],
+                              [c['C1'], c['C3']], [c['C2'], c['C4']])
+
     def getMIfromGM(self, amps, imt, dists=None, mag=None):
         """
         Function to compute macroseismic intensity from ground-motion
@@ -94,57 +101,10 @@ class AK07(GMICE):
             dMMI / dln(amp) (i.e., the slope of the relationship at the
             point in question).
         """
-        lfact = np.log10(np.e)
-        c = self._getConsts(imt)
-        if dists is not None and mag is not None:
-            doresid = True
-            # Limit distances and take the log10
-            ldd = np.log10(np.clip(dists, 10, 300))
-            # Llimit magnitudes
-            lmm = np.clip(mag, 3.0, 7.3)
-        else:
-            doresid = False
-
-        # Account for ln form of amplitudes
-        # Convert (for accelerations) from ln(g) to cm/s^2
-        # then take the log10
-        #
-        if imt != self._pgv:
-            units = 981.0
-        else:
-            units = 1.0
-        #
-        # Math: log10(981 * exp(amps)) = log10(981) + log10(exp(amps))
-        # = log10(981) + amps * log10(e)
-        # For PGV, just convert ln(amp) to log10(amp) by multiplying
-        # by log10(e)
-        #
-        lamps = np.log10(units) + amps * lfact
-        mmi = np.zeros_like(amps)
-        dmmi_damp = np.zeros_like(amps)
-        #
-        # This is the lower segment of the bi-linear fit
-        # where log(Y) is less than T1
-        #
-        idx = (lamps < c['T1'])
-        mmi[idx] = c['C1'] + c['C2'] * lamps[idx]
-        dmmi_damp[idx] = c['C2'] * lfact
-        #
-        # This is the upper segment of the bi-linear fit
-        # where log(Y) is greater than or equal to T1
-        #
-        idx = lamps >= c['T1']
-        mmi[idx] = c['C3'] + c['C4'] * lamps[idx]
-        dmmi_damp[idx] = c['C4'] * lfact
-
         # Inclusion of residuals if magnitude and
         # distance information is available
-        if doresid:
-            mmi += c['C5'] + c['C6'] * lmm + c['C7'] * ldd
-
-        # Limit mmi values
-        mmi = np.clip(mmi, 1.0, 10.0)
-        return mmi, dmmi_damp
+        terms = self._getResidualTerms(dists, mag)
+        return self._miFromGM(amps, imt, self._getResidual(imt, terms))
 
     def getGMfromMI(self, mmi, imt, dists=None, mag=None):
         """
@@ -169,58 +129,10 @@ class AK07(GMICE):
             and PSA, and natural log cm/s for PGV; ndarray of dln(amp) / dMMI
             (i.e., the slope of the relationship at the point in question).
         """
-        lfact = np.log10(np.e)
-        c = self._getConsts(imt)
-        mmi = mmi.copy()
-        # Set nan values to 1
-        ix_nan = np.isnan(mmi)
-        mmi[ix_nan] = 1.0
-
-        if dists is not None and mag is not None:
-            doresid = True
-            # Limit distances and take the log10
-            ldd = np.log10(np.clip(dists, 10, 300))
-            # Limit magnitudes
-            lmm = np.clip(mag, 3.0, 7.3)
-        else:
-            doresid = False
-
         # Inclusion of residuals if magnitude and
         # distance information is available
-        if doresid:
-            mmi -= c['C5'] + c['C6'] * lmm + c['C7'] * ldd
-
-        pgm = np.zeros_like(mmi)
-        dpgm_dmmi = np.zeros_like(mmi)
-        #
-        # This is the lower segment of the bi-linear fit
-        # where MMI is less than I5
-        #
-        idx = mmi < c['T2']
-        pgm[idx] = np.power(10, (mmi[idx] - c['C1']) / c['C2'])
-        dpgm_dmmi[idx] = 1.0 / (c['C2'] * lfact)
-        #
-        # This is the upper segment of the bi-linear fit
-        # where MMI is greater than or equal to I5
-        #
-        idx = mmi >= c['T2']
-        pgm[idx] = np.power(10, (mmi[idx] - c['C3']) / c['C4'])
-        dpgm_dmmi[idx] = 1.0 / (c['C4'] * lfact)
-
-        if imt != self._pgv:
-            units = 981.0
-        else:
-            units = 1.0
-
-        # Return a ln(amp) value. Convert PGA to from cm/s^2 to g
-        pgm /= units
-        pgm = np.log(pgm)
-
-        # Set nan values back from 1 to nan
-        pgm[ix_nan] = np.nan
-        dpgm_dmmi[ix_nan] = np.nan
-
-        return pgm, dpgm_dmmi
+        terms = self._getResidualTerms(dists, mag)
+        return self._gmFromMI(mmi, imt, self._getResidual(imt, terms))
 
     def getGM2MIsd(self):
         """
@@ -265,3 +177,13 @@ class AK07(GMICE):
             raise ValueError("Invalid IMT " + str(imt))
         c = self._constants[imt]
         return c
+
+    def _getResidual(self, imt, terms):
+        """
+        Helper function to get the magnitude and distance term.
+        """
+        c = self._getConsts(imt)
+        if terms is None:
+            return None
+        ldd, lmm = terms
+        return c['C5'] + c['C6'] * lmm + c['C7'] * ldd
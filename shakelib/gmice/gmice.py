@@ -1,6 +1,9 @@
 # stdlib imports
 from abc import ABC, abstractmethod
 
+# third party imports
+import numpy as np
+
 # local imports
 from openquake.hazardlib.imt import PGA, PGV, SA
 
@@ -17,6 +20,7 @@ class GMICE(ABC):
         self._sa03 = SA(0.3)
         self._sa10 = SA(1.0)
         self._sa30 = SA(3.0)
+        self._segments = {}
 
     @staticmethod
     def getDistanceType():
@@ -50,6 +54,40 @@ class GMICE(ABC):
         """
         return self.scale
 
+    def getGMsfromMI(self, mmi, imts, dists=None, mag=None):
+        """
+        Function to compute several ground-motion intensities from one
+        array of macroseismic intensity. This gives the same results as
+        calling getGMfromMI() for each IMT, but the work that does not
+        depend on the IMT (e.g., the distance and magnitude terms) is
+        only done once.
+
+        Args:
+            mmi (ndarray):
+                Macroseismic intensity.
+            imts (list):
+                The OpenQuake IMTs of the requested ground-motion
+                intensities.
+            dists (ndarray):
+                Rupture distances (km) to the corresponding MMIs.
+            mag (float):
+                Earthquake magnitude.
+
+        Returns:
+            dict: A dictionary keyed by IMT; the values are tuples of the
+            ndarray of ground motion intensity and the ndarray of
+            dln(amp) / dMMI, as returned by getGMfromMI().
+        """
+        mmi = np.asarray(mmi, dtype=float)
+        ix_nan = np.isnan(mmi)
+        terms = self._getResidualTerms(dists, mag)
+        result = {}
+        for imt in imts:
+            result[imt] = self._gmFromMI(mmi, imt,
+                                         self._getResidual(imt, terms),
+                                         ix_nan)
+        return result
+
     @abstractmethod
     def getMIfromGM(cls, amps, imt, dists=None, mag=None):
         """
@@ -132,3 +170,119 @@ class GMICE(ABC):
         Helper function to get the constants.
         """
         pass
+
+    @staticmethod
+    def _getResidualTerms(dists, mag):
+        """
+        Helper function to get the (limited) log distance and magnitude
+        used by the distance and magnitude terms of the GMICE, or None
+        if either is not available. Distances are limited to between
+        10 and 300 km and magnitudes to between M3.0 and M7.3.
+        """
+        if dists is None or mag is None:
+            return None
+        return np.log10(np.clip(dists, 10, 300)), np.clip(mag, 3.0, 7.3)
+
+    def _getResidual(self, imt, terms):
+        """
+        Helper function to get the distance and magnitude term (in MMI
+        units) for an IMT, or None if the GMICE does not have one (or
+        terms is None). The default is a GMICE without such a term.
+        """
+        return None
+
+    def _setSegments(self, imt, gm_breaks, mmi_breaks, intercepts, slopes):
+        """
+        Helper function to store the piecewise linear relationship
+
+            MMI = intercepts[i] + slopes[i] * log10(Y)
+
+        between MMI and ground motion Y (cm/s^2 for PGA and PSA, cm/s
+        for PGV) for an IMT. The coefficients are stored in the natural
+        log units (of g for PGA and PSA) of the inputs and outputs of
+        getMIfromGM() and getGMfromMI(), so that both directions are a
+        table lookup and one multiply-add per element.
+
+        Args:
+            imt (OpenQuake IMT): The IMT.
+            gm_breaks (list): The values of log10(Y) at which each segment
+                after the first starts (ascending).
+            mmi_breaks (list): The values of MMI at which each segment
+                after the first starts (ascending).
+            intercepts (list): The intercepts of the segments.
+            slopes (list): The slopes of the segments.
+        """
+        lfact = np.log10(np.e)
+        if imt != self._pgv:
+            units = 981.0
+        else:
+            units = 1.0
+        l10units = np.log10(units)
+        intercepts = np.array(intercepts, dtype=float)
+        slopes = np.array(slopes, dtype=float)
+        self._segments[imt] = {
+            'gm_breaks': (np.array(gm_breaks, dtype=float) - l10units) /
+            lfact,
+            'mmi_breaks': np.array(mmi_breaks, dtype=float),
+            'intercepts': intercepts + slopes * l10units,
+            'dmmi_damp': slopes * lfact,
+            'dpgm_dmmi': 1.0 / (slopes * lfact),
+        }
+
+    def _getSegments(self, imt):
+        """
+        Helper function to get the tables stored by _setSegments().
+
+        Raises:
+            ValueError if the IMT is not supported.
+        """
+        try:
+            return self._segments[imt]
+        except (KeyError, TypeError):
+            raise ValueError("Invalid IMT " + str(imt))
+
+    def _miFromGM(self, amps, imt, resid=None):
+        """
+        Helper function that evaluates the piecewise linear relationship
+        (and its slope) for an array of ground motions in one pass:
+        each element's segment is found with a binary search of the
+        breakpoints and its coefficients are gathered from the tables.
+        See getMIfromGM() for the units. NaN amplitudes give an MMI of
+        0 (plus the residual, before clipping) and a slope of 0.
+        """
+        seg = self._getSegments(imt)
+        amps = np.asarray(amps, dtype=float)
+        ix = np.searchsorted(seg['gm_breaks'], amps, side='right')
+        dmmi_damp = seg['dmmi_damp'].take(ix)
+        mmi = np.multiply(dmmi_damp, amps)
+        mmi += seg['intercepts'].take(ix)
+        ix_nan = np.isnan(amps)
+        if ix_nan.any():
+            mmi[ix_nan] = 0.0
+            dmmi_damp[ix_nan] = 0.0
+        if resid is not None:
+            mmi += resid
+        np.clip(mmi, 1.0, 10.0, out=mmi)
+        return mmi, dmmi_damp
+
+    def _gmFromMI(self, mmi, imt, resid=None, ix_nan=None):
+        """
+        Helper function that evaluates the inverse of the piecewise
+        linear relationship (and its slope) for an array of MMI in one
+        pass. See getGMfromMI() for the units. NaN MMIs give NaN ground
+        motions and slopes. ix_nan, if given, is np.isnan(mmi).
+        """
+        seg = self._getSegments(imt)
+        mmi = np.asarray(mmi, dtype=float)
+        if ix_nan is None:
+            ix_nan = np.isnan(mmi)
+        if resid is not None:
+            mmi = mmi - resid
+        ix = np.searchsorted(seg['mmi_breaks'], mmi, side='right')
+        dpgm_dmmi = seg['dpgm_dmmi'].take(ix)
+        pgm = mmi - seg['intercepts'].take(ix)
+        pgm *= dpgm_dmmi
+        if ix_nan.any():
+            pgm[ix_nan] = np.nan
+            dpgm_dmmi[ix_nan] = np.nan
+        return pgm, dpgm_dmmi
@@ -48,6 +48,13 @@ class Wald99(GMICE):
 
         self.DEFINED_FOR_SA_PERIODS = set([])
 
+        #
+        # The lower and upper segments of the bi-linear fit
+        #
+        for imt, c in self.__constants.items():
+            self._setSegments(imt, [c['T1']], [c['T2']],
+                              [c['C4'], c['C2']], [c['C3'], c['C1']])
+
     def getMIfromGM(self, amps, imt, dists=None, mag=None):
         """
         Function to compute macroseismic intensity from ground-motion
@@ -72,41 +79,7 @@ class Wald99(GMICE):
             dMMI / dln(amp) (i.e., the slope of the relationship at the
             point in question).
         """  # noqa
-        lfact = np.log10(np.e)
-        c = self._getConsts(imt)
-
-        #
-        # Convert (for accelerations) from ln(g) to cm/s^2
-        # then take the log10
-        #
-        if imt == self._pga:
-            units = 981.0
-        else:
-            units = 1.0
-        #
-        # Math: log10(981 * exp(amps)) = log10(981) + log10(exp(amps))
-        # = log10(981) + amps * log10(e)
-        # For PGV, just convert ln(amp) to log10(amp) by multiplying
-        # by log10(e)
-        #
-        lamps = np.log10(units) + amps * lfact
-        mmi = np.zeros_like(amps)
-        dmmi_damp = np.zeros_like(amps)
-        #
-        # This is the upper segment of the bi-linear fit
-        #
-        idx = lamps >= c['T1']
-        mmi[idx] = c['C2'] + c['C1'] * lamps[idx]
-        dmmi_damp[idx] = c['C1'] * lfact
-        #
-        # This is the lower segment of the bi-linear fit
-        #
-        idx = lamps < c['T1']
-        mmi[idx] = c['C4'] + c['C3'] * lamps[idx]
-        dmmi_damp[idx] = c['C3'] * lfact
-
-        mmi = np.clip(mmi, 1.0, 10.0)
-        return mmi, dmmi_damp
+        return self._miFromGM(amps, imt)
 
     def getGMfromMI(self, mmi, imt, dists=None, mag=None):
         """
@@ -132,38 +105,7 @@ class Wald99(GMICE):
             and PSA, and natural log cm/s for PGV; ndarray of dln(amp) / dMMI
             (i.e., the slope of the relationship at the point in question).
         """  # noqa
-        lfact = np.log10(np.e)
-        c = self._getConsts(imt)
-        mmi = mmi.copy()
-        ix_nan = np.isnan(mmi)
-        mmi[ix_nan] = 1.0
-
-        pgm = np.zeros_like(mmi)
-        dpgm_dmmi = np.zeros_like(mmi)
-
-        #
-        # Upper segment of bi-linear relationship
-        #
-        idx = mmi >= c['T2']
-        pgm[idx] = np.power(10, (mmi[idx] - c['C2']) / c['C1'])
-        dpgm_dmmi[idx] = 1.0 / (c['C1'] * lfact)
-        #
-        # Lower segment of bi-linear relationship
-        #
-        idx = mmi < c['T2']
-        pgm[idx] = np.power(10, (mmi[idx] - c['C4']) / c['C3'])
-        dpgm_dmmi[idx] = 1.0 / (c['C3'] * lfact)
-
-        if imt != self._pgv:
-            units = 981.0
-        else:
-            units = 1.0
-        pgm /= units
-        pgm = np.log(pgm)
-        pgm[ix_nan] = np.nan
-        dpgm_dmmi[ix_nan] = np.nan
-
-        return pgm, dpgm_dmmi
+        return self._gmFromMI(mmi, imt)
 
     def getGM2MIsd(self):
         """
@@ -75,6 +75,16 @@ class WGRW12(GMICE):
 
         self.DEFINED_FOR_SA_PERIODS = set([0.3, 1.0, 3.0])
 
+        #
+        # The MMI 1 to 2 segment, then the lower and upper segments of
+        # the bi-linear fit
+        #
+        for imt, c in self._constants.items():
+            c2 = self._constants2[imt]
+            self._setSegments(imt, [c2['T1'], c['T1']], [2.0, c['T2']],
+                              [c2['C1'], c['C1'], c['C3']],
+                              [c2['C2'], c['C2'], c['C4']])
+
     def getMIfromGM(self, amps, imt, dists=None, mag=None):
         """
         Function to compute macroseismic intensity from ground-motion
@@ -99,58 +109,8 @@ class WGRW12(GMICE):
             dMMI / dln(amp) (i.e., the slope of the relationship at the
             point in question).
         """  # noqa
-        lfact = np.log10(np.e)
-        c, c2 = self._getConsts(imt)
-
-        if dists is not None and mag is not None:
-            doresid = True
-            ldd = np.log10(np.clip(dists, 10, 300))
-            lmm = np.clip(mag, 3.0, 7.3)
-        else:
-            doresid = False
-
-        #
-        # Convert (for accelerations) from ln(g) to cm/s^2
-        # then take the log10
-        #
-        if imt != self._pgv:
-            units = 981.0
-        else:
-            units = 1.0
-        #
-        # Math: log10(981 * exp(amps)) = log10(981) + log10(exp(amps))
-        # = log10(981) + amps * log10(e)
-        # For PGV, just convert ln(amp) to log10(amp) by multiplying
-        # by log10(e)
-        #
-        lamps = np.log10(units) + amps * lfact
-        mmi = np.zeros_like(amps)
-        dmmi_damp = np.zeros_like(amps)
-        #
-        # This is the MMI 1 to 2 range that is discussed in the paper but not
-        # specifically implemented there
-        #
-        idx = lamps < c2['T1']
-        mmi[idx] = c2['C1'] + c2['C2'] * lamps[idx]
-        dmmi_damp[idx] = c2['C2'] * lfact
-        #
-        # This is the lower segment of the bi-linear fit
-        #
-        idx = (lamps >= c2['T1']) & (lamps < c['T1'])
-        mmi[idx] = c['C1'] + c['C2'] * lamps[idx]
-        dmmi_damp[idx] = c['C2'] * lfact
-        #
-        # This is the upper segment of the bi-linear fit
-        #
-        idx = lamps >= c['T1']
-        mmi[idx] = c['C3'] + c['C4'] * lamps[idx]
-        dmmi_damp[idx] = c['C4'] * lfact
-
-        if doresid:
-            mmi += c['C5'] + c['C6'] * ldd + c['C7'] * lmm
-
-        mmi = np.clip(mmi, 1.0, 10.0)
-        return mmi, dmmi_damp
+        terms = self._getResidualTerms(dists, mag)
+        return self._miFromGM(amps, imt, self._getResidual(imt, terms))
 
     def getGMfromMI(self, mmi, imt, dists=None, mag=None):
         """
@@ -175,54 +135,8 @@ class WGRW12(GMICE):
             and PSA, and natural log cm/s for PGV; ndarray of dln(amp) / dMMI
             (i.e., the slope of the relationship at the point in question).
         """  # noqa
-        lfact = np.log10(np.e)
-        c, c2 = self._getConsts(imt)
-        mmi = mmi.copy()
-        ix_nan = np.isnan(mmi)
-        mmi[ix_nan] = 1.0
-
-        if dists is not None and mag is not None:
-            doresid = True
-            ldd = np.log10(np.clip(dists, 10, 300))
-            lmm = np.clip(mag, 3.0, 7.3)
-        else:
-            doresid = False
-
-        if doresid:
-            mmi -= c['C5'] + c['C6'] * ldd + c['C7'] * lmm
-
-        pgm = np.zeros_like(mmi)
-        dpgm_dmmi = np.zeros_like(mmi)
-
-        #
-        # MMI 1 to 2
-        #
-        idx = mmi < 2.0
-        pgm[idx] = np.power(10, (mmi[idx] - c2['C1']) / c2['C2'])
-        dpgm_dmmi[idx] = 1.0 / (c2['C2'] * lfact)
-        #
-        # Lower segment of bi-linear relationship
-        #
-        idx = (mmi >= 2.0) & (mmi < c['T2'])
-        pgm[idx] = np.power(10, (mmi[idx] - c['C1']) / c['C2'])
-        dpgm_dmmi[idx] = 1.0 / (c['C2'] * lfact)
-        #
-        # Upper segment of bi-linear relationship
-        #
-        idx = mmi >= c['T2']
-        pgm[idx] = np.power(10, (mmi[idx] - c['C3']) / c['C4'])
-        dpgm_dmmi[idx] = 1.0 / (c['C4'] * lfact)
-
-        if imt != self._pgv:
-            units = 981.0
-        else:
-            units = 1.0
-        pgm /= units
-        pgm = np.log(pgm)
-        pgm[ix_nan] = np.nan
-        dpgm_dmmi[ix_nan] = np.nan
-
-        return pgm, dpgm_dmmi
+        terms = self._getResidualTerms(dists, mag)
+        return self._gmFromMI(mmi, imt, self._getResidual(imt, terms))
 
     def getGM2MIsd(self):
         """
@@ -268,3 +182,13 @@ class WGRW12(GMICE):
         c = self._constants[imt]
         c2 = self._constants2[imt]
         return (c, c2)
+
+    def _getResidual(self, imt, terms):
+        """
+        Helper function to get the distance and magnitude term.
+        """
+        c, _ = self._getConsts(imt)
+        if terms is None:
+            return None
+        ldd, lmm = terms
+        return c['C5'] + c['C6'] * ldd + c['C7'] * lmm
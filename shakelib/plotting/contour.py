@@ -1,18 +1,226 @@
+# stdlib imports
+import os
+import copy
+from collections import OrderedDict, deque
+
 # usgs imports
 from impactutils.colors.cpalette import ColorPalette
 
 # third party imports
-from shapely.geometry import MultiLineString
-from shapely.geometry import mapping
 from scipy.ndimage.filters import median_filter
-from skimage import measure
 import numpy as np
 
+#
+# The segments crossing a grid cell, indexed by the cell's case: the sum
+# of 1 (upper left), 2 (upper right), 4 (lower left), and 8 (lower right)
+# for the corners that are above the contour level. The edges are 0
+# (top), 1 (bottom), 2 (left), and 3 (right). The two saddle cases (6 and
+# 9) have a second segment; like skimage.measure.find_contours(), the
+# saddles are resolved by connecting the low corners.
+#
+_FIRST_SEGMENT = np.array([
+    [-1, -1], [0, 2], [3, 0], [3, 2], [2, 1], [0, 1], [3, 0], [3, 1],
+    [1, 3], [0, 2], [1, 0], [1, 2], [2, 3], [0, 3], [2, 0], [-1, -1]])
+_SECOND_SEGMENT = {6: (2, 1), 9: (1, 3)}
+
+# Contour lines with this many points or fewer are dropped
+MIN_CONTOUR_POINTS = 20
+
+# The number of IMTs whose contours are kept in memory
+CONTOUR_CACHE_SIZE = 32
+_CONTOUR_CACHE = OrderedDict()
+
+
+def find_contours(grid, levels):
+    """
+    Find the contour lines of a grid at several levels in a single sweep
+    over the grid.
+
+    The results are the same as calling skimage.measure.find_contours()
+    for each level: the points are (row, column) positions in the grid,
+    interpolated along the edges of the grid cells, and closed contours
+    end with their first point. Cells with NaN corners are skipped.
+
+    Args:
+        grid (ndarray): A 2-D array of data.
+        levels (array-like): The contour levels.
+
+    Returns:
+        list: For each level, a list of (N x 2) arrays of (row, column)
+        points, one for each contour line.
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64)
+    result = [[] for _ in range(len(levels))]
+    if grid.shape[0] < 2 or grid.shape[1] < 2 or len(levels) == 0:
+        return result
+    order = np.argsort(levels, kind='stable')
+    slevels = levels[order]
+
+    ul = grid[:-1, :-1]
+    ur = grid[:-1, 1:]
+    ll = grid[1:, :-1]
+    lr = grid[1:, 1:]
+    cmin = np.minimum(np.minimum(ul, ur), np.minimum(ll, lr)).ravel()
+    cmax = np.maximum(np.maximum(ul, ur), np.maximum(ll, lr)).ravel()
+    #
+    # A cell crosses a level when cmin <= level < cmax; the levels that
+    # cross each cell are a contiguous run of the sorted levels (cells
+    # with NaNs cross nothing, since the comparisons are all False)
+    #
+    good = ~(np.isnan(cmin) | np.isnan(cmax))
+    lo = np.searchsorted(slevels, cmin[good], side='left')
+    hi = np.searchsorted(slevels, cmax[good], side='left')
+    count = hi - lo
+    cells = np.repeat(np.flatnonzero(good), count)
+    if cells.size == 0:
+        return result
+    first = np.repeat(np.cumsum(count) - count, count)
+    lidx = np.repeat(lo, count) + (np.arange(cells.size) - first)
+
+    ncols = grid.shape[1] - 1
+    row = cells // ncols
+    col = cells % ncols
+    level = slevels[lidx]
+    vul = ul.ravel()[cells]
+    vur = ur.ravel()[cells]
+    vll = ll.ravel()[cells]
+    vlr = lr.ravel()[cells]
+    case = ((vul > level) * 1 + (vur > level) * 2 + (vll > level) * 4 +
+            (vlr > level) * 8)
+
+    def fraction(a, b):
+        diff = b - a
+        same = diff == 0
+        return np.where(same, 0.0, (level - a) / np.where(same, 1.0, diff))
+
+    frow = row.astype(np.float64)
+    fcol = col.astype(np.float64)
+    points = np.empty((4, cells.size, 2))
+    points[0, :, 0] = frow
+    points[0, :, 1] = fcol + fraction(vul, vur)
+    points[1, :, 0] = frow + 1
+    points[1, :, 1] = fcol + fraction(vll, vlr)
+    points[2, :, 0] = frow + fraction(vul, vll)
+    points[2, :, 1] = fcol
+    points[3, :, 0] = frow + fraction(vur, vlr)
+    points[3, :, 1] = fcol + 1
+
+    #
+    # Collect the segments in the order that find_contours() makes them
+    # (by level, then row by row, with the saddles' second segment right
+    # after the first), since the order determines where the closed
+    # contours start
+    #
+    index = np.arange(cells.size)
+    seg_start = [points[_FIRST_SEGMENT[case, 0], index]]
+    seg_end = [points[_FIRST_SEGMENT[case, 1], index]]
+    seg_level = [lidx]
+    seg_cell = [cells]
+    seg_sub = [np.zeros(cells.size, dtype=int)]
+    for saddle, (edge0, edge1) in _SECOND_SEGMENT.items():
+        sel = case == saddle
+        seg_start.append(points[edge0, sel])
+        seg_end.append(points[edge1, sel])
+        seg_level.append(lidx[sel])
+        seg_cell.append(cells[sel])
+        seg_sub.append(np.ones(np.count_nonzero(sel), dtype=int))
+    seg_level = np.concatenate(seg_level)
+    sort = np.lexsort((np.concatenate(seg_sub), np.concatenate(seg_cell),
+                       seg_level))
+    seg_start = np.concatenate(seg_start)[sort]
+    seg_end = np.concatenate(seg_end)[sort]
+    seg_level = seg_level[sort]
+
+    bounds = np.searchsorted(seg_level, np.arange(len(slevels) + 1))
+    for k in range(len(slevels)):
+        if bounds[k] == bounds[k + 1]:
+            continue
+        sel = slice(bounds[k], bounds[k + 1])
+        result[order[k]] = _assemble_contours(seg_start[sel], seg_end[sel])
+    return result
+
+
+def _assemble_contours(starts, ends):
+    """
+    Join line segments that share end points into contour lines, in the
+    same way as skimage.measure.find_contours().
+
+    Args:
+        starts (ndarray): (N x 2) array of the segments' first points.
+        ends (ndarray): (N x 2) array of the segments' second points.
+
+    Returns:
+        list: A list of (M x 2) arrays of points, one for each line.
+    """
+    nseg = len(starts)
+    upoints, ids = np.unique(np.concatenate([starts, ends]), axis=0,
+                             return_inverse=True)
+    ids = ids.reshape(-1).tolist()
+    current_index = 0
+    contours = {}
+    heads = {}
+    tails = {}
+    for from_point, to_point in zip(ids[:nseg], ids[nseg:]):
+        # Degenerate segments occur when a corner of a cell is exactly at
+        # the contour level; the point is picked up by the next cell
+        if from_point == to_point:
+            continue
+        tail, tail_num = heads.pop(to_point, (None, None))
+        head, head_num = tails.pop(from_point, (None, None))
+        if tail is not None and head is not None:
+            if tail is head:
+                # Close the contour
+                head.append(to_point)
+            elif tail_num > head_num:
+                # Join the contours, keeping the one that was made first
+                head.extend(tail)
+                contours.pop(tail_num, None)
+                heads[head[0]] = (head, head_num)
+                tails[head[-1]] = (head, head_num)
+            else:
+                tail.extendleft(reversed(head))
+                heads.pop(head[0], None)
+                contours.pop(head_num, None)
+                heads[tail[0]] = (tail, tail_num)
+                tails[tail[-1]] = (tail, tail_num)
+        elif tail is None and head is None:
+            new_contour = deque((from_point, to_point))
+            contours[current_index] = new_contour
+            heads[from_point] = (new_contour, current_index)
+            tails[to_point] = (new_contour, current_index)
+            current_index += 1
+        elif head is None:
+            tail.appendleft(from_point)
+            heads[from_point] = (tail, tail_num)
+        else:
+            head.append(to_point)
+            tails[to_point] = (head, head_num)
+    return [upoints[list(line)] for _, line in sorted(contours.items())]
+
+
+def _grid_key(container, imtype, component, filter_size):
+    """Return a key for the contour cache, or None if the container's
+    file can't be identified.
+    """
+    try:
+        fname = os.path.abspath(container.getFileName())
+        st = os.stat(fname)
+    except (AttributeError, TypeError, OSError):
+        return None
+    return (fname, st.st_size, st.st_mtime_ns, imtype, component,
+            filter_size)
+
 
 def contour(container, imtype, component, filter_size):
     """
-    Generate contours of a specific IMT and return as a Shapely
-    MultiLineString object.
+    Generate contours of a specific IMT and return them as GeoJSON-like
+    MultiLineString features.
+
+    All of the contour levels are found in one pass over the grid (see
+    find_contours()), and the results are cached by file, IMT, component,
+    and filter size, so that the modules that draw the same contours
+    (contour, kml, and mapping) only compute them once per shake run.
 
     Args:
         container (ShakeMapOutputContainer): ShakeMapOutputContainer
@@ -34,6 +242,23 @@ def contour(container, imtype, component, filter_size):
         NotImplementedError -- if the user attempts to contour a data file
             with sets of points rather than grids.
     """  # noqa
+    key = _grid_key(container, imtype, component, filter_size)
+    if key is not None and key in _CONTOUR_CACHE:
+        _CONTOUR_CACHE.move_to_end(key)
+        return copy.deepcopy(_CONTOUR_CACHE[key])
+    line_strings = _make_contours(container, imtype, component, filter_size)
+    if key is not None:
+        _CONTOUR_CACHE[key] = line_strings
+        while len(_CONTOUR_CACHE) > CONTOUR_CACHE_SIZE:
+            _CONTOUR_CACHE.popitem(last=False)
+        line_strings = copy.deepcopy(line_strings)
+    return line_strings
+
+
+def _make_contours(container, imtype, component, filter_size):
+    """
+    Compute the contours for contour() (which see).
+    """
     intensity_colormap = ColorPalette.fromPreset('mmi')
     imtdict = container.getIMTGrids(imtype, component)
     gridobj = imtdict['mean']
@@ -68,29 +293,22 @@ def contour(container, imtype, component, filter_size):
 
     line_strings = []  # dictionary of MultiLineStrings and props
 
-    for cval in intervals:
-        contours = measure.find_contours(fgrid, cval)
+    for cval, contours in zip(intervals, find_contours(fgrid, intervals)):
         #
         # Convert coords to geographic coordinates; the coordinates
         # are returned in row, column order (i.e., (y, x))
         #
         new_contours = []
-        plot_contours = []
-        for ic, coords in enumerate(contours):  # coords is a line segment
-            if len(coords) <= 20:  # skipping little contour islands?
+        for coords in contours:  # coords is a line segment
+            if len(coords) <= MIN_CONTOUR_POINTS:  # little contour islands
                 continue
-
             mylons = coords[:, 1] * lonspan / nlon + lonstart
             mylats = (nlat - coords[:, 0]) * latspan / nlat + latstart
-            contours[ic][:, 0] = mylons[:]
-            contours[ic][:, 1] = mylats[:]
-            plot_contours.append(contours[ic])
-            new_contours.append(contours[ic].tolist())
+            new_contours.append(np.column_stack((mylons, mylats)).tolist())
 
         if len(new_contours):
-            mls = MultiLineString(new_contours)
             props = {
-                'value': cval,
+                'value': float(cval),
                 'units': units
             }
             if imtype == 'MMI':
@@ -104,7 +322,8 @@ def contour(container, imtype, component, filter_size):
                     props['weight'] = 2
             line_strings.append(
                 {
-                    'geometry': mapping(mls),
+                    'geometry': {'type': 'MultiLineString',
+                                 'coordinates': new_contours},
                     'properties': props
                 }
             )
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 # stdlib imports
+import os.path
+from collections import OrderedDict
 
 # third party imports
 from mapio.gmt import GMTGrid
@@ -13,6 +15,13 @@ import numpy as np
 # local imports
 from shakelib.utils.exception import ShakeLibException
 
+# Recently loaded Vs30 grids, keyed on the file, its modification time,
+# and the sampling parameters. A long-running process (e.g., a warm shake
+# worker) that reruns an event, or runs events in the same region, reuses
+# these rather than reading and resampling the file again.
+_VS30_CACHE = OrderedDict()
+_VS30_CACHE_SIZE = 4
+
 
 class Sites(object):
     """
@@ -64,9 +73,29 @@ class Sites(object):
                     # we want something that is just aligned, since we're
                     # padding edges
                     geodict = fgeodict.getAligned(geodict)
-            vs30grid = cls._load(vs30File, samplegeodict=geodict,
-                                 resample=resample, method='linear',
-                                 doPadding=padding, padValue=defaultVs30)
+            try:
+                key = (os.path.abspath(vs30File),
+                       os.path.getmtime(vs30File),
+                       geodict.xmin, geodict.xmax, geodict.ymin,
+                       geodict.ymax, geodict.dx, geodict.dy, geodict.nx,
+                       geodict.ny, defaultVs30, padding, resample)
+            except OSError:
+                key = None
+            if key is not None and key in _VS30_CACHE:
+                _VS30_CACHE.move_to_end(key)
+                vs30grid = _VS30_CACHE[key]
+            else:
+                vs30grid = cls._load(vs30File, samplegeodict=geodict,
+                                     resample=resample, method='linear',
+                                     doPadding=padding,
+                                     padValue=defaultVs30)
+                if key is not None:
+                    _VS30_CACHE[key] = vs30grid
+                    while len(_VS30_CACHE) > _VS30_CACHE_SIZE:
+                        _VS30_CACHE.popitem(last=False)
+            # Callers are free to modify the grid they get
+            vs30grid = Grid2D(vs30grid.getData().copy(),
+                              vs30grid.getGeoDict().copy())
 
         return vs30grid
 
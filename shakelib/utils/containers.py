@@ -2,8 +2,10 @@
 
 # stdlib imports
 import json
+import math
 
 # third party imports
+import numpy as np
 from mapio.grid2d import Grid2D
 from mapio.geodict import GeoDict
 from mapio.gridcontainer import GridHDFContainer, _split_dset_attrs
@@ -16,7 +18,134 @@ from shakelib.rupture.origin import Origin
 from shakelib.station import StationList
 import shakemap.utils.queue as queue
 
-GROUPS = {'imt': 'imts'}
+GROUPS = {'imt': 'imts', 'array': 'arrays'}
+
+# The length of the fixed-length ID strings of appendIMTArrays()
+ID_LENGTH = 80
+
+
+def _dataset_options(shape, compression=True, compression_opts=None,
+                     shuffle=False, chunks=None):
+    """
+    Translate the storage options of setIMTGrids() into keyword arguments
+    for h5py's create_dataset().
+
+    Args:
+        shape (tuple): The shape of the dataset.
+        compression (bool or str): True for gzip (the default), False or
+            None (or 'none') for no compression, or the name of an HDF5
+            filter ('gzip' or 'lzf').
+        compression_opts (int): The compression level for gzip (0-9);
+            None uses the h5py default.
+        shuffle (bool): Apply the byte shuffle filter before compressing
+            (this usually improves the compression of floating point
+            data).
+        chunks (tuple or bool): The chunk shape; it is clipped to the
+            shape of the dataset. None lets h5py choose a chunk shape if
+            one is needed.
+
+    Returns:
+        dict: Keyword arguments for create_dataset().
+    """
+    if compression is True:
+        compression = 'gzip'
+    elif compression is False or compression == 'none':
+        compression = None
+    options = {'compression': compression}
+    if compression == 'gzip' and compression_opts is not None:
+        options['compression_opts'] = compression_opts
+    if shuffle:
+        options['shuffle'] = True
+    if chunks is not None and chunks is not True and len(shape) > 0:
+        chunks = tuple(max(1, min(int(c), n)) for c, n in zip(chunks, shape))
+    if chunks is not None:
+        options['chunks'] = chunks
+    return options
+
+
+def _append_dataset(group, name, data, compression=True, dtype=None):
+    """
+    Append a one-dimensional array to a dataset, creating the dataset
+    (with an unlimited size) if it doesn't exist.
+
+    Args:
+        group (Group): The HDF group holding the dataset.
+        name (str): The name of the dataset.
+        data (array): The data to append.
+        compression (bool): Whether to compress the dataset with gzip
+            (only used when the dataset is created).
+        dtype (dtype): The type of the dataset (only used when the
+            dataset is created); None uses the type of data.
+
+    Returns:
+        Dataset: The HDF dataset.
+    """
+    data = np.asarray(data).reshape(-1)
+    if name not in group:
+        return group.create_dataset(
+            name, data=data, dtype=dtype, maxshape=(None,), chunks=True,
+            compression='gzip' if compression else None)
+    dset = group[name]
+    if dset.maxshape[0] is not None:
+        raise TypeError('Dataset %s cannot be appended to' % name)
+    nold = dset.shape[0]
+    dset.resize((nold + data.size,))
+    dset[nold:] = data
+    return dset
+
+
+def _grid_window(geodict, bounds=None, stride=1):
+    """
+    Work out the rows and columns of a grid that cover a region, and the
+    GeoDict of the resulting (possibly decimated) sub-grid.
+
+    Args:
+        geodict (GeoDict): The GeoDict of the full grid.
+        bounds (tuple): (xmin, xmax, ymin, ymax) of the region; the window
+            includes every cell that touches the region. None selects the
+            whole grid.
+        stride (int): Take every stride'th row and column.
+
+    Returns:
+        tuple: (row slice, column slice, GeoDict of the window).
+
+    Raises:
+        ValueError: If the region doesn't overlap the grid, or stride is
+            less than 1.
+    """
+    stride = int(stride)
+    if stride < 1:
+        raise ValueError('stride must be at least 1')
+    dx, dy = geodict.dx, geodict.dy
+    if bounds is None:
+        c0, c1 = 0, geodict.nx - 1
+        r0, r1 = 0, geodict.ny - 1
+    else:
+        bxmin, bxmax, bymin, bymax = bounds
+        c0 = max(0, int(math.floor((bxmin - geodict.xmin) / dx + 1e-6)))
+        c1 = min(geodict.nx - 1,
+                 int(math.ceil((bxmax - geodict.xmin) / dx - 1e-6)))
+        r0 = max(0, int(math.floor((geodict.ymax - bymax) / dy + 1e-6)))
+        r1 = min(geodict.ny - 1,
+                 int(math.ceil((geodict.ymax - bymin) / dy - 1e-6)))
+        if c0 > c1 or r0 > r1:
+            raise ValueError('Bounds %s do not overlap the grid' %
+                             str(bounds))
+    nx = (c1 - c0) // stride + 1
+    ny = (r1 - r0) // stride + 1
+    xmin = geodict.xmin + c0 * dx
+    ymax = geodict.ymax - r0 * dy
+    wdict = GeoDict({'xmin': xmin,
+                     'xmax': xmin + (nx - 1) * dx * stride,
+                     'ymin': ymax - (ny - 1) * dy * stride,
+                     'ymax': ymax,
+                     'dx': dx * stride,
+                     'dy': dy * stride,
+                     'nx': nx,
+                     'ny': ny})
+    rows = slice(r0, r0 + (ny - 1) * stride + 1, stride)
+    cols = slice(c0, c0 + (nx - 1) * stride + 1, stride)
+    return rows, cols, wdict
 
 
 class ShakeMapContainer(GridHDFContainer):
@@ -428,7 +557,8 @@ class ShakeMapOutputContainer(ShakeMapContainer):
 
     def setIMTGrids(self, imt_name, imt_mean, mean_metadata,
                     imt_std, std_metadata, component,
-                    compression=True):
+                    compression=True, compression_opts=None, shuffle=False,
+                    chunks=None):
         """
         Store IMT mean and standard deviation objects as datasets.
 
@@ -442,8 +572,16 @@ class ShakeMapOutputContainer(ShakeMapContainer):
             std_metadata (dict): Dictionary containing metadata for mean IMT
                 grid.
             component (str): Component type, i.e. 'Larger','rotd50',etc.
-            compression (bool): Boolean indicating whether dataset should be
-                compressed using the gzip algorithm.
+            compression (bool or str): True (the default) to compress the
+                datasets with gzip, False for no compression, or the name
+                of the filter to use ('gzip' or 'lzf').
+            compression_opts (int): The gzip compression level (0-9); the
+                default is the h5py default (4).
+            shuffle (bool): Apply the byte shuffle filter before
+                compression.
+            chunks (tuple): The (rows, columns) chunk shape. Chunks that
+                are small compared to the grid make windowed reads with
+                getIMTGrids() cheaper. The default lets h5py choose.
 
         Returns:
             HDF Group containing IMT grids and metadata.
@@ -465,8 +603,10 @@ class ShakeMapOutputContainer(ShakeMapContainer):
 
         # create the data set containing the mean IMT data and metadata
         mean_data = imt_mean.getData()
+        options = _dataset_options(mean_data.shape, compression,
+                                   compression_opts, shuffle, chunks)
         mean_set = imt_sub_group.create_dataset('mean', data=mean_data,
-                                                compression=compression)
+                                                **options)
         if mean_metadata is not None:
             for key, value in mean_metadata.items():
                 mean_set.attrs[key] = value
@@ -476,7 +616,7 @@ class ShakeMapOutputContainer(ShakeMapContainer):
         # create the data set containing the std IMT data and metadata
         std_data = imt_std.getData()
         std_set = imt_sub_group.create_dataset('std', data=std_data,
-                                               compression=compression)
+                                               **options)
         if std_metadata is not None:
             for key, value in std_metadata.items():
                 std_set.attrs[key] = value
@@ -485,7 +625,7 @@ class ShakeMapOutputContainer(ShakeMapContainer):
 
         return imt_sub_group
 
-    def getIMTGrids(self, imt_name, component):
+    def getIMTGrids(self, imt_name, component, bounds=None, stride=1):
         """
         Retrieve a Grid2D object and any associated metadata from the
         container.
@@ -493,6 +633,17 @@ class ShakeMapOutputContainer(ShakeMapContainer):
         Args:
             imt_name (str):
                 The name of the IMT stored in the container.
+            component (str):
+                The component of the IMT.
+            bounds (tuple):
+                Optional (xmin, xmax, ymin, ymax); if given, only the part
+                of the grids covering this region (including every cell
+                that touches it) is read. Only the HDF chunks holding the
+                window are decompressed.
+            stride (int):
+                Optional decimation factor; if greater than 1, only every
+                stride'th row and column are returned (starting with the
+                upper left corner of the window).
 
         Returns:
             dict: Dictionary containing 4 items:
@@ -518,18 +669,26 @@ class ShakeMapOutputContainer(ShakeMapContainer):
 
         # get the mean data and metadata
         mean_dset = imt_group['mean']
-        mean_data = mean_dset[()]
-
         array_metadata, mean_metadata = _split_dset_attrs(mean_dset)
         mean_geodict = GeoDict(array_metadata)
+        if bounds is None and stride == 1:
+            mean_data = mean_dset[()]
+        else:
+            rows, cols, mean_geodict = _grid_window(mean_geodict, bounds,
+                                                    stride)
+            mean_data = mean_dset[rows, cols]
         mean_grid = Grid2D(mean_data, mean_geodict)
 
         # get the std data and metadata
         std_dset = imt_group['std']
-        std_data = std_dset[()]
-
         array_metadata, std_metadata = _split_dset_attrs(std_dset)
         std_geodict = GeoDict(array_metadata)
+        if bounds is None and stride == 1:
+            std_data = std_dset[()]
+        else:
+            rows, cols, std_geodict = _grid_window(std_geodict, bounds,
+                                                   stride)
+            std_data = std_dset[rows, cols]
         std_grid = Grid2D(std_data, std_geodict)
 
         # create an output dictionary
@@ -615,6 +774,105 @@ class ShakeMapOutputContainer(ShakeMapContainer):
 
         return imt_sub_group
 
+    def appendIMTArrays(self, imt_name, lons, lats, ids,
+                        imt_mean, mean_metadata,
+                        imt_std, std_metadata,
+                        component, compression=True):
+        """
+        Like setIMTArrays(), but if the IMT's datasets exist, the arrays
+        are added to the end of them, so a long list of points may be
+        stored a piece at a time. The datasets can be read with
+        getIMTArrays(). The IDs are stored as strings of ID_LENGTH
+        characters (longer IDs are truncated).
+
+        Args:
+            imt_name (str): Name of the IMT (MMI, PGA, etc.) to be stored.
+            lons (Numpy array): Array of longitudes of the IMT data.
+            lats (Numpy array): Array of latitudes of the IMT data.
+            ids (Numpy array): Array of ID strings corresponding to the
+                locations given by lons and lats.
+            imt_mean (Numpy array): Array of IMT mean values to be stored.
+            mean_metadata (dict): Dictionary containing metadata for mean IMT
+                grid; only used by the first call for the IMT.
+            imt_std (Numpy array): Array of IMT standard deviation values
+                to be stored.
+            std_metadata (dict): Dictionary containing metadata for mean IMT
+                grid; only used by the first call for the IMT.
+            component (str): Component type, i.e. 'Larger','rotd50',etc.
+            compression (bool): Boolean indicating whether dataset should be
+                compressed using the gzip algorithm.
+
+        Returns:
+            HDF Group containing IMT arrays and metadata.
+        """
+
+        if self.getDataType() == 'grid':
+            raise TypeError('Setting point data in a file containing grids')
+        self.setDataType('points')
+
+        if lons.shape != lats.shape or \
+           lons.shape != ids.shape or \
+           lons.shape != imt_mean.shape or \
+           lons.shape != imt_std.shape:
+            raise ValueError('All input arrays must be the same shape')
+
+        sub_group_name = '%s_%s' % (imt_name, component)
+        if GROUPS['imt'] not in self._hdfobj:
+            imt_group = self._hdfobj.create_group(GROUPS['imt'])
+        else:
+            imt_group = self._hdfobj[GROUPS['imt']]
+        if sub_group_name in imt_group:
+            imt_sub_group = imt_group[sub_group_name]
+            new_group = False
+        else:
+            imt_sub_group = imt_group.create_group(sub_group_name)
+            new_group = True
+
+        _append_dataset(imt_sub_group, 'lons', lons, compression)
+        _append_dataset(imt_sub_group, 'lats', lats, compression)
+        _append_dataset(imt_sub_group, 'ids', ids, compression,
+                        dtype='S%d' % ID_LENGTH)
+        dataset = _append_dataset(imt_sub_group, 'mean', imt_mean,
+                                  compression)
+        if new_group and mean_metadata is not None:
+            for key, value in mean_metadata.items():
+                dataset.attrs[key] = value
+        dataset = _append_dataset(imt_sub_group, 'std', imt_std,
+                                  compression)
+        if new_group and std_metadata is not None:
+            for key, value in std_metadata.items():
+                dataset.attrs[key] = value
+
+        return imt_sub_group
+
+    def appendArray(self, name, array, metadata=None, compression=True):
+        """
+        Like setArray(), but if the array exists (and was made by
+        appendArray()), the data are added to the end of it. The array
+        is flattened. The array can be read with getArray().
+
+        Args:
+            name (str): The name of the array.
+            array (Numpy array): The data to store.
+            metadata (dict): Dictionary of metadata for the array; only
+                used when the array is created.
+            compression (bool): Boolean indicating whether dataset should be
+                compressed using the gzip algorithm.
+
+        Returns:
+            HDF Dataset holding the array.
+        """
+        if GROUPS['array'] not in self._hdfobj:
+            array_group = self._hdfobj.create_group(GROUPS['array'])
+        else:
+            array_group = self._hdfobj[GROUPS['array']]
+        new_array = name not in array_group
+        dset = _append_dataset(array_group, name, array, compression)
+        if new_array and metadata:
+            for key, value in metadata.items():
+                dset.attrs[key] = value
+        return dset
+
     def getIMTArrays(self, imt_name, component):
         """
         Retrieve the arrays and any associated metadata from the container.
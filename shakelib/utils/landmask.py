@@ -0,0 +1,229 @@
+"""
+A global land/water mask, stored as a memory-mapped bit array so that
+it can be shared by processes and queried without reading all of it.
+"""
+# stdlib imports
+import os.path
+import tempfile
+
+# third party imports
+import numpy as np
+
+# The resolutions (arc-minutes) of Basemap's land/sea masks
+BASEMAP_GRIDS = (10, 5, 2.5, 1.25)
+
+# Land masks by file name; see get_land_mask()
+_LAND_MASKS = {}
+
+
+class LandMask(object):
+    """
+    A global land/water mask on a grid of square cells, with one bit per
+    cell (1 for land, 0 for water). The mask is a NumPy (.npy) file of
+    the bits packed with numpy.packbits(); row 0 is the northernmost row,
+    column 0 starts at 180 degrees west, and there are twice as many
+    columns as rows. The file is memory-mapped, so only the parts of it
+    that are queried are read. Use create() or fromBasemap() to make the
+    file, or get_land_mask() to get a (shared) LandMask.
+
+    Args:
+        filename (str): The mask file.
+
+    Raises:
+        ValueError: If the file is not a valid land mask.
+    """
+    def __init__(self, filename):
+        bits = np.load(filename, mmap_mode='r')
+        if bits.dtype != np.uint8 or bits.ndim != 2 or \
+                bits.shape[1] * 8 != bits.shape[0] * 2:
+            raise ValueError('%s is not a valid land mask file' % filename)
+        self._bits = bits
+        self._nlats, ncols = bits.shape
+        self._nlons = ncols * 8
+        self._delta = 360.0 / self._nlons
+        # Points are put in the cell with the nearest center, computed as
+        # maskoceans() does (with single precision centers), so that the
+        # masks made from Basemap's masks are the same as maskoceans()'s
+        self._lon0, self._lon_span = _cell_centers(self._nlons, 360.0)
+        self._lat0, self._lat_span = _cell_centers(self._nlats, 180.0)
+        self.filename = filename
+
+    @classmethod
+    def create(cls, filename, land):
+        """
+        Make a land mask file from a global grid of land cells.
+
+        Args:
+            filename (str): The mask file to write.
+            land (array): A 2-D boolean array, True for land, of shape
+                (n, 2 * n), where n is a multiple of 4. Row 0 is the
+                northernmost row, and column 0 starts at 180 degrees
+                west.
+
+        Returns:
+            LandMask: The new land mask.
+
+        Raises:
+            ValueError: If the shape of land is not valid.
+        """
+        land = np.asarray(land, dtype=bool)
+        if land.ndim != 2 or land.shape[1] != 2 * land.shape[0] or \
+                land.shape[1] % 8 != 0:
+            raise ValueError('A land mask must have n rows and 2 * n '
+                             'columns, where n is a multiple of 4')
+        # Write to a temporary file and rename it, so that concurrent
+        # runs never see a partial file
+        dirname = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.packbits(land, axis=1))
+            os.replace(tmpfile, filename)
+        except OSError:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        return cls(filename)
+
+    @classmethod
+    def fromBasemap(cls, filename, grid=1.25):
+        """
+        Make a land mask file from one of Basemap's land/sea masks (the
+        ones used by mpl_toolkits.basemap.maskoceans()). Lakes are land,
+        as with maskoceans(..., inlands=False). Basemap is only needed
+        to make the file.
+
+        Args:
+            filename (str): The mask file to write.
+            grid (float): The resolution of the mask in arc-minutes; one
+                of 10, 5, 2.5, or 1.25.
+
+        Returns:
+            LandMask: The new land mask.
+
+        Raises:
+            ValueError: If grid is not one of Basemap's resolutions.
+        """
+        if grid not in BASEMAP_GRIDS:
+            raise ValueError('The land mask resolution must be one of %s '
+                             'arc-minutes' %
+                             ', '.join(str(x) for x in BASEMAP_GRIDS))
+        # _readlsmask() is private; this use of it (its arguments and
+        # return values, and the layout of the mask) was checked against
+        # Basemap 1.1.0, where maskoceans() calls it the same way
+        from mpl_toolkits.basemap import _readlsmask
+        # The rows of Basemap's mask go from south to north; 0 is water,
+        # 1 is land, and 2 is a lake
+        _, _, lsmask = _readlsmask(lakes=False, resolution='l', grid=grid)
+        return cls.create(filename, np.flipud(lsmask != 0))
+
+    def getResolution(self):
+        """
+        Get the size of the mask's cells.
+
+        Returns:
+            float: The size of the cells in decimal degrees.
+        """
+        return self._delta
+
+    def isLand(self, lons, lats):
+        """
+        Look up points in the mask.
+
+        Args:
+            lons (array): The longitudes of the points.
+            lats (array): The latitudes of the points; lons and lats
+                must broadcast together.
+
+        Returns:
+            array: Boolean array of the (broadcast) shape of lons and
+            lats, True where the point is on land.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=float),
+                                         np.asarray(lats, dtype=float))
+        cols = self._getCols(lons)
+        rows = self._getRows(lats)
+        return self._getBits(self._bits[rows, cols >> 3], cols)
+
+    def getWaterMask(self, geodict):
+        """
+        Get the water mask of a grid. Each row and column of the grid is
+        looked up once, so this is much faster than isLand() on all of
+        the points of the grid.
+
+        Args:
+            geodict (GeoDict): The grid.
+
+        Returns:
+            array: Boolean array of shape (ny, nx), True where the point
+            is on water. Row 0 is the northernmost row, as in Grid2D.
+        """
+        lons = geodict.xmin + geodict.dx * np.arange(geodict.nx)
+        lats = geodict.ymax - geodict.dy * np.arange(geodict.ny)
+        cols = self._getCols(lons)
+        rows = self._getRows(lats)
+        bits = self._bits[np.ix_(rows, cols >> 3)]
+        return ~self._getBits(bits, cols[np.newaxis, :])
+
+    def _getCols(self, lons):
+        """
+        Get the columns of the cells of some longitudes (in any range).
+        """
+        lons = np.where((lons < -180.0) | (lons > 180.0),
+                        np.mod(lons + 180.0, 360.0) - 180.0, lons)
+        cols = np.around((self._nlons - 1) * (lons - self._lon0) /
+                         self._lon_span)
+        return np.clip(cols, 0, self._nlons - 1).astype(np.int64)
+
+    def _getRows(self, lats):
+        """
+        Get the rows of the cells of some latitudes.
+        """
+        rows = np.around((self._nlats - 1) * (lats - self._lat0) /
+                         self._lat_span)
+        rows = np.clip(rows, 0, self._nlats - 1).astype(np.int64)
+        # Row 0 is the northernmost
+        return self._nlats - 1 - rows
+
+    @staticmethod
+    def _getBits(bits, cols):
+        """
+        Get the bits of columns cols from the bytes that hold them.
+        """
+        return ((bits >> (7 - (cols & 7))) & 1).astype(bool)
+
+
+def _cell_centers(n, span):
+    """
+    Get the first of n cell centers spanning span degrees (centered on
+    zero) and the distance from the first to the last, both in Basemap's
+    single precision.
+    """
+    delta = span / n
+    first = np.float32(-0.5 * span + 0.5 * delta)
+    last = np.float32(0.5 * span - 0.5 * delta)
+    return float(first), float(last - first)
+
+
+def get_land_mask(filename, grid=1.25):
+    """
+    Return the LandMask in a file. If the file doesn't exist, it is made
+    from Basemap's land/sea mask (see LandMask.fromBasemap()). Land masks
+    are kept in memory, so each process opens a file once.
+
+    Args:
+        filename (str): The mask file.
+        grid (float): The resolution (arc-minutes) of the mask to make if
+            the file doesn't exist.
+
+    Returns:
+        LandMask: The land mask.
+    """
+    key = os.path.abspath(filename)
+    if key not in _LAND_MASKS:
+        if os.path.isfile(key):
+            _LAND_MASKS[key] = LandMask(key)
+        else:
+            _LAND_MASKS[key] = LandMask.fromBasemap(key, grid=grid)
+    return _LAND_MASKS[key]
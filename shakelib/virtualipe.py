@@ -95,7 +95,8 @@ class VirtualIPE(GMPE):
 
         return self
 
-    def get_mean_and_stddevs(self, sx, rx, dx, imt, stddev_types, fd=None):
+    def get_mean_and_stddevs(self, sx, rx, dx, imt, stddev_types, fd=None,
+                             gm_mean=None, gm_stddevs=None):
         """
         See superclass
         `method <http://docs.openquake.org/oq-hazardlib/master/gsim/index.html#openquake.hazardlib.gsim.base.GroundShakingIntensityModel.get_mean_and_stddevs>`__
@@ -107,6 +108,14 @@ class VirtualIPE(GMPE):
         sites and is added to the ground motions before conversion to
         MMI.
 
+        Additional subclass arguments "gm_mean" and "gm_stddevs" are
+        the mean and the list of standard deviations (corresponding to
+        stddev_types) that the MultiGMPE produces for the sites and
+        self.imt. These are optional; if the caller has already made
+        these predictions, supplying them skips the call to the
+        MultiGMPE, so that the IPE only has to do the GMICE conversion.
+        The arrays are not modified.
+
         Returns:
             ndarray, list of ndarray:
 
@@ -126,8 +135,14 @@ class VirtualIPE(GMPE):
         #
         # Get the mean ground motions and stddev for the preferred IMT
         #
-        mgm, sdev = self.gmpe.get_mean_and_stddevs(sx, rx, dx, self.imt,
-                                                   stddev_types)
+        if gm_mean is not None:
+            if gm_stddevs is None or len(gm_stddevs) != len(stddev_types):
+                raise ValueError('gm_mean requires gm_stddevs with one '
+                                 'array per stddev type')
+            mgm, sdev = gm_mean, gm_stddevs
+        else:
+            mgm, sdev = self.gmpe.get_mean_and_stddevs(sx, rx, dx, self.imt,
+                                                       stddev_types)
 
         if fd is not None:
             mgm = mgm + fd
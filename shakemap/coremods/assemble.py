@@ -163,6 +163,15 @@ class AssembleModule(CoreModule):
                                         vs30file)
             global_config['data']['vs30file'] = vs30file
         #
+        # So may the land mask file (which needn't exist yet)
+        #
+        landmask_file = global_config['data']['landmask_file']
+        if landmask_file:
+            global_config['data']['landmask_file'] = \
+                path_macro_sub(landmask_file, ip=install_path,
+                               dp=data_path, gp=global_data_path,
+                               ei=self._eventid)
+        #
         # If there is a prediction_location->file file, then we need
         # to expand any macros
         #
@@ -6,6 +6,7 @@ from abc import ABC, abstractmethod
 import os.path
 import re
 import glob
+import copy
 from collections import OrderedDict
 
 # third party imports
@@ -83,8 +84,11 @@ class CoreModule(ABC):
     def writeContents(self):
         # if the module has not defined a contents dictionary
         # or contents dictionary is empty, just return
+        # (work on a copy: contents is usually a class attribute, and
+        # the expansion below would otherwise modify it for every later
+        # run in the same process)
         try:
-            contents = self.contents
+            contents = copy.deepcopy(self.contents)
         except AttributeError:
             return
 
@@ -9,13 +9,13 @@ import argparse
 import inspect
 
 # third party imports
-import fiona
-from shakelib.utils.containers import ShakeMapOutputContainer
+import numpy as np
 from shakelib.utils.imt_string import oq_to_file
 
 # local imports
 from .base import CoreModule
 from shakemap.utils.config import get_config_paths, get_logging_config
+from shakemap.utils.session import open_output_container
 from shakelib.plotting.contour import contour
 
 FORMATS = {
@@ -24,6 +24,9 @@ FORMATS = {
 
 DEFAULT_FILTER_SIZE = 10
 
+GEOJSON_CRS = {'type': 'name',
+               'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84'}}
+
 
 class ContourModule(CoreModule):
     """
@@ -105,7 +108,7 @@ class ContourModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         if container.getDataType() != 'grid':
             raise NotImplementedError('contour module can only contour '
@@ -166,29 +169,15 @@ def contour_to_files(container, output_dir, logger,
     # Right now geojson is all we support; if that changes, we'll have
     # to add a configuration or command-line option
     file_format = 'geojson'
-    # open a file for writing
     driver, extension = FORMATS[file_format]
-    sa_schema = {
-        'geometry': 'MultiLineString',
-        'properties': {
-            'value': 'float',
-            'units': 'str'
-        }
-    }
-    mmi_schema = {
-        'geometry': 'MultiLineString',
-        'properties': {
-            'value': 'float',
-            'units': 'str',
-            'color': 'str',
-            'weight': 'int'
-        }
-    }
-    crs = {
-        'no_defs': True,
-        'ellps': 'WGS84',
-        'datum': 'WGS84',
-        'proj': 'longlat'
+
+    # Grab some metadata
+    meta = container.getMetadata()
+    event_info = meta['input']['event_information']
+    mdict = {
+        'eventid': event_info['event_id'],
+        'longitude': float(event_info['longitude']),
+        'latitude': float(event_info['latitude'])
     }
 
     for imtype in imtlist:
@@ -205,68 +194,61 @@ def contour_to_files(container, output_dir, logger,
             for fname in flist:
                 os.remove(fname)
 
-        # fiona spews a warning here when driver is geojson
-        # this warning appears to be un-catchable using
-        # with warnings.catch_warnings()
-        # or
-        # logging.captureWarning()
-        # or
-        # even redirecting stderr/stdout to IO streams
-        # not sure where the warning is coming from,
-        # but there appears to be no way to stop it...
-        with fiona.drivers():
-            if imtype == 'MMI':
-                selected_schema = mmi_schema
-            else:
-                selected_schema = sa_schema
-            vector_file = fiona.open(
-                filename, 'w',
-                driver=driver,
-                schema=selected_schema,
-                crs=crs
-            )
-
-            line_strings = contour(
-                container,
-                imtype,
-                component,
-                filter_size
-            )
+        line_strings = contour(
+            container,
+            imtype,
+            component,
+            filter_size
+        )
 
-            for feature in line_strings:
-                vector_file.write(feature)
+        logger.debug('Writing contour file %s' % filename)
+        write_geojson(filename, line_strings, mdict)
 
-                # Grab some metadata
-            meta = container.getMetadata()
-            event_info = meta['input']['event_information']
-            mdict = {
-                'eventid': event_info['event_id'],
-                'longitude': float(event_info['longitude']),
-                'latitude': float(event_info['latitude'])
-            }
+        #####################################
+        # Make an extra version of the MMI contour file
+        # so that the current web rendering code can find it.
+        # Delete this file once everyone has moved to new version
+        # of ComCat code.
 
-            logger.debug('Writing contour file %s' % filename)
-            vector_file.close()
+        if imtype == 'MMI':
+            old_file = os.path.join(output_dir, 'cont_mi.json')
+            shutil.copy(filename, old_file)
+        #####################################
 
-            # Get bounds
-            tmp = fiona.open(filename)
-            bounds = tmp.bounds
-            tmp.close()
 
-            # Read back in to add metadata/bounds
-            data = json.load(open(filename))
-            data['metadata'] = mdict
-            data['bbox'] = bounds
-            with open(filename, 'w') as outfile:
-                json.dump(data, outfile)
-
-            #####################################
-            # Make an extra version of the MMI contour file
-            # so that the current web rendering code can find it.
-            # Delete this file once everyone has moved to new version
-            # of ComCat code.
+def write_geojson(filename, line_strings, metadata):
+    """
+    Write contour lines to a GeoJSON file. The features are written one
+    at a time, along with the metadata and the bounding box of all of
+    the lines (which is left out if there are no lines).
 
-            if imtype == 'MMI':
-                old_file = os.path.join(output_dir, 'cont_mi.json')
-                shutil.copy(filename, old_file)
-            #####################################
+    Args:
+        filename (str): Path to the output file.
+        line_strings (list): Features as returned by
+            shakelib.plotting.contour.contour().
+        metadata (dict): Event metadata to add to the FeatureCollection.
+    """
+    xmin = ymin = float('inf')
+    xmax = ymax = float('-inf')
+    for feature in line_strings:
+        for line in feature['geometry']['coordinates']:
+            coords = np.array(line)
+            xmin = min(xmin, coords[:, 0].min())
+            xmax = max(xmax, coords[:, 0].max())
+            ymin = min(ymin, coords[:, 1].min())
+            ymax = max(ymax, coords[:, 1].max())
+    header = OrderedDict([('type', 'FeatureCollection'), ('crs', GEOJSON_CRS),
+                          ('metadata', metadata)])
+    if line_strings:
+        header['bbox'] = [float(xmin), float(ymin), float(xmax), float(ymax)]
+    with open(filename, 'w') as outfile:
+        outfile.write(json.dumps(header)[:-1])
+        outfile.write(', "features": [')
+        for i, feature in enumerate(line_strings):
+            if i:
+                outfile.write(', ')
+            outfile.write(json.dumps(OrderedDict(
+                [('type', 'Feature'),
+                 ('properties', feature['properties']),
+                 ('geometry', feature['geometry'])])))
+        outfile.write(']}')
@@ -1,18 +1,23 @@
 # stdlib imports
 import os.path
+import io
+import copy
 import logging
+import zipfile
+import argparse
+import inspect
 from datetime import datetime
 import re
 from collections import OrderedDict
+from xml.sax import saxutils
 
 # third party imports
 import numpy as np
-from shakelib.utils.containers import ShakeMapOutputContainer
-from mapio.shake import ShakeGrid
 
 # local imports
 from .base import CoreModule
 from shakemap.utils.config import get_config_paths
+from shakemap.utils.session import open_output_container
 import shakemap
 
 # historically, we only had the component we are now calling
@@ -24,6 +29,17 @@ COMPONENT = 'GREATER_OF_TWO_HORIZONTAL'
 
 TIMEFMT = '%Y-%m-%dT%H:%M:%SZ'
 
+# The time format and schemas used in grid.xml files
+XML_TIMEFMT = '%Y-%m-%dT%H:%M:%S'
+XML_SCHEMA = 'http://www.w3.org/2001/XMLSchema-instance'
+SHAKEMAP_SCHEMA = 'http://earthquake.usgs.gov/eqcenter/shakemap'
+SCHEMA_LOCATION = 'http://earthquake.usgs.gov ' \
+                  'http://earthquake.usgs.gov/eqcenter/shakemap/xml/' \
+                  'schemas/shakemap.xsd'
+
+# The (approximate) number of grid points formatted at a time
+BLOCK_POINTS = 65536
+
 
 def _oq_to_gridxml(oqimt):
     """
@@ -75,7 +91,8 @@ class GridXMLModule(CoreModule):
     """
 
     command_name = 'gridxml'
-    targets = [r'products/grid\.xml', r'products/uncertainty\.xml']
+    targets = [r'products/grid\.xml', r'products/uncertainty\.xml',
+               r'products/grid\.xml\.zip', r'products/uncertainty\.xml\.zip']
     dependencies = [('products/shake_result.hdf', True)]
 
     contents = {'xmlGrids': {'title': 'XML Grid',
@@ -92,6 +109,54 @@ class GridXMLModule(CoreModule):
                                     }
                 }
 
+    def __init__(self, eventid, zip_output=False):
+        """
+        Instantiate a GridXMLModule class with an event ID.
+        """
+        super(GridXMLModule, self).__init__(eventid)
+        self.zip_output = zip_output
+        self._setContents()
+
+    def parseArgs(self, arglist):
+        """
+        Set up the object to accept the --zip flag.
+        """
+        parser = argparse.ArgumentParser(
+            prog=self.__class__.command_name,
+            description=inspect.getdoc(self.__class__))
+        parser.add_argument('-z', '--zip', action='store_true',
+                            help='Write grid.xml.zip and '
+                            'uncertainty.xml.zip instead of the plain XML '
+                            'files.')
+        #
+        # This line should be in any modules that overrides this
+        # one. It will collect up everything after the current
+        # modules options in args.rem, which should be returned
+        # by this function. Note: doing parser.parse_known_args()
+        # will not work as it will suck up any later modules'
+        # options that are the same as this one's.
+        #
+        parser.add_argument('rem', nargs=argparse.REMAINDER,
+                            help=argparse.SUPPRESS)
+        args = parser.parse_args(arglist)
+        self.zip_output = args.zip
+        self._setContents()
+        return args.rem
+
+    def _setContents(self):
+        """
+        Set the contents for the files that execute() will write: the
+        zip archives if zip_output is set. This is done here rather than
+        in execute() so that an instance that only parsed the options
+        (as in a parallel run) writes the same contents.xml.
+        """
+        self.contents = copy.deepcopy(self.__class__.contents)
+        if self.zip_output:
+            for cdict in self.contents.values():
+                for tformat in cdict['formats']:
+                    tformat['filename'] += '.zip'
+                    tformat['type'] = 'application/zip'
+
     def execute(self):
         """Create grid.xml and uncertainty.xml files.
 
@@ -110,88 +175,230 @@ class GridXMLModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         # get all of the grid layers and the geodict
         if container.getDataType() != 'grid':
             raise NotImplementedError('gridxml module can only function on '
                                       'gridded data, not sets of points')
         gridnames = container.getIMTs(COMPONENT)
-        xml_types = ['grid', 'uncertainty']
-        for xml_type in xml_types:
-            layers = OrderedDict()
-            field_keys = OrderedDict()
-            for gridname in gridnames:
-                imt_field = _oq_to_gridxml(gridname)
-                imtdict = container.getIMTGrids(gridname, COMPONENT)
-                if xml_type == 'grid':
-                    grid = imtdict['mean']
-                    metadata = imtdict['mean_metadata']
-                elif xml_type == 'uncertainty':
-                    grid = imtdict['std']
-                    metadata = imtdict['std_metadata']
-
-                units = metadata['units']
-                digits = metadata['digits']
-                grid_data = grid.getData()
-                # convert from HDF units to legacy grid.xml units
-                if xml_type == 'grid':
-                    if units == 'ln(cm/s)':
-                        grid_data = np.exp(grid_data)
-                        units = 'cm/s'
-                    elif units == 'ln(g)':
-                        grid_data = np.exp(grid_data) * 100
-                        units = '%g'
-                    else:
-                        pass
-
-                if xml_type == 'grid':
-                    layers[imt_field] = grid_data
-                    field_keys[imt_field] = (units, digits)
-                else:
-                    layers['STD' + imt_field] = grid_data
-                    field_keys['STD' + imt_field] = (units, digits)
-
-            geodict = grid.getGeoDict()
-
-            config = container.getConfig()
-
-            # event dictionary
-            info = container.getMetadata()
-            event_info = info['input']['event_information']
-            event_dict = {}
-            event_dict['event_id'] = event_info['event_id']
-            event_dict['magnitude'] = float(event_info['magnitude'])
-            event_dict['depth'] = float(event_info['depth'])
-            event_dict['lat'] = float(event_info['latitude'])
-            event_dict['lon'] = float(event_info['longitude'])
-            event_dict['event_timestamp'] = datetime.strptime(
-                event_info['origin_time'], TIMEFMT)
-            event_dict['event_description'] = event_info['location']
-            event_dict['event_network'] = \
-                info['input']['event_information']['eventsource']
-
-            # shake dictionary
-            shake_dict = {}
-            shake_dict['event_id'] = event_dict['event_id']
-            shake_dict['shakemap_id'] = event_dict['event_id']
-            shake_dict['shakemap_version'] = \
-                info['processing']['shakemap_versions']['map_version']
-            shake_dict['code_version'] = shakemap.__version__
-            ptime = info['processing']['shakemap_versions']['process_time']
-            shake_dict['process_timestamp'] = datetime.strptime(ptime, TIMEFMT)
-            shake_dict['shakemap_originator'] = \
-                config['system']['source_network']
-            shake_dict['map_status'] = config['system']['map_status']
-            shake_dict['shakemap_event_type'] = 'ACTUAL'
-            if event_dict['event_id'].endswith('_se'):
-                shake_dict['shakemap_event_type'] = 'SCENARIO'
-
-            shake_grid = ShakeGrid(
-                layers, geodict, event_dict,
-                shake_dict, {}, field_keys=field_keys)
-            fname = os.path.join(datadir, '%s.xml' % xml_type)
-            logger.debug('Saving IMT grids to %s' % fname)
-            shake_grid.save(fname)  # TODO - set grid version number
+        #
+        # Read each IMT once, and keep the means for grid.xml and the
+        # standard deviations for uncertainty.xml
+        #
+        xml_layers = OrderedDict([('grid', OrderedDict()),
+                                  ('uncertainty', OrderedDict())])
+        for gridname in gridnames:
+            imt_field = _oq_to_gridxml(gridname)
+            imtdict = container.getIMTGrids(gridname, COMPONENT)
+            grid = imtdict['mean']
+            metadata = imtdict['mean_metadata']
+            units = metadata['units']
+            grid_data = grid.getData()
+            # convert from HDF units to legacy grid.xml units
+            if units == 'ln(cm/s)':
+                grid_data = np.exp(grid_data)
+                units = 'cm/s'
+            elif units == 'ln(g)':
+                grid_data = np.exp(grid_data) * 100
+                units = '%g'
+            else:
+                pass
+            xml_layers['grid'][imt_field] = (grid_data, units,
+                                             metadata['digits'])
+            metadata = imtdict['std_metadata']
+            xml_layers['uncertainty']['STD' + imt_field] = (
+                imtdict['std'].getData(), metadata['units'],
+                metadata['digits'])
+
+        geodict = grid.getGeoDict()
+
+        config = container.getConfig()
+
+        # event dictionary
+        info = container.getMetadata()
+        event_info = info['input']['event_information']
+        event_dict = {}
+        event_dict['event_id'] = event_info['event_id']
+        event_dict['magnitude'] = float(event_info['magnitude'])
+        event_dict['depth'] = float(event_info['depth'])
+        event_dict['lat'] = float(event_info['latitude'])
+        event_dict['lon'] = float(event_info['longitude'])
+        event_dict['event_timestamp'] = datetime.strptime(
+            event_info['origin_time'], TIMEFMT)
+        event_dict['event_description'] = event_info['location']
+        event_dict['event_network'] = \
+            info['input']['event_information']['eventsource']
+
+        # shake dictionary
+        shake_dict = {}
+        shake_dict['event_id'] = event_dict['event_id']
+        shake_dict['shakemap_id'] = event_dict['event_id']
+        shake_dict['shakemap_version'] = \
+            info['processing']['shakemap_versions']['map_version']
+        shake_dict['code_version'] = shakemap.__version__
+        ptime = info['processing']['shakemap_versions']['process_time']
+        shake_dict['process_timestamp'] = datetime.strptime(ptime, TIMEFMT)
+        shake_dict['shakemap_originator'] = \
+            config['system']['source_network']
+        shake_dict['map_status'] = config['system']['map_status']
+        shake_dict['shakemap_event_type'] = 'ACTUAL'
+        if event_dict['event_id'].endswith('_se'):
+            shake_dict['shakemap_event_type'] = 'SCENARIO'
 
         container.close()
+
+        writers = []
+        try:
+            for xml_type, layers in xml_layers.items():
+                fname = os.path.join(datadir, '%s.xml' % xml_type)
+                if self.zip_output:
+                    fname += '.zip'
+                logger.debug('Saving IMT grids to %s' % fname)
+                writer = GridXMLWriter(fname, layers, geodict, event_dict,
+                                       shake_dict, zip_output=self.zip_output)
+                writers.append(writer)
+            write_grid_xml(writers, geodict)
+        finally:
+            for writer in writers:
+                writer.close()
+
+
+class GridXMLWriter(object):
+    """Write one grid.xml-format file (or a zip archive containing one)
+    in pieces: the header when it is created, then blocks of grid rows,
+    then the closing tags when close() is called.
+    """
+
+    def __init__(self, filename, layers, geodict, event_dict, shake_dict,
+                 zip_output=False):
+        """
+        Args:
+            filename (str): The output file.
+            layers (OrderedDict): Dictionary of field name: (2-D array,
+                units, significant digits) for the data columns.
+            geodict (GeoDict): The geodict of the grids.
+            event_dict (dict): Event information (see mapio's ShakeGrid).
+            shake_dict (dict): ShakeMap information (see mapio's
+                ShakeGrid).
+            zip_output (bool): If True, write a zip archive containing
+                the file (named as filename without the .zip extension).
+        """
+        self.layers = layers
+        self._zipfile = None
+        if zip_output:
+            self._zipfile = zipfile.ZipFile(filename, 'w',
+                                            zipfile.ZIP_DEFLATED)
+            arcname = os.path.basename(filename)
+            if arcname.endswith('.zip'):
+                arcname = arcname[:-4]
+            self._file = io.TextIOWrapper(self._zipfile.open(arcname, 'w'),
+                                          encoding='utf-8')
+        else:
+            self._file = open(filename, 'w', encoding='utf-8')
+        self._file.write(_get_xml_header(layers, geodict, event_dict,
+                                         shake_dict))
+        self._row_format = '%s %s ' + ' '.join(
+            '%%.%ig' % digits for _, _, digits in layers.values()) + '\n'
+        self._buffer = None
+
+    def write(self, lons, lats, row0, nrows):
+        """Write a block of grid rows.
+
+        Args:
+            lons (ndarray): Object array of the formatted longitudes of
+                the grid columns.
+            lats (ndarray): Object array of the formatted latitudes of the
+                grid rows in the block.
+            row0 (int): The first grid row of the block.
+            nrows (int): The number of rows in the block.
+        """
+        ncols = len(lons)
+        npts = nrows * ncols
+        if self._buffer is None or len(self._buffer) < npts:
+            self._buffer = np.empty((npts, 2 + len(self.layers)),
+                                    dtype=object)
+            self._buffer[:, 0] = np.tile(lons, nrows)
+        buf = self._buffer[:npts]
+        buf[:, 1] = np.repeat(lats, ncols)
+        for i, (data, _, _) in enumerate(self.layers.values()):
+            buf[:, 2 + i] = data[row0:row0 + nrows].ravel()
+        self._file.write((self._row_format * npts) %
+                         tuple(buf.ravel().tolist()))
+
+    def close(self):
+        """Write the closing tags and close the file.
+        """
+        if self._file is None:
+            return
+        self._file.write('</grid_data>\n</shakemap_grid>\n')
+        self._file.close()
+        if self._zipfile is not None:
+            self._zipfile.close()
+        self._file = None
+
+
+def write_grid_xml(writers, geodict, block_points=BLOCK_POINTS):
+    """Write the grid data to one or more grid.xml-format files in a
+    single pass over the grids, a block of rows at a time. The points
+    are written from the upper left corner of the grid, row by row.
+
+    Args:
+        writers (list): GridXMLWriter objects.
+        geodict (GeoDict): The geodict of the grids.
+        block_points (int): The (approximate) number of grid points to
+            format at a time.
+    """
+    if geodict.xmax < geodict.xmin:
+        lons = np.linspace(geodict.xmin, geodict.xmax + 360, num=geodict.nx)
+    else:
+        lons = np.linspace(geodict.xmin, geodict.xmax, num=geodict.nx)
+    lats = np.linspace(geodict.ymin, geodict.ymax, num=geodict.ny)[::-1]
+    lonstrs = np.array(['%.4f' % lon for lon in lons], dtype=object)
+    latstrs = np.array(['%.4f' % lat for lat in lats], dtype=object)
+    block = max(1, block_points // geodict.nx)
+    for row0 in range(0, geodict.ny, block):
+        nrows = min(block, geodict.ny - row0)
+        for writer in writers:
+            writer.write(lonstrs, latstrs[row0:row0 + nrows], row0, nrows)
+
+
+def _get_xml_header(layers, geodict, event_dict, shake_dict):
+    """Return the text of a grid.xml file up to the grid data (in the
+    same form as mapio's ShakeGrid.save()).
+    """
+    header = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>']
+    fmt = '<shakemap_grid xmlns:xsi="%s" xmlns="%s" ' \
+          'xsi:schemaLocation="%s" event_id="%s" shakemap_id="%s" ' \
+          'shakemap_version="%i" code_version="%s" ' \
+          'process_timestamp="%s" shakemap_originator="%s" ' \
+          'map_status="%s" shakemap_event_type="%s">\n'
+    header.append(fmt % (
+        XML_SCHEMA, SHAKEMAP_SCHEMA, SCHEMA_LOCATION,
+        shake_dict['event_id'], shake_dict['shakemap_id'],
+        shake_dict['shakemap_version'], shake_dict['code_version'],
+        datetime.utcnow().strftime(XML_TIMEFMT),
+        shake_dict['shakemap_originator'], shake_dict['map_status'],
+        shake_dict['shakemap_event_type']))
+    fmt = '<event event_id="%s" magnitude="%.1f" depth="%.1f" ' \
+          'lat="%.4f" lon="%.4f" event_timestamp="%s" event_network="%s" ' \
+          'event_description="%s" />\n'
+    header.append(fmt % (
+        event_dict['event_id'], event_dict['magnitude'],
+        event_dict['depth'], event_dict['lat'], event_dict['lon'],
+        event_dict['event_timestamp'].strftime(XML_TIMEFMT),
+        event_dict['event_network'],
+        saxutils.escape(event_dict['event_description'])))
+    fmt = '<grid_specification lon_min="%.4f" lat_min="%.4f" ' \
+          'lon_max="%.4f" lat_max="%.4f" nominal_lon_spacing="%.4f" ' \
+          'nominal_lat_spacing="%.4f" nlon="%i" nlat="%i"/>'
+    header.append(fmt % (geodict.xmin, geodict.ymin, geodict.xmax,
+                         geodict.ymax, geodict.dx, geodict.dy, geodict.nx,
+                         geodict.ny))
+    header.append('<grid_field index="1" name="LON" units="dd" />\n')
+    header.append('<grid_field index="2" name="LAT" units="dd" />\n')
+    fmt = '<grid_field index="%i" name="%s" units="%s" />\n'
+    for idx, (field, (_, units, _)) in enumerate(layers.items()):
+        header.append(fmt % (idx + 3, field.upper(), units))
+    header.append('<grid_data>\n')
+    return ''.join(header)
@@ -4,7 +4,7 @@ from collections import OrderedDict
 import json
 
 # third party imports
-from shakelib.utils.containers import ShakeMapOutputContainer
+from shakemap.utils.session import open_output_container
 
 # local imports
 from .base import CoreModule
@@ -49,7 +49,7 @@ class InfoModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         # create ShakeMap metadata file
         self.logger.debug('Writing info.json file...')
@@ -5,11 +5,9 @@ import logging
 import zipfile
 import shutil
 import re
+from xml.sax.saxutils import escape
 
 # third party imports
-from shapely.geometry import shape
-import fiona
-from shakelib.utils.containers import ShakeMapOutputContainer
 from PIL import Image
 import configobj
 from lxml import etree
@@ -17,11 +15,13 @@ import numpy as np
 
 # local imports
 from .base import CoreModule
+from .contour import DEFAULT_FILTER_SIZE
 from shakemap.utils.config import get_config_paths, get_logging_config
+from shakemap.utils.masks import get_ocean_mask
+from shakemap.utils.session import open_output_container
 from shakemap.utils.utils import path_macro_sub
 from shakelib.plotting.contour import contour
 from impactutils.colors.cpalette import ColorPalette
-from mapio.grid2d import Grid2D
 
 OVERLAY_IMG = 'ii_overlay.png'
 OVERLAY_KML = 'overlay.kml'
@@ -38,14 +38,25 @@ LOOKAT_ALTITUDE = 500000  # meters
 TRIANGLE = 'triangle.png'
 CIRCLE = 'circle.png'
 
+DYFI_NETWORKS = ['INTENSITY', 'DYFI', 'CIIM']
+
+PLACEMARK_TEMPLATE = (
+    '<Placemark><styleUrl>%s</styleUrl>'
+    '<Style><IconStyle><color>%s</color></IconStyle></Style>'
+    '<name>%s</name><visibility>0</visibility>'
+    '<description><![CDATA[%s]]></description>'
+    '<Point><altitudeModel>clampToGround</altitudeModel>'
+    '<coordinates>%.4f,%.4f,0</coordinates></Point></Placemark>')
+
+FOLDER_TEMPLATE = ('<Folder><name>%s</name><visibility>0</visibility>'
+                   '%s</Folder>')
+
 IMT_UNITS = {'pga': '%g',
              'pgv': 'cm/sec',
              'sa(0.3)': '%g',
              'sa(1.0)': '%g',
              'sa(3.0)': '%g'}
 
-DEFAULT_FILTER_SIZE = 10
-
 
 class KMLModule(CoreModule):
     """
@@ -99,7 +110,7 @@ class KMLModule(CoreModule):
                                         'shakemap_data')
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         if container.getDataType() != 'grid':
             raise NotImplementedError('kml module can only contour '
@@ -113,13 +124,17 @@ class KMLModule(CoreModule):
         oceanfile = path_macro_sub(oceanfile, ip=install_path, dp=data_path,
                                    gp=global_data_path)
 
+        # rasterized ocean masks are kept between runs
+        mask_dir = os.path.join(install_path, 'data', 'ocean_masks')
+
         # call create_kmz function
-        create_kmz(container, datadir, oceanfile, self.logger)
+        create_kmz(container, datadir, oceanfile, self.logger,
+                   mask_dir=mask_dir)
 
         container.close()
 
 
-def create_kmz(container, datadir, oceanfile, logger):
+def create_kmz(container, datadir, oceanfile, logger, mask_dir=None):
     # we're going to combine all these layers into one KMZ file.
     kmz_contents = []
 
@@ -140,7 +155,8 @@ def create_kmz(container, datadir, oceanfile, logger):
 
     # create intensity overlay
     logger.debug('Creating intensity overlay...')
-    overlay_image = create_overlay(container, oceanfile, datadir, document)
+    overlay_image = create_overlay(container, oceanfile, datadir, document,
+                                   mask_dir=mask_dir)
     kmz_contents += [overlay_image]
     logger.debug('Created intensity overlay image %s' % overlay_image)
 
@@ -350,7 +366,7 @@ def create_line_styles(document):
         vis.text = '1'
 
 
-def create_overlay(container, oceanfile, datadir, document):
+def create_overlay(container, oceanfile, datadir, document, mask_dir=None):
     """Create a KML file and intensity map.
 
     Args:
@@ -358,12 +374,14 @@ def create_overlay(container, oceanfile, datadir, document):
         oceanfile (str): Path to shapefile containing ocean polygons.
         datadir (str): Path to data directory where output KMZ will be written.
         document (SubElement): KML document where the overlay tags should go.
+        mask_dir (str): Directory of cached ocean masks (or None).
     Returns:
         tuple: (Path to output KMZ file, Path to output overlay image)
     """
     # create the overlay image file
     overlay_img_file = os.path.join(datadir, OVERLAY_IMG)
-    geodict = create_overlay_image(container, oceanfile, overlay_img_file)
+    geodict = create_overlay_image(container, oceanfile, overlay_img_file,
+                                   mask_dir=mask_dir)
 
     overlay = etree.SubElement(document, 'GroundOverlay')
     name = etree.SubElement(overlay, 'name')
@@ -394,13 +412,14 @@ def create_overlay(container, oceanfile, datadir, document):
     return overlay_img_file
 
 
-def create_overlay_image(container, oceanfile, filename):
+def create_overlay_image(container, oceanfile, filename, mask_dir=None):
     """Create a semi-transparent PNG image of intensity.
 
     Args:
         container (ShakeMapOutputContainer): Results of model.conf.
         oceanfile (str): Path to shapefile containing ocean polygons.
         filename (str): Path to desired output PNG file.
+        mask_dir (str): Directory of cached ocean masks (or None).
     Returns:
         GeoDict: GeoDict object for the intensity grid.
     """
@@ -423,15 +442,7 @@ def create_overlay_image(container, oceanfile, filename):
     rgba[imtdata <= 1.5] = 0
 
     # mask off the areas covered by ocean
-    bbox = (gd.xmin, gd.ymin, gd.xmax, gd.ymax)
-    with fiona.open(oceanfile) as c:
-        tshapes = list(c.items(bbox=bbox))
-        shapes = []
-        for tshp in tshapes:
-            shapes.append(shape(tshp[1]['geometry']))
-        if len(shapes):
-            oceangrid = Grid2D.rasterizeFromGeometry(shapes, gd, fillValue=0.0)
-            rgba[oceangrid.getData() == 1] = 0
+    rgba[get_ocean_mask(oceanfile, gd, cache_dir=mask_dir)] = 0
 
     # save rgba image as png
     img = Image.fromarray(rgba)
@@ -458,23 +469,24 @@ def create_stations(container, datadir, document):
     # get the station data from the container
     station_dict = container.getStationDict()
 
-    # Group the MMI and instrumented stations separately
-    mmi_folder = etree.SubElement(document, 'Folder')
-    mmi_name = etree.SubElement(mmi_folder, 'name')
-    mmi_name.text = 'Macroseismic Stations'
-    mmi_vis = etree.SubElement(mmi_folder, 'visibility')
-    mmi_vis.text = '0'
-
-    ins_folder = etree.SubElement(document, 'Folder')
-    ins_name = etree.SubElement(ins_folder, 'name')
-    ins_name.text = 'Instrumented Stations'
-    ins_vis = etree.SubElement(ins_folder, 'visibility')
-    ins_vis.text = '0'
+    # Group the MMI and instrumented stations separately; each folder
+    # is written as text and parsed once, rather than built an element
+    # at a time
+    colors = {}
+    mmi_placemarks = []
+    ins_placemarks = []
     for station in station_dict['features']:
+        placemark = make_placemark(station, cpalette, colors)
         if station['properties']['station_type'] == 'seismic':
-            make_placemark(ins_folder, station, cpalette)
+            ins_placemarks.append(placemark)
         else:
-            make_placemark(mmi_folder, station, cpalette)
+            mmi_placemarks.append(placemark)
+
+    parser = etree.XMLParser(strip_cdata=False, huge_tree=True)
+    for name, placemarks in [('Macroseismic Stations', mmi_placemarks),
+                             ('Instrumented Stations', ins_placemarks)]:
+        folder = FOLDER_TEMPLATE % (escape(name), ''.join(placemarks))
+        document.append(etree.fromstring(folder, parser))
 
     # we need to find the triangle and circle icons and copy them to
     # the output directory
@@ -490,38 +502,35 @@ def create_stations(container, datadir, document):
     return (tridest, cirdest)
 
 
-def make_placemark(document, station, cpalette):
-    """Create a placemark element in station KML.
+def make_placemark(station, cpalette, colors=None):
+    """Create the text of a placemark element in station KML.
 
     Args:
-        document (Element): LXML KML Document element.
         station (dict): Dictionary containing station data.
         cpalette (ColorPalette): Object allowing user to convert MMI to color.
+        colors (dict): Cache of KML colors keyed by intensity, shared
+            between calls (or None).
+
+    Returns:
+        str: The Placemark element as a string.
     """
-    placemark = etree.SubElement(document, 'Placemark')
-    style_url = etree.SubElement(placemark, 'styleUrl')
-    if station['properties']['network'] in ['INTENSITY', 'DYFI', 'CIIM']:
-        style_url.text = '#dyfiIconMap'
+    if station['properties']['network'] in DYFI_NETWORKS:
+        style_url = '#dyfiIconMap'
     else:
-        style_url.text = '#stationIconMap'
-    style = etree.SubElement(placemark, 'Style')
-    icon_style = etree.SubElement(style, 'IconStyle')
-    color = etree.SubElement(icon_style, 'color')
+        style_url = '#stationIconMap'
     intensity = get_intensity(station)
-    rgb = cpalette.getDataColor(intensity, color_format='hex')
-    color.text = flip_rgb(rgb)
-    name = etree.SubElement(placemark, 'name')
-    name.text = station['id']
-    visibility = etree.SubElement(placemark, 'visibility')
-    visibility.text = '0'
-    description = etree.SubElement(placemark, 'description')
-    description.text = etree.CDATA(get_description_table(station))
-    point = etree.SubElement(placemark, 'Point')
-    alt_model = etree.SubElement(point, 'altitudeModel')
-    alt_model.text = 'clampToGround'
-    coordinates = etree.SubElement(point, 'coordinates')
-    coordinates.text = '%.4f,%.4f,0' % (
-        tuple(station['geometry']['coordinates']))
+    if colors is None:
+        colors = {}
+    if intensity not in colors:
+        rgb = cpalette.getDataColor(intensity, color_format='hex')
+        colors[intensity] = flip_rgb(rgb)
+    # ']]>' may not appear inside a CDATA section, so split it across two
+    description = get_description_table(station).replace(
+        ']]>', ']]]]><![CDATA[>')
+    return PLACEMARK_TEMPLATE % (
+        style_url, colors[intensity], escape(station['id']), description,
+        station['geometry']['coordinates'][0],
+        station['geometry']['coordinates'][1])
 
 
 def get_intensity(station):
@@ -555,27 +564,20 @@ def get_description_table(station):
     Returns:
         str: String containing HTML table describing station.
     """
-    table = etree.Element('table', border='1')
-
-    if station['properties']['network'] in ['INTENSITY', 'DYFI', 'CIIM']:
+    if station['properties']['network'] in DYFI_NETWORKS:
         network = 'DYFI'
     else:
         network = station['properties']['network']
-    make_row(table, 'Network', network)
-    make_row(table, 'Station ID', station['id'])
-    make_row(table, 'Location', station['properties']['location'])
-    make_row(table,
-             'Lat',
-             '%.4f' % station['geometry']['coordinates'][1])
-    make_row(table,
-             'Lon',
-             '%.4f' % station['geometry']['coordinates'][0])
-    make_row(table,
-             'Distance to source',
-             '%.2f' % station['properties']['distance'])
+    rows = [make_row('Network', network),
+            make_row('Station ID', station['id']),
+            make_row('Location', station['properties']['location']),
+            make_row('Lat', '%.4f' % station['geometry']['coordinates'][1]),
+            make_row('Lon', '%.4f' % station['geometry']['coordinates'][0]),
+            make_row('Distance to source',
+                     '%.2f' % station['properties']['distance'])]
 
     intensity_string = '%.1f' % get_intensity(station)
-    make_row(table, 'Intensity', intensity_string)
+    rows.append(make_row('Intensity', intensity_string))
 
     # get the list of IMTs in the station tag
     imt_list = []
@@ -587,10 +589,9 @@ def get_description_table(station):
 
     for imt in imt_list:
         imt_str = imt_to_string(imt)
-        make_row(table, imt_str, get_imt_text(station, imt))
+        rows.append(make_row(imt_str, get_imt_text(station, imt)))
 
-    desc_xml = etree.tostring(table).decode('utf8')
-    return desc_xml
+    return '<table border="1">%s</table>' % ''.join(rows)
 
 
 def imt_to_string(imt):
@@ -603,20 +604,19 @@ def imt_to_string(imt):
     return imt_string
 
 
-def make_row(table, key, value):
+def make_row(key, value):
     """Create a row in the description table.
 
     Args:
-        table (Element): LXML Element for table tag.
         key (str): Text for left hand column of row.
         value (str): Text for right hand column of row.
 
+    Returns:
+        str: The tr element as a string.
     """
-    row = etree.SubElement(table, 'tr')
-    row_col1 = etree.SubElement(row, 'td')
-    row_col1.text = key
-    row_col2 = etree.SubElement(row, 'td')
-    row_col2.text = value
+    if value is None:
+        return '<tr><td>%s</td><td/></tr>' % escape(key)
+    return '<tr><td>%s</td><td>%s</td></tr>' % (escape(key), escape(value))
 
 
 def get_description(station):
@@ -632,7 +632,7 @@ def get_description(station):
     network_dt = etree.SubElement(dl, 'dt')
     network_dt.text = 'NETWORK:'
     network_dd = etree.SubElement(dl, 'dd')
-    if station['properties']['network'] in ['INTENSITY', 'DYFI', 'CIIM']:
+    if station['properties']['network'] in DYFI_NETWORKS:
         network_dd.text = 'DYFI'
     else:
         network_dd.text = station['properties']['network']
@@ -1,6 +1,13 @@
 # stdlib
 import os.path
 import time
+import logging
+import copy
+import argparse
+import inspect
+import resource
+import tempfile
+import concurrent.futures as cf
 from datetime import datetime
 from collections import OrderedDict
 
@@ -10,6 +17,8 @@ import fiona
 from configobj import ConfigObj
 
 from matplotlib.colors import LightSource
+from matplotlib.collections import LineCollection
+from matplotlib.patches import PathPatch
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
 import matplotlib.patheffects as path_effects
@@ -29,20 +38,20 @@ from shapely.geometry import shape as sShape
 
 import numpy as np
 from descartes import PolygonPatch
-from scipy.ndimage import gaussian_filter
 
 # local imports
 from mapio.gmt import GMTGrid
 from impactutils.colors.cpalette import ColorPalette
 from mapio.basemapcity import BasemapCities
-from shakelib.utils.containers import ShakeMapOutputContainer
+from shakemap.utils.session import open_output_container
 from shakelib.rupture.origin import Origin
 from shakelib.rupture.point_rupture import PointRupture
 from shakelib.rupture.factory import rupture_from_dict_and_origin
 from shakelib.utils.imt_string import oq_to_file
-from shakelib.plotting.contour import getContourLevels
+from shakelib.plotting.contour import contour
 from shakemap.utils.config import get_config_paths
 from .base import CoreModule
+from .contour import DEFAULT_FILTER_SIZE
 from shakemap.utils.utils import path_macro_sub
 from impactutils.time.ancient_time import HistoricTime
 
@@ -146,6 +155,48 @@ class MappingModule(CoreModule):
                                               ]
                                   }
 
+    def __init__(self, eventid, processes=1):
+        """
+        Instantiate a MappingModule class with an event ID.
+
+        Args:
+            eventid (str): The event ID.
+            processes (int): The number of worker processes in which to
+                draw the maps; if 1, the maps are drawn in this process,
+                and if 0, one process per processor is used.
+        """
+        super(MappingModule, self).__init__(eventid)
+        self.processes = processes
+
+    def parseArgs(self, arglist):
+        """
+        Set up the object to accept the --processes flag.
+        """
+        parser = argparse.ArgumentParser(
+            prog=self.__class__.command_name,
+            description=inspect.getdoc(self.__class__))
+        parser.add_argument('-p', '--processes', type=int, default=1,
+                            help='Draw the maps in this many worker '
+                            'processes, one IMT per process (default=1, '
+                            'draw them in sequence; use 0 for one process '
+                            'per processor).')
+        #
+        # This line should be in any modules that overrides this
+        # one. It will collect up everything after the current
+        # modules options in args.rem, which should be returned
+        # by this function. Note: doing parser.parse_known_args()
+        # will not work as it will suck up any later modules'
+        # options that are the same as this one's.
+        #
+        parser.add_argument('rem', nargs=argparse.REMAINDER,
+                            help=argparse.SUPPRESS)
+        args = parser.parse_args(arglist)
+        if args.processes < 0:
+            raise ValueError('The number of processes must not be '
+                             'negative.')
+        self.processes = args.processes
+        return args.rem
+
     def execute(self):
         """
         Raises:
@@ -162,7 +213,7 @@ class MappingModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
         if container.getDataType() != 'grid':
             raise NotImplementedError('mapping module can only operate on '
                                       'gridded data, not sets of points')
@@ -206,15 +257,20 @@ class MappingModule(CoreModule):
                             config['products']['mapping']['operator'])
 
         imtlist = container.getIMTs()
-        for imt in imtlist:
-            if imt == 'MMI':
-                self.logger.debug('Drawing intensity map...')
-                intensity_map = mapmaker.drawIntensityMap(datadir)
-                self.logger.debug('Created intensity map %s' % intensity_map)
-            else:
-                self.logger.debug('Drawing %s contour map...' % imt)
-                contour_file = mapmaker.drawContourMap(imt, datadir)
-                self.logger.debug('Created contour map %s' % contour_file)
+        if self.processes != 1 and len(imtlist) > 1:
+            self._drawMaps(mapmaker, imtlist, datadir)
+        else:
+            for imt in imtlist:
+                if imt == 'MMI':
+                    self.logger.debug('Drawing intensity map...')
+                    intensity_map = mapmaker.drawIntensityMap(datadir)
+                    self.logger.debug('Created intensity map %s' %
+                                      intensity_map)
+                else:
+                    self.logger.debug('Drawing %s contour map...' % imt)
+                    contour_file = mapmaker.drawContourMap(imt, datadir)
+                    self.logger.debug('Created contour map %s' %
+                                      contour_file)
 
         ###########################
         # Make a placeholder plot of standard deviation
@@ -242,6 +298,127 @@ class MappingModule(CoreModule):
 
         container.close()
 
+    def _drawMaps(self, mapmaker, imtlist, datadir):
+        """Draw the map of each IMT in a pool of worker processes.
+
+        The projected topography and hillshade are computed here, once,
+        and written to files that the workers memory-map, so the workers
+        share one copy of them; the rest of the IMT-independent layers
+        are sent to each worker with its IMT's data.
+
+        Args:
+            mapmaker (MapMaker): The MapMaker for the event.
+            imtlist (list): The IMTs to map.
+            datadir (str): Path to directory where the maps should be
+                saved.
+        """
+        nworkers = self.processes or os.cpu_count() or 1
+        nworkers = min(nworkers, len(imtlist))
+        gd = mapmaker.getSampleDict(imtlist[0])
+        if mapmaker.city_cols is not None:
+            # Each map does this anyway; doing it here saves sending the
+            # whole cities list to every worker
+            mapmaker.cities = mapmaker.cities.limitByBounds(
+                (gd.xmin, gd.xmax, gd.ymin, gd.ymax))
+        self.logger.debug('Drawing %d maps in %d processes...' %
+                          (len(imtlist), nworkers))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shared = mapmaker.shareLayers(gd, tmpdir)
+            with cf.ProcessPoolExecutor(max_workers=nworkers) as ex:
+                futures = {}
+                for imt in imtlist:
+                    future = ex.submit(_draw_map, mapmaker.copyForWorker(imt),
+                                       shared, imt, datadir)
+                    futures[future] = imt
+                for future in cf.as_completed(futures):
+                    outfile, elapsed, peak_mb = future.result()
+                    self.logger.debug(
+                        'Created %s map %s in %.1f seconds (worker peak '
+                        'memory %.0f MB)' %
+                        (futures[future], outfile, elapsed, peak_mb))
+
+
+def _draw_map(mapmaker, shared, imt, outfolder):
+    """Draw the map of one IMT in a worker process.
+
+    Args:
+        mapmaker (MapMaker): A MapMaker from MapMaker.copyForWorker().
+        shared (dict): The shared layers from MapMaker.shareLayers().
+        imt (str): The IMT to map.
+        outfolder (str): Path to directory where the map should be saved.
+
+    Returns:
+        tuple: The path to the map, the time it took to draw in seconds,
+        and the peak memory used by the worker process so far, in MB.
+    """
+    t0 = time.time()
+    # The workers only draw to files
+    plt.switch_backend('Agg')
+    # Loggers can't be sent to other processes (before Python 3.7), so
+    # the copy doesn't have one
+    mapmaker.logger = logging.getLogger()
+    mapmaker.useSharedLayers(shared)
+    if imt == 'MMI':
+        outfile = mapmaker.drawIntensityMap(outfolder)
+    else:
+        outfile = mapmaker.drawContourMap(imt, outfolder)
+    plt.close('all')
+    # ru_maxrss is in kilobytes (on Linux; bytes on macOS)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return outfile, time.time() - t0, peak_mb
+
+
+class _MapData(object):
+    """The parts of a ShakeMapOutputContainer that MapMaker uses, taken
+    from an open container so that they can be sent to a worker process
+    (an open container can't be).
+    """
+
+    def __init__(self, container, imts):
+        """Copy data from a container.
+
+        Args:
+            container (ShakeMapOutputContainer): The container.
+            imts (list): The IMTs whose grids should be copied.
+        """
+        self._filename = container.getFileName()
+        self._metadata = container.getMetadata()
+        self._stations = container.getStationDict()
+        self._rupture = container.getRuptureDict()
+        self._components = {}
+        self._grids = {}
+        for imt in imts:
+            components = container.getComponents(imt)
+            self._components[imt] = components
+            for component in components:
+                self._grids[(imt, component)] = container.getIMTGrids(
+                    imt, component)
+
+    def getFileName(self):
+        return self._filename
+
+    def getDataType(self):
+        return 'grid'
+
+    def getMetadata(self):
+        return self._metadata
+
+    def getStationDict(self):
+        return self._stations
+
+    def getRuptureDict(self):
+        return self._rupture
+
+    def getIMTs(self, component=None):
+        return [imt for imt, components in self._components.items()
+                if component is None or component in components]
+
+    def getComponents(self, imt):
+        return self._components[imt]
+
+    def getIMTGrids(self, imt, component):
+        return self._grids[(imt, component)]
+
 
 def getProjectedPolygon(polygon, m):
     """
@@ -373,6 +550,10 @@ class MapMaker(object):
         self.logger = logger
         self.operator = operator
 
+        # the projection, topography and projected vector layers of each
+        # map extent; these are the same for every IMT
+        self._layers = {}
+
         # clip all the vector data now so that map rendering will be fast
         t1 = time.time()
         self._clipBounds()
@@ -497,18 +678,172 @@ class MapMaker(object):
         Returns:
             Basemap: Basemap instance, Mercator projection.
         """
-        clon = gd.xmin + (gd.xmax - gd.xmin) / 2.0
-        clat = gd.ymin + (gd.ymax - gd.ymin) / 2.0
         f = plt.figure(figsize=(self.fig_width, self.fig_height))
         ax = f.add_axes([0.1, 0.1, 0.8, 0.8])
 
+        # the projection is shared by all of the maps with these bounds;
+        # only the axes it draws on are new
+        m = self._getLayers(gd)['basemap']
+        m.ax = ax
+        return m
+
+    def _makeBasemap(self, gd):
+        """Make the map projection.
+
+        Args:
+            gd (GeoDict): MapIO GeoDict defining bounds of the map.
+
+        Returns:
+            Basemap: Basemap instance, Mercator projection (with no axes).
+        """
+        clon = gd.xmin + (gd.xmax - gd.xmin) / 2.0
+        clat = gd.ymin + (gd.ymax - gd.ymin) / 2.0
         m = Basemap(llcrnrlon=gd.xmin, llcrnrlat=gd.ymin, urcrnrlon=gd.xmax,
                     urcrnrlat=gd.ymax, rsphere=(6378137.00, 6356752.3142),
                     resolution=BASEMAP_RESOLUTION, projection='merc',
-                    lat_0=clat, lon_0=clon, lat_ts=clat, ax=ax,
+                    lat_0=clat, lon_0=clon, lat_ts=clat, ax=None,
                     suppress_ticks=True)
         return m
 
+    def _layerKey(self, gd):
+        """The key of a map's layers in the layer cache.
+        """
+        return (gd.xmin, gd.xmax, gd.ymin, gd.ymax, gd.dx, gd.dy,
+                gd.nx, gd.ny)
+
+    def _getLayers(self, gd):
+        """Get the map layers that do not depend on the IMT being mapped:
+        the projection, the projected topography and its hillshade, and
+        the projected vector layers. These are computed the first time a
+        map with the given bounds is drawn and reused afterward.
+
+        Args:
+            gd (GeoDict): MapIO GeoDict defining bounds/resolution of the
+                map; it must be aligned with the topography grid.
+
+        Returns:
+            dict: Dictionary containing fields:
+
+                - basemap: Basemap instance, Mercator projection (with
+                  no axes).
+                - topo: Projected topography.
+                - shade: Hillshade intensity of the projected topography.
+                - hillshade: Colored, shaded topography (see _getShaded()).
+                - boundaries: List of projected (x, y) country and state
+                  boundary lines.
+                - coasts: List of projected (x, y) coastlines.
+                - lakes: List of projected lake Paths.
+                - oceans: List of projected ocean Paths.
+        """
+        key = self._layerKey(gd)
+        if key in self._layers:
+            return self._layers[key]
+
+        t1 = time.time()
+        m = self._makeBasemap(gd)
+
+        # get topo layer and project it
+        topogrid = GMTGrid.load(
+            self.topofile, samplegeodict=gd, resample=False)
+        topodata = topogrid.getData().copy()
+        ptopo = self._projectGrid(topodata, m, gd)
+        shade = self._getHillshade(ptopo)
+
+        layers = {
+            'basemap': m,
+            'topo': ptopo,
+            'shade': shade,
+            'hillshade': self._getShaded(ptopo, shade),
+            'boundaries': self._projectBoundaries(m),
+            'coasts': self._projectCoastlines(m),
+            'lakes': [patch.get_path()
+                      for lake in self.vectors['lake']
+                      for patch in getProjectedPatches(lake, m)],
+            'oceans': []
+        }
+        if len(self.vectors['ocean']):
+            ocean = self.vectors['ocean'][0]  # this is one shapely polygon
+            layers['oceans'] = [patch.get_path()
+                                for patch in getProjectedPatches(ocean, m)]
+        self._layers[key] = layers
+        t2 = time.time()
+        self.logger.debug('%.1f seconds to prepare map layers.' % (t2 - t1))
+        return layers
+
+    def getSampleDict(self, imt):
+        """Get the bounds and resolution of the map of an IMT: the part
+        of the topography grid that is inside the ShakeMap.
+
+        Args:
+            imt (str): The IMT.
+
+        Returns:
+            GeoDict: GeoDict of the map, aligned with the topography.
+        """
+        topodict = GMTGrid.getFileGeoDict(self.topofile)[0]
+        comp = self.container.getComponents(imt)[0]
+        imtdict = self.container.getIMTGrids(imt, comp)
+        smdict = imtdict['mean'].getGeoDict()
+        return topodict.getBoundsWithin(smdict)
+
+    def shareLayers(self, gd, folder):
+        """Get the map layers for a map (see _getLayers()) in a form that
+        can be sent to worker processes: the arrays are written to files
+        that the workers can memory-map.
+
+        Args:
+            gd (GeoDict): GeoDict of the map (see getSampleDict()).
+            folder (str): Directory in which to write the arrays; it must
+                exist until the workers are done with them.
+
+        Returns:
+            dict: Shared layers, for useSharedLayers().
+        """
+        layers = self._getLayers(gd)
+        shared = {'geodict': gd, 'files': {}, 'vectors': {}}
+        for name, layer in layers.items():
+            if name == 'basemap':
+                continue
+            if isinstance(layer, np.ndarray):
+                filename = os.path.join(folder, '%s.npy' % name)
+                np.save(filename, layer)
+                shared['files'][name] = filename
+            else:
+                shared['vectors'][name] = layer
+        return shared
+
+    def useSharedLayers(self, shared):
+        """Use map layers made by another process's shareLayers() instead
+        of computing them. Only the projection is made again.
+
+        Args:
+            shared (dict): Shared layers from shareLayers().
+        """
+        gd = shared['geodict']
+        layers = dict(shared['vectors'])
+        layers['basemap'] = self._makeBasemap(gd)
+        for name, filename in shared['files'].items():
+            layers[name] = np.load(filename, mmap_mode='r')
+        self._layers[self._layerKey(gd)] = layers
+
+    def copyForWorker(self, imt):
+        """Get a copy of this MapMaker that can be sent to a worker
+        process to draw the map of one IMT. The copy has the container
+        data it needs for the map, but not the container itself, and it
+        has no logger; the worker must set one.
+
+        Args:
+            imt (str): The IMT to be mapped.
+
+        Returns:
+            MapMaker: The copy.
+        """
+        mapmaker = copy.copy(self)
+        mapmaker.container = _MapData(self.container, [imt])
+        mapmaker._layers = {}
+        mapmaker.logger = None
+        return mapmaker
+
     def _projectGrid(self, data, m, gd):
         """Project 2D array to map projection.
 
@@ -533,12 +868,29 @@ class MapMaker(object):
                                    checkbounds=False, order=1, masked=False)
         return pdata
 
-    def _getDraped(self, data, topodata):
+    def _getHillshade(self, ptopo):
+        """Get the hillshade intensity of topography, as lit from the
+        northwest and the southwest.
+
+        Args:
+            ptopo (ndarray): Numpy array of projected topography data.
+
+        Returns:
+            ndarray: Numpy array of hillshade intensity.
+        """
+        ls1 = LightSource(azdeg=120, altdeg=45)
+        ls2 = LightSource(azdeg=225, altdeg=45)
+        intensity1 = ls1.hillshade(ptopo, fraction=0.25, vert_exag=VERT_EXAG)
+        intensity2 = ls2.hillshade(ptopo, fraction=0.25, vert_exag=VERT_EXAG)
+        return intensity1 * 0.5 + intensity2 * 0.5
+
+    def _getDraped(self, data, shade):
         """Get array of data "draped" on topography.
 
         Args:
             data (ndarray): 2D Numpy array.
-            topodata (ndarray): 2D Numpy array.
+            shade (ndarray): 2D Numpy array of topographic hillshade
+                intensity (see _getHillshade()).
 
         Returns:
             ndarray: Numpy array of data draped on topography.
@@ -550,27 +902,22 @@ class MapMaker(object):
         rgb = np.squeeze(rgba_img[:, :, 0:3])
         # use lightsource class to make our shaded topography
         ls = LightSource(azdeg=135, altdeg=45)
-        # intensity = ls.hillshade(ptopo,fraction=0.25,vert_exag=1.0)
-
-        ls1 = LightSource(azdeg=120, altdeg=45)
-        ls2 = LightSource(azdeg=225, altdeg=45)
-        intensity1 = ls1.hillshade(
-            topodata, fraction=0.25, vert_exag=VERT_EXAG)
-        intensity2 = ls2.hillshade(
-            topodata, fraction=0.25, vert_exag=VERT_EXAG)
-        intensity = intensity1 * 0.5 + intensity2 * 0.5
 
-        draped_hsv = ls.blend_hsv(rgb, np.expand_dims(intensity, 2))
+        draped_hsv = ls.blend_hsv(rgb, np.expand_dims(shade, 2))
 
         return draped_hsv
 
-    def _drawBoundaries(self, m):
-        """Draw all country/state boundaries on the map.
+    def _projectBoundaries(self, m):
+        """Project all country/state boundaries.
 
         Args:
             m (Basemap): Basemap instance.
 
+        Returns:
+            list: A list of (x, y) tuples of boundary lines in map
+            coordinates.
         """
+        lines = []
         allshapes = self.vectors['country'] + self.vectors['state']
         for shape in allshapes:
             # shape is a geojson-like mapping thing
@@ -579,16 +926,41 @@ class MapMaker(object):
                     blon, blat = zip(*shape.exterior.coords[:])
                 else:
                     blon, blat = zip(*shape.coords[:])
-                bx, by = m(blon, blat)
-                m.plot(bx, by, 'k', zorder=BORDER_ZORDER)
+                lines.append(m(blon, blat))
             except NotImplementedError:
                 for tshape in shape:
                     try:
                         blon, blat = zip(*tshape.exterior.coords[:])
-                        bx, by = m(blon, blat)
-                        m.plot(bx, by, 'k', zorder=BORDER_ZORDER)
+                        lines.append(m(blon, blat))
                     except NotImplementedError:
                         continue
+        return lines
+
+    def _drawLines(self, m, lines):
+        """Draw projected black lines (boundaries or coastlines) on the map
+        as a single collection.
+
+        Args:
+            m (Basemap): Basemap instance.
+            lines (list): A list of (x, y) tuples in map coordinates.
+        """
+        if not len(lines):
+            return
+        segments = [np.column_stack((x, y)) for x, y in lines]
+        collection = LineCollection(
+            segments, colors='k', zorder=BORDER_ZORDER,
+            linewidths=matplotlib.rcParams['lines.linewidth'])
+        m.ax.add_collection(collection, autolim=False)
+
+    def _drawBoundaries(self, m, layers):
+        """Draw all country/state boundaries on the map.
+
+        Args:
+            m (Basemap): Basemap instance.
+            layers (dict): Map layers (see _getLayers()).
+
+        """
+        self._drawLines(m, layers['boundaries'])
 
     def _drawRoads(self, m):
         """Draw all roads on the map.
@@ -627,31 +999,31 @@ class MapMaker(object):
             bx, by = m(blon, blat)
             m.plot(bx, by, '#808080', zorder=ROAD_ZORDER)
 
-    def _drawLakes(self, m, gd):
+    def _drawLakes(self, m, layers):
         """Draw all lakes on the map.
 
         Args:
             m (Basemap): Basemap instance.
+            layers (dict): Map layers (see _getLayers()).
 
         """
-        lakes = self.vectors['lake']
-        for lake in lakes:
-            ppatches = getProjectedPatches(lake, m, edgecolor='k')
-            for ppatch in ppatches:
-                m.ax.add_patch(ppatch)
+        for path in layers['lakes']:
+            m.ax.add_patch(PathPatch(
+                path, facecolor=WATERCOLOR, edgecolor='k',
+                zorder=OCEAN_ZORDER, linewidth=1, fill=True, visible=True))
 
-    def _drawOceans(self, m, gd):
+    def _drawOceans(self, m, layers):
         """Draw all oceans on the map.
 
         Args:
             m (Basemap): Basemap instance.
+            layers (dict): Map layers (see _getLayers()).
 
         """
-        if len(self.vectors['ocean']):
-            ocean = self.vectors['ocean'][0]  # this is one shapely polygon
-            ppatches = getProjectedPatches(ocean, m)
-            for ppatch in ppatches:
-                m.ax.add_patch(ppatch)
+        for path in layers['oceans']:
+            m.ax.add_patch(PathPatch(
+                path, facecolor=WATERCOLOR, edgecolor=WATERCOLOR,
+                zorder=OCEAN_ZORDER, linewidth=1, fill=True, visible=True))
 
     def _drawMapScale(self, m, gd):
         """Draw a map scale in the lower left corner of the map.
@@ -681,29 +1053,39 @@ class MapMaker(object):
         m.drawmapscale(scalex, scaley, clon, clat, length,
                        barstyle='fancy', yoffset=yoff, zorder=SCALE_ZORDER)
 
-    def _drawCoastlines(self, m, gd):
-        """Draw all coastlines on the map.
+    def _projectCoastlines(self, m):
+        """Project all coastlines.
 
         Args:
             m (Basemap): Basemap instance.
-            gd (GeoDict): MapIO GeoDict instance.
 
+        Returns:
+            list: A list of (x, y) tuples of coastlines in map coordinates.
         """
+        lines = []
         coasts = self.vectors['coast']
         for coast in coasts:  # these are polygons?
             if isinstance(coast, sPolygon):
                 clon, clat = zip(*coast.exterior.coords[:])
-                cx, cy = m(clon, clat)
-                m.plot(cx, cy, 'k', zorder=BORDER_ZORDER)
+                lines.append(m(clon, clat))
             elif isinstance(coast, LineString):
                 clon, clat = zip(*coast.coords[:])
-                cx, cy = m(clon, clat)
-                m.plot(cx, cy, 'k', zorder=BORDER_ZORDER)
+                lines.append(m(clon, clat))
             else:
                 for tshape in coast:
                     clon, clat = zip(*tshape.coords[:])
-                    cx, cy = m(clon, clat)
-                    m.plot(cx, cy, 'k', zorder=BORDER_ZORDER)
+                    lines.append(m(clon, clat))
+        return lines
+
+    def _drawCoastlines(self, m, layers):
+        """Draw all coastlines on the map.
+
+        Args:
+            m (Basemap): Basemap instance.
+            layers (dict): Map layers (see _getLayers()).
+
+        """
+        self._drawLines(m, layers['coasts'])
 
     def _drawGraticules(self, m, gd):
         """Draw meridian/parallels on the map.
@@ -932,27 +1314,23 @@ class MapMaker(object):
 
         gd = mmigrid.getGeoDict()
 
-        # establish the basemap object
+        # establish the basemap object; the projected topography comes
+        # with it
         m = self._setMap(gd)
-
-        # get topo layer and project it
-        topogrid = GMTGrid.load(
-            self.topofile, samplegeodict=sampledict, resample=False)
-        topodata = topogrid.getData().copy()
-        ptopo = self._projectGrid(topodata, m, gd)
+        layers = self._getLayers(gd)
 
         # get intensity layer and project it
         imtdata = mmigrid.getData().copy()
         pimt = self._projectGrid(imtdata, m, gd)
 
         # get the draped intensity data
-        draped_hsv = self._getDraped(pimt, ptopo)  # where will 10.0 come from
+        draped_hsv = self._getDraped(pimt, layers['shade'])
 
         # draw the draped intensity data
         m.imshow(draped_hsv, interpolation='none', zorder=IMG_ZORDER)
 
         # draw country/state boundaries
-        self._drawBoundaries(m)
+        self._drawBoundaries(m, layers)
 
         # draw whatever road data is available
         # self.logger.debug('Drawing roads...')
@@ -960,16 +1338,13 @@ class MapMaker(object):
         # self.logger.debug('Done drawing roads...')
 
         # draw lakes
-        self._drawLakes(m, gd)
+        self._drawLakes(m, layers)
 
         # draw oceans (pre-processed with islands taken out)
-        t1 = time.time()
-        self._drawOceans(m, gd)
-        t2 = time.time()
-        self.logger.debug('%.1f seconds to render oceans.' % (t2 - t1))
+        self._drawOceans(m, layers)
 
         # draw coastlines
-        self._drawCoastlines(m, gd)
+        self._drawCoastlines(m, layers)
 
         # draw meridians, parallels, labels, ticks
         self._drawGraticules(m, gd)
@@ -1056,11 +1431,13 @@ class MapMaker(object):
 
         return outfile
 
-    def _getShaded(self, ptopo):
+    def _getShaded(self, ptopo, shade):
         """Get shaded topography.
 
         Args:
             ptopo (ndarray): Numpy array of projected topography data.
+            shade (ndarray): Numpy array of hillshade intensity (see
+                _getHillshade()).
 
         Returns:
             ndarray: Numpy array of light-shaded topography.
@@ -1068,16 +1445,12 @@ class MapMaker(object):
         """
         maxvalue = self.contour_colormap.vmax
         ls1 = LightSource(azdeg=120, altdeg=45)
-        ls2 = LightSource(azdeg=225, altdeg=45)
-        intensity1 = ls1.hillshade(ptopo, fraction=0.25, vert_exag=VERT_EXAG)
-        intensity2 = ls2.hillshade(ptopo, fraction=0.25, vert_exag=VERT_EXAG)
-        intensity = intensity1 * 0.5 + intensity2 * 0.5
 
         ptoposc = ptopo / maxvalue
         rgba = self.contour_colormap.cmap(ptoposc)
         rgb = np.squeeze(rgba)
 
-        draped_hsv = ls1.blend_hsv(rgb, np.expand_dims(intensity, 2))
+        draped_hsv = ls1.blend_hsv(rgb, np.expand_dims(shade, 2))
 
         return draped_hsv
 
@@ -1097,6 +1470,49 @@ class MapMaker(object):
         correction = 0.5 if n >= 0 else -0.5
         return int(n / precision + correction) * precision
 
+    def _projectLines(self, m, feature):
+        """Project the lines of a contour feature.
+
+        Args:
+            m (Basemap): Basemap instance.
+            feature (dict): A contour feature (see
+                shakelib.plotting.contour.contour()).
+
+        Returns:
+            list: A list of (x, y) tuples of arrays in map coordinates.
+        """
+        lines = []
+        for line in feature['geometry']['coordinates']:
+            coords = np.array(line)
+            lines.append(m(coords[:, 0], coords[:, 1]))
+        return lines
+
+    def _getLabelPoints(self, lines, gd, m):
+        """Choose a label position on each contour line: the middle of
+        the part of the line that is on the map.
+
+        Args:
+            lines (list): Projected lines (see _projectLines()).
+            gd (GeoDict): GeoDict of the map.
+            m (Basemap): Basemap instance.
+
+        Returns:
+            list: A list of (x, y) label positions in map coordinates.
+        """
+        xmin, ymin = m(gd.xmin, gd.ymin)
+        xmax, ymax = m(gd.xmax, gd.ymax)
+        points = []
+        for x, y in lines:
+            x = np.asarray(x)
+            y = np.asarray(y)
+            inside = np.flatnonzero((x > xmin) & (x < xmax) &
+                                    (y > ymin) & (y < ymax))
+            if len(inside) == 0:
+                continue
+            middle = inside[len(inside) // 2]
+            points.append((x[middle], y[middle]))
+        return points
+
     def drawContourMap(self, imt, outfolder, cmin=None, cmax=None):
         """
         Render IMT data as contours over topography, with oceans, coastlines,
@@ -1123,88 +1539,38 @@ class MapMaker(object):
         # get a geodict that is aligned with topo, but inside shakemap
         sampledict = topodict.getBoundsWithin(smdict)
 
-        imtgrid = imtgrid.interpolateToGrid(sampledict)
-
-        gd = imtgrid.getGeoDict()
+        gd = sampledict
 
-        # establish the basemap object
+        # establish the basemap object; the shaded topography comes
+        # with it
         m = self._setMap(gd)
+        layers = self._getLayers(gd)
 
-        # get topo layer and project it
-        topogrid = GMTGrid.load(
-            self.topofile, samplegeodict=sampledict, resample=False)
-        topodata = topogrid.getData().copy()
-        ptopo = self._projectGrid(topodata, m, gd)
-
-        # get contour layer and project it1
-        imtdata = imtgrid.getData().copy()
-
-        # convert units if necessary
-        if imt == 'MMI':
-            pass
-        elif imt == 'PGV':
-            imtdata = np.exp(imtdata)
-        else:
-            imtdata = np.exp(imtdata) * 100
-
-        pimt = self._projectGrid(imtdata, m, gd)
-
-        # get the draped intensity data
-        hillshade = self._getShaded(ptopo)
-
-        # draw the draped intensity data
-        m.imshow(hillshade, interpolation='none', zorder=IMG_ZORDER)
+        # draw the shaded topography
+        m.imshow(layers['hillshade'], interpolation='none', zorder=IMG_ZORDER)
 
-        # draw the contours of imt data
-        xmin = gd.xmin
-        if gd.xmax < gd.xmin:
-            xmin -= 360
-        lons = np.linspace(xmin, gd.xmax, gd.nx)
-        # backwards so it plots right side up
-        lats = np.linspace(gd.ymax, gd.ymin, gd.ny)
-        x, y = m(*np.meshgrid(lons, lats))
-        pimt = gaussian_filter(pimt, 5.0)
-        dmin = pimt.min()
-        dmax = pimt.max()
+        # draw the contours of imt data; these are the same (cached)
+        # contours that the contour and kml modules produce
+        line_strings = contour(self.container, imt, comp,
+                               DEFAULT_FILTER_SIZE)
         if imt == 'MMI':
-            levels = getContourLevels(dmin, dmax, itype='linear')
-            mmimap = ColorPalette.fromPreset('mmi')
-
-            for level in levels:
-                # First, draw contours at half unit locations
+            for feature in line_strings:
+                level = feature['properties']['value']
+                color = feature['properties']['color']
+                lines = self._projectLines(m, feature)
                 if (level * 2) % 2 == 1:
-                    # Show dashed contours everywhere
-                    m.contour(x, y, np.flipud(pimt),
-                              linestyles='dashed',
-                              cmap=mmimap.cmap,
-                              vmin=mmimap.vmin,
-                              vmax=mmimap.vmax,
-                              levels=level,
-                              zorder=DASHED_CONTOUR_ZORDER)
-
-                    # Solid contours on land
-                    m.contour(x, y, np.flipud(pimt),
-                              cmap=mmimap.cmap,
-                              vmin=mmimap.vmin,
-                              vmax=mmimap.vmax,
-                              levels=level,
-                              zorder=CONTOUR_ZORDER)
-
-                # Put contour labels at the whole unit locations
+                    # Draw contours at half unit locations: dashed
+                    # everywhere, solid on land
+                    for x, y in lines:
+                        m.plot(x, y, color=color, linestyle='dashed',
+                               zorder=DASHED_CONTOUR_ZORDER)
+                        m.plot(x, y, color=color, zorder=CONTOUR_ZORDER)
                 else:
-                    cs = m.contour(x, y, np.flipud(pimt),
-                                   linestyles='dashed',
-                                   cmap=mmimap.cmap,
-                                   vmin=mmimap.vmin,
-                                   vmax=mmimap.vmax,
-                                   levels=level,
-                                   linewidths=0.0,
-                                   zorder=DASHED_CONTOUR_ZORDER)
-                    labs = cs.clabel(fontsize=0, fmt='%.0f')
-                    for clabel in labs:
-                        cx, cy = clabel.get_position()
-                        label_str = clabel.get_text()
-                        roman_label = MMI_LABELS[label_str]
+                    # Put contour labels at the whole unit locations
+                    roman_label = MMI_LABELS.get('%.0f' % level)
+                    if roman_label is None:
+                        continue
+                    for cx, cy in self._getLabelPoints(lines, gd, m):
                         th = plt.text(cx, cy, roman_label,
                                       zorder=DASHED_CONTOUR_ZORDER,
                                       ha='center',
@@ -1218,45 +1584,35 @@ class MapMaker(object):
                              path_effects.Normal()])
 
         else:
-            levels = getContourLevels(dmin, dmax)
-
-            # Show dashed contours everywhere
-            m.contour(x, y, np.flipud(pimt), colors='w',
-                      linestyles='dashed',
-                      cmap=None,
-                      levels=levels,
-                      zorder=DASHED_CONTOUR_ZORDER)
-
-            # Solid contours on land
-            cs = m.contour(x, y, np.flipud(pimt), colors='w',
-                           cmap=None,
-                           levels=levels,
-                           zorder=CONTOUR_ZORDER)
-            clabels = plt.clabel(cs, colors='k', fmt='%.3g',
-                                 fontsize=8.0,
-                                 zorder=CONTOUR_ZORDER)
-
-            # Put labels at the dashed zorder so that they are not maksed by
-            # oceans
-            for cl in clabels:
-                bbox = dict(boxstyle="round", facecolor='white', edgecolor='w')
-                cl.set_bbox(bbox)
-                cl.set_zorder(DASHED_CONTOUR_ZORDER)
+            for feature in line_strings:
+                level = feature['properties']['value']
+                lines = self._projectLines(m, feature)
+                for x, y in lines:
+                    # Show dashed contours everywhere
+                    m.plot(x, y, color='w', linestyle='dashed',
+                           zorder=DASHED_CONTOUR_ZORDER)
+                    # Solid contours on land
+                    m.plot(x, y, color='w', zorder=CONTOUR_ZORDER)
+                # Put labels at the dashed zorder so that they are not
+                # masked by oceans
+                bbox = dict(boxstyle="round", facecolor='white',
+                            edgecolor='w')
+                for cx, cy in self._getLabelPoints(lines, gd, m):
+                    plt.text(cx, cy, '%.3g' % level, color='k',
+                             fontsize=8.0, ha='center', va='center',
+                             bbox=bbox, zorder=DASHED_CONTOUR_ZORDER)
 
         # draw country/state boundaries
-        self._drawBoundaries(m)
+        self._drawBoundaries(m, layers)
 
         # draw lakes
-        self._drawLakes(m, gd)
+        self._drawLakes(m, layers)
 
         # draw oceans (pre-processed with islands taken out)
-        t1 = time.time()
-        self._drawOceans(m, gd)
-        t2 = time.time()
-        self.logger.debug('%.1f seconds to render oceans.' % (t2 - t1))
+        self._drawOceans(m, layers)
 
         # draw coastlines
-        self._drawCoastlines(m, gd)
+        self._drawCoastlines(m, layers)
 
         # draw meridians, parallels, labels, ticks
         self._drawGraticules(m, gd)
@@ -2,18 +2,21 @@
 Process a ShakeMap, based on the configuration and data found in
 shake_data.hdf, and produce output in shake_result.hdf.
 """
-import warnings
 import os.path
+import argparse
+import inspect
 import time as time
 import copy
 from time import gmtime, strftime
 import shutil
+import threading
+import itertools
 from collections import OrderedDict
 
 import numpy as np
 import numpy.ma as ma
 import numexpr as ne
-from mpl_toolkits.basemap import maskoceans
+from scipy.ndimage import distance_transform_edt
 from openquake.hazardlib import imt
 import openquake.hazardlib.const as oqconst
 
@@ -33,6 +36,7 @@ from shakelib.utils.imt_string import oq_to_file
 from shakelib.utils.containers import ShakeMapInputContainer
 from shakelib.utils.containers import ShakeMapOutputContainer
 from shakelib.utils.distance import geodetic_distance_fast
+from shakelib.utils.landmask import get_land_mask
 
 from mapio.geodict import GeoDict
 from mapio.grid2d import Grid2D
@@ -91,6 +95,40 @@ class ModelModule(CoreModule):
                      'type': 'application/x-bag'}]
     }
 
+    def __init__(self, eventid, do_regression=True):
+        """
+        Instantiate a ModelModule class with an event ID.
+        """
+        super(ModelModule, self).__init__(eventid)
+        self.do_regression = do_regression
+
+    def parseArgs(self, arglist):
+        """
+        Set up the object to accept the --no-regression flag.
+        """
+        parser = argparse.ArgumentParser(
+            prog=self.__class__.command_name,
+            description=inspect.getdoc(self.__class__))
+        parser.add_argument('-n', '--no-regression', action='store_true',
+                            help='Do not compute the ground motions on rock '
+                            'and soil for the regression plots. This '
+                            'saves two GMPE evaluations per IMT over the '
+                            'whole grid, but plotregr cannot be run on the '
+                            'results.')
+        #
+        # This line should be in any modules that overrides this
+        # one. It will collect up everything after the current
+        # modules options in args.rem, which should be returned
+        # by this function. Note: doing parser.parse_known_args()
+        # will not work as it will suck up any later modules'
+        # options that are the same as this one's.
+        #
+        parser.add_argument('rem', nargs=argparse.REMAINDER,
+                            help=argparse.SUPPRESS)
+        args = parser.parse_args(arglist)
+        self.do_regression = not args.no_regression
+        return args.rem
+
     def execute(self):
         """
         Interpolate ground motions to a grid or list of locations.
@@ -128,8 +166,14 @@ class ModelModule(CoreModule):
             pgv_imt = imt.from_string('PGV')
             ipe_gmpe = MultiGMPE.from_config(self.config, filter_imt=pgv_imt)
             self.ipe = VirtualIPE.fromFuncs(ipe_gmpe, self.gmice)
+            # The IPE's ground motions are the PGV predictions if it
+            # converts from PGV, so those can be shared
+            self.share_ipe_preds = self.ipe.imt == pgv_imt
         else:
             self.ipe = get_object_from_config('ipe', 'modeling', self.config)
+            self.share_ipe_preds = False
+        self.shared_preds = {}
+        self.shared_pred_locks = {}
         # ------------------------------------------------------------------
         # Get the rupture object and rupture context
         # ------------------------------------------------------------------
@@ -239,30 +283,46 @@ class ModelModule(CoreModule):
         self.rocksd = {}
         self.soilsd = {}
 
+        #
+        # The GMPE of each output IMT, the station terms of the MVN for
+        # each output IMT, and the maximum of each output IMT (at all of
+        # the output points, and at the points on land)
+        #
+        self.imt_gmpes = {}
+        self.station_mvn = {}
+        self.out_max = {}
+
         self.logger.debug('Doing MVN...')
-        with cf.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-            ex.map(self._computeMVN, self.imt_out_set)
-#        self._computeMVN()
+        if self.stream_points:
+            #
+            # Do the points a chunk at a time, and store the results as
+            # they are made
+            #
+            oc = self._createOutputContainer()
+            self._computePointChunks(oc)
+            moutgrid = None
+        else:
+            with cf.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                if self.adaptive:
+                    self._computeAdaptiveMVN(ex)
+                else:
+                    ex.map(self._computeMVN, self.imt_out_set)
+            self.shared_preds.clear()
+
+            oc = self._createOutputContainer()
+            #
+            # We're going to need masked arrays of the output grids later,
+            # so make them now.
+            #
+            moutgrid = self._getMaskedGrids()
+            self._updateMaxima(moutgrid)
 
         # ------------------------------------------------------------------
-        # Output the data and metadata
-        # ------------------------------------------------------------------
-        product_path = os.path.join(self.datadir, 'products')
-        if not os.path.isdir(product_path):
-            os.mkdir(product_path)
-        oc = ShakeMapOutputContainer.create(os.path.join(
-            product_path, 'shake_result.hdf'))
-        # ------------------------------------------------------------------
-        # Might as well stick the whole config in the result
+        # Output the data and metadata. Might as well stick the whole
+        # config in the result.
         # ------------------------------------------------------------------
         oc.setConfig(self.config)
 
-        #
-        # We're going to need masked arrays of the output grids later, so
-        # make them now.
-        #
-        moutgrid = self._getMaskedGrids()
-
         #
         # Get the info dictionary that will become info.json, and
         # store it in the output container
@@ -288,10 +348,10 @@ class ModelModule(CoreModule):
         # ------------------------------------------------------------------
         if self.do_grid:
             self._storeGriddedData(oc)
-        else:
+        elif not self.stream_points:
             self._storePointData(oc)
 
-        if self.do_grid:
+        if self.do_grid and self.do_regression:
             self._storeRegressionData(oc)
 
         oc.close()
@@ -334,6 +394,19 @@ class ModelModule(CoreModule):
         if os.path.isdir(products_path):
             shutil.rmtree(products_path, ignore_errors=True)
 
+    def _createOutputContainer(self):
+        """
+        Create the output container, products/shake_result.hdf.
+
+        Returns:
+            ShakeMapOutputContainer: The output container.
+        """
+        product_path = os.path.join(self.datadir, 'products')
+        if not os.path.isdir(product_path):
+            os.mkdir(product_path)
+        return ShakeMapOutputContainer.create(os.path.join(
+            product_path, 'shake_result.hdf'))
+
     def _setConfigOptions(self):
         """
         Pull various useful configuration options out of the config
@@ -375,12 +448,46 @@ class ModelModule(CoreModule):
         self.smdx = self.config['interp']['prediction_location']['xres']
         self.smdy = self.config['interp']['prediction_location']['yres']
         # ------------------------------------------------------------------
+        # The number of points in the prediction file to process at a
+        # time (0 to do them all at once)
+        # ------------------------------------------------------------------
+        self.point_chunk_size = \
+            self.config['interp']['prediction_location'].get('chunk_size', 0)
+        # ------------------------------------------------------------------
+        # Adaptive grid parameters: the spacing of the coarse grid (as a
+        # multiple of xres and yres; 1 turns off the adaptive grid), and
+        # the distance (km) from the rupture and stations and the
+        # difference in the MVN's adjustment of the predictions between
+        # neighboring coarse points within which the coarse grid is
+        # refined
+        # ------------------------------------------------------------------
+        ploc = self.config['interp']['prediction_location']
+        self.coarse_factor = ploc.get('coarse_factor', 1)
+        self.refine_distance = ploc.get('refine_distance', 30.0)
+        self.refine_tolerance = ploc.get('refine_tolerance', 0.1)
+        # ------------------------------------------------------------------
+        # Do we skip the points of the output grid that are on water?
+        # ------------------------------------------------------------------
+        self.skip_water = ploc.get('skip_water', False)
+        # ------------------------------------------------------------------
         # Get the Vs30 file name
         # ------------------------------------------------------------------
         self.vs30default = self.config['data']['vs30default']
         self.vs30_file = self.config['data']['vs30file']
         if not self.vs30_file:
             self.vs30_file = None
+        # ------------------------------------------------------------------
+        # The land mask file and its resolution (arc-minutes); the file is
+        # made if it doesn't exist
+        # ------------------------------------------------------------------
+        self.landmask_grid = \
+            float(self.config['data'].get('landmask_resolution', 1.25))
+        self.landmask_file = self.config['data'].get('landmask_file', '')
+        if not self.landmask_file:
+            install_path, _ = get_config_paths()
+            self.landmask_file = os.path.join(
+                install_path, 'data',
+                'landmask_%gmin.npy' % self.landmask_grid)
 
     def _setOutputParams(self):
         """
@@ -392,52 +499,52 @@ class ModelModule(CoreModule):
         if self.config['interp']['prediction_location']['file'] and \
            self.config['interp']['prediction_location']['file'] != 'None':
             #
-            # FILE: Open the file and get the output points
+            # FILE: Open the file and get the extent and number of the
+            # output points. If the points are processed in chunks, they
+            # are read again (a chunk at a time) when the MVN is done;
+            # otherwise keep them.
             #
             self.do_grid = False
-            in_sites = np.genfromtxt(
-                self.config['interp']['prediction_location']['file'],
-                autostrip=True, unpack=True,
-                dtype=[np.float, np.float, np.float, '<U80'])
-            if np.size(in_sites) == 0:
+            self.adaptive = False
+            self.water_mask = None
+            self.land_fill = None
+            self.points_file = \
+                self.config['interp']['prediction_location']['file']
+            self.stream_points = self.point_chunk_size > 0
+            self.W = self.S = np.inf
+            self.E = self.N = -np.inf
+            self.smnx = 0
+            self.smny = 1
+            self.use_point_vs30 = False
+            points = None
+            for chunk in _read_points(self.points_file,
+                                      self.point_chunk_size):
+                lons, lats, vs30, _ = chunk
+                self.W = min(self.W, np.min(lons))
+                self.E = max(self.E, np.max(lons))
+                self.S = min(self.S, np.min(lats))
+                self.N = max(self.N, np.max(lats))
+                self.smnx += np.size(lons)
+                self.use_point_vs30 |= bool(np.any(vs30 > 0))
+                if not self.stream_points:
+                    points = chunk
+            if self.smnx == 0:
                 self.logger.info('Points file is empty; nothing to do')
                 return
-            elif np.size(in_sites) == 1:
-                lons, lats, vs30, idents = in_sites.item()
-                self.idents = [idents]
-            else:
-                lons, lats, vs30, self.idents = zip(*in_sites)
-            self.lons = np.array(lons).reshape(1, -1)
-            self.lats = np.array(lats).reshape(1, -1)
-            self.vs30 = np.array(vs30).reshape(1, -1)
-            self.depths = np.zeros_like(self.lats)
-            self.W = np.min(self.lons)
-            self.E = np.max(self.lons)
-            self.S = np.min(self.lats)
-            self.N = np.max(self.lats)
-            self.smnx = np.size(self.lons)
-            self.smny = 1
-            dist_obj_out = Distance(self.default_gmpe, self.lons, self.lats,
-                                    self.depths, self.rupture_obj)
 
             self.sites_obj_out = Sites.fromBounds(self.W, self.E, self.S,
                                                   self.N, self.smdx, self.smdy,
                                                   defaultVs30=self.vs30default,
                                                   vs30File=self.vs30_file,
                                                   padding=True, resample=True)
-
-            self.sx_out = self.sites_obj_out.getSitesContext(
-                {'lats': self.lats,
-                 'lons': self.lons})
-            # Replace the Vs30 from the grid (or default) with the Vs30
-            # provided with the site list.
-            if np.any(self.vs30 > 0):
-                self.sx_out.vs30 = self.vs30
+            if points is not None:
+                self._setPoints(*points)
         else:
             #
             # GRID: Figure out the grid parameters and get output points
             #
             self.do_grid = True
+            self.stream_points = False
 
             if self.config['interp']['prediction_location']['extent']:
                 self.W, self.S, self.E, self.N = \
@@ -452,12 +559,21 @@ class ModelModule(CoreModule):
                                                   vs30File=self.vs30_file,
                                                   padding=True, resample=True)
             self.smnx, self.smny = self.sites_obj_out.getNxNy()
+            #
+            # The adaptive grid needs at least two coarse cells in each
+            # direction to be worth doing
+            #
+            self.adaptive = self.coarse_factor > 1 and \
+                min(self.smnx, self.smny) >= 2 * self.coarse_factor
             self.sx_out = self.sites_obj_out.getSitesContext()
             #
             # Grids on rock and soil for the regression plots
             #
-            self.sx_rock = self.sites_obj_out.getSitesContext(rock_vs30=760)
-            self.sx_soil = self.sites_obj_out.getSitesContext(rock_vs30=180)
+            if self.do_regression:
+                self.sx_rock = \
+                    self.sites_obj_out.getSitesContext(rock_vs30=760)
+                self.sx_soil = \
+                    self.sites_obj_out.getSitesContext(rock_vs30=180)
             lons, lats = np.meshgrid(self.sx_out.lons,
                                      self.sx_out.lats)
             self.sx_out.lons = np.flipud(lons.copy())
@@ -469,11 +585,84 @@ class ModelModule(CoreModule):
                                               self.sites_obj_out,
                                               self.rupture_obj)
 
+            #
+            # TODO: This will break if the IPE needs distance measures
+            # that the GMPE doesn't; should make this a union of the
+            # requirements of both
+            #
+            self.dx_out = dist_obj_out.getDistanceContext()
+
+            self.lons_out_rad = np.radians(self.lons)
+            self.lats_out_rad = np.radians(self.lats)
+            self._setLandPoints()
+
+    def _setLandPoints(self):
+        """
+        If skip_water is set, make the water mask of the output grid now
+        (rather than after the MVN), and set up the MVN of the points on
+        land. If the grid is all land or all water, every point is
+        computed.
+
+        Returns:
+            nothing
+        """
+        self.water_mask = None
+        self.land_fill = None
+        if not self.skip_water:
+            return
+        self.water_mask = self._getWaterMask()
+        nwater = np.count_nonzero(self.water_mask)
+        self.logger.debug('Output grid has %d of %d points on water' %
+                          (nwater, self.water_mask.size))
+        if nwater == 0 or nwater == self.water_mask.size or self.adaptive:
+            # The adaptive grid leaves out the water in its refinement
+            return
+        shape = (self.smny, self.smnx)
+        self.land_index = _padded_index(~self.water_mask, self.smnx)
+        self.sx_land = _subset_context(self.sx_out, self.land_index, shape)
+        self.dx_land = _subset_context(self.dx_out, self.land_index, shape)
+        #
+        # The index of the nearest point on land of every point
+        #
+        self.land_fill = tuple(distance_transform_edt(
+            self.water_mask, return_distances=False, return_indices=True))
+
+    def _setPoints(self, lons, lats, vs30, idents):
+        """
+        Set the output points (all of the points in the prediction file,
+        or, when they are processed in chunks, the current chunk) and
+        make their sites and distance contexts.
+
+        Args:
+            lons (array): The longitudes of the points.
+            lats (array): The latitudes of the points.
+            vs30 (array): The Vs30 of the points.
+            idents (array): The IDs of the points.
+
+        Returns:
+            nothing
+        """
+        self.idents = idents
+        self.lons = np.array(lons).reshape(1, -1)
+        self.lats = np.array(lats).reshape(1, -1)
+        self.vs30 = np.array(vs30).reshape(1, -1)
+        self.depths = np.zeros_like(self.lats)
+
+        self.sx_out = self.sites_obj_out.getSitesContext(
+            {'lats': self.lats,
+             'lons': self.lons})
+        # Replace the Vs30 from the grid (or default) with the Vs30
+        # provided with the site list.
+        if self.use_point_vs30:
+            self.sx_out.vs30 = self.vs30
+
         #
         # TODO: This will break if the IPE needs distance measures
         # that the GMPE doesn't; should make this a union of the
         # requirements of both
         #
+        dist_obj_out = Distance(self.default_gmpe, self.lons, self.lats,
+                                self.depths, self.rupture_obj)
         self.dx_out = dist_obj_out.getDistanceContext()
 
         self.lons_out_rad = np.radians(self.lons)
@@ -525,9 +714,12 @@ class ModelModule(CoreModule):
                 gmpe = None
                 if imtstr != 'MMI':
                     gmpe = MultiGMPE.from_config(self.config, filter_imt=oqimt)
+                gm_pred = self._getSharedPrediction(oqimt, dfid, dfn.sx,
+                                                    dfn.dx,
+                                                    self.stddev_types)
                 pmean, pstddev = _gmas(self.ipe, gmpe, dfn.sx, self.rx,
                                        dfn.dx, oqimt, self.stddev_types,
-                                       self.apply_gafs)
+                                       self.apply_gafs, gm_pred)
                 df[imtstr + '_pred'] = pmean
                 df[imtstr + '_pred_sigma'] = pstddev[0]
                 if self.total_sd_only:
@@ -598,46 +790,55 @@ class ModelModule(CoreModule):
             return
 
         df2 = self.df2.df
+        oqimts = []
         for gmice_imt in self.gmice.DEFINED_FOR_INTENSITY_MEASURE_TYPES:
             if imt.SA == gmice_imt:
                 iterlist = self.gmice.DEFINED_FOR_SA_PERIODS
             else:
                 iterlist = [None]
             for period in iterlist:
-                oqimt = gmice_imt(period)
-                imtstr = str(oqimt)
-
-                np.seterr(invalid='ignore')
-                df2[imtstr], _ = self.gmice.getGMfromMI(df2['MMI'], oqimt,
-                                                        dists=df2['rrup'],
-                                                        mag=self.rx.mag)
-                df2[imtstr][df2['MMI'] < SM_CONSTS['min_mmi_convert']] = \
-                    np.nan
-                np.seterr(invalid='warn')
-                df2[imtstr + '_sd'] = \
-                    np.full_like(df2['MMI'], self.gmice.getMI2GMsd()[oqimt])
-                self.df2.imts.add(imtstr)
-                #
-                # Get the predictions and stddevs
-                #
-                gmpe = MultiGMPE.from_config(self.config, filter_imt=oqimt)
-                pmean, pstddev = _gmas(self.ipe, gmpe, self.df2.sx, self.rx,
-                                       self.df2.dx, oqimt, self.stddev_types,
-                                       self.apply_gafs)
-                df2[imtstr + '_pred'] = pmean
-                df2[imtstr + '_pred_sigma'] = pstddev[0]
-                if self.total_sd_only:
-                    tau_guess = SM_CONSTS['default_stddev_inter']
-                    df2[imtstr + '_pred_tau'] = np.full_like(
-                        df2[imtstr + '_pred'], tau_guess)
-                    df2[imtstr + '_pred_phi'] = np.sqrt(pstddev[0]**2 -
-                                                        tau_guess**2)
-                else:
-                    df2[imtstr + '_pred_tau'] = pstddev[1]
-                    df2[imtstr + '_pred_phi'] = pstddev[2]
-                df2[imtstr + '_residual'] = df2[imtstr] - pmean
-                df2[imtstr + '_outliers'] = np.full(
-                    pmean.shape, False, dtype=np.bool)
+                oqimts.append(gmice_imt(period))
+        #
+        # Convert the MMI to all of the IMTs at once
+        #
+        np.seterr(invalid='ignore')
+        derived_gms = self.gmice.getGMsfromMI(df2['MMI'], oqimts,
+                                              dists=df2['rrup'],
+                                              mag=self.rx.mag)
+        ix_low = df2['MMI'] < SM_CONSTS['min_mmi_convert']
+        np.seterr(invalid='warn')
+        for oqimt in oqimts:
+            imtstr = str(oqimt)
+
+            df2[imtstr], _ = derived_gms[oqimt]
+            df2[imtstr][ix_low] = np.nan
+            df2[imtstr + '_sd'] = \
+                np.full_like(df2['MMI'], self.gmice.getMI2GMsd()[oqimt])
+            self.df2.imts.add(imtstr)
+            #
+            # Get the predictions and stddevs
+            #
+            gmpe = MultiGMPE.from_config(self.config, filter_imt=oqimt)
+            gm_pred = self._getSharedPrediction(oqimt, 'df2', self.df2.sx,
+                                                self.df2.dx,
+                                                self.stddev_types)
+            pmean, pstddev = _gmas(self.ipe, gmpe, self.df2.sx, self.rx,
+                                   self.df2.dx, oqimt, self.stddev_types,
+                                   self.apply_gafs, gm_pred)
+            df2[imtstr + '_pred'] = pmean
+            df2[imtstr + '_pred_sigma'] = pstddev[0]
+            if self.total_sd_only:
+                tau_guess = SM_CONSTS['default_stddev_inter']
+                df2[imtstr + '_pred_tau'] = np.full_like(
+                    df2[imtstr + '_pred'], tau_guess)
+                df2[imtstr + '_pred_phi'] = np.sqrt(pstddev[0]**2 -
+                                                    tau_guess**2)
+            else:
+                df2[imtstr + '_pred_tau'] = pstddev[1]
+                df2[imtstr + '_pred_phi'] = pstddev[2]
+            df2[imtstr + '_residual'] = df2[imtstr] - pmean
+            df2[imtstr + '_outliers'] = np.full(
+                pmean.shape, False, dtype=np.bool)
 
     def _deriveMMIFromIMTs(self):
         """
@@ -686,9 +887,12 @@ class ModelModule(CoreModule):
         # Get the prediction and stddevs
         #
         gmpe = None
+        oqimt = imt.from_string('MMI')
+        gm_pred = self._getSharedPrediction(oqimt, 'df1', self.df1.sx,
+                                            self.df1.dx, self.stddev_types)
         pmean, pstddev = _gmas(self.ipe, gmpe, self.df1.sx, self.rx,
-                               self.df1.dx, imt.from_string('MMI'),
-                               self.stddev_types, self.apply_gafs)
+                               self.df1.dx, oqimt, self.stddev_types,
+                               self.apply_gafs, gm_pred)
         df1['MMI' + '_pred'] = pmean
         df1['MMI' + '_pred_sigma'] = pstddev[0]
         if self.total_sd_only:
@@ -852,125 +1056,361 @@ class ModelModule(CoreModule):
                 % (imtstr, self.nominal_bias[imtstr], np.sqrt(nom_variance),
                    np.size(sta_lons_rad_dl), bias_time))
 
+    def _getSharedPrediction(self, oqimt, sites, sx, dx, stddev_types):
+        """
+        When the IPE is a VirtualIPE that converts from PGV, the ground
+        motions it converts to MMI are the same PGV predictions that are
+        made for the PGV output, so they are made once for each set of
+        sites and shared. This returns those predictions (a tuple of the
+        mean and the list of standard deviations, which must not be
+        modified) if oqimt is MMI or the IPE's IMT, otherwise None.
+
+        Args:
+            oqimt: The OpenQuake IMT being predicted.
+            sites (str): A name for the set of sites (e.g., 'out' or 'df1').
+            sx: Sites context.
+            dx: Distance context.
+            stddev_types: list of OpenQuake standard deviation types.
+
+        Returns:
+            tuple or None: The mean and standard deviations of the IPE's
+            GMPE for the sites, or None.
+        """
+        if not self.share_ipe_preds or \
+                ('MMI' not in oqimt and oqimt != self.ipe.imt):
+            return None
+        key = (sites, tuple(stddev_types))
+        # The MVN runs in threads; only one of them makes the predictions
+        lock = self.shared_pred_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self.shared_preds:
+                self.shared_preds[key] = self.ipe.gmpe.get_mean_and_stddevs(
+                    copy.deepcopy(sx), self.rx, copy.deepcopy(dx),
+                    self.ipe.imt, stddev_types)
+        return self.shared_preds[key]
+
     def _computeMVN(self, imtstr):
         """
         Do the MVN computations
         """
-        time1 = time.time()
-        #
-        # Get the index of the (pesudo-) period of the output IMT
-        #
-        outperiod_ix = self.imt_per_ix[imtstr]
-        #
-        # Get the predictions at the output points
-        #
-        oqimt = imt.from_string(imtstr)
-        gmpe = None
-        if imtstr != 'MMI':
-            gmpe = MultiGMPE.from_config(self.config, filter_imt=oqimt)
-        pout_mean, pout_sd = _gmas(self.ipe, gmpe, self.sx_out,
-                                   self.rx, self.dx_out, oqimt,
-                                   self.stddev_types, self.apply_gafs)
-        if self.do_grid:
+        if self.land_fill is None:
+            mean, sd, psd = self._predictMVN(imtstr, 'out', self.sx_out,
+                                             self.dx_out, self.lons_out_rad,
+                                             self.lats_out_rad)
+        else:
+            #
+            # Only do the points on land, and give the points on water
+            # the values of the nearest point on land
+            #
+            shape = (self.smny, self.smnx)
+            fix = self.land_index
+            results = self._predictMVN(
+                imtstr, 'land', self.sx_land, self.dx_land,
+                self.lons_out_rad.reshape(shape)[fix],
+                self.lats_out_rad.reshape(shape)[fix])
+            mean, sd, psd = [_fill_water(x, fix, shape, self.land_fill)
+                             for x in results]
+        self.outgrid[imtstr] = mean
+        self.outsd[imtstr] = sd
+        if psd is not None:
+            self.psd[imtstr] = psd
+        if self.do_grid and self.do_regression:
             #
             # Fill the grids for the regression plots
             #
-            x_mean, x_sd = _gmas(self.ipe, gmpe, self.sx_rock,
-                                 self.rx, self.dx_out, oqimt,
-                                 [oqconst.StdDev.TOTAL], False)
-            self.rockgrid[imtstr] = x_mean
-            self.rocksd[imtstr] = x_sd[0]
-            x_mean, x_sd = _gmas(self.ipe, gmpe, self.sx_soil,
-                                 self.rx, self.dx_out, oqimt,
-                                 [oqconst.StdDev.TOTAL], False)
-            self.soilgrid[imtstr] = x_mean
-            self.soilsd[imtstr] = x_sd[0]
+            self.rockgrid[imtstr], self.rocksd[imtstr], \
+                self.soilgrid[imtstr], self.soilsd[imtstr] = \
+                self._getRegressionGrids(imtstr, '', self.sx_rock,
+                                         self.sx_soil, self.dx_out)
 
+    def _computeAdaptiveMVN(self, ex):
+        """
+        Do the MVN computations on the output grid adaptively. They are
+        first done on a coarse grid (every coarse_factor'th row and
+        column of the output grid). The coarse cells that are within
+        refine_distance of the rupture or a station, or across which the
+        MVN's adjustment of the prediction of an IMT changes by more
+        than refine_tolerance, are then done at the full resolution. In
+        the rest of the output grid, the mean is the prediction (made at
+        every point, so the site terms are at full resolution) plus the
+        adjustment interpolated from the coarse grid, and the standard
+        deviations are interpolated from the coarse grid. The results
+        are on the full output grid, just as if every point had been
+        computed.
+
+        Args:
+            ex (Executor): The executor with which to do the IMTs.
+        """
+        shape = (self.smny, self.smnx)
+        imts = list(self.imt_out_set)
+        lons_rad = self.lons_out_rad.reshape(shape)
+        lats_rad = self.lats_out_rad.reshape(shape)
+        #
+        # The coarse grid
+        #
+        rows = _coarse_index(self.smny, self.coarse_factor)
+        cols = _coarse_index(self.smnx, self.coarse_factor)
+        cix = np.ix_(rows, cols)
+        sx_coarse = _subset_context(self.sx_out, cix, shape)
+        dx_coarse = _subset_context(self.dx_out, cix, shape)
+        if self.do_regression:
+            sx_rock = _subset_context(self.sx_rock, cix, shape)
+            sx_soil = _subset_context(self.sx_soil, cix, shape)
+
+        def coarse_mvn(imtstr):
+            regr = None
+            if self.do_regression:
+                regr = self._getRegressionGrids(imtstr, '_coarse', sx_rock,
+                                                sx_soil, dx_coarse)
+            # The MVN's adjustment of the prediction varies smoothly, the
+            # prediction (with its site terms) may not
+            pred = self._predict(imtstr, 'out', self.sx_out, self.dx_out,
+                                 [oqconst.StdDev.TOTAL])[0]
+            mean, sd, psd = self._predictMVN(imtstr, 'coarse', sx_coarse,
+                                             dx_coarse, lons_rad[cix],
+                                             lats_rad[cix])
+            return (pred, mean - pred[cix], sd, psd), regr
+
+        coarse = dict(zip(imts, ex.map(coarse_mvn, imts)))
+        #
+        # Find the coarse cells to refine; the distance limit is
+        # extended by the size of a cell, since the rupture or a
+        # station may be in the middle of one
+        #
+        dist_limit = self.refine_distance + self.coarse_factor * 111.2 * \
+            np.sqrt(self.smdx**2 + self.smdy**2)
+        near = dx_coarse.rrup < dist_limit
+        near |= self._getNearStations(lons_rad[cix], lats_rad[cix],
+                                      dist_limit)
+        corners = _cell_corners(near)
+        refine = np.any(corners, axis=0)
+        for (_, adj, _, _), _ in coarse.values():
+            corners = _cell_corners(adj)
+            refine |= (np.max(corners, axis=0) - np.min(corners, axis=0)) > \
+                self.refine_tolerance
+        #
+        # Interpolate the coarse grids to the output grid
+        #
+        row_cells, row_weights = _interp_weights(rows, self.smny)
+        col_cells, col_weights = _interp_weights(cols, self.smnx)
+
+        def interp(grid):
+            return _interp_coarse(grid, row_cells, row_weights,
+                                  col_cells, col_weights)
+
+        for imtstr, ((pred, adj, sd, psd), regr) in coarse.items():
+            self.outgrid[imtstr] = pred + interp(adj)
+            self.outsd[imtstr] = interp(sd)
+            if psd is not None:
+                self.psd[imtstr] = interp(psd)
+            if regr is not None:
+                self.rockgrid[imtstr], self.rocksd[imtstr], \
+                    self.soilgrid[imtstr], self.soilsd[imtstr] = \
+                    [interp(x) for x in regr]
+        #
+        # Do the points in the refined cells (other than the coarse grid
+        # points) at full resolution. They are arranged in rows as long
+        # as the output grid's (the last one is padded with copies of the
+        # last point), so the MVN uses no more memory than it would on
+        # the full grid.
+        #
+        fine = refine[row_cells, :][:, col_cells]
+        fine[cix] = False
+        if self.water_mask is not None:
+            fine &= ~self.water_mask
+        nfine = np.count_nonzero(fine)
+        if nfine > 0:
+            fix = _padded_index(fine, self.smnx)
+            sx_fine = _subset_context(self.sx_out, fix, shape)
+            dx_fine = _subset_context(self.dx_out, fix, shape)
+
+            def fine_mvn(imtstr):
+                return self._predictMVN(imtstr, 'fine', sx_fine, dx_fine,
+                                        lons_rad[fix], lats_rad[fix])
+
+            for imtstr, (mean, sd, psd) in zip(imts, ex.map(fine_mvn, imts)):
+                self.outgrid[imtstr][fix] = mean
+                self.outsd[imtstr][fix] = sd
+                if psd is not None:
+                    self.psd[imtstr][fix] = psd
+        self.logger.debug('Adaptive grid: computed %d coarse and %d fine of '
+                          '%d points' % (np.size(rows) * np.size(cols),
+                                         nfine, self.smnx * self.smny))
+
+    def _getNearStations(self, lons_rad, lats_rad, dist):
+        """
+        Find the points that are within a distance of any station.
+
+        Args:
+            lons_rad (array): 2-D array of the longitudes of the points in
+                radians.
+            lats_rad (array): 2-D array of the latitudes of the points in
+                radians.
+            dist (float): The distance (km).
+
+        Returns:
+            array: Boolean array of the shape of lons_rad, True where
+            the point is within dist of a station.
+        """
+        near = np.zeros(lons_rad.shape, dtype=bool)
+        stations = [np.hstack((self.sta_lons_rad[x], self.sta_lats_rad[x]))
+                    for x in self.sta_lons_rad
+                    if np.size(self.sta_lons_rad[x]) > 0]
+        if not stations:
+            return near
+        stations = np.unique(np.vstack(stations), axis=0)
+        for iy in range(lons_rad.shape[0]):
+            dists = geodetic_distance_fast(lons_rad[iy:iy + 1, :],
+                                           lats_rad[iy:iy + 1, :],
+                                           stations[:, 0:1],
+                                           stations[:, 1:2])
+            near[iy, :] = np.min(dists, axis=0) < dist
+        return near
+
+    def _getIMTGMPE(self, imtstr):
+        """
+        Get the GMPE for an output IMT (None for MMI). The GMPE is made
+        once for each IMT (the MVN may be done for several sets of
+        points).
+        """
+        if imtstr not in self.imt_gmpes:
+            gmpe = None
+            if imtstr != 'MMI':
+                gmpe = MultiGMPE.from_config(
+                    self.config, filter_imt=imt.from_string(imtstr))
+            self.imt_gmpes[imtstr] = gmpe
+        return self.imt_gmpes[imtstr]
+
+    def _getRegressionGrids(self, imtstr, sites, sx_rock, sx_soil, dx):
+        """
+        Get the predictions on rock and soil for the regression plots.
+
+        Args:
+            imtstr (str): The output IMT.
+            sites (str): A name for the set of sites, which is added to
+                'rock' and 'soil' (see _getSharedPrediction()).
+            sx_rock: Sites context of the sites on rock.
+            sx_soil: Sites context of the sites on soil.
+            dx: Distance context of the sites.
+
+        Returns:
+            tuple: The mean and standard deviation on rock, and the mean
+            and standard deviation on soil.
+        """
+        oqimt = imt.from_string(imtstr)
+        gmpe = self._getIMTGMPE(imtstr)
+        sd_types = [oqconst.StdDev.TOTAL]
+        gm_pred = self._getSharedPrediction(oqimt, 'rock' + sites, sx_rock,
+                                            dx, sd_types)
+        rock_mean, rock_sd = _gmas(self.ipe, gmpe, sx_rock,
+                                   self.rx, dx, oqimt,
+                                   sd_types, False, gm_pred)
+        gm_pred = self._getSharedPrediction(oqimt, 'soil' + sites, sx_soil,
+                                            dx, sd_types)
+        soil_mean, soil_sd = _gmas(self.ipe, gmpe, sx_soil,
+                                   self.rx, dx, oqimt,
+                                   sd_types, False, gm_pred)
+        return rock_mean, rock_sd[0], soil_mean, soil_sd[0]
+
+    def _predict(self, imtstr, sites, sx, dx, stddev_types):
+        """
+        Get the (unconditioned) predictions for a set of sites.
+
+        Args:
+            imtstr (str): The output IMT.
+            sites (str): A name for the set of sites (see
+                _getSharedPrediction()).
+            sx: Sites context.
+            dx: Distance context.
+            stddev_types: list of OpenQuake standard deviation types.
+
+        Returns:
+            tuple: The mean and the list of standard deviations.
+        """
+        oqimt = imt.from_string(imtstr)
+        gmpe = self._getIMTGMPE(imtstr)
+        gm_pred = self._getSharedPrediction(oqimt, sites, sx, dx,
+                                            stddev_types)
+        return _gmas(self.ipe, gmpe, sx, self.rx, dx, oqimt, stddev_types,
+                     self.apply_gafs, gm_pred)
+
+    def _predictMVN(self, imtstr, sites, sx, dx, lons_rad, lats_rad):
+        """
+        Get the predictions for a set of sites and condition them on the
+        station data with the MVN.
+
+        Args:
+            imtstr (str): The output IMT.
+            sites (str): A name for the set of sites (see
+                _getSharedPrediction()).
+            sx: Sites context; its arrays have the shape (nrows, ncols).
+            dx: Distance context.
+            lons_rad (array): The longitudes of the sites in radians.
+            lats_rad (array): The latitudes of the sites in radians.
+
+        Returns:
+            tuple: The conditional mean and standard deviation at the
+            sites, and the within-event standard deviation (phi) of the
+            predictions, or None if there are no data for the IMT.
+        """
+        time1 = time.time()
+        #
+        # Get the predictions at the output points
+        #
+        pout_mean, pout_sd = self._predict(imtstr, sites, sx, dx,
+                                           self.stddev_types)
         #
         # If there are no data, just use the unbiased prediction
         # and the total stddev
         #
         if np.size(self.sta_lons_rad[imtstr]) == 0:
-            self.outgrid[imtstr] = pout_mean
-            self.outsd[imtstr] = pout_sd[0]
-            return
+            return pout_mean, pout_sd[0], None
+        #
+        # The station terms of the MVN only depend on the IMT
+        #
+        if imtstr not in self.station_mvn:
+            self.station_mvn[imtstr] = self._getStationMVN(imtstr)
         #
         # Get an array of the within-event standard deviations for the
         # output IMT at the output points
         #
         if self.total_sd_only:
-            self.psd[imtstr] = np.sqrt(
+            psd = np.sqrt(
                 pout_sd[0]**2 - SM_CONSTS['default_stddev_inter']**2)
-            self.tsd[imtstr] = np.full_like(
-                self.psd[imtstr], SM_CONSTS['default_stddev_inter'])
+            tsd = np.full_like(psd, SM_CONSTS['default_stddev_inter'])
         else:
-            self.psd[imtstr] = pout_sd[2]
-            self.tsd[imtstr] = pout_sd[1]
-        pout_sd2 = np.power(self.psd[imtstr], 2.0)
+            psd = pout_sd[2]
+            tsd = pout_sd[1]
+        pout_sd2 = np.power(psd, 2.0)
         #
         # Bias the predictions, and add the residual variance to
         # phi
         #
-        out_bias_var = 1.0 / ((1.0 / self.tsd[imtstr]**2) +
-                              self.bias_den[imtstr])
+        out_bias_var = 1.0 / ((1.0 / tsd**2) + self.bias_den[imtstr])
         out_bias = self.bias_num[imtstr] * out_bias_var
         pout_mean += out_bias.reshape(pout_mean.shape)
-        self.psd[imtstr] = np.sqrt(self.psd[imtstr]**2 + out_bias_var)
+        psd = np.sqrt(psd**2 + out_bias_var)
         pout_sd2 += out_bias_var.reshape(pout_sd2.shape)
         #
-        # Unbias the station residuals and compute the
-        # new phi that includes the variance of the bias
-        #
-        for i in range(np.size(self.sta_lons_rad[imtstr])):
-            imtin = self.sta_imtstr[imtstr][i]
-            in_bias_var = 1.0 / ((1.0 / self.sta_tau[imtstr][i, 0]**2) +
-                                 self.bias_den[imtin])
-            in_bias = self.bias_num[imtin] * in_bias_var
-            self.sta_resids[imtstr][i, 0] -= in_bias
-            self.sta_phi[imtstr][i, 0] = np.sqrt(
-                self.sta_phi[imtstr][i, 0]**2 + in_bias_var)
-        #
-        # Update the omega factors to account for the bias and the
-        # new value of phi
-        #
-        corr_adj = self.sta_phi[imtstr] / np.sqrt(
-            self.sta_phi[imtstr]**2 + self.sta_sig_extra[imtstr]**2)
-        corr_adj22 = corr_adj * corr_adj.T
-        np.fill_diagonal(corr_adj22, 1.0)
-        #
-        # Re-build the covariance matrix of the residuals with
-        # the full set of data
-        #
-        dist22 = geodetic_distance_fast(self.sta_lons_rad[imtstr],
-                                        self.sta_lats_rad[imtstr],
-                                        self.sta_lons_rad[imtstr].T,
-                                        self.sta_lats_rad[imtstr].T)
-        d22_rows, d22_cols = np.shape(dist22)  # should be square
-        t1_22 = np.tile(self.sta_period_ix[imtstr], (1, d22_cols))
-        t2_22 = np.tile(self.sta_period_ix[imtstr].T, (d22_rows, 1))
-        corr22 = self.ccf.getCorrelation(t1_22, t2_22, dist22)
-        #
-        # Rebuild sigma22_inv now that we have updated phi and
-        # the correlation adjustment factors
-        #
-        sigma22 = corr22 * corr_adj22 * \
-            (self.sta_phi[imtstr] * self.sta_phi[imtstr].T)
-        sigma22inv = np.linalg.pinv(sigma22)
-        #
         # Now do the MVN itself...
         #
+        corr_adj, sigma22inv, adj_resid = self.station_mvn[imtstr]
+        outperiod_ix = self.imt_per_ix[imtstr]
+        lons_out_rad = lons_rad.reshape(-1)
+        lats_out_rad = lats_rad.reshape(-1)
+        nrows, ncols = pout_mean.shape
         dtime = mtime = ddtime = ctime = stime = atime = 0
 
         ampgrid = np.zeros_like(pout_mean)
         sdgrid = np.zeros_like(pout_mean)
-        corr_adj12 = corr_adj * np.ones((1, self.smnx))  # noqa
-        for iy in range(self.smny):
-            ss = iy * self.smnx
-            se = (iy + 1) * self.smnx
+        corr_adj12 = corr_adj * np.ones((1, ncols))  # noqa
+        for iy in range(nrows):
+            ss = iy * ncols
+            se = (iy + 1) * ncols
             time4 = time.time()
             dist12 = geodetic_distance_fast(
-                self.lons_out_rad[ss:se].reshape(1, -1),
-                self.lats_out_rad[ss:se].reshape(1, -1),
+                lons_out_rad[ss:se].reshape(1, -1),
+                lats_out_rad[ss:se].reshape(1, -1),
                 self.sta_lons_rad[imtstr],
                 self.sta_lats_rad[imtstr])
             t2_12 = np.full(dist12.shape, outperiod_ix, dtype=np.int)
@@ -982,7 +1422,7 @@ class ModelModule(CoreModule):
             ctime += time.time() - time4
             time4 = time.time()
             # sdarr is the standard deviation of the output sites
-            sdarr = self.psd[imtstr][iy, :].reshape((1, -1))  # noqa
+            sdarr = psd[iy, :].reshape((1, -1))  # noqa
             # sdsta is the standard deviation of the stations
             sdsta = self.sta_phi[imtstr]  # noqa
             sigma12 = ne.evaluate(
@@ -999,7 +1439,6 @@ class ModelModule(CoreModule):
             #
             # This is the MVN solution for the conditional mean
             #
-            adj_resid = corr_adj * self.sta_resids[imtstr]
             ampgrid[iy, :] = \
                 pout_mean[iy, :] + rcmatrix.dot(adj_resid).reshape((-1,))
             atime += time.time() - time4
@@ -1015,9 +1454,7 @@ class ModelModule(CoreModule):
                 pout_sd2[iy, :] - np.sum(rcmatrix * sigma12, axis=1)
             mtime += time.time() - time4
 
-        self.outgrid[imtstr] = ampgrid
         sdgrid[sdgrid < 0] = 0
-        self.outsd[imtstr] = np.sqrt(sdgrid)
 
         self.logger.debug('\ttime for %s distance=%f' % (imtstr, ddtime))
         self.logger.debug('\ttime for %s correlation=%f' % (imtstr, ctime))
@@ -1027,6 +1464,78 @@ class ModelModule(CoreModule):
         self.logger.debug('\ttime for %s sd calc=%f' % (imtstr, mtime))
         self.logger.debug('total time for %s=%f' %
                           (imtstr, time.time() - time1))
+        return ampgrid, np.sqrt(sdgrid), psd
+
+    def _getStationMVN(self, imtstr):
+        """
+        Get the parts of the MVN that depend only on the stations: unbias
+        the station residuals (in place, so this must only be done once
+        for each IMT) and invert their covariance matrix.
+
+        Args:
+            imtstr (str): The output IMT.
+
+        Returns:
+            tuple: The correlation adjustment factors (omega) of the
+            stations, the inverse of the stations' covariance matrix
+            (sigma22inv), and the adjusted station residuals.
+        """
+        #
+        # Unbias the station residuals and compute the
+        # new phi that includes the variance of the bias
+        #
+        for i in range(np.size(self.sta_lons_rad[imtstr])):
+            imtin = self.sta_imtstr[imtstr][i]
+            in_bias_var = 1.0 / ((1.0 / self.sta_tau[imtstr][i, 0]**2) +
+                                 self.bias_den[imtin])
+            in_bias = self.bias_num[imtin] * in_bias_var
+            self.sta_resids[imtstr][i, 0] -= in_bias
+            self.sta_phi[imtstr][i, 0] = np.sqrt(
+                self.sta_phi[imtstr][i, 0]**2 + in_bias_var)
+        #
+        # Update the omega factors to account for the bias and the
+        # new value of phi
+        #
+        corr_adj = self.sta_phi[imtstr] / np.sqrt(
+            self.sta_phi[imtstr]**2 + self.sta_sig_extra[imtstr]**2)
+        corr_adj22 = corr_adj * corr_adj.T
+        np.fill_diagonal(corr_adj22, 1.0)
+        #
+        # Re-build the covariance matrix of the residuals with
+        # the full set of data
+        #
+        dist22 = geodetic_distance_fast(self.sta_lons_rad[imtstr],
+                                        self.sta_lats_rad[imtstr],
+                                        self.sta_lons_rad[imtstr].T,
+                                        self.sta_lats_rad[imtstr].T)
+        d22_rows, d22_cols = np.shape(dist22)  # should be square
+        t1_22 = np.tile(self.sta_period_ix[imtstr], (1, d22_cols))
+        t2_22 = np.tile(self.sta_period_ix[imtstr].T, (d22_rows, 1))
+        corr22 = self.ccf.getCorrelation(t1_22, t2_22, dist22)
+        #
+        # Rebuild sigma22_inv now that we have updated phi and
+        # the correlation adjustment factors
+        #
+        sigma22 = corr22 * corr_adj22 * \
+            (self.sta_phi[imtstr] * self.sta_phi[imtstr].T)
+        sigma22inv = np.linalg.pinv(sigma22)
+        adj_resid = corr_adj * self.sta_resids[imtstr]
+        return corr_adj, sigma22inv, adj_resid
+
+    def _getWaterMask(self):
+        """
+        Get the water mask of the output grid or points.
+
+        Returns:
+            array: Boolean array of the shape of the output grid, True
+            where the point is on water.
+        """
+        landmask = get_land_mask(self.landmask_file,
+                                 grid=self.landmask_grid)
+        if self.do_grid:
+            geodict = self.sites_obj_out.getVs30Grid().getGeoDict()
+            return landmask.getWaterMask(geodict)
+        return ~landmask.isLand(self.sx_out.lons, self.sx_out.lats)
 
     def _getMaskedGrids(self):
         """
@@ -1034,27 +1543,67 @@ class ModelModule(CoreModule):
         masked out.
         """
         moutgrid = {}
-        # We only need to make the mask for one IMT, then we can
-        # apply it to all of the other grids.
-        refimt = list(self.imt_out_set)[0]
-        #
-        # Don't know what to do about this warning; hopefully someone
-        # will fix maskoceans()
-        #
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore",
-                                    category=np.VisibleDeprecationWarning)
-            moutgrid[refimt] = \
-                maskoceans(self.sx_out.lons, self.sx_out.lats,
-                           self.outgrid[refimt], inlands=False, grid=1.25)
+        # We only need to make the mask once, then we can apply it to all
+        # of the grids. It may have been made before the MVN.
+        if self.water_mask is not None:
+            water_mask = self.water_mask
+        else:
+            water_mask = self._getWaterMask()
         for imtout in self.imt_out_set:
-            if imtout == refimt:
-                continue
             moutgrid[imtout] = \
                 ma.masked_array(self.outgrid[imtout],
-                                mask=copy.copy(moutgrid[refimt].mask))
+                                mask=copy.copy(water_mask))
         return moutgrid
 
+    def _updateMaxima(self, moutgrid):
+        """
+        Update the maxima of the output IMTs (self.out_max) with the
+        current output grids or points (self.outgrid) and their
+        landmasked versions.
+
+        Args:
+            moutgrid (dict): The landmasked output grids (see
+                _getMaskedGrids()).
+        """
+        for imtout in self.imt_out_set:
+            max_all = np.max(self.outgrid[imtout])
+            max_land = np.max(moutgrid[imtout])
+            if imtout in self.out_max:
+                old_all, old_land = self.out_max[imtout]
+                max_all = max(max_all, old_all)
+                if max_land is ma.masked:
+                    max_land = old_land
+                elif old_land is not ma.masked:
+                    max_land = max(max_land, old_land)
+            self.out_max[imtout] = (max_all, max_land)
+
+    def _computePointChunks(self, oc):
+        """
+        Do the MVN for the points in the prediction file a chunk at a
+        time and store each chunk's results in the output container, so
+        that the memory used depends on the size of the chunks rather
+        than the number of points. The stations' terms of the MVN are
+        computed once for each IMT and used for all of the chunks.
+
+        Args:
+            oc (ShakeMapOutputContainer): The output container.
+        """
+        npoints = 0
+        with cf.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            for chunk in _read_points(self.points_file,
+                                      self.point_chunk_size):
+                time1 = time.time()
+                self._setPoints(*chunk)
+                # list() waits for the IMTs and raises their exceptions
+                list(ex.map(self._computeMVN, self.imt_out_set))
+                self.shared_preds.clear()
+                self._updateMaxima(self._getMaskedGrids())
+                self._storePointData(oc, append=True)
+                npoints += np.size(self.lons)
+                self.logger.debug('Did %d of %d points (%d in %f s)' %
+                                  (npoints, self.smnx, np.size(self.lons),
+                                   time.time() - time1))
+
     def _getInfo(self, moutgrid):
         """
         Create an info dictionary that can be made into the info.json file.
@@ -1132,8 +1681,8 @@ class ModelModule(CoreModule):
                 info[op][gm][myimt]['bias'] = str(self.nominal_bias[myimt])
             else:
                 info[op][gm][myimt]['bias'] = '-'
-            info[op][gm][myimt]['max_grid'] = str(np.max(self.outgrid[myimt]))
-            info[op][gm][myimt]['max'] = str(np.max(moutgrid[myimt]))
+            info[op][gm][myimt]['max_grid'] = str(self.out_max[myimt][0])
+            info[op][gm][myimt]['max'] = str(self.out_max[myimt][1])
         info[op][mi] = {}
         info[op][mi]['grid_points'] = {}
         info[op][mi]['grid_points']['longitude'] = str(self.smnx)
@@ -1468,6 +2017,13 @@ class ModelModule(CoreModule):
         # Output the data and uncertainty grids
         #
         component = self.config['interp']['component']
+        sysconf = self.config['system']
+        chunks = sysconf.get('hdf_chunks', [])
+        storage = {'compression': sysconf.get('hdf_compression', 'gzip'),
+                   'compression_opts': sysconf.get('hdf_compression_level',
+                                                   None),
+                   'shuffle': sysconf.get('hdf_shuffle', False),
+                   'chunks': tuple(chunks) if chunks else None}
         for key, value in self.outgrid.items():
             # set the data grid
             mean_grid = Grid2D(value, gdict)
@@ -1483,19 +2039,31 @@ class ModelModule(CoreModule):
             oc.setIMTGrids(key,
                            mean_grid, mean_metadata,
                            std_grid, std_metadata,
-                           component)
+                           component, **storage)
 
-    def _storePointData(self, oc):
+    def _storePointData(self, oc, append=False):
         """
         Store point data in the output container.
+
+        Args:
+            oc (ShakeMapOutputContainer): The output container.
+            append (bool): If True, the points are added to the end of
+                the points already in the output container (see
+                _computePointChunks()).
         """
+        if append:
+            set_array = oc.appendArray
+            set_imt_arrays = oc.appendIMTArrays
+        else:
+            set_array = oc.setArray
+            set_imt_arrays = oc.setIMTArrays
         #
         # Store the Vs30
         #
         vs30_metadata = {'units': 'm/s',
                          'digits': 4}
-        oc.setArray('vs30', self.sx_out.vs30.flatten(),
-                    metadata=vs30_metadata)
+        set_array('vs30', self.sx_out.vs30.flatten(),
+                  metadata=vs30_metadata)
         #
         # Store the distances
         #
@@ -1505,8 +2073,8 @@ class ModelModule(CoreModule):
             dm_arr = getattr(self.dx_out, dm, None)
             if dm_arr is None:
                 continue
-            oc.setArray('distance_' + dm, dm_arr.copy().flatten(),
-                        metadata=distance_metadata)
+            set_array('distance_' + dm, dm_arr.copy().flatten(),
+                      metadata=distance_metadata)
         #
         # Store the IMTs
         #
@@ -1522,59 +2090,195 @@ class ModelModule(CoreModule):
             std_layername, units, digits = _get_layer_info(key + '_sd')
             std_metadata = {'units': units,
                             'digits': digits}
-            oc.setIMTArrays(key, self.sx_out.lons.flatten(),
-                            self.sx_out.lats.flatten(),
-                            ascii_ids, value.flatten(), mean_metadata,
-                            self.outsd[key].flatten(), std_metadata, component)
+            set_imt_arrays(key, self.sx_out.lons.flatten(),
+                           self.sx_out.lats.flatten(),
+                           ascii_ids, value.flatten(), mean_metadata,
+                           self.outsd[key].flatten(), std_metadata,
+                           component)
 
     def _storeRegressionData(self, oc):
         """
         Average the regression grids in distance bins and output the arrays
         """
-        rrup = self.dx_out.rrup
+        rrup = self.dx_out.rrup.reshape(-1)
         dx = self.smdx * 111.0
         dmax = np.max(rrup)
         dists = np.arange(0, dmax + dx, dx)
-        ndists = np.size(dists)
-        rockmean = {}
-        soilmean = {}
-        rocksd = {}
-        soilsd = {}
-        mean_dists = np.zeros(ndists - 1)
-        for imtstr in self.rockgrid.keys():
-            rockmean[imtstr] = np.zeros(ndists - 1)
-            soilmean[imtstr] = np.zeros(ndists - 1)
-            rocksd[imtstr] = np.zeros(ndists - 1)
-            soilsd[imtstr] = np.zeros(ndists - 1)
-
-        bad_ix = []
-        for ix in range(ndists - 1):
-            ixx = (rrup >= dists[ix]) & (rrup < dists[ix+1])
-            mean_dists[ix] = (dists[ix] + dists[ix+1]) / 2.0
-            if not np.any(ixx):
-                bad_ix.append(ix)
-                continue
-            for imtstr in self.rockgrid.keys():
-                rockmean[imtstr][ix] = np.mean(self.rockgrid[imtstr][ixx])
-                soilmean[imtstr][ix] = np.mean(self.soilgrid[imtstr][ixx])
-                rocksd[imtstr][ix] = np.mean(self.rocksd[imtstr][ixx])
-                soilsd[imtstr][ix] = np.mean(self.soilsd[imtstr][ixx])
+        nbins = np.size(dists) - 1
+        #
+        # Find the bin of each point (bin i holds the points with
+        # dists[i] <= rrup < dists[i+1]); points outside of the bins are
+        # left out
+        #
+        bins = np.digitize(rrup, dists) - 1
+        inbin = (bins >= 0) & (bins < nbins)
+        bins = bins[inbin]
+        counts = np.bincount(bins, minlength=nbins)
+        good = counts > 0
+        mean_dists = ((dists[:-1] + dists[1:]) / 2.0)[good]
+        #
+        # Sum all of the grids of all of the IMTs in one pass by giving
+        # each grid its own set of bins
+        #
+        imtlist = list(self.rockgrid.keys())
+        grids = [getattr(self, name)[imtstr]
+                 for imtstr in imtlist
+                 for name in ('rockgrid', 'soilgrid', 'rocksd', 'soilsd')]
+        ngrids = len(grids)
+        if ngrids > 0:
+            values = np.vstack([g.reshape(-1)[inbin] for g in grids])
+            allbins = bins + nbins * np.arange(ngrids)[:, np.newaxis]
+            sums = np.bincount(allbins.reshape(-1),
+                               weights=values.reshape(-1),
+                               minlength=ngrids * nbins)
+            means = sums.reshape((ngrids, nbins))[:, good] / counts[good]
 
-        mean_dists = np.delete(mean_dists, bad_ix)
         oc.setArray('regression_distances', mean_dists)
-        for imtstr in self.rockgrid.keys():
-            rockmean[imtstr] = np.delete(rockmean[imtstr], bad_ix)
-            soilmean[imtstr] = np.delete(soilmean[imtstr], bad_ix)
-            rocksd[imtstr] = np.delete(rocksd[imtstr], bad_ix)
-            soilsd[imtstr] = np.delete(soilsd[imtstr], bad_ix)
-            oc.setArray('regression_' + imtstr + '_rock_mean',
-                        rockmean[imtstr])
-            oc.setArray('regression_' + imtstr + '_soil_mean',
-                        soilmean[imtstr])
-            oc.setArray('regression_' + imtstr + '_rock_sd',
-                        rocksd[imtstr])
-            oc.setArray('regression_' + imtstr + '_soil_sd',
-                        soilsd[imtstr])
+        for i, imtstr in enumerate(imtlist):
+            rockmean, soilmean, rocksd, soilsd = means[4 * i:4 * i + 4]
+            oc.setArray('regression_' + imtstr + '_rock_mean', rockmean)
+            oc.setArray('regression_' + imtstr + '_soil_mean', soilmean)
+            oc.setArray('regression_' + imtstr + '_rock_sd', rocksd)
+            oc.setArray('regression_' + imtstr + '_soil_sd', soilsd)
+
+
+def _read_points(filename, chunk_size=0):
+    """
+    Read the output points from a prediction location file, chunk_size
+    points at a time. The file is either text, with the longitude,
+    latitude, Vs30, and ID of a point on each line (separated by white
+    space), or, if its name ends with '.npy', a NumPy file holding a
+    structured array with the fields 'lon', 'lat', 'vs30', and 'id'; the
+    NumPy file is memory-mapped rather than read into memory.
+
+    Args:
+        filename (str): The path to the file.
+        chunk_size (int): The number of points to read at a time; 0
+            reads all of them at once.
+
+    Yields:
+        tuple: Arrays of the longitudes, latitudes, Vs30, and IDs (as
+        strings) of the next chunk of points.
+    """
+    if filename.endswith('.npy'):
+        points = np.load(filename, mmap_mode='r')
+        npoints = np.size(points)
+        if chunk_size <= 0:
+            chunk_size = max(npoints, 1)
+        for start in range(0, npoints, chunk_size):
+            chunk = points[start:start + chunk_size]
+            yield (np.array(chunk['lon'], dtype=float),
+                   np.array(chunk['lat'], dtype=float),
+                   np.array(chunk['vs30'], dtype=float),
+                   np.array(chunk['id']).astype(str))
+        return
+
+    with open(filename, 'rt') as f:
+        while True:
+            if chunk_size > 0:
+                lines = list(itertools.islice(f, chunk_size))
+            else:
+                lines = f.readlines()
+            if not lines:
+                return
+            in_sites = np.atleast_1d(np.genfromtxt(
+                lines, autostrip=True,
+                dtype=[np.float, np.float, np.float, '<U80']))
+            if np.size(in_sites) > 0:
+                yield (in_sites['f0'], in_sites['f1'], in_sites['f2'],
+                       in_sites['f3'])
+            if chunk_size <= 0:
+                return
+
+
+def _coarse_index(n, factor):
+    """
+    Return the indices of every factor'th element of an axis of length
+    n, including the last element.
+    """
+    index = np.arange(0, n, factor)
+    if index[-1] != n - 1:
+        index = np.append(index, n - 1)
+    return index
+
+
+def _padded_index(mask, ncols):
+    """
+    Return the indices of the True elements of a 2-D mask as a tuple of
+    2-D arrays with rows of ncols elements, so that the points can be
+    done a row at a time like those of a grid. The last row is padded
+    with copies of the last point.
+    """
+    rows, cols = np.nonzero(mask)
+    npad = -np.size(rows) % ncols
+    rows = np.append(rows, np.full(npad, rows[-1]))
+    cols = np.append(cols, np.full(npad, cols[-1]))
+    return rows.reshape((-1, ncols)), cols.reshape((-1, ncols))
+
+
+def _fill_water(values, index, shape, fill):
+    """
+    Make a grid of the given shape from the values of the points at
+    index (see _padded_index()), and fill the other points with the value
+    of the nearest of those points (fill is the index of the nearest
+    point, from scipy.ndimage.distance_transform_edt()). Returns None if
+    values is None.
+    """
+    if values is None:
+        return None
+    grid = np.zeros(shape)
+    grid[index] = values
+    return grid[fill]
+
+
+def _subset_context(ctx, index, shape):
+    """
+    Return a copy of a sites or distance context in which the arrays of
+    the given shape are replaced by array[index]; other attributes are
+    unchanged.
+    """
+    sub = copy.copy(ctx)
+    for name, value in vars(ctx).items():
+        if isinstance(value, np.ndarray) and value.shape == shape:
+            setattr(sub, name, value[index])
+    return sub
+
+
+def _cell_corners(grid):
+    """
+    Return an array of shape (4, ny - 1, nx - 1) of the values at the
+    corners of the cells of a grid of shape (ny, nx).
+    """
+    return np.stack((grid[:-1, :-1], grid[:-1, 1:],
+                     grid[1:, :-1], grid[1:, 1:]))
+
+
+def _interp_weights(nodes, n):
+    """
+    For each of the indices 0 to n - 1, find the interval between the
+    (sorted) nodes that holds it and the linear interpolation weight of
+    the upper node.
+
+    Returns:
+        tuple: Arrays of the interval (the index of its lower node) and
+        the weight of each index.
+    """
+    index = np.arange(n)
+    cells = np.clip(np.searchsorted(nodes, index, side='right') - 1,
+                    0, np.size(nodes) - 2)
+    weights = (index - nodes[cells]) / (nodes[cells + 1] - nodes[cells])
+    return cells, weights
+
+
+def _interp_coarse(grid, row_cells, row_weights, col_cells, col_weights):
+    """
+    Bilinearly interpolate a coarse grid to a fine grid (see
+    _interp_weights()).
+    """
+    tmp = grid[:, col_cells] * (1.0 - col_weights) + \
+        grid[:, col_cells + 1] * col_weights
+    return tmp[row_cells, :] * (1.0 - row_weights)[:, np.newaxis] + \
+        tmp[row_cells + 1, :] * row_weights[:, np.newaxis]
 
 
 def _get_period_arrays(*args):
@@ -1854,7 +2558,8 @@ def _get_layer_info(layer):
 # Helper function to call get_mean_and_stddevs for the
 # appropriate object given the IMT
 #
-def _gmas(ipe, gmpe, sx, rx, dx, oqimt, stddev_types, apply_gafs):
+def _gmas(ipe, gmpe, sx, rx, dx, oqimt, stddev_types, apply_gafs,
+          gm_pred=None):
     """
     This is a helper function to call get_mean_and_stddevs for the
     appropriate object given the IMT.
@@ -1869,6 +2574,11 @@ def _gmas(ipe, gmpe, sx, rx, dx, oqimt, stddev_types, apply_gafs):
         stddev_types: list of OpenQuake standard deviation types.
         apply_gafs (boolean): Whether or not to apply the generic
             amplification factors to the GMPE output.
+        gm_pred: Optional tuple of the mean and the list of standard
+            deviations (corresponding to stddev_types) already predicted
+            by the GMPE for these sites, or, if oqimt is MMI, by the
+            IPE's GMPE (see VirtualIPE). If given, the GMPE is not
+            called. These arrays are not modified.
 
     Returns:
         tuple: Tuple of two items:
@@ -1878,13 +2588,22 @@ def _gmas(ipe, gmpe, sx, rx, dx, oqimt, stddev_types, apply_gafs):
               requested stddev_types.
 
     """
-    if 'MMI' in oqimt:
-        pe = ipe
+    if gm_pred is not None:
+        if 'MMI' in oqimt:
+            mean, stddevs = ipe.get_mean_and_stddevs(
+                sx, rx, dx, oqimt, stddev_types,
+                gm_mean=gm_pred[0], gm_stddevs=gm_pred[1])
+        else:
+            mean = gm_pred[0].copy()
+            stddevs = [sd.copy() for sd in gm_pred[1]]
     else:
-        pe = gmpe
-    mean, stddevs = pe.get_mean_and_stddevs(copy.deepcopy(sx), rx,
-                                            copy.deepcopy(dx), oqimt,
-                                            stddev_types)
+        if 'MMI' in oqimt:
+            pe = ipe
+        else:
+            pe = gmpe
+        mean, stddevs = pe.get_mean_and_stddevs(copy.deepcopy(sx), rx,
+                                                copy.deepcopy(dx), oqimt,
+                                                stddev_types)
     if apply_gafs:
         gafs = get_generic_amp_factors(sx, str(oqimt))
         if gafs is not None:
@@ -7,11 +7,9 @@ from collections import OrderedDict
 import matplotlib.pyplot as plt
 import numpy as np
 
-# neic imports
-from shakelib.utils.containers import ShakeMapOutputContainer
-
 # local imports
 from shakemap.utils.config import get_config_paths
+from shakemap.utils.session import open_output_container
 from .base import CoreModule
 from shakelib.utils.imt_string import oq_to_file
 
@@ -82,12 +80,23 @@ class PlotRegr(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        ic = ShakeMapOutputContainer.load(datafile)
+        ic = open_output_container(datafile)
         if ic.getDataType() != 'grid':
             raise NotImplementedError('plotregr module can only operate on '
                                       'gridded data not sets of points')
 
         #
+        # Model doesn't make the regression curves if it was run with
+        # --no-regression
+        #
+        try:
+            distances, _ = ic.getArray('regression_distances')
+        except LookupError:
+            ic.close()
+            raise LookupError('%s has no regression curves; run model '
+                              'without --no-regression to make them' %
+                              datafile)
+        #
         # Cheating here a bit by assuming that the IMTs are the same
         # as the regression IMTs
         #
@@ -103,7 +112,6 @@ class PlotRegr(CoreModule):
                 'regression_' + myimt + '_soil_mean')
             rocksd[myimt], _ = ic.getArray('regression_' + myimt + '_rock_sd')
             soilsd[myimt], _ = ic.getArray('regression_' + myimt + '_soil_sd')
-        distances, _ = ic.getArray('regression_distances')
 
         stations = ic.getStationDict()
         ic.close()
@@ -1,15 +1,21 @@
 # stdlib imports
 import os.path
+import copy
 import zipfile
+import argparse
+import inspect
+import sys
+import functools
+import concurrent.futures as cf
 from collections import OrderedDict
 
 # third party imports
-from shakelib.utils.containers import ShakeMapOutputContainer
-from mapio.gdal import GDALGrid
+import numpy as np
 
 # local imports
 from .base import CoreModule
 from shakemap.utils.config import get_config_paths
+from shakemap.utils.session import open_output_container
 from shakelib.utils.imt_string import oq_to_file
 
 FORMATS = {
@@ -19,6 +25,9 @@ FORMATS = {
 
 DEFAULT_FILTER_SIZE = 10
 
+# The tile size of GeoTIFF output
+GEOTIFF_BLOCKSIZE = 256
+
 
 class RasterModule(CoreModule):
     """
@@ -38,10 +47,64 @@ class RasterModule(CoreModule):
                     'type': 'application/zip'}]
     }
 
+    def __init__(self, eventid, raster_format='esri', multiband=False):
+        """
+        Instantiate a RasterModule class with an event ID.
+        """
+        super(RasterModule, self).__init__(eventid)
+        self.raster_format = raster_format
+        self.multiband = multiband
+        self._setContents()
+
+    def parseArgs(self, arglist):
+        """
+        Set up the object to accept the --format and --multiband flags.
+        """
+        parser = argparse.ArgumentParser(
+            prog=self.__class__.command_name,
+            description=inspect.getdoc(self.__class__))
+        parser.add_argument('-f', '--format', choices=['esri', 'geotiff'],
+                            default='esri',
+                            help='Write ESRI .flt/.hdr files (the default) '
+                            'or tiled, compressed (cloud-optimized) '
+                            'GeoTIFFs with overviews (which needs rasterio '
+                            '1.0 or later).')
+        parser.add_argument('-m', '--multiband', action='store_true',
+                            help='With --format geotiff, write one file per '
+                            'IMT with the mean and std as bands 1 and 2.')
+        #
+        # This line should be in any modules that overrides this
+        # one. It will collect up everything after the current
+        # modules options in args.rem, which should be returned
+        # by this function. Note: doing parser.parse_known_args()
+        # will not work as it will suck up any later modules'
+        # options that are the same as this one's.
+        #
+        parser.add_argument('rem', nargs=argparse.REMAINDER,
+                            help=argparse.SUPPRESS)
+        args = parser.parse_args(arglist)
+        self.raster_format = args.format
+        self._setContents()
+        self.multiband = args.multiband
+        return args.rem
+
+    def _setContents(self):
+        """
+        Set the title and caption of the rasters for raster_format. This
+        is done here rather than in execute() so that an instance that
+        only parsed the options (as in a parallel run) writes the same
+        contents.xml.
+        """
+        self.contents = copy.deepcopy(self.__class__.contents)
+        if self.raster_format == 'geotiff':
+            self.contents['rasterData']['title'] = 'GeoTIFF Raster Files'
+            self.contents['rasterData']['caption'] = \
+                'Data and uncertainty grids in cloud-optimized GeoTIFF format'
+
     def execute(self):
         """
-        Write raster.zip file containing ESRI Raster files of all the IMTs
-        in shake_result.hdf.
+        Write raster.zip file containing ESRI Raster files (or GeoTIFFs) of
+        all the IMTs in shake_result.hdf.
 
         Raises:
             NotADirectoryError: When the event data directory does not exist.
@@ -58,52 +121,182 @@ class RasterModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
         if container.getDataType() != 'grid':
             raise NotImplementedError('raster module can only operate on '
                                       'gridded data, not sets of points')
 
-        # create GIS-readable .flt files of imt and uncertainty
+        if self.raster_format == 'geotiff':
+            encode = _geotiff_files
+            compression = zipfile.ZIP_STORED
+        else:
+            encode = _esri_files
+            compression = zipfile.ZIP_DEFLATED
+
+        # create GIS-readable files of imt and uncertainty
         self.logger.debug('Creating GIS grids...')
         layers = container.getIMTs()
 
-        # Package up all of these files into one zip file.
+        #
+        # Package up all of these files into one zip file. The files are
+        # made in memory, one IMT per thread (the grids are read here,
+        # since the container can't be shared between threads), and
+        # written straight to the archive. GeoTIFFs are compressed
+        # internally, so they are stored without compressing them again.
+        #
         zfilename = os.path.join(datadir, 'rasters.zip')
-        zfile = zipfile.ZipFile(zfilename, mode='w',
-                                compression=zipfile.ZIP_DEFLATED)
-
-        files_written = []
-        for layer in layers:
-            fileimt = oq_to_file(layer)
-            # This is a bit hacky -- we only produce the raster for the
-            # first IMC returned. It should work as long as we only have
-            # one IMC produced per ShakeMap run.
-            imclist = container.getComponents(layer)
-            imtdict = container.getIMTGrids(layer, imclist[0])
-            mean_grid = imtdict['mean']
-            std_grid = imtdict['std']
-            mean_gdal = GDALGrid.copyFromGrid(mean_grid)
-            std_gdal = GDALGrid.copyFromGrid(std_grid)
-            mean_fname = os.path.join(datadir, '%s_mean.flt' % fileimt)
-            mean_hdr = os.path.join(datadir, '%s_mean.hdr' % fileimt)
-            std_fname = os.path.join(datadir, '%s_std.flt' % fileimt)
-            std_hdr = os.path.join(datadir, '%s_std.hdr' % fileimt)
-            self.logger.debug('Saving %s...' % mean_fname)
-            mean_gdal.save(mean_fname)
-            files_written.append(mean_fname)
-            files_written.append(mean_hdr)
-            self.logger.debug('Saving %s...' % std_fname)
-            std_gdal.save(std_fname)
-            files_written.append(std_fname)
-            files_written.append(std_hdr)
-            zfile.write(mean_fname, '%s_mean.flt' % fileimt)
-            zfile.write(mean_hdr, '%s_mean.hdr' % fileimt)
-            zfile.write(std_fname, '%s_std.flt' % fileimt)
-            zfile.write(std_hdr, '%s_std.hdr' % fileimt)
-
-        zfile.close()
+        nthreads = max(1, min(len(layers), os.cpu_count() or 1))
+        with zipfile.ZipFile(zfilename, mode='w',
+                             compression=compression) as zfile, \
+                cf.ThreadPoolExecutor(max_workers=nthreads) as executor:
+            futures = []
+            for layer in layers:
+                fileimt = oq_to_file(layer)
+                # This is a bit hacky -- we only produce the raster for the
+                # first IMC returned. It should work as long as we only have
+                # one IMC produced per ShakeMap run.
+                imclist = container.getComponents(layer)
+                imtdict = container.getIMTGrids(layer, imclist[0])
+                futures.append(executor.submit(
+                    encode, fileimt, imtdict['mean'], imtdict['std'],
+                    self.multiband))
+            for future in futures:
+                for fname, data in future.result():
+                    self.logger.debug('Saving %s...' % fname)
+                    zfile.writestr(fname, data)
+
         container.close()
 
-        # nuke all of the copies of the files we just put in the zipfile
-        for file_written in files_written:
-            os.remove(file_written)
+
+def _esri_files(fileimt, mean_grid, std_grid, multiband=False):
+    """Make ESRI .flt and .hdr files (the same as GDALGrid.save() writes
+    for float data) in memory.
+
+    Args:
+        fileimt (str): The IMT, as used in file names.
+        mean_grid (Grid2D): The mean grid.
+        std_grid (Grid2D): The standard deviation grid.
+        multiband (bool): Not used.
+
+    Returns:
+        list: List of (file name, bytes) tuples.
+    """
+    files = []
+    for name, grid in [('mean', mean_grid), ('std', std_grid)]:
+        hdr = _esri_header(grid)
+        data = grid.getData().astype(np.float32)
+        data[np.isnan(data)] = hdr['NODATA']
+        hdr_text = ''.join('%s  %s\n' % (key, str(value))
+                           for key, value in hdr.items())
+        files.append(('%s_%s.flt' % (fileimt, name), data.tobytes()))
+        files.append(('%s_%s.hdr' % (fileimt, name), hdr_text))
+    return files
+
+
+def _esri_header(grid):
+    """Make the header of an ESRI .flt file of 32-bit floats from a
+    grid's geodict.
+
+    Args:
+        grid (Grid2D): The grid.
+
+    Returns:
+        OrderedDict: The header's keys and values, in order.
+    """
+    gd = grid.getGeoDict()
+    data = grid.getData()
+    hdr = OrderedDict()
+    hdr['BYTEORDER'] = 'LSBFIRST' if sys.byteorder == 'little' \
+        else 'MSBFIRST'
+    hdr['LAYOUT'] = 'BIL'
+    hdr['NROWS'] = gd.ny
+    hdr['NCOLS'] = gd.nx
+    hdr['NBANDS'] = 1
+    hdr['NBITS'] = 32
+    hdr['BANDROWBYTES'] = gd.nx * 4.0
+    hdr['TOTALROWBYTES'] = gd.nx * 4.0
+    hdr['PIXELTYPE'] = 'FLOAT'
+    hdr['ULXMAP'] = gd.xmin
+    hdr['ULYMAP'] = gd.ymax
+    hdr['XDIM'] = gd.dx
+    hdr['YDIM'] = gd.dy
+    # A readable NODATA value (999, 9999, ...) greater than the data,
+    # as GDALGrid uses
+    zmin = np.nanmin(data)
+    zmax = np.nanmax(data)
+    nodata = np.array([int('9' * i) for i in range(3, 20)])
+    if zmin < nodata[-1]:
+        hdr['NODATA'] = nodata[np.where(nodata > zmin)[0][0]]
+    else:
+        hdr['NODATA'] = zmax + 1
+    return hdr
+
+
+def _geotiff_files(fileimt, mean_grid, std_grid, multiband=False):
+    """Make tiled, DEFLATE-compressed GeoTIFFs with overviews in memory,
+    using GDAL's COG (cloud-optimized GeoTIFF) driver if it is available.
+
+    Args:
+        fileimt (str): The IMT, as used in file names.
+        mean_grid (Grid2D): The mean grid.
+        std_grid (Grid2D): The standard deviation grid.
+        multiband (bool): If True, make one file with the mean and
+            standard deviation as bands 1 and 2; otherwise make one file
+            for each.
+
+    Returns:
+        list: List of (file name, bytes) tuples.
+    """
+    if multiband:
+        return [('%s.tif' % fileimt,
+                 _geotiff_bytes([mean_grid, std_grid], ['mean', 'std']))]
+    return [('%s_mean.tif' % fileimt, _geotiff_bytes([mean_grid], ['mean'])),
+            ('%s_std.tif' % fileimt, _geotiff_bytes([std_grid], ['std']))]
+
+
+def _geotiff_bytes(grids, names):
+    """Return the contents of a GeoTIFF made from one or more grids with
+    the same geodict.
+    """
+    # rasterio is only needed for GeoTIFFs
+    from rasterio.io import MemoryFile
+    from rasterio.enums import Resampling
+    from affine import Affine
+
+    gd = grids[0].getGeoDict()
+    # The geotransform is for the corner of the upper left cell
+    transform = Affine(gd.dx, 0.0, gd.xmin - gd.dx / 2,
+                       0.0, -gd.dy, gd.ymax + gd.dy / 2)
+    profile = {'width': gd.nx, 'height': gd.ny, 'count': len(grids),
+               'dtype': 'float32', 'crs': 'EPSG:4326',
+               'transform': transform, 'nodata': np.nan,
+               'compress': 'DEFLATE', 'predictor': 3}
+    if _have_cog_driver():
+        profile.update({'driver': 'COG', 'blocksize': GEOTIFF_BLOCKSIZE,
+                        'overview_resampling': 'average'})
+    else:
+        profile.update({'driver': 'GTiff', 'tiled': True,
+                        'blockxsize': GEOTIFF_BLOCKSIZE,
+                        'blockysize': GEOTIFF_BLOCKSIZE})
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            for band, (grid, name) in enumerate(zip(grids, names), 1):
+                dst.write(grid.getData().astype(np.float32), band)
+                dst.set_band_description(band, name)
+            if profile['driver'] == 'GTiff':
+                factors = [2 ** i for i in range(1, 6)
+                           if max(gd.nx, gd.ny) // 2 ** i >=
+                           GEOTIFF_BLOCKSIZE]
+                if factors:
+                    dst.build_overviews(factors, Resampling.average)
+        return bytes(memfile.getbuffer())
+
+
+@functools.lru_cache(maxsize=None)
+def _have_cog_driver():
+    """Return True if GDAL has the COG driver (GDAL >= 3.1).
+    """
+    import rasterio
+
+    with rasterio.Env() as env:
+        return 'COG' in env.drivers()
@@ -4,7 +4,7 @@ import json
 from collections import OrderedDict
 
 # third party imports
-from shakelib.utils.containers import ShakeMapOutputContainer
+from shakemap.utils.session import open_output_container
 
 # local imports
 from .base import CoreModule
@@ -50,7 +50,7 @@ class RuptureModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         # create ShakeMap rupture file
         for fformat in ALLOWED_FORMATS:
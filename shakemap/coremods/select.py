@@ -5,9 +5,11 @@ Parse STREC output and create/select a GMPE set for an event.
 import os.path
 import shutil
 from collections import OrderedDict
+import multiprocessing as mp
 
 # third party imports
 from configobj import ConfigObj
+from strec.subtype import SubductionSelector
 
 # local imports
 from .base import CoreModule
@@ -17,6 +19,9 @@ from shakemap.utils.layers import (validate_config,
                                    update_config_regions)
 from shakelib.rupture.origin import Origin
 
+# The state of a select_events() worker; see _init_select_worker()
+_WORKER = {}
+
 
 class SelectModule(CoreModule):
     """
@@ -52,73 +57,207 @@ class SelectModule(CoreModule):
         if not os.path.isdir(datadir):
             raise NotADirectoryError('%s is not a valid directory' % datadir)
         # ---------------------------------------------------------------------
-        # Open event.xml and make an Origin object
-        # ---------------------------------------------------------------------
-        eventxml = os.path.join(datadir, 'event.xml')
-        if not os.path.isfile(eventxml):
-            raise FileNotFoundError('%s does not exist.' % eventxml)
-        momentfile = os.path.join(datadir, 'moment.xml')
-        if not os.path.isfile(momentfile):
-            momentfile = None
-        sourcefile = os.path.join(datadir, 'source.txt')
-        if not os.path.isfile(sourcefile):
-            sourcefile = None
-
-        org = Origin.fromFile(
-            eventxml, sourcefile=sourcefile, momentfile=momentfile)
-
-        #
-        # Clear away results from previous runs
-        #
-        products_path = os.path.join(datadir, 'products')
-        if os.path.isdir(products_path):
-            shutil.rmtree(products_path, ignore_errors=True)
-
-        # ---------------------------------------------------------------------
         # Get config file from install_path/config, parse and
         # validate it
         # ---------------------------------------------------------------------
-        config = ConfigObj(os.path.join(install_path, 'config', 'select.conf'))
-        validate_config(config, install_path)
+        config = get_select_config(install_path)
 
-        # ---------------------------------------------------------------------
-        # Search through all custom regions, and the first one that we are
-        # inside of, take its tectonic region config stuff and replace the
-        # default tectonic regions.
-        # ---------------------------------------------------------------------
-        config = update_config_regions(org.lat, org.lon, config)
+        select_event(self._eventid, data_path, config,
+                     layer_cache=os.path.join(install_path, 'data',
+                                              'layer_index'))
 
-        # ---------------------------------------------------------------------
-        # Get the default weighting for this event
-        # ---------------------------------------------------------------------
-        gmpe_list, weight_list, strec_results = get_weights(org, config)
 
-        # ---------------------------------------------------------------------
-        # Create ConfigObj object for output to model_zc.conf
-        # ---------------------------------------------------------------------
-        zc_file = os.path.join(datadir, 'model_zc.conf')
-        zc_conf = ConfigObj(indent_type='    ')
-        zc_conf.filename = zc_file
-        #
-        # Add the new gmpe set to the object
-        #
-        gmpe_set = 'gmpe_' + str(self._eventid) + '_custom'
-        zc_conf['gmpe_sets'] = OrderedDict([
-            (gmpe_set, OrderedDict([
-                ('gmpes', list(gmpe_list)),
-                ('weights', list(weight_list)),
-                ('weights_large_dist', 'None'),
-                ('dist_cutoff', 'nan'),
-                ('site_gmpes', 'None'),
-                ('weights_site_gmpes', 'None')
-            ]))
-        ])
-        #
-        # Set gmpe to use the new gmpe set
-        #
-        zc_conf['modeling'] = OrderedDict([
-            ('gmpe', gmpe_set),
-            ('mechanism', strec_results['FocalMechanism'])
-        ])
-
-        zc_conf.write()
+def get_select_config(install_path):
+    """
+    Read and validate select.conf.
+
+    Args:
+        install_path (str): The profile's install path.
+
+    Returns:
+        ConfigObj: The validated configuration.
+
+    Raises:
+        ValidateError -- problems with the configuration file
+    """
+    config = ConfigObj(os.path.join(install_path, 'config', 'select.conf'))
+    validate_config(config, install_path)
+    return config
+
+
+def select_event(eventid, data_path, config, layer_cache=None,
+                 selector=None, clear_products=True):
+    """
+    Make the GMPE set for an event and write model_zc.conf in the event's
+    'current' directory. This is what the select module does; it is
+    separate so that many events can share the configuration and STREC
+    (see select_events()).
+
+    Args:
+        eventid (str): The event ID.
+        data_path (str): The profile's data path.
+        config (ConfigObj): The configuration from get_select_config().
+            It is not modified.
+        layer_cache (str): Directory in which to keep the parsed layers
+            (see shakemap.utils.layers.get_layer_index()), or None.
+        selector (SubductionSelector): A STREC SubductionSelector, or
+            None to make one.
+        clear_products (bool): If True, remove the event's products
+            directory, the results of previous runs.
+
+    Returns:
+        str: The path to the model_zc.conf file.
+
+    Raises:
+        NotADirectoryError -- the event's current directory doesn't exist
+        FileNotFoundError -- the event.xml file doesn't exist
+        RuntimeError -- various problems matching the event to a gmpe set
+    """
+    datadir = os.path.join(data_path, eventid, 'current')
+    if not os.path.isdir(datadir):
+        raise NotADirectoryError('%s is not a valid directory' % datadir)
+    # -------------------------------------------------------------------------
+    # Open event.xml and make an Origin object
+    # -------------------------------------------------------------------------
+    eventxml = os.path.join(datadir, 'event.xml')
+    if not os.path.isfile(eventxml):
+        raise FileNotFoundError('%s does not exist.' % eventxml)
+    momentfile = os.path.join(datadir, 'moment.xml')
+    if not os.path.isfile(momentfile):
+        momentfile = None
+    sourcefile = os.path.join(datadir, 'source.txt')
+    if not os.path.isfile(sourcefile):
+        sourcefile = None
+
+    org = Origin.fromFile(
+        eventxml, sourcefile=sourcefile, momentfile=momentfile)
+
+    #
+    # Clear away results from previous runs
+    #
+    products_path = os.path.join(datadir, 'products')
+    if clear_products and os.path.isdir(products_path):
+        shutil.rmtree(products_path, ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    # Search through all custom regions, and the first one that we are
+    # inside of, take its tectonic region config stuff and replace the
+    # default tectonic regions. The replacement is done in a copy of the
+    # top level of the config, so that the config can be used again.
+    # -------------------------------------------------------------------------
+    config = dict(config)
+    config['tectonic_regions'] = dict(config['tectonic_regions'])
+    config = update_config_regions(org.lat, org.lon, config,
+                                   cache_dir=layer_cache)
+
+    # -------------------------------------------------------------------------
+    # Get the default weighting for this event
+    # -------------------------------------------------------------------------
+    gmpe_list, weight_list, strec_results = get_weights(org, config,
+                                                        selector)
+
+    # -------------------------------------------------------------------------
+    # Create ConfigObj object for output to model_zc.conf
+    # -------------------------------------------------------------------------
+    zc_file = os.path.join(datadir, 'model_zc.conf')
+    zc_conf = ConfigObj(indent_type='    ')
+    zc_conf.filename = zc_file
+    #
+    # Add the new gmpe set to the object
+    #
+    gmpe_set = 'gmpe_' + str(eventid) + '_custom'
+    zc_conf['gmpe_sets'] = OrderedDict([
+        (gmpe_set, OrderedDict([
+            ('gmpes', list(gmpe_list)),
+            ('weights', list(weight_list)),
+            ('weights_large_dist', 'None'),
+            ('dist_cutoff', 'nan'),
+            ('site_gmpes', 'None'),
+            ('weights_site_gmpes', 'None')
+        ]))
+    ])
+    #
+    # Set gmpe to use the new gmpe set
+    #
+    zc_conf['modeling'] = OrderedDict([
+        ('gmpe', gmpe_set),
+        ('mechanism', strec_results['FocalMechanism'])
+    ])
+
+    zc_conf.write()
+    return zc_file
+
+
+def select_events(eventids, max_workers=1, install_path=None,
+                  data_path=None, clear_products=False):
+    """
+    Run select for many events, e.g., to remake the GMPE sets of past
+    events after select.conf has changed. select.conf, the layers, and
+    STREC are set up once (in each worker process) rather than once per
+    event.
+
+    Args:
+        eventids (list): The event IDs.
+        max_workers (int): The number of processes to use; if 1, the
+            events are processed in this process.
+        install_path (str): The profile's install path; if None, the
+            current profile's is used.
+        data_path (str): The profile's data path; if None, the current
+            profile's is used.
+        clear_products (bool): If True, remove each event's products
+            directory, as the select module does. The default is to
+            leave the products of past runs alone.
+
+    Returns:
+        list: A list of (eventid, error) tuples, in the order of
+        eventids, where error is None if the event's model_zc.conf was
+        written, otherwise a string describing the failure.
+    """
+    if install_path is None or data_path is None:
+        install_path, data_path = cfg.get_config_paths()
+    initargs = (install_path, data_path, clear_products)
+    if max_workers == 1:
+        _init_select_worker(*initargs)
+        try:
+            return [_select_worker(eventid) for eventid in eventids]
+        finally:
+            _WORKER.clear()
+    chunksize = max(1, min(50, len(eventids) // (4 * max_workers)))
+    pool = mp.Pool(processes=max_workers, initializer=_init_select_worker,
+                   initargs=initargs)
+    try:
+        return pool.map(_select_worker, eventids, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _init_select_worker(install_path, data_path, clear_products):
+    """Set up a select_events() worker: read the configuration and set up
+    STREC. A failure is saved and reported for each event, because a pool
+    restarts workers whose initializer raises, forever.
+    """
+    _WORKER['data_path'] = data_path
+    _WORKER['clear_products'] = clear_products
+    _WORKER['layer_cache'] = os.path.join(install_path, 'data',
+                                          'layer_index')
+    try:
+        _WORKER['config'] = get_select_config(install_path)
+        _WORKER['selector'] = SubductionSelector()
+    except Exception as e:
+        _WORKER['error'] = '%s: %s' % (type(e).__name__, e)
+
+
+def _select_worker(eventid):
+    """Run select for one event in a select_events() worker.
+    """
+    if 'error' in _WORKER:
+        return (eventid, _WORKER['error'])
+    try:
+        select_event(eventid, _WORKER['data_path'], _WORKER['config'],
+                     layer_cache=_WORKER['layer_cache'],
+                     selector=_WORKER['selector'],
+                     clear_products=_WORKER['clear_products'])
+    except Exception as e:
+        return (eventid, '%s: %s' % (type(e).__name__, e))
+    return (eventid, None)
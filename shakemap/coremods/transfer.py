@@ -7,7 +7,7 @@ import shutil
 import logging
 
 # third party imports
-from shakelib.utils.containers import ShakeMapOutputContainer
+from shakemap.utils.session import open_output_container
 from configobj import ConfigObj
 from impactutils.transfer.factory import get_sender_class
 
@@ -81,7 +81,7 @@ class TransferModule(CoreModule):
             raise FileNotFoundError('%s does not exist.' % datafile)
 
         # Open the ShakeMapOutputContainer and extract the data
-        container = ShakeMapOutputContainer.load(datafile)
+        container = open_output_container(datafile)
 
         # call the transfer method
         _transfer(config, container, products_dir)
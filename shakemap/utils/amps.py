@@ -6,6 +6,7 @@ from xml.dom import minidom
 from datetime import datetime, timezone, timedelta
 from collections import OrderedDict
 import time
+import concurrent.futures as cf
 import defusedxml.cElementTree as dET
 import xml.etree.cElementTree as ET
 import json
@@ -564,211 +565,216 @@ class AmplitudeHandler(object):
             xmlfile (str): XML file containing peak ground motion data.
         """
         _, fname = os.path.split(xmlfile)
-        try:
-            xmlstr = open(xmlfile, 'r').read()
-            # sometimes these records have non-ascii bytes in them
-            newxmlstr = re.sub(r'[^\x00-\x7F]+', ' ', xmlstr)
-            # newxmlstr = _invalid_xml_remove(xmlstr)
-            newxmlstr = newxmlstr.encode('utf-8', errors='xmlcharrefreplace')
-            amps = dET.fromstring(newxmlstr)
-        except Exception as e:
-            raise Exception('Could not parse %s, due to error "%s"' %
-                            (xmlfile, str(e)))
-
-        if amps.tag != 'amplitudes':
-            raise Exception('%s does not appear to be an amplitude XML '
-                            'file.' % xmlfile)
-        agency = amps.get('agency')
-        record = amps.find('record')
-        timing = record.find('timing')
-        reference = timing.find('reference')
-        has_pgm = False
-        time_dict = {}
-        for child in reference.iter():
-            node_name = child.tag
-            if node_name == 'PGMTime':
-                has_pgm = True
-            elif node_name == 'year':
-                time_dict['year'] = int(child.get('value'))
-            elif node_name == 'month':
-                time_dict['month'] = int(child.get('value'))
-            elif node_name == 'day':
-                time_dict['day'] = int(child.get('value'))
-            elif node_name == 'hour':
-                time_dict['hour'] = int(child.get('value'))
-            elif node_name == 'minute':
-                time_dict['minute'] = int(child.get('value'))
-            elif node_name == 'second':
-                time_dict['second'] = int(child.get('value'))
-            elif node_name == 'msec':
-                time_dict['msec'] = int(child.get('value'))
-        if has_pgm:
-            pgmtime_str = reference.find('PGMTime').text
-            pgmdate = datetime.strptime(pgmtime_str[0:19], TIMEFMT).\
-                replace(tzinfo=timezone.utc)
-            pgmtime = int(dt_to_timestamp(pgmdate))
-        else:
-            if not len(time_dict):
-                print('No time data for file %s' % fname)
-                return
-            pgmdate = datetime(time_dict['year'],
-                               time_dict['month'],
-                               time_dict['day'],
-                               time_dict['hour'],
-                               time_dict['minute'],
-                               time_dict['second'])
-            pgmtime = dt_to_timestamp(pgmdate)
-
-        # there are often multiple stations per file, but they're
-        # all duplicates of each other, so just grab the information
-        # from the first one
-        station = record.find('station')
-        attrib = dict(station.items())
-        lat = float(attrib['lat'])
-        lon = float(attrib['lon'])
-        code = attrib['code']
-        name = attrib['name']
-        if 'net' in attrib:
-            network = attrib['net']
-        elif 'netid' in attrib:
-            network = attrib['netid']
+        record = parse_amps_file(xmlfile)
+        if record is None:
+            print('No time data for file %s' % fname)
+            return
+        self._insertRecords([record])
+        return
+
+    def insertAmpsBatch(self, xmlfiles, max_workers=None):
+        """Insert data from many amps files into the database.
+
+        The files are parsed in a pool of worker processes, and the
+        resulting records are merged and written to the database in a
+        single transaction. The result is the same as calling insertAmps()
+        on each file in turn, but much faster when there are many files.
+
+        Args:
+            xmlfiles (list): List of XML files containing peak ground
+                             motion data.
+            max_workers (int): The maximum number of processes used to
+                               parse the files. If None, the number of
+                               processors on the machine is used; if 1,
+                               the files are parsed in this process.
+
+        Returns:
+            tuple: The number of files inserted into the database, and a
+            list of (xmlfile, message) tuples for the files that could not
+            be inserted. As with insertAmps(), files with no time data are
+            skipped but are not treated as failures; they are included in
+            the count of inserted files.
+        """
+        if max_workers == 1 or len(xmlfiles) < 2:
+            results = [_parse_amps_file_safe(x) for x in xmlfiles]
         else:
-            network = agency
-        #
-        # The station (at this pgmtime +/- 10 seconds) might already exist
-        # in the DB; if it does, use it
-        #
+            nworkers = max_workers or os.cpu_count() or 1
+            chunksize = max(1, len(xmlfiles) // (4 * nworkers))
+            with cf.ProcessPoolExecutor(max_workers=max_workers) as ex:
+                results = list(ex.map(_parse_amps_file_safe, xmlfiles,
+                                      chunksize=chunksize))
+
+        records = []
+        failed = []
+        nskipped = 0
+        for xmlfile, record, error in results:
+            if error is not None:
+                failed.append((xmlfile, error))
+            elif record is None:
+                print('No time data for file %s' % os.path.basename(xmlfile))
+                nskipped += 1
+            else:
+                records.append(record)
+
+        if len(records) > 0:
+            #
+            # WAL mode lets readers (e.g., the associator) continue
+            # while the big write is going on
+            #
+            self.commit()
+            self._cursor.execute('PRAGMA journal_mode = WAL')
+            self._insertRecords(records)
+        return len(records) + nskipped, failed
+
+    def _insertRecords(self, records):
+        """Insert a list of parsed amplitude records (as returned by
+        parse_amps_file()) into the database in one transaction.
+
+        A record is merged into an existing station with the same network
+        and code if that station's time is within 10 seconds of the
+        record's time (the closest one is chosen); channels and IMTs
+        that already exist for the station are not inserted again.
+
+        Args:
+            records (list): A list of amplitude record dictionaries.
+
+        Returns:
+            nothing: Nothing.
+        """
         self._cursor.execute('BEGIN EXCLUSIVE')
-        query = ('SELECT id, timestamp FROM station where network = ? and '
-                 'code = ? and timestamp > ? and timestamp < ?')
-        self._cursor.execute(query,
-                             (network, code, pgmtime - 10, pgmtime + 10))
+        try:
+            self._insertRecordsTransaction(records)
+        except Exception:
+            self._connection.rollback()
+            raise
+        self.commit()
+        return
+
+    def _insertRecordsTransaction(self, records):
+        """Do the work of _insertRecords() inside an already open
+        transaction.
+        """
         #
-        # It's possible that the query returned more than one station; pick
-        # the one closest to the new station's pgmtime
+        # New rows get explicit ids so that they can be inserted with
+        # executemany(); this is the same value SQLite would choose
+        # for an INTEGER PRIMARY KEY
         #
-        rows = self._cursor.fetchall()
-        best_sid = None
-        best_time = None
-        for row in rows:
-            dtime = abs(row[1] - pgmtime)
-            if best_time is None or dtime < best_time:
-                best_time = dtime
-                best_sid = row[0]
-        inserted_station = False
-        if best_sid is None:
-            fmt = ('INSERT INTO station '
-                   '(timestamp, lat, lon, name, code, network) '
-                   'VALUES (?, ?, ?, ?, ?, ?)')
-            self._cursor.execute(fmt, (pgmtime, lat, lon, name, code, network))
-            best_sid = self._cursor.lastrowid
-            inserted_station = True
+        self._cursor.execute('SELECT max(id) FROM station')
+        next_sid = (self._cursor.fetchone()[0] or 0) + 1
+        self._cursor.execute('SELECT max(id) FROM channel')
+        next_cid = (self._cursor.fetchone()[0] or 0) + 1
 
         #
-        # If the station is already there, it has at least one channel, too
+        # Get the existing stations that might match any of the records:
+        # one query per (network, code) covering the span of times in
+        # the batch
         #
-        existing_channels = {}
-        if inserted_station is False:
-            chan_query = 'SELECT channel, id FROM channel where station_id = ?'
-            self._cursor.execute(chan_query, (best_sid,))
-            rows = self._cursor.fetchall()
-            existing_channels = dict(rows)
-
-        # might need these
-        insert_channel = ('INSERT INTO channel '
-                          '(station_id, channel, loc)'
-                          'VALUES (?, ?, ?)')
-        insert_pgm = ('INSERT INTO pgm '
-                      '(channel_id, imt, value)'
-                      'VALUES (?, ?, ?)')
-
-        # loop over components
-        channels_inserted = 0
-        for channel in record.iter('component'):
-            # We don't want channels with qual > 4 (assuming qual is Cosmos
-            # table 6 value)
-            qual = channel.get('qual')
-            if qual:
-                try:
-                    iqual = int(qual)
-                except ValueError:
-                    # qual is something we don't understand
-                    iqual = 0
-            else:
-                iqual = 0
-            if iqual > 4:
-                continue
-            loc = channel.get('loc')
-            if not loc:
-                loc = '--'
-            cname = channel.get('name')
-            if cname in existing_channels:
-                best_cid = existing_channels[cname]
-                inserted_channel = False
-            else:
-                self._cursor.execute(insert_channel, (best_sid, cname, loc))
-                best_cid = self._cursor.lastrowid
-                inserted_channel = True
-                channels_inserted += 1
-
+        spans = {}
+        for record in records:
+            key = (record['network'], record['code'])
+            tmin, tmax = spans.get(key, (record['time'], record['time']))
+            spans[key] = (min(tmin, record['time']),
+                          max(tmax, record['time']))
+        station_query = ('SELECT id, timestamp FROM station where '
+                         'network = ? and code = ? and timestamp > ? and '
+                         'timestamp < ?')
+        stations = {}
+        for key, (tmin, tmax) in spans.items():
+            self._cursor.execute(station_query,
+                                 (key[0], key[1], tmin - 10, tmax + 10))
+            stations[key] = self._cursor.fetchall()
+
+        chan_query = 'SELECT channel, id FROM channel where station_id = ?'
+        pgm_query = 'SELECT imt FROM pgm where channel_id = ?'
+        # station id -> {channel name: channel id}
+        sta_channels = {}
+        # channel id -> set of IMTs
+        chan_imts = {}
+
+        station_rows = []
+        channel_rows = []
+        pgm_rows = []
+        for record in records:
+            pgmtime = record['time']
             #
-            # Similarly, if the channel is already there, we don't want to
-            # insert repeated IMTs (and updating them doesn't make a lot of
-            # sense)
+            # It's possible that more than one station matched; pick
+            # the one closest to the new station's pgmtime
             #
-            existing_pgms = {}
-            if inserted_channel is False:
-                pgm_query = 'SELECT imt, id FROM pgm where channel_id = ?'
-                self._cursor.execute(pgm_query, (best_cid,))
-                rows = self._cursor.fetchall()
-                existing_pgms = dict(rows)
-            # loop over imts in channel
-            pgm_list = []
-            for pgm in list(channel):
-                imt = pgm.tag
-                if imt not in IMTS:
+            best_sid = None
+            best_time = None
+            for sid, timestamp in stations[(record['network'],
+                                            record['code'])]:
+                if timestamp <= pgmtime - 10 or timestamp >= pgmtime + 10:
                     continue
-                try:
-                    value = float(pgm.get('value'))
-                except ValueError:
-                    #
-                    # Couldn't interpret the value for some reason
-                    #
+                dtime = abs(timestamp - pgmtime)
+                if best_time is None or dtime < best_time:
+                    best_time = dtime
+                    best_sid = sid
+            if best_sid is None:
+                new_station = True
+                best_sid = next_sid
+                existing_channels = {}
+            else:
+                new_station = False
+                if best_sid not in sta_channels:
+                    self._cursor.execute(chan_query, (best_sid,))
+                    sta_channels[best_sid] = dict(self._cursor.fetchall())
+                existing_channels = sta_channels[best_sid]
+
+            new_channels = []
+            new_pgms = []
+            for cname, loc, imt_values in record['channels']:
+                if cname in existing_channels:
+                    cid = existing_channels[cname]
+                    if cid not in chan_imts:
+                        self._cursor.execute(pgm_query, (cid,))
+                        chan_imts[cid] = set(
+                            [x[0] for x in self._cursor.fetchall()])
+                    existing_pgms = chan_imts[cid]
+                    inserted_channel = False
+                else:
+                    cid = next_cid + len(new_channels)
+                    existing_pgms = set()
+                    inserted_channel = True
+                pgm_list = [(cid, imt, value) for imt, value in imt_values
+                            if imt not in existing_pgms]
+                if len(pgm_list) == 0:
+                    # Don't insert a channel with no amps
                     continue
-                if imt == 'sa':
-                    imt = 'p'+imt+pgm.get('period').replace('.', '')
-                    value = value / 9.81
-                if imt in IMTDICT:
-                    imt = IMTDICT[imt]
-                if imt == 'pga':
-                    value = value / 9.81
-                if imt in existing_pgms:
+                if inserted_channel:
+                    new_channels.append((cid, best_sid, cname, loc))
+                    existing_channels[cname] = cid
+                    chan_imts[cid] = set()
+                chan_imts[cid].update([x[1] for x in pgm_list])
+                new_pgms += pgm_list
+
+            if new_station:
+                # Don't insert a station with no channels
+                if len(new_channels) == 0:
                     continue
-                pgm_list.append((best_cid, imt, value))
-            if len(pgm_list) > 0:
-                #
-                # Insert the new amps
-                #
-                self._cursor.executemany(insert_pgm, pgm_list)
-            elif inserted_channel:
-                #
-                # If we didn't insert any amps, but we inserted the channel,
-                # delete the channel
-                #
-                channel_delete = 'DELETE FROM channel WHERE id = ?'
-                self._cursor.execute(channel_delete, (best_cid,))
-                channels_inserted -= 1
-            # End of pgm loop
-        # End of channel loop
-
-        #
-        # If we inserted the station but no channels, delete the station
-        #
-        if channels_inserted == 0 and inserted_station:
-            station_delete = 'DELETE FROM station WHERE id = ?'
-            self._cursor.execute(station_delete, (best_sid,))
-
-        self.commit()
+                station_rows.append((best_sid, pgmtime, record['lat'],
+                                     record['lon'], record['name'],
+                                     record['code'], record['network']))
+                stations[(record['network'], record['code'])].append(
+                    (best_sid, pgmtime))
+                sta_channels[best_sid] = existing_channels
+                next_sid += 1
+            next_cid += len(new_channels)
+            channel_rows += new_channels
+            pgm_rows += new_pgms
+
+        self._cursor.executemany(
+            'INSERT INTO station '
+            '(id, timestamp, lat, lon, name, code, network) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', station_rows)
+        self._cursor.executemany(
+            'INSERT INTO channel '
+            '(id, station_id, channel, loc) '
+            'VALUES (?, ?, ?, ?)', channel_rows)
+        self._cursor.executemany(
+            'INSERT INTO pgm '
+            '(channel_id, imt, value) '
+            'VALUES (?, ?, ?)', pgm_rows)
         return
 
     def cleanAmps(self, threshold=30):
@@ -875,6 +881,156 @@ def timestr_to_timestamp(timestr):
     return timestamp
 
 
+def parse_amps_file(xmlfile):
+    """Parse an amps file into a record that can be inserted into the
+    database.
+
+    Args:
+        xmlfile (str): XML file containing peak ground motion data.
+
+    Returns:
+        dict: A dictionary with keys 'network', 'code', 'name', 'lat',
+        'lon', 'time' (the Unix timestamp of the peak ground motion), and
+        'channels', a list of (channel name, location code, [(imt, value),
+        ...]) tuples. None is returned if the file has no time data.
+
+    Raises:
+        Exception: If the file cannot be parsed or is not an amplitude
+        XML file.
+    """
+    try:
+        xmlstr = open(xmlfile, 'r').read()
+        # sometimes these records have non-ascii bytes in them
+        newxmlstr = re.sub(r'[^\x00-\x7F]+', ' ', xmlstr)
+        # newxmlstr = _invalid_xml_remove(xmlstr)
+        newxmlstr = newxmlstr.encode('utf-8', errors='xmlcharrefreplace')
+        amps = dET.fromstring(newxmlstr)
+    except Exception as e:
+        raise Exception('Could not parse %s, due to error "%s"' %
+                        (xmlfile, str(e)))
+
+    if amps.tag != 'amplitudes':
+        raise Exception('%s does not appear to be an amplitude XML '
+                        'file.' % xmlfile)
+    agency = amps.get('agency')
+    record = amps.find('record')
+    timing = record.find('timing')
+    reference = timing.find('reference')
+    has_pgm = False
+    time_dict = {}
+    for child in reference.iter():
+        node_name = child.tag
+        if node_name == 'PGMTime':
+            has_pgm = True
+        elif node_name == 'year':
+            time_dict['year'] = int(child.get('value'))
+        elif node_name == 'month':
+            time_dict['month'] = int(child.get('value'))
+        elif node_name == 'day':
+            time_dict['day'] = int(child.get('value'))
+        elif node_name == 'hour':
+            time_dict['hour'] = int(child.get('value'))
+        elif node_name == 'minute':
+            time_dict['minute'] = int(child.get('value'))
+        elif node_name == 'second':
+            time_dict['second'] = int(child.get('value'))
+        elif node_name == 'msec':
+            time_dict['msec'] = int(child.get('value'))
+    if has_pgm:
+        pgmtime_str = reference.find('PGMTime').text
+        pgmdate = datetime.strptime(pgmtime_str[0:19], TIMEFMT).\
+            replace(tzinfo=timezone.utc)
+        pgmtime = int(dt_to_timestamp(pgmdate))
+    else:
+        if not len(time_dict):
+            return None
+        pgmdate = datetime(time_dict['year'],
+                           time_dict['month'],
+                           time_dict['day'],
+                           time_dict['hour'],
+                           time_dict['minute'],
+                           time_dict['second'])
+        pgmtime = dt_to_timestamp(pgmdate)
+
+    # there are often multiple stations per file, but they're
+    # all duplicates of each other, so just grab the information
+    # from the first one
+    station = record.find('station')
+    attrib = dict(station.items())
+    lat = float(attrib['lat'])
+    lon = float(attrib['lon'])
+    code = attrib['code']
+    name = attrib['name']
+    if 'net' in attrib:
+        network = attrib['net']
+    elif 'netid' in attrib:
+        network = attrib['netid']
+    else:
+        network = agency
+
+    # loop over components
+    channels = []
+    for channel in record.iter('component'):
+        # We don't want channels with qual > 4 (assuming qual is Cosmos
+        # table 6 value)
+        qual = channel.get('qual')
+        if qual:
+            try:
+                iqual = int(qual)
+            except ValueError:
+                # qual is something we don't understand
+                iqual = 0
+        else:
+            iqual = 0
+        if iqual > 4:
+            continue
+        loc = channel.get('loc')
+        if not loc:
+            loc = '--'
+        cname = channel.get('name')
+
+        # loop over imts in channel
+        imt_values = []
+        for pgm in list(channel):
+            imt = pgm.tag
+            if imt not in IMTS:
+                continue
+            try:
+                value = float(pgm.get('value'))
+            except ValueError:
+                #
+                # Couldn't interpret the value for some reason
+                #
+                continue
+            if imt == 'sa':
+                imt = 'p'+imt+pgm.get('period').replace('.', '')
+                value = value / 9.81
+            if imt in IMTDICT:
+                imt = IMTDICT[imt]
+            if imt == 'pga':
+                value = value / 9.81
+            imt_values.append((imt, value))
+        channels.append((cname, loc, imt_values))
+
+    return {'network': network,
+            'code': code,
+            'name': name,
+            'lat': lat,
+            'lon': lon,
+            'time': pgmtime,
+            'channels': channels}
+
+
+def _parse_amps_file_safe(xmlfile):
+    """Wrapper around parse_amps_file() for use in a process pool;
+    returns (xmlfile, record, error message) rather than raising.
+    """
+    try:
+        return xmlfile, parse_amps_file(xmlfile), None
+    except Exception as e:
+        return xmlfile, None, str(e)
+
+
 # def _invalid_xml_remove(c):
     # http://stackoverflow.com/questions/1707890/fast-way-to-filter-illegal-xml-unicode-chars-in-python
     # noqa
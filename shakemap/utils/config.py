@@ -139,6 +139,7 @@ def get_custom_validator():
         'gmpe_list': gmpe_list,
         'weight_list': weight_list,
         'extent_list': extent_list,
+        'chunk_list': chunk_list,
         'status_string': status_string,
     }
     validator = Validator(fdict)
@@ -369,6 +370,40 @@ def extent_list(value):
     return out
 
 
+def chunk_list(value):
+    """
+    Checks to see if value is an empty list or a list of two positive
+    integers (the rows and columns of an HDF5 chunk). Returns a list upon
+    success; raises a ValidateError exception on failure.
+
+    Args:
+        value (str): A string representing a list of two integers.
+
+    Returns:
+        list: The input string converted to a list of ints.
+
+    """
+
+    if isinstance(value, str) and (value == 'None' or value == '[]'):
+        return []
+    if isinstance(value, list) and not value:
+        return []
+    if not isinstance(value, list) or len(value) != 2:
+        print("'%s' is not a list of 2 integers" % value)
+        raise ValidateError()
+    try:
+        out = [int(a) for a in value]
+    except ValueError:
+        print("%s is not a list of 2 integers" % value)
+        raise ValidateError()
+    if out[0] < 1 or out[1] < 1:
+        print("Invalid chunk shape: ", value,
+              " : the rows and columns must be positive")
+        raise ValidateError()
+
+    return out
+
+
 def file_type(value):
     """
     Checks to see if value is a valid file or an empty string.
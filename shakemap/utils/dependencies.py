@@ -4,6 +4,7 @@ import sqlite3
 import glob
 import re
 import logging
+from collections import OrderedDict
 
 
 from shakemap.utils.config import get_config_paths
@@ -164,6 +165,41 @@ class CommandDatabase(object):
                        (command text, dependency text, required integer)''')
         con.commit()
 
+        #
+        # The dependencies.db database keeps track of the state of the
+        # dependencies from previous runs
+        #
+        dbfile = os.path.join(install_path, 'data', 'dependencies.db')
+        if not os.path.isfile(dbfile):
+            # It doesn't exist, so create it
+            # TODO: Better checking would probably be good here
+            self.fconnect = sqlite3.connect(dbfile)
+            self.fcursor = self.fconnect.cursor()
+            self.fcursor.execute(
+                '''CREATE TABLE file_checksums (command text NOT NULL,
+                   file text NOT NULL,
+                   checksum text, PRIMARY KEY (command, file))''')
+            self.fcursor.execute(
+                '''CREATE TABLE cmd_checksums (command text NOT NULL,
+                   eventid text NOT NULL,
+                   checksum text, PRIMARY KEY (command, eventid))''')
+            self.fconnect.commit()
+        else:
+            self.fconnect = sqlite3.connect(dbfile)
+            self.fcursor = self.fconnect.cursor()
+        #
+        # The stat_checksums table caches the checksums of files so
+        # that a file is only hashed again when its size, modification
+        # time, or inode changes. (Older databases won't have it.)
+        #
+        self.fcursor.execute(
+            '''CREATE TABLE IF NOT EXISTS stat_checksums
+               (file text NOT NULL PRIMARY KEY, size integer,
+               mtime_ns integer, inode integer, checksum text)''')
+        self.fconnect.commit()
+        self.statsums = {}
+        self.pruned = False
+
         config_path = os.path.join(install_path, 'config')
         self.targets = {}
         self.cmdsums = {}
@@ -188,36 +224,14 @@ class CommandDatabase(object):
                                          os.path.join(config_path, config),
                                          1))
 
-            self.cmdsums[cmd] = sha_sum(cd['mfile'])
+            self.cmdsums[cmd] = self.__checksum(cd['mfile'])
+        self.fconnect.commit()
 
         if len(dependencies) > 0:
             cur.executemany('INSERT into dependencies values (?, ?, ?)',
                             dependencies)
             con.commit()
 
-        #
-        # The dependencies.db database keeps track of the state of the
-        # dependencies from previous runs
-        #
-        dbfile = os.path.join(install_path, 'data', 'dependencies.db')
-        if not os.path.isfile(dbfile):
-            # It doesn't exist, so create it
-            # TODO: Better checking would probably be good here
-            self.fconnect = sqlite3.connect(dbfile)
-            self.fcursor = self.fconnect.cursor()
-            self.fcursor.execute(
-                '''CREATE TABLE file_checksums (command text NOT NULL,
-                   file text NOT NULL,
-                   checksum text, PRIMARY KEY (command, file))''')
-            self.fcursor.execute(
-                '''CREATE TABLE cmd_checksums (command text NOT NULL,
-                   eventid text NOT NULL,
-                   checksum text, PRIMARY KEY (command, eventid))''')
-            self.fconnect.commit()
-        else:
-            self.fconnect = sqlite3.connect(dbfile)
-            self.fcursor = self.fconnect.cursor()
-
     def close(self):
         """Closes the object and associated databases
         """
@@ -270,9 +284,20 @@ class CommandDatabase(object):
     def __getDependencyStatus(self, tree):
         """Internal function to create a list of out-of-date commands.
         """
+        #
+        # List the event directories once for all of the target checks
+        #
+        files = glob.glob(os.path.join(self.event_path, '*'))
+        files += glob.glob(os.path.join(self.event_path, 'products', '*'))
         status = []
         for leaf in tree.getLeaves():
-            status += self.__traceLeaf(leaf)
+            status += self.__traceLeaf(leaf, files)
+        # Drop the cached checksums of files that have gone away (once
+        # is enough for a run), and save any checksums that were computed
+        if not self.pruned:
+            self.__pruneChecksums()
+            self.pruned = True
+        self.fconnect.commit()
 
         # Make a list of unique commands, in order from ancestors to
         # descendents: set() gets the unique elements, sorted() puts
@@ -282,9 +307,10 @@ class CommandDatabase(object):
                                        reverse=True)]
         return status
 
-    def __traceLeaf(self, leaf):
+    def __traceLeaf(self, leaf, files):
         """Internal function to produce a list of all commands that are
-        descendents of the leaf argument's command.
+        descendents of the leaf argument's command. The files argument
+        is a list of the files in the event and products directories.
         """
         clean = True
         status = []
@@ -321,9 +347,6 @@ class CommandDatabase(object):
             if explist is not None:
                 for exp in explist:
                     found_target = False
-                    files = glob.glob(os.path.join(self.event_path, '*'))
-                    files += glob.glob(os.path.join(self.event_path,
-                                                    'products', '*'))
                     for filename in files:
                         if exp.fullmatch(filename):
                             found_target = True
@@ -340,8 +363,9 @@ class CommandDatabase(object):
             # If dep file is out of date, child command and all descendent
             # commands need to be rerun
             #
-            sql = ('SELECT checksum FROM file_checksums WHERE command=? '
-                   'AND file=?')
+            sql = 'SELECT file, checksum FROM file_checksums WHERE command=?'
+            self.fcursor.execute(sql, (leaf.cmd(),))
+            old_sums = dict(self.fcursor.fetchall())
             for pattern, required in leaf.deps():
                 found = glob.glob(pattern)
                 if len(found) == 0 and required:
@@ -352,9 +376,7 @@ class CommandDatabase(object):
                     break
                 if len(found) > 0:
                     for fp in found:
-                        self.fcursor.execute(sql, (leaf.cmd(), fp))
-                        result = self.fcursor.fetchall()
-                        if len(result) == 0 or result[0][0] != sha_sum(fp):
+                        if old_sums.get(fp) != self.__checksum(fp):
                             # File is a dependency, but isn't in DB, or
                             # file checksum has changed: need to rerun
                             clean = False
@@ -387,7 +409,7 @@ class CommandDatabase(object):
             # Only do dependencies that actually exist
             efiles = glob.glob(fp[0])
             for ef in efiles:
-                csum = sha_sum(ef)
+                csum = self.__checksum(ef)
                 args.append((cmd, ef, csum))
         if len(args) > 0:
             self.fcursor.executemany(sql, args)
@@ -398,6 +420,94 @@ class CommandDatabase(object):
         self.fconnect.commit()
         return
 
+    def getCommandGraph(self, cmds):
+        """Work out which of a list of commands must finish before each
+        of the others can start, so that independent commands can be run
+        at the same time.
+
+        A command depends on an earlier command in the list if one of its
+        dependencies is a target of the earlier command. A dependency
+        that is a glob pattern (e.g., 'products/*') makes the command
+        depend on all of the earlier commands. A command that does not
+        declare both its targets and its dependencies is treated as a
+        barrier: it depends on all of the earlier commands, and all of
+        the later commands depend on it.
+
+        Args:
+            cmds (list): The commands, in the order they were requested.
+
+        Returns:
+            OrderedDict: A dictionary of command: set of commands that
+            must finish before it can start.
+        """
+        graph = OrderedDict()
+        barrier = None
+        for i, cmd in enumerate(cmds):
+            earlier = cmds[:i]
+            # Configs can't be the targets of other commands
+            deps = [dep for dep in self.__getDependencies(cmd)
+                    if dep[0].startswith(self.event_path + os.sep)]
+            if self.targets[cmd] is None or len(deps) == 0:
+                graph[cmd] = set(earlier)
+                barrier = cmd
+                continue
+            preds = set()
+            if barrier is not None:
+                preds.add(barrier)
+            for dep, _ in deps:
+                if re.search(r'[*?\[]', dep):
+                    preds.update(earlier)
+                    break
+                for other in earlier:
+                    explist = self.targets[other]
+                    if explist is None:
+                        continue
+                    if any(exp.fullmatch(dep) for exp in explist):
+                        preds.add(other)
+            graph[cmd] = preds
+        return graph
+
+    def __checksum(self, fname):
+        """Internal function to get the checksum of a file. The checksum
+        is cached in the database, keyed on the file's size, modification
+        time, and inode, so the file is only read again if one of them
+        changes. The caller is responsible for committing the database.
+        """
+        st = os.stat(fname)
+        key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        if fname in self.statsums and self.statsums[fname][0] == key:
+            return self.statsums[fname][1]
+        self.fcursor.execute(
+            'SELECT size, mtime_ns, inode, checksum FROM stat_checksums '
+            'WHERE file=?', (fname,))
+        result = self.fcursor.fetchall()
+        if len(result) > 0 and tuple(result[0][:3]) == key:
+            csum = result[0][3]
+        else:
+            csum = sha_sum(fname)
+            self.fcursor.execute(
+                'INSERT OR REPLACE INTO stat_checksums (file, size, '
+                'mtime_ns, inode, checksum) values (?, ?, ?, ?, ?)',
+                (fname,) + key + (csum,))
+        self.statsums[fname] = (key, csum)
+        return csum
+
+    def __pruneChecksums(self):
+        """Internal function to delete the cached checksums of files
+        that no longer exist (e.g., the files of events that have been
+        removed), so the stat_checksums table doesn't grow without
+        bound. The caller is responsible for committing the database.
+        """
+        self.fcursor.execute('SELECT file FROM stat_checksums')
+        stale = [(fname,) for (fname,) in self.fcursor.fetchall()
+                 if not os.path.isfile(fname)]
+        if len(stale) > 0:
+            self.fcursor.executemany(
+                'DELETE FROM stat_checksums WHERE file=?', stale)
+        for (fname,) in stale:
+            self.statsums.pop(fname, None)
+        return
+
     def __getDependencies(self, cmd):
         """Internal function to get the file dependencies of a command.
         """
@@ -406,6 +516,22 @@ class CommandDatabase(object):
             (cmd,))
         return self.ccursor.fetchall()
 
+    def isTarget(self, cmd, filepath):
+        """Return True if the file is one of the targets of a command
+        (i.e., running the command may create or replace the file).
+
+        Args:
+            cmd (str): The command.
+            filepath (str): The full path to the file.
+
+        Returns:
+            bool: Whether or not the file is one of cmd's targets.
+        """
+        explist = self.targets.get(cmd)
+        if explist is None:
+            return False
+        return any(exp.fullmatch(filepath) for exp in explist)
+
     def __findCmd(self, filepath):
         """Find the command that produces the target file named by
         filepath.
@@ -1,5 +1,7 @@
 import glob
+import hashlib
 import os.path
+import tempfile
 from functools import partial
 import logging
 
@@ -7,14 +9,20 @@ import logging
 import pyproj
 from shapely.geometry import Point, Polygon, MultiPolygon
 from shapely.ops import transform
+import shapely.wkb
 import shapely.wkt
 import numpy as np
-from openquake.hazardlib.geo.geodetic import min_distance_to_segment
+from openquake.hazardlib.geo.geodetic import (azimuth,
+                                              distance_to_arc,
+                                              min_geodetic_distance)
 from validate import ValidateError
 
 import shakemap.utils.config as config
 from shakemap.utils.utils import path_macro_sub
 
+# Layer indexes by layer directory; see get_layer_index()
+_LAYER_INDEXES = {}
+
 
 # ##########################################################################
 # We can't use normal ConfigObj validation because there are
@@ -66,20 +74,72 @@ def nearest_edge(elon, elat, poly):
         float: The distance (in km) from the reference point to the
         nearest edge (or vertex) of the polygon.
     """
-    elon_arr = np.array([elon])
-    elat_arr = np.array([elat])
+    #
+    # This is min_distance_to_segment() from OpenQuake's geodetic module,
+    # done for all of the segments at once: for each segment, the
+    # distance to the great circle arc if the point is between the
+    # perpendiculars at the segment's ends, otherwise the distance to
+    # the nearer end. (As before, the closing segment isn't included.)
+    # The distances to the ends come from min_geodetic_distance(), as
+    # they do in min_distance_to_segment().
+    #
     x, y = poly.exterior.xy
+    x = np.array(x)
+    y = np.array(y)
     nearest = 99999.
-    for ix in range(1, len(x) - 1):
-        dd = min_distance_to_segment(np.array(x[ix - 1:ix + 1]),
-                                     np.array(y[ix - 1:ix + 1]),
-                                     elon_arr, elat_arr)
-        if np.abs(dd[0]) < nearest:
-            nearest = dd[0]
-    return nearest
+    if len(x) < 3:
+        return nearest
+    lon0, lat0 = x[:-2], y[:-2]
+    lon1, lat1 = x[1:-1], y[1:-1]
+    seg_azim = azimuth(lon0, lat0, lon1, lat1)
+    azimuth1 = azimuth(lon0, lat0, elon, elat)
+    azimuth2 = azimuth(lon1, lat1, elon, elat)
+    vert_dist = min_geodetic_distance(np.array([elon]), np.array([elat]),
+                                      x[:-1], y[:-1])
+    idx_in = (np.cos(np.radians(seg_azim - azimuth1)) >= 0.0) & \
+        (np.cos(np.radians(seg_azim - azimuth2)) <= 0.0)
+    dists = np.where(
+        idx_in,
+        distance_to_arc(lon0, lat0, seg_azim, elon, elat),
+        np.minimum(vert_dist[:-1], vert_dist[1:]))
+    # Points to the left of a segment have negative distances
+    idx_neg = np.sin(np.radians(azimuth1 - seg_azim)) < 0.0
+    dists = np.abs(dists)
+    #
+    # Going through the segments in order, the nearest distance was
+    # replaced by each distance whose absolute value was less than it,
+    # so it stopped changing once a negative distance was taken
+    #
+    prev = np.minimum.accumulate(np.concatenate(([nearest], dists[:-1])))
+    taken = np.nonzero(dists < prev)[0]
+    if len(taken) == 0:
+        return nearest
+    taken_neg = taken[idx_neg[taken]]
+    if len(taken_neg):
+        return -dists[taken_neg[0]]
+    return dists[taken[-1]]
+
+
+def aeqd_projection(elon, elat):
+    """
+    Return a function that projects shapely geometries from geographic
+    coordinates to an azimuthal equidistant projection (in km) centered
+    on a point. Make one for a point and use it for every layer.
+
+    Args:
+        elon (float): The longitude of the reference point.
+        elat (float): The latitude of the reference point.
+
+    Returns:
+        function: A function for shapely.ops.transform.
+    """
+    return partial(
+        pyproj.transform,
+        pyproj.Proj(proj='latlong'),
+        pyproj.Proj(proj='aeqd  +lat_0=%f +lon_0=%f +R=6371' % (elat, elon)))
 
 
-def dist_to_layer(elon, elat, geom):
+def dist_to_layer(elon, elat, geom, project=None):
     """
     Return the distance from a point to the polygon(s) in a layer; zero if
     the point is inside the polygon. If the nearest edge of the polygon is
@@ -92,6 +152,8 @@ def dist_to_layer(elon, elat, geom):
         elat (float): The latitude of the reference point.
         geom (Polygon or MultiPolygon): An instance of a shapely Polygon
             or MultiPolygon.
+        project (function): The result of aeqd_projection() for the
+            reference point. If None, it is made here.
 
     Returns:
         float: The distance (in km) from the reference point to the
@@ -105,10 +167,16 @@ def dist_to_layer(elon, elat, geom):
     else:
         raise TypeError('Invalid geometry type in layer: %s' % type(geom))
 
-    project = partial(
-        pyproj.transform,
-        pyproj.Proj(proj='latlong'),
-        pyproj.Proj(proj='aeqd  +lat_0=%f +lon_0=%f +R=6371' % (elat, elon)))
+    return _dist_to_polygons(elon, elat, plist, project)
+
+
+def _dist_to_polygons(elon, elat, plist, project=None):
+    """
+    Return the distance from a point to the nearest of a list of
+    polygons; see dist_to_layer().
+    """
+    if project is None:
+        project = aeqd_projection(elon, elat)
     ep = Point(0.0, 0.0)
     min_dist = 99999.
     for poly in plist:
@@ -122,7 +190,206 @@ def dist_to_layer(elon, elat, geom):
     return min_dist
 
 
-def get_layer_distances(elon, elat, layer_dir):
+class LayerIndex(object):
+    """
+    The polygons of the layer files in a directory, parsed once and
+    indexed by their bounding boxes. Use get_layer_index() to get one.
+
+    Args:
+        geoms (dict): The layer geometries (Polygons or MultiPolygons),
+            keyed by layer name.
+
+    Raises:
+        TypeError: If a geometry is not a Polygon or MultiPolygon.
+    """
+    def __init__(self, geoms):
+        self._geoms = {}
+        self._polygons = {}
+        self._bounds = {}
+        for name, geom in geoms.items():
+            if isinstance(geom, Polygon):
+                plist = [geom]
+            elif isinstance(geom, MultiPolygon):
+                plist = list(geom.geoms)
+            else:
+                raise TypeError('Invalid geometry type in layer %s: %s' %
+                                (name, type(geom)))
+            self._geoms[name] = geom
+            self._polygons[name] = plist
+            # (xmin, ymin, xmax, ymax) of each polygon
+            self._bounds[name] = np.array([poly.bounds for poly in plist])
+
+    @classmethod
+    def fromDirectory(cls, layer_dir):
+        """
+        Read the layer files (.wkt) in a directory.
+
+        Args:
+            layer_dir (str): The path to the directory containg the layer
+                files.
+
+        Returns:
+            LayerIndex: The layers.
+        """
+        geoms = {}
+        for file in glob.glob(os.path.join(layer_dir, '*.wkt')):
+            layer_name = os.path.splitext(os.path.basename(file))[0]
+            with open(file, 'r') as fd:
+                data = fd.read()
+            geoms[layer_name] = shapely.wkt.loads(data)
+        return cls(geoms)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read layers written by save().
+
+        Args:
+            filename (str): The file.
+
+        Returns:
+            LayerIndex: The layers.
+        """
+        geoms = {}
+        with np.load(filename) as data:
+            for i, name in enumerate(data['names']):
+                geoms[str(name)] = shapely.wkb.loads(
+                    data['wkb_%d' % i].tobytes())
+        return cls(geoms)
+
+    def save(self, filename):
+        """
+        Write the layers (as Well-Known Binary, which is much faster to
+        read than the text files).
+
+        Args:
+            filename (str): The file.
+        """
+        names = self.getNames()
+        arrays = {}
+        for i, name in enumerate(names):
+            arrays['wkb_%d' % i] = np.frombuffer(
+                shapely.wkb.dumps(self._geoms[name]), dtype=np.uint8)
+        with open(filename, 'wb') as f:
+            np.savez(f, names=np.array(names), **arrays)
+
+    def getNames(self):
+        """
+        Return the names of the layers.
+
+        Returns:
+            list: The sorted layer names.
+        """
+        return sorted(self._geoms)
+
+    def getDistance(self, name, elon, elat, project=None):
+        """
+        Return the distance from a point to the nearest polygon in a
+        layer; see dist_to_layer(). The polygons whose bounding boxes
+        contain the point are checked first, since those are the ones
+        likely to contain it.
+
+        Args:
+            name (str): The layer name.
+            elon (float): The longitude of the reference point.
+            elat (float): The latitude of the reference point.
+            project (function): The result of aeqd_projection() for the
+                reference point. If None, it is made here.
+
+        Returns:
+            float: The distance (in km) from the reference point to the
+            nearest polygon in the layer; zero if the point lies inside
+            a polygon.
+        """
+        bounds = self._bounds[name]
+        plist = self._polygons[name]
+        inbox = (bounds[:, 0] <= elon) & (elon <= bounds[:, 2]) & \
+            (bounds[:, 1] <= elat) & (elat <= bounds[:, 3])
+        if np.any(inbox) and not np.all(inbox):
+            plist = [plist[i] for i in np.argsort(~inbox, kind='mergesort')]
+        return _dist_to_polygons(elon, elat, plist, project)
+
+    def getDistances(self, elon, elat):
+        """
+        Return the distances from a point to the nearest polygon in each
+        layer; see get_layer_distances().
+
+        Args:
+            elon (float): The longitude of the reference point.
+            elat (float): The latitude of the reference point.
+
+        Returns:
+            dict: The distances (in km) keyed by layer name.
+        """
+        project = aeqd_projection(elon, elat)
+        return {name: self.getDistance(name, elon, elat, project)
+                for name in self.getNames()}
+
+
+def _layer_key(layer_dir):
+    """Return a key that identifies the layer files (and their versions)
+    in a directory.
+    """
+    layer_dir = os.path.abspath(layer_dir)
+    files = []
+    for file in sorted(glob.glob(os.path.join(layer_dir, '*.wkt'))):
+        st = os.stat(file)
+        files.append((os.path.basename(file), st.st_size, st.st_mtime_ns))
+    return (layer_dir, tuple(files))
+
+
+def get_layer_index(layer_dir, cache_dir=None):
+    """
+    Return the LayerIndex for the layer files in a directory. Indexes are
+    kept in memory and, if cache_dir is given, in files in cache_dir (so
+    that later processes don't have to parse the layer files), and are
+    remade when the layer files change.
+
+    Args:
+        layer_dir (str): The path to the directory containg the layer
+            files.
+        cache_dir (str): Directory in which to keep indexes between runs;
+            if None, indexes are only kept in memory.
+
+    Returns:
+        LayerIndex: The layers.
+    """
+    key = _layer_key(layer_dir)
+    if key in _LAYER_INDEXES:
+        return _LAYER_INDEXES[key]
+    index = None
+    index_file = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        index_file = os.path.join(cache_dir, digest + '.npz')
+        if os.path.isfile(index_file):
+            try:
+                index = LayerIndex.load(index_file)
+            except (OSError, ValueError, KeyError):
+                index = None
+    if index is None:
+        index = LayerIndex.fromDirectory(layer_dir)
+        if index_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file and rename it, so that
+            # concurrent runs never see a partial file
+            fd, tmpfile = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            os.close(fd)
+            try:
+                index.save(tmpfile)
+                os.replace(tmpfile, index_file)
+            except OSError:
+                if os.path.exists(tmpfile):
+                    os.remove(tmpfile)
+                raise
+    # Only keep the current version of a directory's layers
+    for old_key in [k for k in _LAYER_INDEXES if k[0] == key[0]]:
+        del _LAYER_INDEXES[old_key]
+    _LAYER_INDEXES[key] = index
+    return index
+
+
+def get_layer_distances(elon, elat, layer_dir, cache_dir=None):
     """
     Return the distances from a point to the nearest polygon in each
     layer file found in 'layer_dir'. The distance will be zero if
@@ -140,6 +407,8 @@ def get_layer_distances(elon, elat, layer_dir):
         elat (float): The latitude of the reference point.
         layer_dir (str): The path to the directory containg the layer
             files.
+        cache_dir (str): Directory in which to keep the parsed layers
+            between runs; see get_layer_index().
 
     Returns:
         dict: A dictionary where the keys are the layer names, and the
@@ -147,39 +416,48 @@ def get_layer_distances(elon, elat, layer_dir):
         nearest polygon in the layer. The distance will be zero if the
         point lies inside the polygon.
     """
-    layer_files = glob.glob(os.path.join(layer_dir, '*.wkt'))
-    dist_dict = {}
-    for file in layer_files:
-        layer_name = os.path.splitext(os.path.basename(file))[0]
-        with open(file, 'r') as fd:
-            data = fd.read()
-        geom = shapely.wkt.loads(data)
-        dist_dict[layer_name] = dist_to_layer(elon, elat, geom)
-    return dist_dict
+    return get_layer_index(layer_dir, cache_dir).getDistances(elon, elat)
+
 
+def update_config_regions(lat, lon, config, cache_dir=None):
+    """
+    If a point is inside one of the layers configured in select.conf,
+    replace the default tectonic region configuration with the
+    layer's. Layers are checked in the order they are configured and
+    the first one containing the point is used.
 
-def update_config_regions(lat, lon, config):
-    min_dist_to_layer = 999999.9
+    Args:
+        lat (float): The latitude of the point.
+        lon (float): The longitude of the point.
+        config (dict-like): The validated select.conf configuration.
+        cache_dir (str): Directory in which to keep the parsed layers
+            between runs; see get_layer_index().
+
+    Returns:
+        dict-like: The configuration.
+    """
     inside_layer_name = None
     if 'layers' in config and 'layer_dir' in config['layers']:
         layer_dir = config['layers']['layer_dir']
         if layer_dir and layer_dir != 'None':
-            geo_layers = get_layer_distances(lon, lat, layer_dir)
+            index = get_layer_index(layer_dir, cache_dir)
+            layer_names = set(index.getNames())
         else:
-            geo_layers = {}
+            index = None
+            layer_names = set()
+        project = None
         for layer in config['layers']:
             if layer == 'layer_dir':
                 continue
-            if layer not in geo_layers:
+            if layer not in layer_names:
                 logging.warn('Error: cannot find layer %s in %s' %
                              (layer, layer_dir))
                 continue
-            ldist = geo_layers[layer]
-            if ldist < min_dist_to_layer:
-                min_dist_to_layer = ldist
-                if min_dist_to_layer == 0:
-                    inside_layer_name = layer
-                    break
+            if project is None:
+                project = aeqd_projection(lon, lat)
+            if index.getDistance(layer, lon, lat, project) == 0:
+                inside_layer_name = layer
+                break
     if inside_layer_name is None:
         return config
     else:
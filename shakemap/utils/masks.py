@@ -0,0 +1,153 @@
+"""
+A store of rasterized ocean masks. Rasterizing the ocean polygons onto
+a ShakeMap grid is slow, and the same grid (or the same topography-
+aligned grid) is masked several times per run and again whenever an
+event is rerun, so the masks are kept in memory and, optionally, on disk
+(as bit-packed arrays), keyed by the polygon file and the geodict.
+"""
+import os
+import glob
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import fiona
+from shapely.geometry import shape
+from mapio.grid2d import Grid2D
+
+# The number of masks kept in memory
+MASK_CACHE_SIZE = 8
+
+# The number of mask files kept in the cache directory
+MASK_FILE_LIMIT = 200
+
+_MASK_CACHE = OrderedDict()
+
+
+def _mask_key(oceanfile, geodict):
+    """Return a key that identifies a polygon file (and its version) and
+    a geodict.
+    """
+    oceanfile = os.path.abspath(oceanfile)
+    st = os.stat(oceanfile)
+    return (oceanfile, st.st_size, st.st_mtime_ns,
+            geodict.xmin, geodict.xmax, geodict.ymin, geodict.ymax,
+            geodict.dx, geodict.dy, geodict.nx, geodict.ny)
+
+
+def rasterize_ocean(oceanfile, geodict):
+    """Rasterize the ocean polygons that intersect a grid.
+
+    Args:
+        oceanfile (str): Path to a shapefile of ocean polygons.
+        geodict (GeoDict): The grid.
+
+    Returns:
+        ndarray: A boolean array (shaped like the grid) that is True
+        where the grid is covered by ocean.
+    """
+    bbox = (geodict.xmin, geodict.ymin, geodict.xmax, geodict.ymax)
+    with fiona.open(oceanfile) as c:
+        shapes = [shape(feature['geometry'])
+                  for _, feature in c.items(bbox=bbox)]
+    if not len(shapes):
+        return np.zeros((geodict.ny, geodict.nx), dtype=bool)
+    oceangrid = Grid2D.rasterizeFromGeometry(shapes, geodict, fillValue=0.0)
+    return oceangrid.getData() == 1
+
+
+def _read_mask_file(mask_file, geodict):
+    """Read a mask written by _write_mask_file().
+
+    Args:
+        mask_file (str): Path to the (.npz) mask file.
+        geodict (GeoDict): The grid the mask was made for.
+
+    Returns:
+        ndarray: A boolean array (shaped like the grid) that is True
+        where the grid is covered by ocean.
+    """
+    with np.load(mask_file) as data:
+        bits = data['bits']
+    size = geodict.ny * geodict.nx
+    return np.unpackbits(bits)[:size].reshape(
+        (geodict.ny, geodict.nx)).astype(bool)
+
+
+def _write_mask_file(mask_file, mask):
+    """Write a mask to the cache directory as a bit-packed array, and
+    remove the least recently used mask files beyond MASK_FILE_LIMIT.
+
+    Args:
+        mask_file (str): Path to the (.npz) mask file; its directory is
+            the cache directory.
+        mask (ndarray): The boolean mask array.
+
+    Returns:
+        nothing: Nothing.
+    """
+    # Write to a temporary file and rename it, so that concurrent runs
+    # never see a partial file
+    cache_dir = os.path.dirname(mask_file)
+    fd, tmpfile = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, bits=np.packbits(mask))
+        os.replace(tmpfile, mask_file)
+    except OSError:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    # Remove the least recently used files beyond the limit
+    mask_files = glob.glob(os.path.join(cache_dir, '*.npz'))
+    if len(mask_files) > MASK_FILE_LIMIT:
+        mask_files.sort(key=os.path.getmtime)
+        for old_file in mask_files[:len(mask_files) - MASK_FILE_LIMIT]:
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+
+
+def get_ocean_mask(oceanfile, geodict, cache_dir=None):
+    """Return the ocean mask for a grid, from the in-memory cache, the
+    cache directory, or (if neither has it) by rasterizing the ocean
+    polygons.
+
+    Args:
+        oceanfile (str): Path to a shapefile of ocean polygons.
+        geodict (GeoDict): The grid.
+        cache_dir (str): Directory in which to keep masks between runs;
+            if None, masks are only kept in memory.
+
+    Returns:
+        ndarray: A boolean array (shaped like the grid) that is True
+        where the grid is covered by ocean. The array belongs to the
+        caller.
+    """
+    key = _mask_key(oceanfile, geodict)
+    if key in _MASK_CACHE:
+        _MASK_CACHE.move_to_end(key)
+        return _MASK_CACHE[key].copy()
+    mask = None
+    mask_file = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        mask_file = os.path.join(cache_dir, digest + '.npz')
+        if os.path.isfile(mask_file):
+            try:
+                mask = _read_mask_file(mask_file, geodict)
+                # Mark the file as recently used
+                os.utime(mask_file)
+            except (OSError, ValueError, KeyError):
+                mask = None
+    if mask is None:
+        mask = rasterize_ocean(oceanfile, geodict)
+        if mask_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_mask_file(mask_file, mask)
+    _MASK_CACHE[key] = mask
+    while len(_MASK_CACHE) > MASK_CACHE_SIZE:
+        _MASK_CACHE.popitem(last=False)
+    return mask.copy()
@@ -7,7 +7,7 @@ import logging
 from strec.subtype import SubductionSelector
 
 
-def get_weights(origin, config):
+def get_weights(origin, config, selector=None):
     """Get list of GMPEs and their weights for a given earthquake.
 
     Args:
@@ -15,6 +15,9 @@ def get_weights(origin, config):
             info.
         config (dict-like): Configuration information regarding earthquake
             type.
+        selector (SubductionSelector): A STREC SubductionSelector to use;
+            if None, one is made. Pass one in when processing many
+            events so that STREC is only set up once.
 
     Returns:
         tuple: Tuple with elements that are:
@@ -24,7 +27,7 @@ def get_weights(origin, config):
             - Pandas series containing STREC output.
     """
     logging.debug('Testing')
-    tprobs, strec_results = get_probs(origin, config)
+    tprobs, strec_results = get_probs(origin, config, selector)
     gmpelist = []
     weightlist = []
 
@@ -61,7 +64,7 @@ def get_weights(origin, config):
     return gmpelist, weightlist, strec_results
 
 
-def get_probs(origin, config):
+def get_probs(origin, config, selector=None):
     """Calculate probabilities for each earthquake type.
 
     The results here contain probabilities that can be rolled up in many ways:
@@ -77,6 +80,8 @@ def get_probs(origin, config):
             info.
         config (dict-like): Configuration information regarding earthquake
             type.
+        selector (SubductionSelector): A STREC SubductionSelector to use;
+            if None, one is made.
 
     Returns:
         dict: Probabilities for each earthquake type, with fields:
@@ -99,7 +104,8 @@ def get_probs(origin, config):
                 interface.
 
     """
-    selector = SubductionSelector()
+    if selector is None:
+        selector = SubductionSelector()
     lat, lon, depth, mag = origin.lat, origin.lon, origin.depth, origin.mag
 
     if not origin.id.startswith(origin.netid):
@@ -8,6 +8,9 @@ from datetime import datetime, timezone
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import subprocess
+import heapq
+import itertools
+import math
 
 from configobj import ConfigObj
 from validate import Validator
@@ -21,6 +24,16 @@ MAX_SIZE = 4096
 TIMEFMT = '%Y-%m-%dT%H:%M:%S.%fZ'
 ALT_TIMEFMT = '%Y-%m-%dT%H:%M:%SZ'
 
+# Event priorities for the EventScheduler are in units of magnitude:
+# events inside a metro box get this bonus...
+METRO_BOX_PRIORITY = 1.0
+# ...and events lose this much priority for every factor of ten in
+# their age (in hours) since origin time, so new events run before the
+# reruns of old ones.
+AGE_PRIORITY = 1.0
+# Cancellations go to the head of the queue
+CANCEL_PRIORITY = float('inf')
+
 
 def send_queue(command, data, port=9755):
     """
@@ -164,21 +177,72 @@ def magnitude_too_small(mag, lon, lat, config):
     Returns:
         bool: True if the event is too small to process; False otherwise.
     """
+    minmag, _ = magnitude_threshold(lon, lat, config)
+    return mag < minmag
+
+
+def magnitude_threshold(lon, lat, config):
+    """ Return the threshold magnitude of the first metro box within
+    which the point falls, or the global minmag if it does not fall
+    within a box.
+
+    Args:
+        lon (float): event longitude
+        lat (float): event latitude
+        config (dict): the configuration structure
+
+    Returns:
+        tuple: The threshold magnitude, and a bool that is True if the
+        point is in one of the metro boxes and False otherwise.
+    """
     pt = Point((lon, lat))
     for boxname in sorted(config['boxes']):
         boxdict = config['boxes'][boxname]
         if pt.within(boxdict['poly']):
-            if mag >= boxdict['mag']:
-                return False
-            else:
-                return True
+            return boxdict['mag'], True
     #
     # Not in any boxes
     #
-    if mag >= config['minmag']:
-        return False
+    return config['minmag'], False
+
+
+def event_priority(event, config, current_time=None):
+    """ Return the priority of an event for the EventScheduler. Larger
+    events run first; events in a metro box get a bonus of
+    METRO_BOX_PRIORITY, and AGE_PRIORITY is subtracted for every factor
+    of ten in the age of the event (in hours).
+
+    Args:
+        event (dict): The event data structure; must have 'mag', 'lon',
+                      'lat', and 'time' keys.
+        config (dict): The configuration data structure.
+        current_time (float): The time (Unix timestamp) at which to
+                              evaluate the age of the event; the default
+                              is now.
 
-    return True
+    Returns:
+        float: The priority of the event (higher values run first).
+    """
+    if current_time is None:
+        current_time = time.time()
+    mag = float(event['mag'])
+    _, in_box = magnitude_threshold(float(event['lon']), float(event['lat']),
+                                    config)
+    priority = mag
+    if in_box:
+        priority += METRO_BOX_PRIORITY
+    event_time = None
+    for fmt in (TIMEFMT, ALT_TIMEFMT):
+        try:
+            event_time = datetime.strptime(event['time'], fmt).\
+                replace(tzinfo=timezone.utc).timestamp()
+            break
+        except ValueError:
+            continue
+    if event_time is not None:
+        age_hours = max(0.0, current_time - event_time) / 3600.0
+        priority -= AGE_PRIORITY * math.log10(1.0 + age_hours)
+    return priority
 
 
 def event_too_old_or_in_future(event, config):
@@ -236,7 +300,7 @@ def get_logger(logpath, attached):
     return logger
 
 
-def dispatch_event(eventid, logger, children, action, config):
+def dispatch_event(eventid, logger, children, action, config, pool=None):
     """ Start a subprocess to run the specified event and add its data
     to the children structure.
 
@@ -250,6 +314,10 @@ def dispatch_event(eventid, logger, children, action, config):
                       shake process. See the configuration file 'queue.conf'
                       for the exact commands that will be run.
         config (dict): The configuration dictionary.
+        pool (WorkerPool): A pool of warm shake workers (see
+                      shakemap.utils.workers); if it is not None and one
+                      of its workers is idle, the shake or cancel command
+                      is run by the worker rather than in a new process.
 
     Returns:
         nothing: Nothing.
@@ -259,7 +327,7 @@ def dispatch_event(eventid, logger, children, action, config):
         cmd = config['cancel_command'].replace('shake', config['shake_path'])
         cmd = cmd.replace('<EVID>', eventid)
         cmd = cmd.split()
-        p = subprocess.Popen(cmd)
+        p = _start_command(cmd, config, pool)
     elif action == 'test':
         logger.info('Testing event %s' % eventid)
         p = subprocess.Popen(['echo', eventid])
@@ -268,13 +336,33 @@ def dispatch_event(eventid, logger, children, action, config):
         cmd = config['shake_command'].replace('shake', config['shake_path'])
         cmd = cmd.replace('<EVID>', eventid)
         cmd = cmd.split()
-        p = subprocess.Popen(cmd)
+        p = _start_command(cmd, config, pool)
 
-    children[eventid] = {'popen': p, 'start_time': time.time()}
+    children[eventid] = {'popen': p, 'start_time': time.time(),
+                         'action': action}
 
     return
 
 
+def _start_command(cmd, config, pool):
+    """Run a shake command on an idle worker from the pool, if possible,
+    otherwise in a new process.
+
+    Args:
+        cmd (list): The command and its arguments.
+        config (dict): The configuration dictionary.
+        pool (WorkerPool): The worker pool, or None.
+
+    Returns:
+        subprocess.Popen or WorkerJob: The handle of the running process.
+    """
+    if pool is not None and cmd[0] == config['shake_path']:
+        job = pool.submit(cmd[1:])
+        if job is not None:
+            return job
+    return subprocess.Popen(cmd)
+
+
 def reap_children(children, config, logger):
     """
     Look through the list of child processes, reap the ones that have
@@ -295,8 +383,10 @@ def reap_children(children, config, logger):
     for eventid, info in children.items():
         returncode = info['popen'].poll()
         if returncode is not None:
-            logger.info('Reaped child for event %s (return code %d)' %
-                        (eventid, returncode))
+            logger.info('Reaped child for event %s (return code %d, run '
+                        'time %.1f sec)' %
+                        (eventid, returncode, current_time -
+                         info['start_time']))
             to_delete.append(eventid)
             continue
         #
@@ -313,3 +403,131 @@ def reap_children(children, config, logger):
         del children[eventid]
 
     return
+
+
+class EventScheduler(object):
+    """Limit the number of shake processes that run at once. Events
+    are queued with a priority (see event_priority()) and started, highest
+    priority first, as running processes finish. A trigger for an event
+    that is already waiting in the queue is merged with the waiting entry
+    rather than queued again.
+    """
+
+    def __init__(self, children, config, logger, pool=None):
+        """Create a scheduler.
+
+        Args:
+            children (dict): The structure holding info on the child
+                             processes (see dispatch_event()).
+            config (dict): The configuration dictionary; if
+                           'max_subprocesses' is greater than zero, it is
+                           the maximum number of children that will run
+                           at once, otherwise there is no limit.
+            logger (logger): The process logger.
+            pool (WorkerPool): A pool of warm shake workers passed to
+                           dispatch_event(), or None.
+        """
+        self._children = children
+        self._config = config
+        self._logger = logger
+        self._pool = pool
+        self._max_running = config.get('max_subprocesses', 0)
+        # The queue is a heap of [-priority, sequence, eventid] lists;
+        # _pending maps eventid to the live heap entry and its metadata.
+        # Entries that have been superseded have their eventid set to
+        # None and are discarded when they reach the top of the heap.
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        """Return the number of events waiting to run.
+        """
+        return len(self._pending)
+
+    def __contains__(self, eventid):
+        """Return True if the event is waiting to run.
+        """
+        return eventid in self._pending
+
+    def submit(self, eventid, action, priority):
+        """Queue an event to be run, and start it if there is room.
+
+        If the event is already waiting in the queue, the entries are
+        merged: the higher priority and the earlier submission time are
+        kept. The queued action is kept unless either action is a
+        'cancel', in which case the most recent action is used.
+
+        Args:
+            eventid (str): The event ID to process.
+            action (str): The action passed to dispatch_event().
+            priority (float): The priority of the event (higher values
+                              run first).
+
+        Returns:
+            nothing: Nothing.
+        """
+        submit_time = time.time()
+        if eventid in self._pending:
+            old = self._pending[eventid]
+            self._logger.info('Event %s is already queued; merging action '
+                              '%s with the queued action %s' %
+                              (eventid, action, old['action']))
+            if action != 'cancel' and old['action'] != 'cancel':
+                action = old['action']
+            priority = max(priority, old['priority'])
+            submit_time = old['submit_time']
+            old['entry'][-1] = None
+        entry = [-priority, next(self._counter), eventid]
+        heapq.heappush(self._heap, entry)
+        self._pending[eventid] = {'entry': entry,
+                                  'action': action,
+                                  'priority': priority,
+                                  'submit_time': submit_time}
+        self.startReady()
+        return
+
+    def startReady(self):
+        """Start queued events, highest priority first, until the
+        maximum number of children are running. Events that are
+        already running stay in the queue until they finish.
+
+        Returns:
+            nothing: Nothing.
+        """
+        deferred = []
+        while self._heap:
+            if self._max_running > 0 and \
+               len(self._children) >= self._max_running:
+                break
+            entry = heapq.heappop(self._heap)
+            eventid = entry[-1]
+            if eventid is None:
+                continue
+            if eventid in self._children:
+                deferred.append(entry)
+                continue
+            info = self._pending.pop(eventid)
+            wait_time = time.time() - info['submit_time']
+            dispatch_event(eventid, self._logger, self._children,
+                           info['action'], self._config,
+                           pool=self._pool)
+            self._logger.info('Started event %s (priority %.2f) after '
+                              'waiting %.1f sec in queue; %d running, %d '
+                              'queued' %
+                              (eventid, info['priority'], wait_time,
+                               len(self._children), len(self._pending)))
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return
+
+    def reap(self):
+        """Reap finished children (see reap_children()) and start any
+        queued events that now have room to run.
+
+        Returns:
+            nothing: Nothing.
+        """
+        reap_children(self._children, self._config, self._logger)
+        self.startReady()
+        return
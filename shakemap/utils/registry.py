@@ -0,0 +1,275 @@
+"""
+A lightweight registry of the commands (coremods) available to the shake
+program. The command names, documentation, targets, dependencies, and
+configs of each command are read from the source of the coremod modules
+(without importing them), and the implementing module is only imported
+when a command is actually run. The results are kept in a manifest file
+keyed on the size and modification time of each module, so the sources
+only need to be read again when they change.
+"""
+import os
+import os.path
+import ast
+import json
+import inspect
+import importlib
+import importlib.util
+import pkgutil
+from collections import OrderedDict
+
+# The attributes of a CoreModule subclass that describe its command
+COMMAND_ATTRIBUTES = ('command_name', 'targets', 'dependencies', 'configs')
+
+# Bump this if the format of the manifest changes
+MANIFEST_VERSION = 1
+
+
+class CommandSpec(object):
+    """A stand-in for a CoreModule subclass that has not (necessarily)
+    been imported. It has the class attributes used by the dependency
+    system (command_name, targets, dependencies, configs), and calling
+    it imports the module and instantiates the real class.
+    """
+
+    def __init__(self, command_name, class_name, module, mfile, doc=None,
+                 targets=None, dependencies=None, configs=None):
+        """Create a CommandSpec.
+
+        Args:
+            command_name (str): The name of the command.
+            class_name (str): The name of the class implementing the
+                command.
+            module (str): The name of the module containing the class.
+            mfile (str): The path to the module's source file.
+            doc (str): The class docstring.
+            targets (list): The command's targets (see CoreModule).
+            dependencies (list): The command's dependencies (see
+                CoreModule).
+            configs (list): The command's config files (see CoreModule).
+        """
+        self.command_name = command_name
+        self.class_name = class_name
+        self.module = module
+        self.mfile = mfile
+        self.doc = doc
+        self.targets = targets
+        self.dependencies = dependencies
+        self.configs = configs
+        self._class = None
+
+    def load(self):
+        """Import the module and return the class implementing the
+        command.
+
+        Returns:
+            class: The CoreModule subclass.
+        """
+        if self._class is None:
+            module = importlib.import_module(self.module)
+            self._class = getattr(module, self.class_name)
+        return self._class
+
+    def __call__(self, *args, **kwargs):
+        """Instantiate the class implementing the command.
+        """
+        return self.load()(*args, **kwargs)
+
+    def toDict(self):
+        """Return the static description of the command as a dictionary
+        that can be serialized to JSON.
+        """
+        return {'command_name': self.command_name,
+                'class_name': self.class_name,
+                'module': self.module,
+                'mfile': self.mfile,
+                'doc': self.doc,
+                'targets': self.targets,
+                'dependencies': self.dependencies,
+                'configs': self.configs}
+
+    @classmethod
+    def fromDict(cls, cdict):
+        """Create a CommandSpec from the output of toDict().
+        """
+        cdict = dict(cdict)
+        # JSON turns the dependency tuples into lists
+        if cdict['dependencies'] is not None:
+            cdict['dependencies'] = [tuple(dep) for dep in
+                                     cdict['dependencies']]
+        return cls(**cdict)
+
+
+def _literal_class_attributes(node):
+    """Return a dictionary of the class attributes in COMMAND_ATTRIBUTES
+    that are assigned in the body of the class, or None if any of them
+    are not literals.
+    """
+    attrs = {}
+    for stmt in node.body:
+        if not isinstance(stmt, ast.Assign) or len(stmt.targets) != 1:
+            continue
+        target = stmt.targets[0]
+        if not isinstance(target, ast.Name) or \
+                target.id not in COMMAND_ATTRIBUTES:
+            continue
+        try:
+            attrs[target.id] = ast.literal_eval(stmt.value)
+        except ValueError:
+            return None
+    return attrs
+
+
+def _scan_module(modname, mfile):
+    """Find the commands defined in a module by parsing its source.
+
+    Args:
+        modname (str): The name of the module.
+        mfile (str): The path to the module's source file.
+
+    Returns:
+        list: A list of CommandSpec objects, or None if the commands
+        can't be determined without importing the module (e.g., a class
+        attribute isn't a literal, or a command inherits from something
+        other than CoreModule).
+    """
+    with open(mfile, 'rb') as f:
+        tree = ast.parse(f.read(), filename=mfile)
+    specs = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        attrs = _literal_class_attributes(node)
+        if attrs is None:
+            return None
+        if not attrs.get('command_name'):
+            continue
+        bases = [base.id for base in node.bases
+                 if isinstance(base, ast.Name)]
+        if bases != ['CoreModule']:
+            return None
+        doc = ast.get_docstring(node)
+        specs.append(CommandSpec(attrs['command_name'], node.name, modname,
+                                 mfile, doc=doc,
+                                 targets=attrs.get('targets'),
+                                 dependencies=attrs.get('dependencies'),
+                                 configs=attrs.get('configs')))
+    return specs
+
+
+def _inspect_module(modname):
+    """Find the commands defined in a module by importing it. This is
+    the fallback for modules that _scan_module() can't handle.
+    """
+    module = importlib.import_module(modname)
+    specs = []
+    for name, core_class in inspect.getmembers(module, inspect.isclass):
+        if core_class.__module__ != modname:
+            continue
+        cmd = getattr(core_class, 'command_name', None)
+        if not cmd:
+            continue
+        spec = CommandSpec(cmd, name, modname, module.__file__,
+                           doc=inspect.getdoc(core_class),
+                           targets=core_class.targets,
+                           dependencies=core_class.dependencies,
+                           configs=core_class.configs)
+        spec._class = core_class
+        specs.append(spec)
+    return specs
+
+
+def _find_modules(packages):
+    """Return a list of (module name, source file) for the modules in
+    the named packages, without importing the modules themselves.
+    """
+    modules = []
+    for pkgname in packages:
+        pkgspec = importlib.util.find_spec(pkgname)
+        if pkgspec is None or pkgspec.submodule_search_locations is None:
+            raise ImportError('Cannot find coremods package %s' % pkgname)
+        for _, name, _ in pkgutil.iter_modules(
+                pkgspec.submodule_search_locations, pkgname + '.'):
+            spec = importlib.util.find_spec(name)
+            modules.append((name, spec.origin))
+    return modules
+
+
+def _read_manifest(manifest_file):
+    if manifest_file is None or not os.path.isfile(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('modules', {})
+
+
+def _write_manifest(manifest_file, modules):
+    # Write to a temporary file and rename it, so that concurrent shake
+    # runs never see a partial manifest
+    tmpfile = '%s.%d' % (manifest_file, os.getpid())
+    try:
+        with open(tmpfile, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'modules': modules}, f)
+        os.replace(tmpfile, manifest_file)
+    except OSError:
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+
+
+def get_command_registry(packages, manifest_file=None):
+    """Build the table of commands available to shake, without importing
+    the coremods.
+
+    Args:
+        packages (list): The names of the packages containing the
+            coremods (i.e., the 'coremods' parameter of shake.conf).
+        manifest_file (str): The path to a file in which to cache the
+            command descriptions; if None, no cache is used.
+
+    Returns:
+        OrderedDict: A dictionary, sorted by command name, of
+        command: {'class': CommandSpec, 'module': module name,
+        'mfile': module file}. (This is the form expected by
+        shakemap.utils.dependencies.CommandDatabase.)
+    """
+    old_manifest = _read_manifest(manifest_file)
+    manifest = {}
+    specs = []
+    for modname, mfile in _find_modules(packages):
+        try:
+            st = os.stat(mfile)
+            key = [st.st_size, st.st_mtime_ns]
+        except (OSError, TypeError):
+            key = None
+        entry = old_manifest.get(modname)
+        if key is not None and entry is not None and \
+                entry['mfile'] == mfile and entry['key'] == key:
+            specs += [CommandSpec.fromDict(c) for c in entry['commands']]
+            manifest[modname] = entry
+            continue
+        mspecs = None
+        if mfile is not None and mfile.endswith('.py'):
+            mspecs = _scan_module(modname, mfile)
+        if mspecs is None:
+            # Modules that need to be imported to be understood aren't
+            # cached
+            specs += _inspect_module(modname)
+            continue
+        specs += mspecs
+        if key is not None:
+            manifest[modname] = {'mfile': mfile, 'key': key,
+                                 'commands': [s.toDict() for s in mspecs]}
+    if manifest_file is not None and manifest != old_manifest:
+        _write_manifest(manifest_file, manifest)
+
+    classes = OrderedDict()
+    for spec in sorted(specs, key=lambda s: s.command_name):
+        classes[spec.command_name] = {'class': spec, 'module': spec.module,
+                                      'mfile': spec.mfile}
+    return classes
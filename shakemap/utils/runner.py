@@ -0,0 +1,191 @@
+"""
+Run shake commands concurrently. The commands form a graph based on their
+declared targets and dependencies (see
+shakemap.utils.dependencies.CommandDatabase.getCommandGraph()), and each
+command is run in a process pool as soon as the commands it depends on
+have finished. The log output of each command is collected in the
+worker process and logged by the parent as a block when the command
+finishes, so that the output of concurrent commands isn't interleaved.
+"""
+import io
+import sys
+import time
+import socket
+import logging
+import importlib
+import traceback
+import concurrent.futures as cf
+from collections import OrderedDict
+
+
+def format_error_info(exception, eventid):
+    """
+    Format exception information and stack trace into a coherent multi-line
+    string.
+
+    Args:
+        exception (Exception): Python Exception (or child thereof) instance.
+        eventid (str): ShakeMap event ID (i.e., us2018abcd).
+    Returns:
+        str: Multiline string containing: Hostname,eventid,Exception string,
+             and stack trace.
+
+    """
+    stringio = io.StringIO()
+    ex_type, ex, tb = sys.exc_info()
+    traceback.print_tb(tb, file=stringio)
+    stack_trace = stringio.getvalue()
+    stringio.close()
+    hostname = socket.gethostname()
+    fmt = '\nHost: %s\nEvent ID: %s\nException: %s\nStack Trace: %s'
+    error_msg = fmt % (hostname, eventid, str(exception), stack_trace)
+    return error_msg
+
+
+class _RecordCollector(logging.Handler):
+    """A logging handler that keeps the records it is given, in a form
+    that can be sent back to the parent process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Merge the arguments and the exception into the message so that
+        # the record can be pickled
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _run_command(module, class_name, eventid, arglist, level):
+    """Run a command in a worker process.
+
+    Args:
+        module (str): The name of the module containing the command.
+        class_name (str): The name of the CoreModule subclass.
+        eventid (str): The event ID.
+        arglist (list): The command's command line options.
+        level (int): The logging level.
+
+    Returns:
+        tuple: (log records, error message or None, elapsed time in
+        seconds, the command's contents after it ran or None). Commands
+        may change their contents when they run, so the parent uses
+        these to write contents.xml.
+    """
+    collector = _RecordCollector()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(collector)
+    root.setLevel(level)
+    t1 = time.time()
+    error = None
+    contents = None
+    try:
+        core_class = getattr(importlib.import_module(module), class_name)
+        obj = core_class(eventid)
+        obj.parseArgs(arglist)
+        obj.execute()
+        contents = getattr(obj, 'contents', None)
+    except Exception as e:
+        error = format_error_info(e, eventid)
+    elapsed = time.time() - t1
+    return collector.records, error, elapsed, contents
+
+
+def run_commands(cmd_list, cmd_args, graph, eventid, check, finish, logger,
+                 max_workers):
+    """Run commands concurrently, subject to their dependencies.
+
+    Args:
+        cmd_list (OrderedDict): A dictionary of command: CoreModule
+            instance for the commands to run.
+        cmd_args (dict): A dictionary of command: list of the command's
+            command line options.
+        graph (dict): A dictionary of command: set of the commands that
+            must finish before it can start.
+        eventid (str): The event ID.
+        check (function): A function that is called with a command when
+            its prerequisites have finished. It returns 'run' if the
+            command should be run, 'skip' if it should not be run (the
+            commands that depend on it are still considered), or 'stop'
+            if no more commands should be started.
+        finish (function): A function that is called with a command
+            after it has run successfully. The command's instance in
+            cmd_list has been given the contents of the instance that
+            ran it, so its writeContents() writes what the command
+            made.
+        logger (logger): The logger.
+        max_workers (int): The maximum number of commands to run at once.
+
+    Returns:
+        str: None if all of the commands ran (or were skipped), 'stop' if
+        check() stopped the run, or an error message if a command failed.
+    """
+    pending = OrderedDict((cmd, set(graph[cmd])) for cmd in cmd_list)
+    done = set()
+    running = {}
+    result = None
+    level = logging.getLogger().getEffectiveLevel()
+    with cf.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            #
+            # Start everything that is ready to go; skipping a command
+            # may make others ready, so keep looking until nothing new
+            # happens
+            #
+            progress = result is None
+            while progress:
+                progress = False
+                for cmd in list(pending):
+                    if not pending[cmd] <= done:
+                        continue
+                    del pending[cmd]
+                    logger.info('Running command %s' % cmd)
+                    status = check(cmd)
+                    if status == 'stop':
+                        result = 'stop'
+                        break
+                    if status == 'skip':
+                        done.add(cmd)
+                        progress = True
+                        continue
+                    spec = cmd_list[cmd].__class__
+                    future = executor.submit(_run_command, spec.__module__,
+                                             spec.__name__, eventid,
+                                             cmd_args[cmd], level)
+                    running[future] = cmd
+            if not running:
+                break
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for future in finished:
+                cmd = running.pop(future)
+                try:
+                    records, error, elapsed, contents = future.result()
+                except Exception as e:
+                    # The worker process died
+                    records, error, elapsed, contents = [], str(e), 0, None
+                for record in records:
+                    logger.handle(record)
+                if error is not None:
+                    logger.error('Command %s failed' % cmd)
+                    if result is None or result == 'stop':
+                        result = error
+                    continue
+                logger.info('Finished running command %s: Elapsed %.2f secs'
+                            % (cmd, elapsed))
+                if contents is not None:
+                    cmd_list[cmd].contents = contents
+                finish(cmd)
+                done.add(cmd)
+            if result is not None:
+                # Let the running commands finish, but don't start any more
+                pending.clear()
+    return result
@@ -0,0 +1,201 @@
+"""
+A per-invocation session for the shake program's output container. While
+a session is active, the product modules that call
+open_output_container() share one open ShakeMapOutputContainer, and the
+grids, metadata, station data, and config that they decode from it are
+kept in a read-through cache (subject to a memory limit), so that each
+one is only read and decompressed once per shake run.
+
+Outside of a session, open_output_container() simply loads the container.
+"""
+import os
+import copy
+from collections import OrderedDict
+
+import numpy as np
+
+from shakelib.utils.containers import ShakeMapOutputContainer
+
+# The currently active session (if any)
+_session = None
+
+
+def _nbytes(value):
+    """Estimate the memory used by the numpy arrays in a (possibly
+    nested) result.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if hasattr(value, 'getData'):
+        return _nbytes(value.getData())
+    return 0
+
+
+def _file_key(path):
+    """Return a key that changes when a file is replaced or modified.
+    """
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class CachedOutputContainer(object):
+    """A read-through cache in front of a ShakeMapOutputContainer.
+
+    The results of the methods in CACHED_METHODS are kept, keyed on the
+    method and its arguments, and callers get a (deep) copy of the
+    cached result, so they are free to modify it. Results that hold
+    arrays are discarded, least recently used first, when their total
+    size exceeds the cache's limit. Everything else is passed through to
+    the container.
+    """
+
+    CACHED_METHODS = ('getIMTGrids', 'getIMTArrays', 'getArray',
+                      'getMetadata', 'getStationDict', 'getConfig',
+                      'getIMTs', 'getComponents', 'getDataType',
+                      'getRuptureDict', 'getDictionary',
+                      'getVersionHistory')
+
+    def __init__(self, container, max_bytes):
+        """Create a cache.
+
+        Args:
+            container (ShakeMapOutputContainer): The open container.
+            max_bytes (int): The maximum size (in bytes) of the cached
+                arrays.
+        """
+        self._container = container
+        self._max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, name, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return getattr(self._container, name)(*args, **kwargs)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(self._cache[key][0])
+        self.misses += 1
+        value = getattr(self._container, name)(*args, **kwargs)
+        nbytes = _nbytes(value)
+        if nbytes <= self._max_bytes:
+            self._cache[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self._max_bytes:
+                _, (_, old_nbytes) = self._cache.popitem(last=False)
+                self._nbytes -= old_nbytes
+            value = copy.deepcopy(value)
+        return value
+
+    def __getattr__(self, name):
+        if name in self.CACHED_METHODS:
+            def method(*args, **kwargs):
+                return self._cached(name, *args, **kwargs)
+            return method
+        return getattr(self._container, name)
+
+    def close(self):
+        """Does nothing: the container stays open until the session
+        ends.
+        """
+        pass
+
+
+class ContainerSession(object):
+    """A context manager that makes open_output_container() share
+    containers (and their decoded contents) until it exits.
+    """
+
+    def __init__(self, max_mb=512):
+        """Create a session.
+
+        Args:
+            max_mb (float): The maximum size (in MB) of the decoded
+                arrays kept for each container.
+        """
+        self._max_bytes = int(max_mb * 1048576)
+        self._containers = {}
+
+    def __enter__(self):
+        global _session
+        self._previous = _session
+        _session = self
+        return self
+
+    def __exit__(self, *args):
+        global _session
+        _session = self._previous
+        self.close()
+        return False
+
+    def open(self, datafile):
+        """Return the shared container for a file, (re)opening it if the
+        file has changed since it was opened.
+
+        Args:
+            datafile (str): The path to the HDF file.
+
+        Returns:
+            CachedOutputContainer: The shared container.
+        """
+        path = os.path.abspath(datafile)
+        if path in self._containers:
+            old_key, cached = self._containers[path]
+            if old_key == _file_key(path):
+                return cached
+            cached._container.close()
+        cached = CachedOutputContainer(ShakeMapOutputContainer.load(path),
+                                       self._max_bytes)
+        # The file is opened read/write, and HDF5 may touch it on open,
+        # so the key is taken after opening
+        self._containers[path] = (_file_key(path), cached)
+        return cached
+
+    def paths(self):
+        """Return a list of the files the session has open.
+        """
+        return list(self._containers.keys())
+
+    def discard(self, datafile):
+        """Close a file (if the session has it open) and drop its cached
+        contents.
+
+        Args:
+            datafile (str): The path to the HDF file.
+        """
+        path = os.path.abspath(datafile)
+        if path in self._containers:
+            _, cached = self._containers.pop(path)
+            cached._container.close()
+
+    def close(self):
+        """Close all of the session's containers.
+        """
+        for _, cached in self._containers.values():
+            cached._container.close()
+        self._containers = {}
+
+
+def open_output_container(datafile):
+    """Open an output container for reading. If a ContainerSession is
+    active, the session's shared container is returned (and its close()
+    method does nothing); otherwise the file is loaded.
+
+    Args:
+        datafile (str): The path to the HDF file.
+
+    Returns:
+        ShakeMapOutputContainer or CachedOutputContainer: The container.
+    """
+    if _session is not None:
+        return _session.open(datafile)
+    return ShakeMapOutputContainer.load(datafile)
@@ -0,0 +1,341 @@
+"""
+A pool of long-lived "warm" worker processes that run shake. Each worker
+loads the shake program (and, thus, its configuration and all of the
+coremods and their dependencies) once, and then runs the event jobs it
+is sent without the startup cost of a new interpreter. Workers are
+replaced after a configurable number of jobs, or when their memory use
+grows too large.
+"""
+import os
+import os.path
+import sys
+import runpy
+import shutil
+import signal
+import multiprocessing
+
+import psutil
+
+# How long (in seconds) to wait for a worker to exit when stopping it
+STOP_TIMEOUT = 5
+
+
+def _worker_main(conn, shake_path):
+    """The main loop of a worker process: load shake, then run the jobs
+    that arrive on the connection until told to quit (by receiving None)
+    or the connection is closed.
+
+    Each job is a list of command line arguments for shake (not
+    including the program name); the result sent back is a tuple of
+    (return code, memory in use in MB).
+
+    Args:
+        conn (multiprocessing.Connection): The worker's end of the pipe.
+        shake_path (str): The path to the shake program.
+
+    Returns:
+        nothing: Nothing.
+    """
+    shake = runpy.run_path(shake_path, run_name='shake_worker')
+    if 'preload_commands' in shake:
+        shake['preload_commands']()
+    parser = shake['get_parser']()
+    process = psutil.Process(os.getpid())
+    while True:
+        try:
+            argv = conn.recv()
+        except EOFError:
+            break
+        if argv is None:
+            break
+        try:
+            pargs = parser.parse_args(argv)
+            shake['main'](pargs)
+            returncode = 0
+        except SystemExit as e:
+            if e.code is None:
+                returncode = 0
+            elif isinstance(e.code, int):
+                returncode = e.code
+            else:
+                returncode = 1
+        except Exception:
+            returncode = 1
+        # Anything left in the output buffers should go out now, not
+        # with the next job
+        sys.stdout.flush()
+        sys.stderr.flush()
+        mem = process.memory_info().rss / 1048576.0
+        conn.send((returncode, mem))
+    conn.close()
+
+
+class WorkerJob(object):
+    """A job running in a ShakeWorker. It provides the parts of the
+    interface of subprocess.Popen that queue.reap_children() uses:
+    poll(), wait(), kill(), and returncode.
+    """
+
+    def __init__(self, worker):
+        """Create a job handle.
+
+        Args:
+            worker (ShakeWorker): The worker running the job.
+        """
+        self._worker = worker
+        self.returncode = None
+
+    def poll(self):
+        """Check if the job has finished.
+
+        Returns:
+            int: The return code of the job, or None if it is still
+            running.
+        """
+        if self.returncode is None:
+            self._worker.check()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Wait for the job to finish.
+
+        Args:
+            timeout (float): The maximum time (in seconds) to wait; None
+                waits forever.
+
+        Returns:
+            int: The return code of the job, or None if it timed out.
+        """
+        if self.returncode is None:
+            self._worker.check(timeout=timeout, block=True)
+        return self.returncode
+
+    def kill(self):
+        """Kill the job. This kills the worker running the job (the
+        pool will replace it).
+        """
+        if self.returncode is None:
+            self._worker.terminate()
+
+
+class ShakeWorker(object):
+    """A single warm worker process.
+    """
+
+    def __init__(self, shake_path):
+        """Start a worker process.
+
+        Args:
+            shake_path (str): The path to the shake program.
+        """
+        # A freshly spawned interpreter doesn't inherit our sockets,
+        # database connections, or daemon state
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(target=_worker_main,
+                                    args=(child_conn, shake_path))
+        self._process.start()
+        child_conn.close()
+        self.job = None
+        self.njobs = 0
+        self.memory = 0.0
+
+    @property
+    def pid(self):
+        """The process ID of the worker.
+        """
+        return self._process.pid
+
+    def is_alive(self):
+        """Return True if the worker process is running.
+        """
+        return self._process.is_alive()
+
+    def is_idle(self):
+        """Return True if the worker is alive and not running a job.
+        """
+        self.check()
+        return self.job is None and self.is_alive()
+
+    def run(self, argv):
+        """Send a job to the worker.
+
+        Args:
+            argv (list): The command line arguments for shake (not
+                including the program name).
+
+        Returns:
+            WorkerJob: A handle for the job.
+        """
+        self._conn.send(argv)
+        self.job = WorkerJob(self)
+        self.njobs += 1
+        return self.job
+
+    def check(self, timeout=0, block=False):
+        """See if the current job (if any) has finished, and if so, set
+        its return code.
+
+        Args:
+            timeout (float): How long to wait for the result (if block
+                is True); None waits forever.
+            block (bool): Whether or not to wait for the result.
+
+        Returns:
+            nothing: Nothing.
+        """
+        if self.job is None:
+            return
+        if not block:
+            timeout = 0
+        try:
+            ready = self._conn.poll(timeout)
+        except (EOFError, OSError):
+            ready = True
+        if ready:
+            try:
+                returncode, self.memory = self._conn.recv()
+            except (EOFError, OSError):
+                returncode = self._exitcode()
+            self.job.returncode = returncode
+            self.job = None
+        elif not self.is_alive():
+            self.job.returncode = self._exitcode()
+            self.job = None
+
+    def _exitcode(self):
+        """The return code to report for a job whose worker died.
+        """
+        self._process.join(STOP_TIMEOUT)
+        code = self._process.exitcode
+        if code is None or code == 0:
+            code = -1
+        return code
+
+    def stop(self):
+        """Ask the worker to exit (when its current job, if any, is
+        done), and kill it if it doesn't.
+        """
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            self.terminate()
+        self._conn.close()
+
+    def terminate(self):
+        """Kill the worker immediately. A job that was running will
+        have a negative return code.
+        """
+        self._process.terminate()
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            # Process.kill() is new in Python 3.7
+            try:
+                os.kill(self._process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self._process.join()
+        if self.job is not None:
+            self.job.returncode = self._process.exitcode
+            self.job = None
+
+
+class WorkerPool(object):
+    """A pool of ShakeWorkers.
+    """
+
+    def __init__(self, config, logger):
+        """Start the workers.
+
+        Args:
+            config (dict): The queue configuration; uses the
+                'shake_path', 'workers', 'worker_max_jobs', and
+                'worker_max_memory' parameters.
+            logger (logger): The process logger.
+
+        Raises:
+            FileNotFoundError: If the shake program can't be found.
+        """
+        shake_path = config['shake_path']
+        if not os.path.isfile(shake_path):
+            shake_path = shutil.which(shake_path)
+            if shake_path is None:
+                raise FileNotFoundError("Can't find the shake program %s" %
+                                        config['shake_path'])
+        self._shake_path = shake_path
+        self._max_jobs = config['worker_max_jobs']
+        self._max_memory = config['worker_max_memory']
+        self._logger = logger
+        self._workers = []
+        for _ in range(config['workers']):
+            self._startWorker()
+
+    def __len__(self):
+        return len(self._workers)
+
+    @property
+    def shake_path(self):
+        """The path to the shake program run by the workers.
+        """
+        return self._shake_path
+
+    def _startWorker(self):
+        worker = ShakeWorker(self._shake_path)
+        self._workers.append(worker)
+        self._logger.info('Started shake worker (pid %d)' % worker.pid)
+        return worker
+
+    def recycle(self):
+        """Replace workers that have died, have run worker_max_jobs jobs,
+        or are using more than worker_max_memory MB (if it is greater
+        than zero). Workers that are running a job are left alone.
+
+        Returns:
+            nothing: Nothing.
+        """
+        for worker in list(self._workers):
+            worker.check()
+            if worker.job is not None:
+                continue
+            if not worker.is_alive():
+                reason = 'worker died'
+            elif worker.njobs >= self._max_jobs:
+                reason = 'ran %d jobs' % worker.njobs
+            elif self._max_memory > 0 and worker.memory > self._max_memory:
+                reason = 'using %.1f MB' % worker.memory
+            else:
+                continue
+            self._logger.info('Recycling shake worker (pid %d): %s' %
+                              (worker.pid, reason))
+            worker.stop()
+            self._workers.remove(worker)
+            self._startWorker()
+
+    def submit(self, argv):
+        """Run a job on an idle worker.
+
+        Args:
+            argv (list): The command line arguments for shake (not
+                including the program name).
+
+        Returns:
+            WorkerJob: A handle for the job, or None if there are no idle
+            workers.
+        """
+        self.recycle()
+        for worker in self._workers:
+            if worker.is_idle():
+                self._logger.info('Sending job to shake worker (pid %d)' %
+                                  worker.pid)
+                return worker.run(argv)
+        return None
+
+    def shutdown(self):
+        """Stop all of the workers.
+        """
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
@@ -151,5 +151,27 @@ def test_wgrw12():
         mi, dmda = gmice.getMIfromGM(amps_in, MMI(), dists=None, mag=None)
 
 
+def test_wgrw12_multiple_imts():
+    gmice = WGRW12()
+    imts = [PGA(), PGV(), SA(0.3), SA(1.0), SA(3.0)]
+    mmi = mmi_in.copy()
+    mmi[1] = np.nan
+    for dd, mag in [(None, None), (dists, 6.5)]:
+        result = gmice.getGMsfromMI(mmi, imts, dists=dd, mag=mag)
+        assert set(result) == set(imts)
+        for imt in imts:
+            amps, dadm = gmice.getGMfromMI(mmi, imt, dists=dd, mag=mag)
+            np.testing.assert_array_equal(result[imt][0], amps)
+            np.testing.assert_array_equal(result[imt][1], dadm)
+            assert np.isnan(amps[1]) and np.isnan(dadm[1])
+    # The input is not changed
+    assert np.isnan(mmi[1])
+    np.testing.assert_array_equal(mmi[2:], mmi_in[2:])
+
+    with pytest.raises(ValueError):
+        gmice.getGMsfromMI(mmi, [PGA(), MMI()])
+
+
 if __name__ == '__main__':
     test_wgrw12()
+    test_wgrw12_multiple_imts()
@@ -278,6 +278,78 @@ Available IMTs (components):
         os.remove(datafile)
 
 
+def test_output_grid_storage():
+    geodict = GeoDict.createDictFromBox(-118.5, -114.5, 32.1, 36.7, 0.01, 0.02)
+    mean_data = np.random.rand(geodict.ny, geodict.nx)
+    std_data = mean_data / 10
+    mean_grid = Grid2D(mean_data, geodict)
+    std_grid = Grid2D(std_data, geodict)
+
+    f, datafile = tempfile.mkstemp()
+    os.close(f)
+    try:
+        container = ShakeMapOutputContainer.create(datafile)
+        container.setIMTGrids('mmi', mean_grid, {}, std_grid, {},
+                              component='maximum', compression='lzf',
+                              shuffle=True, chunks=(64, 5000))
+        container.setIMTGrids('pga', mean_grid, {}, std_grid, {},
+                              component='maximum', compression_opts=1)
+        container.setIMTGrids('pgv', mean_grid, {}, std_grid, {},
+                              component='maximum', compression=False)
+        container.close()
+
+        container = ShakeMapOutputContainer.load(datafile)
+        dset = container._hdfobj['imts']['mmi_maximum']['mean']
+        assert dset.compression == 'lzf'
+        assert dset.shuffle
+        # The chunk shape is clipped to the grid
+        assert dset.chunks == (64, geodict.nx)
+        dset = container._hdfobj['imts']['pga_maximum']['std']
+        assert dset.compression == 'gzip'
+        assert dset.compression_opts == 1
+        dset = container._hdfobj['imts']['pgv_maximum']['std']
+        assert dset.compression is None
+        for imt in ['mmi', 'pga', 'pgv']:
+            imt_dict = container.getIMTGrids(imt, 'maximum')
+            np.testing.assert_array_equal(imt_dict['mean'].getData(),
+                                          mean_data)
+            np.testing.assert_array_equal(imt_dict['std'].getData(),
+                                          std_data)
+
+        # Read a window
+        imt_dict = container.getIMTGrids('mmi', 'maximum',
+                                         bounds=(-117.0, -116.0, 34.0, 35.0))
+        wdict = imt_dict['mean'].getGeoDict()
+        assert wdict.xmin <= -117.0 and wdict.xmax >= -116.0
+        assert wdict.ymin <= 34.0 and wdict.ymax >= 35.0
+        assert wdict.dx == geodict.dx and wdict.dy == geodict.dy
+        row = int(round((geodict.ymax - wdict.ymax) / geodict.dy))
+        col = int(round((wdict.xmin - geodict.xmin) / geodict.dx))
+        np.testing.assert_array_equal(
+            imt_dict['mean'].getData(),
+            mean_data[row:row + wdict.ny, col:col + wdict.nx])
+        np.testing.assert_array_equal(
+            imt_dict['std'].getData(),
+            std_data[row:row + wdict.ny, col:col + wdict.nx])
+
+        # A decimated view of the whole grid
+        imt_dict = container.getIMTGrids('pga', 'maximum', stride=4)
+        wdict = imt_dict['mean'].getGeoDict()
+        np.testing.assert_array_equal(imt_dict['mean'].getData(),
+                                      mean_data[::4, ::4])
+        assert wdict.dx == geodict.dx * 4
+        assert wdict.xmin == geodict.xmin and wdict.ymax == geodict.ymax
+        assert (wdict.ny, wdict.nx) == mean_data[::4, ::4].shape
+
+        # Bounds that miss the grid
+        with pytest.raises(ValueError):
+            container.getIMTGrids('pga', 'maximum',
+                                  bounds=(10.0, 11.0, 10.0, 11.0))
+        container.close()
+    finally:
+        os.remove(datafile)
+
+
 def test_output_arrays():
 
     f, datafile = tempfile.mkstemp()
@@ -354,6 +426,68 @@ def test_output_arrays():
         os.remove(datafile)
 
 
+def test_output_arrays_append():
+
+    f, datafile = tempfile.mkstemp()
+    os.close(f)
+
+    try:
+        container = ShakeMapOutputContainer.create(datafile)
+        mean = np.random.rand(100)
+        std = np.random.rand(100)
+        lats = np.random.rand(100)
+        lons = np.random.rand(100)
+        ids = np.array([randomword(random.randint(1, 10)).encode('ascii')
+                        for x in range(100)])
+        metadata = {
+            'units': '%g',
+            'digits': 4
+        }
+        #
+        # Store the points in pieces of different sizes
+        #
+        for start, end in ((0, 10), (10, 11), (11, 100)):
+            container.appendIMTArrays('PGA', lons[start:end],
+                                      lats[start:end], ids[start:end],
+                                      mean[start:end], metadata,
+                                      std[start:end], metadata, 'Larger')
+            container.appendArray('vs30', mean[start:end],
+                                  metadata={'units': 'm/s'})
+        dout = container.getIMTArrays('PGA', 'Larger')
+        assert all(dout['lons'] == lons)
+        assert all(dout['lats'] == lats)
+        assert all(dout['ids'] == ids)
+        assert all(dout['mean'] == mean)
+        assert all(dout['std'] == std)
+        assert dout['mean_metadata']['digits'] == 4
+        vs30, vs30_metadata = container.getArray('vs30')
+        assert all(vs30 == mean)
+        assert vs30_metadata['units'] == 'm/s'
+        assert container.getDataType() == 'points'
+        # Shapes of inputs not the same
+        with pytest.raises(ValueError):
+            container.appendIMTArrays('PGA', lons[:5], lats, ids,
+                                      mean, metadata,
+                                      std, metadata, 'Larger')
+        # Can't append to the arrays made by setIMTArrays()
+        container.setIMTArrays('PGV', lons, lats, ids,
+                               mean, metadata,
+                               std, metadata, 'Larger')
+        with pytest.raises(TypeError):
+            container.appendIMTArrays('PGV', lons, lats, ids,
+                                      mean, metadata,
+                                      std, metadata, 'Larger')
+        # Trying to set a grid in a file with points
+        with pytest.raises(TypeError):
+            container.setIMTGrids('MMI', mean, metadata,
+                                  std, metadata, 'Larger')
+
+        container.close()
+
+    finally:
+        os.remove(datafile)
+
+
 def test_output_repr():
     out_file = os.path.join(
         shakedir, 'tests', 'data', 'containers', 'northridge',
@@ -386,5 +520,7 @@ Available IMTs (components):
 if __name__ == '__main__':
     test_input_container()
     test_output_container()
+    test_output_grid_storage()
     test_output_arrays()
+    test_output_arrays_append()
     test_output_repr()
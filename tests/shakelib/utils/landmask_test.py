@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import os.path
+import tempfile
+import shutil
+
+# third party imports
+import numpy as np
+import pytest
+from mapio.geodict import GeoDict
+
+# local imports
+from shakelib.utils.landmask import LandMask, get_land_mask
+
+
+def test_landmask():
+    tdir = tempfile.mkdtemp()
+    try:
+        # A mask of 5 degree cells
+        rng = np.random.RandomState(42)
+        land = rng.uniform(size=(36, 72)) > 0.5
+        mfile = os.path.join(tdir, 'landmask.npy')
+        lm = LandMask.create(mfile, land)
+        assert lm.getResolution() == 5.0
+
+        # The centers of the cells
+        lons = -177.5 + 5.0 * np.arange(72)
+        lats = 87.5 - 5.0 * np.arange(36)
+        glons, glats = np.meshgrid(lons, lats)
+        assert np.array_equal(lm.isLand(glons, glats), land)
+        # Longitudes in any range, and lats and lons that broadcast
+        assert np.array_equal(lm.isLand(glons + 360.0, glats), land)
+        assert np.array_equal(lm.isLand(lons[np.newaxis, :] - 360.0,
+                                        lats[:, np.newaxis]), land)
+        # Latitudes beyond the poles are in the first and last rows
+        assert np.array_equal(lm.isLand(lons, 95.0), land[0, :])
+        assert np.array_equal(lm.isLand(lons, -95.0), land[-1, :])
+
+        # A grid across the antimeridian
+        gd = GeoDict.createDictFromBox(170.0, 200.0, -20.0, 10.0, 0.5, 0.5)
+        water = lm.getWaterMask(gd)
+        assert water.shape == (gd.ny, gd.nx)
+        glons, glats = np.meshgrid(
+            gd.xmin + gd.dx * np.arange(gd.nx),
+            gd.ymax - gd.dy * np.arange(gd.ny))
+        assert np.array_equal(water, ~lm.isLand(glons, glats))
+
+        # Read the file again
+        lm2 = get_land_mask(mfile)
+        assert np.array_equal(lm2.getWaterMask(gd), water)
+        assert get_land_mask(mfile) is lm2
+
+        with pytest.raises(ValueError):
+            LandMask.create(os.path.join(tdir, 'bad.npy'),
+                            np.ones((36, 70), dtype=bool))
+        with pytest.raises(ValueError):
+            LandMask.fromBasemap(os.path.join(tdir, 'bad.npy'), grid=3)
+        np.save(os.path.join(tdir, 'bad.npy'), np.zeros((4, 4)))
+        with pytest.raises(ValueError):
+            LandMask(os.path.join(tdir, 'bad.npy'))
+    finally:
+        shutil.rmtree(tdir)
+
+
+if __name__ == '__main__':
+    test_landmask()
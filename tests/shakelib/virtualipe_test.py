@@ -219,6 +219,19 @@ def test_virtualipe():
     assert(np.allclose(mmi_fd, mmi_rjb))
     assert(np.allclose(mmi_fdsd, mmi_sd_rjb))
 
+    # Supplying the GMPE's predictions gives the same results
+    gm_mean, gm_sd = gmpe.get_mean_and_stddevs(sx, rx, dx, ipe.imt,
+                                               sd_types)
+    mmi_pre, mmi_sd_pre = ipe.get_mean_and_stddevs(sx, rx, dx, MMI(),
+                                                   sd_types, gm_mean=gm_mean,
+                                                   gm_stddevs=gm_sd)
+    assert(np.allclose(mmi_pre, mmi_rjb))
+    for i in range(len(sd_types)):
+        assert(np.allclose(mmi_sd_pre[i], mmi_sd_rjb[i]))
+    with pytest.raises(ValueError):
+        ipe.get_mean_and_stddevs(sx, rx, dx, MMI(), sd_types,
+                                 gm_mean=gm_mean)
+
 
 if __name__ == '__main__':
 
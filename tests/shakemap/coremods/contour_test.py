@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 
+import os.path
+import json
+import tempfile
+
 import numpy as np
-from shakelib.plotting.contour import getContourLevels
+from skimage import measure
+from shakelib.plotting.contour import getContourLevels, find_contours
+from shakemap.coremods.contour import write_geojson
 
 
 def test_intervals():
@@ -21,5 +27,93 @@ def test_intervals():
     np.testing.assert_almost_equal(intervals[-1], 8.0)
 
 
+def test_find_contours():
+    # A small square bump: one closed contour at each level
+    grid = np.zeros((4, 4))
+    grid[1:3, 1:3] = 2.0
+    contours = find_contours(grid, [1.0, 0.5, 3.0])
+    assert len(contours) == 3
+    assert len(contours[0]) == 1
+    line = contours[0][0]
+    assert len(line) == 9
+    np.testing.assert_array_equal(line[0], line[-1])
+    assert {tuple(p) for p in line} == {
+        (0.5, 1.0), (0.5, 2.0), (1.0, 2.5), (2.0, 2.5), (2.5, 2.0),
+        (2.5, 1.0), (2.0, 0.5), (1.0, 0.5)}
+    assert {tuple(p) for p in contours[1][0]} == {
+        (0.25, 1.0), (0.25, 2.0), (1.0, 2.75), (2.0, 2.75), (2.75, 2.0),
+        (2.75, 1.0), (2.0, 0.25), (1.0, 0.25)}
+    assert contours[2] == []
+
+    # A ramp crossing the grid: open lines, the same as one level at a
+    # time; cells with NaNs break the lines
+    x, y = np.meshgrid(np.linspace(0, 10, 30), np.linspace(0, 5, 20))
+    grid = x + y
+    levels = [2.0, 7.5, 12.0]
+    contours = find_contours(grid, levels)
+    for level, lines in zip(levels, contours):
+        assert len(lines) == 1
+        single = find_contours(grid, [level])[0]
+        np.testing.assert_array_equal(lines[0], single[0])
+        rows = lines[0][:, 0]
+        cols = lines[0][:, 1]
+        np.testing.assert_allclose(cols * 10 / 29 + rows * 5 / 19, level)
+    grid[10, :] = np.nan
+    contours = find_contours(grid, [7.5])
+    assert len(contours[0]) == 2
+
+    # The lines should be the same as those of scikit-image, in the same
+    # order, including for grids with NaNs and with values equal to the
+    # contour levels
+    rng = np.random.RandomState(0)
+    for i in range(30):
+        ny, nx = rng.randint(2, 40, 2)
+        grid = rng.uniform(0, 10, (ny, nx))
+        if i % 3 == 1:
+            grid = np.round(grid)
+        elif i % 3 == 2:
+            grid[rng.uniform(size=grid.shape) < 0.05] = np.nan
+        levels = list(rng.uniform(0, 10, 4)) + [5.0]
+        contours = find_contours(grid, levels)
+        for level, lines in zip(levels, contours):
+            expected = measure.find_contours(grid, level)
+            assert len(lines) == len(expected)
+            for line, eline in zip(lines, expected):
+                np.testing.assert_array_equal(line, eline)
+
+
+def test_write_geojson():
+    features = [
+        {'geometry': {'type': 'MultiLineString',
+                      'coordinates': [[[-120.0, 35.0], [-119.5, 35.5]],
+                                      [[-121.0, 34.5], [-120.5, 34.0]]]},
+         'properties': {'value': 4.5, 'units': 'mmi'}},
+        {'geometry': {'type': 'MultiLineString',
+                      'coordinates': [[[-120.2, 36.0], [-120.1, 35.8]]]},
+         'properties': {'value': 5.0, 'units': 'mmi'}}]
+    metadata = {'eventid': 'test', 'longitude': -120.0, 'latitude': 35.0}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'cont_MMI.json')
+        write_geojson(filename, features, metadata)
+        with open(filename) as f:
+            data = json.load(f)
+        assert data['type'] == 'FeatureCollection'
+        assert data['metadata'] == metadata
+        assert data['bbox'] == [-121.0, 34.0, -119.5, 36.0]
+        assert len(data['features']) == 2
+        assert data['features'][1]['type'] == 'Feature'
+        assert data['features'][1]['properties'] == {'value': 5.0,
+                                                     'units': 'mmi'}
+        assert data['features'][0]['geometry'] == features[0]['geometry']
+
+        write_geojson(filename, [], metadata)
+        with open(filename) as f:
+            data = json.load(f)
+        assert data['features'] == []
+        assert 'bbox' not in data
+
+
 if __name__ == '__main__':
     test_intervals()
+    test_find_contours()
+    test_write_geojson()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os.path
+import zipfile
+import tempfile
+from datetime import datetime
+from collections import OrderedDict
+
+import numpy as np
+from mapio.geodict import GeoDict
+from mapio.shake import ShakeGrid
+
+from shakemap.coremods.gridxml import (GridXMLModule, GridXMLWriter,
+                                       write_grid_xml)
+
+
+def test_write_grid_xml():
+    geodict = GeoDict({'xmin': -118.0, 'xmax': -117.0, 'ymin': 34.0,
+                       'ymax': 34.5, 'dx': 0.1, 'dy': 0.1, 'nx': 11,
+                       'ny': 6})
+    rng = np.random.RandomState(1234)
+    mmi = rng.uniform(1, 10, (6, 11))
+    pga = rng.uniform(0.01, 100, (6, 11))
+    layers = OrderedDict([('MMI', (mmi, 'intensity', 3)),
+                          ('PGA', (pga, '%g', 4))])
+    event_dict = {'event_id': 'test', 'magnitude': 6.5, 'depth': 10.0,
+                  'lat': 34.2, 'lon': -117.5,
+                  'event_timestamp': datetime(2018, 1, 1, 12, 0, 0),
+                  'event_description': 'Somewhere & nowhere',
+                  'event_network': 'us'}
+    shake_dict = {'event_id': 'test', 'shakemap_id': 'test',
+                  'shakemap_version': 1, 'code_version': '4.0',
+                  'process_timestamp': datetime(2018, 1, 1, 12, 30, 0),
+                  'shakemap_originator': 'us', 'map_status': 'RELEASED',
+                  'shakemap_event_type': 'ACTUAL'}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        xmlfile = os.path.join(tmpdir, 'grid.xml')
+        zfile = os.path.join(tmpdir, 'grid2.xml.zip')
+        writers = [GridXMLWriter(xmlfile, layers, geodict, event_dict,
+                                 shake_dict),
+                   GridXMLWriter(zfile, layers, geodict, event_dict,
+                                 shake_dict, zip_output=True)]
+        # write a few rows at a time
+        write_grid_xml(writers, geodict, block_points=25)
+        for writer in writers:
+            writer.close()
+
+        grid = ShakeGrid.load(xmlfile, adjust='res')
+        assert grid.getEventDict()['event_description'] == \
+            'Somewhere & nowhere'
+        np.testing.assert_allclose(grid.getLayer('mmi').getData(), mmi,
+                                   rtol=5e-3)
+        np.testing.assert_allclose(grid.getLayer('pga').getData(), pga,
+                                   rtol=5e-4)
+        with zipfile.ZipFile(zfile) as zf:
+            assert zf.namelist() == ['grid2.xml']
+            with open(xmlfile, 'rb') as f:
+                assert zf.read('grid2.xml') == f.read()
+
+
+def test_gridxml_contents():
+    # The contents are set by the options, before execute() runs
+    mod = GridXMLModule('test')
+    assert mod.parseArgs(['-z']) == []
+    filenames = [f['filename'] for c in mod.contents.values()
+                 for f in c['formats']]
+    assert sorted(filenames) == ['grid.xml.zip', 'uncertainty.xml.zip']
+    mod = GridXMLModule('test')
+    mod.parseArgs([])
+    filenames = [f['filename'] for c in mod.contents.values()
+                 for f in c['formats']]
+    assert sorted(filenames) == ['grid.xml', 'uncertainty.xml']
+    assert GridXMLModule('test', zip_output=True).contents['xmlGrids'][
+        'formats'][0]['type'] == 'application/zip'
+
+
+if __name__ == '__main__':
+    test_write_grid_xml()
+    test_gridxml_contents()
@@ -3,12 +3,15 @@
 import os
 import os.path
 
+import numpy as np
 import pytest
+from configobj import ConfigObj
 
 from shakemap.utils.config import get_config_paths
 from shakemap.coremods.model import ModelModule
 from shakemap.coremods.assemble import AssembleModule
 from shakemap.coremods.plotregr import PlotRegr
+from shakelib.utils.containers import ShakeMapOutputContainer
 from common import clear_files, set_files
 
 ########################################################################
@@ -75,8 +78,136 @@ def test_model_4():
     clear_files(event_path)
 
 
+def test_model_adaptive():
+
+    #
+    # With a refine_tolerance of zero, the adaptive grid should refine
+    # every cell and reproduce the full resolution grid; with a
+    # refine_tolerance (and no refine_distance), the interpolated points
+    # should be within the tolerance of the full resolution grid
+    #
+    install_path, data_path = get_config_paths()
+    event_path = os.path.join(data_path, 'nc72282711', 'current')
+    set_files(event_path, {'event.xml': 'event.xml',
+                           'stationlist.xml.small': 'stationlist.xml',
+                           'model.conf': 'model.conf'})
+    conf_file = os.path.join(event_path, 'model.conf')
+    res_file = os.path.join(event_path, 'products', 'shake_result.hdf')
+    try:
+        results = []
+        tolerance = 0.1
+        for coarse_factor, refine_tolerance in ((1, 0.0), (4, 0.0),
+                                                (4, tolerance)):
+            config = ConfigObj(conf_file)
+            ploc = config['interp']['prediction_location']
+            ploc['coarse_factor'] = coarse_factor
+            ploc['refine_distance'] = 0.0
+            ploc['refine_tolerance'] = refine_tolerance
+            config.write()
+            assemble = AssembleModule('nc72282711', comment='Test comment.')
+            assemble.execute()
+            model = ModelModule('nc72282711')
+            model.execute()
+            oc = ShakeMapOutputContainer.load(res_file)
+            grids = {}
+            for imtstr in oc.getIMTs():
+                component = oc.getComponents(imtstr)[0]
+                imtdict = oc.getIMTGrids(imtstr, component)
+                grids[imtstr] = (imtdict['mean'].getData(),
+                                 imtdict['std'].getData())
+            oc.close()
+            results.append(grids)
+        assert sorted(results[0]) == sorted(results[1])
+        assert sorted(results[0]) == sorted(results[2])
+        for imtstr, (mean, std) in results[0].items():
+            assert np.allclose(mean, results[1][imtstr][0])
+            assert np.allclose(std, results[1][imtstr][1])
+            assert np.max(np.abs(mean - results[2][imtstr][0])) <= \
+                tolerance
+            assert np.max(np.abs(std - results[2][imtstr][1])) <= \
+                tolerance
+    finally:
+        clear_files(event_path)
+
+
+def test_model_skip_water():
+
+    #
+    # Skipping the water should not change the grids on land, and the
+    # grids on water should be filled
+    #
+    install_path, data_path = get_config_paths()
+    event_path = os.path.join(data_path, 'nc72282711', 'current')
+    set_files(event_path, {'event.xml': 'event.xml',
+                           'stationlist.xml.small': 'stationlist.xml',
+                           'model.conf': 'model.conf'})
+    conf_file = os.path.join(event_path, 'model.conf')
+    res_file = os.path.join(event_path, 'products', 'shake_result.hdf')
+    try:
+        results = []
+        for skip_water in (False, True):
+            config = ConfigObj(conf_file)
+            config['interp']['prediction_location']['skip_water'] = \
+                skip_water
+            config.write()
+            assemble = AssembleModule('nc72282711', comment='Test comment.')
+            assemble.execute()
+            model = ModelModule('nc72282711')
+            model.execute()
+            oc = ShakeMapOutputContainer.load(res_file)
+            grids = {}
+            for imtstr in oc.getIMTs():
+                component = oc.getComponents(imtstr)[0]
+                imtdict = oc.getIMTGrids(imtstr, component)
+                grids[imtstr] = (imtdict['mean'].getData(),
+                                 imtdict['std'].getData())
+            oc.close()
+            results.append(grids)
+        land = ~model.water_mask
+        assert sorted(results[0]) == sorted(results[1])
+        for imtstr, (mean, std) in results[0].items():
+            assert np.allclose(mean[land], results[1][imtstr][0][land])
+            assert np.allclose(std[land], results[1][imtstr][1][land])
+            assert np.all(np.isfinite(results[1][imtstr][0]))
+    finally:
+        clear_files(event_path)
+
+
+def test_model_no_regression():
+
+    #
+    # Without the regression grids the output should be the same, but
+    # there are no regression curves for plotregr
+    #
+    install_path, data_path = get_config_paths()
+    event_path = os.path.join(data_path, 'nc72282711', 'current')
+    set_files(event_path, {'event.xml': 'event.xml',
+                           'stationlist.xml.small': 'stationlist.xml',
+                           'model.conf': 'model.conf'})
+    res_file = os.path.join(event_path, 'products', 'shake_result.hdf')
+    try:
+        assemble = AssembleModule('nc72282711', comment='Test comment.')
+        assemble.execute()
+        model = ModelModule('nc72282711')
+        assert model.parseArgs(['--no-regression']) == []
+        model.execute()
+        oc = ShakeMapOutputContainer.load(res_file)
+        with pytest.raises(LookupError):
+            oc.getArray('regression_distances')
+        assert len(oc.getIMTs()) > 0
+        oc.close()
+        plotregr = PlotRegr('nc72282711')
+        with pytest.raises(LookupError):
+            plotregr.execute()
+    finally:
+        clear_files(event_path)
+
+
 if __name__ == '__main__':
     os.environ['CALLED_FROM_PYTEST'] = 'True'
     test_model_2()
     test_model_3()
     test_model_4()
+    test_model_adaptive()
+    test_model_skip_water()
+    test_model_no_regression()
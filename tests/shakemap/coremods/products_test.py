@@ -270,6 +270,32 @@ def do_contour_command_line(evid, datapath):
     assert not cp.returncode
 
 
+def do_mapping_processes(evid, datapath):
+    #
+    # Draw the maps again in a pool of worker processes; they should
+    # make the same files as drawing them in sequence
+    #
+    products = os.path.join(datapath, evid, 'current', 'products')
+    patterns = ['intensity.*', '*_contour.*']
+    mapfiles = sorted(f for p in patterns
+                      for f in glob.glob(os.path.join(products, p)))
+    assert mapfiles
+    for mapfile in mapfiles:
+        os.remove(mapfile)
+    mod = MappingModule(evid)
+    rem = mod.parseArgs(['-p', '2'])
+    assert rem == []
+    assert mod.processes == 2
+    mod.execute()
+    newfiles = sorted(f for p in patterns
+                      for f in glob.glob(os.path.join(products, p)))
+    assert newfiles == mapfiles
+    for mapfile in newfiles:
+        assert os.path.getsize(mapfile) > 0
+    with pytest.raises(ValueError):
+        mod.parseArgs(['-p', '-1'])
+
+
 def test_products():
 
     installpath, datapath = get_config_paths()
@@ -313,6 +339,7 @@ def test_products():
         mod = MappingModule(evid)
         mod.execute()
         mod.writeContents()
+        do_mapping_processes(evid, datapath)
 
         check_failures(evid, datapath, PlotRegr)
         #
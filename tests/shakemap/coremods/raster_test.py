@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import os.path
+import tempfile
+
+import numpy as np
+from mapio.geodict import GeoDict
+from mapio.grid2d import Grid2D
+from mapio.gdal import GDALGrid
+
+from shakemap.coremods.raster import (RasterModule, _esri_files,
+                                      _geotiff_files)
+
+
+def _get_grids():
+    geodict = GeoDict({'xmin': -118.0, 'xmax': -116.0, 'ymin': 34.0,
+                       'ymax': 35.0, 'dx': 0.005, 'dy': 0.005, 'nx': 401,
+                       'ny': 201})
+    x, y = np.meshgrid(np.linspace(-1, 1, 401), np.linspace(-1, 1, 201))
+    mean = -2.0 * np.sqrt(x**2 + y**2)
+    mean[0, 0] = np.nan
+    std = np.full_like(mean, 0.6)
+    return Grid2D(mean, geodict), Grid2D(std, geodict.copy())
+
+
+def test_esri_files():
+    # The in-memory files are the same as the ones GDALGrid writes
+    mean, std = _get_grids()
+    files = dict(_esri_files('PGA', mean, std))
+    assert sorted(files.keys()) == ['PGA_mean.flt', 'PGA_mean.hdr',
+                                    'PGA_std.flt', 'PGA_std.hdr']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = os.path.join(tmpdir, 'PGA_mean.flt')
+        GDALGrid.copyFromGrid(mean).save(fname)
+        with open(fname, 'rb') as f:
+            assert files['PGA_mean.flt'] == f.read()
+        with open(os.path.join(tmpdir, 'PGA_mean.hdr')) as f:
+            assert files['PGA_mean.hdr'] == f.read()
+
+
+def test_geotiff_files():
+    from rasterio.io import MemoryFile
+
+    mean, std = _get_grids()
+    files = _geotiff_files('PGA', mean, std)
+    assert [fname for fname, _ in files] == ['PGA_mean.tif', 'PGA_std.tif']
+    with MemoryFile(files[0][1]) as memfile, memfile.open() as src:
+        assert src.count == 1
+        assert src.block_shapes[0] == (256, 256)
+        assert src.overviews(1)
+        assert src.descriptions == ('mean',)
+        # The geotransform is for the corner of the upper left cell
+        np.testing.assert_allclose([src.transform.c, src.transform.f],
+                                   [-118.0025, 35.0025])
+        np.testing.assert_allclose(src.read(1),
+                                   mean.getData().astype(np.float32))
+
+    files = _geotiff_files('PGA', mean, std, multiband=True)
+    assert [fname for fname, _ in files] == ['PGA.tif']
+    with MemoryFile(files[0][1]) as memfile, memfile.open() as src:
+        assert src.count == 2
+        assert src.descriptions == ('mean', 'std')
+        np.testing.assert_allclose(src.read(2),
+                                   std.getData().astype(np.float32))
+
+
+def test_raster_contents():
+    # The contents are set by the options, before execute() runs
+    mod = RasterModule('test')
+    assert mod.parseArgs(['-f', 'geotiff']) == []
+    assert mod.contents['rasterData']['title'] == 'GeoTIFF Raster Files'
+    mod = RasterModule('test')
+    mod.parseArgs([])
+    assert mod.contents['rasterData']['title'] == 'ESRI Raster Files'
+    assert RasterModule.contents['rasterData']['title'] == \
+        'ESRI Raster Files'
+
+
+if __name__ == '__main__':
+    test_esri_files()
+    test_geotiff_files()
+    test_raster_contents()
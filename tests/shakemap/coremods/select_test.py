@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 import os
 import os.path
+import shutil
 
 import pytest
 
 from shakemap.utils.config import get_config_paths
-from shakemap.coremods.select import SelectModule
+from shakemap.coremods.select import SelectModule, select_events
 from common import clear_files, set_files
 
 
@@ -51,6 +52,47 @@ def test_select():
             os.remove(conf_file)
 
 
+def test_select_batch():
+
+    installpath, datapath = get_config_paths()
+
+    event_path = os.path.join(datapath, 'nc72282711', 'current')
+    set_files(event_path, {'event.xml': 'event.xml'})
+    conf_file = os.path.join(event_path, 'model_zc.conf')
+    products_path = os.path.join(event_path, 'products')
+    try:
+        results = select_events(['nc72282711', 'not_an_event'])
+        assert [x[0] for x in results] == ['nc72282711', 'not_an_event']
+        assert results[0][1] is None
+        assert results[1][1].startswith('NotADirectoryError')
+        assert os.path.isfile(conf_file)
+        os.remove(conf_file)
+
+        # In a pool of processes; the products of past runs are kept
+        # unless clear_products is set
+        os.makedirs(products_path, exist_ok=True)
+        eventids = ['nc72282711', 'not_an_event', 'usp0004bxs']
+        results = select_events(eventids, max_workers=2)
+        assert [x[0] for x in results] == eventids
+        assert results[0][1] is None
+        assert results[1][1].startswith('NotADirectoryError')
+        assert results[2][1] is None
+        assert os.path.isfile(conf_file)
+        assert os.path.isdir(products_path)
+        results = select_events(['nc72282711'], max_workers=2,
+                                clear_products=True)
+        assert results == [('nc72282711', None)]
+        assert not os.path.isdir(products_path)
+    finally:
+        clear_files(event_path)
+        shutil.rmtree(products_path, ignore_errors=True)
+        zc_file = os.path.join(datapath, 'usp0004bxs', 'current',
+                               'model_zc.conf')
+        if os.path.isfile(zc_file):
+            os.remove(zc_file)
+
+
 if __name__ == '__main__':
     os.environ['CALLED_FROM_PYTEST'] = 'True'
     test_select()
+    test_select_batch()
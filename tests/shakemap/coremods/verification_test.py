@@ -3,6 +3,7 @@ import os
 import os.path
 
 import numpy as np
+from configobj import ConfigObj
 
 from shakemap.utils.config import get_config_paths
 from shakemap.coremods.model import ModelModule
@@ -102,6 +103,33 @@ def test_verification_0003():
             os.remove(data_file)
 
 
+def test_verification_0003_chunked():
+    #
+    # Process the points in chunks and check that the results are the
+    # same as doing them all at once
+    #
+    installpath, datapath = get_config_paths()
+    evid = 'verification_test_0003'
+    conf_file = os.path.join(datapath, evid, 'current', 'model.conf')
+    with open(conf_file, 'rt') as f:
+        conf_text = f.read()
+    try:
+        imtdict = run_event(evid)
+        config = ConfigObj(conf_file)
+        config['interp']['prediction_location']['chunk_size'] = 100
+        config.write()
+        chunk_dict = run_event(evid)
+        assert np.all(imtdict['ids'] == chunk_dict['ids'])
+        for key in ('lons', 'lats', 'mean', 'std'):
+            assert np.allclose(imtdict[key], chunk_dict[key])
+    finally:
+        with open(conf_file, 'wt') as f:
+            f.write(conf_text)
+        data_file = os.path.join(datapath, evid, 'current', 'shake_data.hdf')
+        if os.path.isfile(data_file):
+            os.remove(data_file)
+
+
 def test_verification_0004():
     installpath, datapath = get_config_paths()
     evid = 'verification_test_0004'
@@ -288,6 +316,7 @@ if __name__ == '__main__':
     test_verification_0001()
     test_verification_0002()
     test_verification_0003()
+    test_verification_0003_chunked()
     test_verification_0004()
     test_verification_0005()
     test_verification_0008a()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import os
+import io
+import json
+import time
+import types
+import socket
+import asyncio
+import logging
+import concurrent.futures as cf
+from importlib.machinery import SourceFileLoader
+
+import shakemap.utils.queue as queue
+
+homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
+shakedir = os.path.abspath(os.path.join(homedir, '..', '..', '..'))
+
+
+def load_sm_queue():
+    """Import the sm_queue program as a module.
+    """
+    loader = SourceFileLoader('sm_queue',
+                              os.path.join(shakedir, 'bin', 'sm_queue'))
+    module = types.ModuleType(loader.name)
+    loader.exec_module(module)
+    return module
+
+
+def get_dummy_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    log_capture_string = io.StringIO()
+    handler = logging.StreamHandler(log_capture_string)
+    handler.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger, log_capture_string
+
+
+class DummyHandler(object):
+    """An AmplitudeHandler that only knows some events.
+    """
+    def __init__(self, events):
+        self.events = events
+
+    def getEvent(self, eventid):
+        return self.events.get(eventid)
+
+
+class DummyScheduler(object):
+    """An EventScheduler that records what is submitted.
+    """
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, eventid, action, priority):
+        self.submitted.append((eventid, action, priority))
+
+
+########################################################################
+# Test sm_queue
+########################################################################
+
+
+def test_process_command():
+    smq = load_sm_queue()
+    logger, logstring = get_dummy_logger('test_process_command')
+    handler = DummyHandler({'event1': {'id': 'event1'}})
+    scheduler = DummyScheduler()
+
+    def process(data):
+        smq.process_command(data, 'host1', handler, '', logger, {}, {},
+                            scheduler)
+
+    process(b'not json')
+    assert "Couldn't decode data from host1" in logstring.getvalue()
+    process(json.dumps({'type': 'cancel', 'data': {}}).encode('utf8'))
+    process(json.dumps(['cancel']).encode('utf8'))
+    assert logstring.getvalue().count('Bad data from host1') == 2
+    assert scheduler.submitted == []
+
+    # Commands for events we haven't seen are ignored
+    process(json.dumps({'type': 'cancel',
+                        'data': {'id': 'event2'}}).encode('utf8'))
+    assert 'cancel is for unprocessed event event2' in logstring.getvalue()
+    process(json.dumps({'type': 'test',
+                        'data': {'id': 'event2'}}).encode('utf8'))
+    assert 'Trigger is for unprocessed event event2' in \
+        logstring.getvalue()
+    assert scheduler.submitted == []
+
+    process(json.dumps({'type': 'cancel',
+                        'data': {'id': 'event1'}}).encode('utf8'))
+    assert 'Received "cancel" for event event1' in logstring.getvalue()
+    assert scheduler.submitted == [('event1', 'cancel',
+                                    queue.CANCEL_PRIORITY)]
+    logstring.close()
+
+
+def test_get_hostname():
+    smq = load_sm_queue()
+    lookups = []
+
+    def gethostbyaddr(address):
+        lookups.append(address)
+        if address == '10.0.0.2':
+            raise socket.herror('Unknown host')
+        return ('host1.example.com', [], [address])
+
+    smq.socket = types.SimpleNamespace(gethostbyaddr=gethostbyaddr)
+    loop = asyncio.new_event_loop()
+    try:
+        cache = {}
+        for _ in range(3):
+            hostname = loop.run_until_complete(
+                smq.get_hostname(loop, '10.0.0.1', cache))
+            assert hostname == 'host1.example.com'
+        assert lookups == ['10.0.0.1']
+        # Failed lookups give the address, and are cached too
+        for _ in range(2):
+            hostname = loop.run_until_complete(
+                smq.get_hostname(loop, '10.0.0.2', cache))
+            assert hostname == '10.0.0.2'
+        assert lookups == ['10.0.0.1', '10.0.0.2']
+        # Old results are looked up again
+        cache['10.0.0.1'] = ('host1.example.com',
+                             time.time() - smq.DNS_CACHE_TIME - 1)
+        hostname = loop.run_until_complete(
+            smq.get_hostname(loop, '10.0.0.1', cache))
+        assert hostname == 'host1.example.com'
+        assert lookups == ['10.0.0.1', '10.0.0.2', '10.0.0.1']
+    finally:
+        loop.close()
+
+
+def test_run_periodically():
+    smq = load_sm_queue()
+    logger, logstring = get_dummy_logger('test_run_periodically')
+    calls = []
+
+    def func(name):
+        calls.append(name)
+        if calls.count(name) == 2:
+            raise ValueError('second call failed')
+
+    async def coro_func(name):
+        calls.append(name)
+
+    def run(*args, **kwargs):
+        try:
+            loop.run_until_complete(asyncio.wait_for(
+                smq.run_periodically(0.01, *args, **kwargs), 0.2))
+        except asyncio.TimeoutError:
+            pass
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    executor = cf.ThreadPoolExecutor(max_workers=1)
+    try:
+        # Errors are logged, and don't stop the schedule
+        run(func, logger, 'func')
+        assert len(calls) > 2
+        assert 'Error in periodic task func: second call failed' in \
+            logstring.getvalue()
+        del calls[:]
+        run(coro_func, logger, 'coro')
+        assert len(calls) > 2
+        assert set(calls) == {'coro'}
+        del calls[:]
+        run(func, logger, 'executor', executor=executor)
+        assert len(calls) > 2
+        assert set(calls) == {'executor'}
+        assert logstring.getvalue().count('second call failed') == 2
+    finally:
+        executor.shutdown()
+        asyncio.set_event_loop(None)
+        loop.close()
+    logstring.close()
+
+
+if __name__ == '__main__':
+    test_process_command()
+    test_get_hostname()
+    test_run_periodically()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
 import os.path
+import re
 from datetime import datetime
 import shutil
+import tempfile
 import time
 
 import numpy as np
@@ -168,6 +170,80 @@ def test_amps():
             os.remove(dbfile)
 
 
+def test_amps_batch():
+    install_path, data_path = get_config_paths()
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    dbfile = os.path.join(homedir, '..', '..', 'data', 'install', 'data',
+                          'amps.db')
+    ampdir = os.path.join(homedir, '..', '..', 'data', 'ampdata')
+    xmlfiles = [os.path.join(ampdir, 'USR_100416_20180307_180450%s.xml' % x)
+                for x in ['', '_2', '_3', '_4', '_5', '_6']]
+    event = {'id': 'ci37889959',
+             'netid': 'ci',
+             'network': '',
+             'time': datetime(2018, 3, 7, 18, 5, 0).strftime(
+                queue.TIMEFMT),
+             'lat': 35.487,
+             'lon': -120.027,
+             'depth': 8.0,
+             'locstring': 'Somewhere in California',
+             'mag': 3.7}
+
+    # A file with no time data is skipped, but isn't a failure
+    tmpdir = tempfile.mkdtemp()
+    notime = os.path.join(tmpdir, 'notime.xml')
+    with open(xmlfiles[0], 'r') as f:
+        xmlstr = f.read()
+    xmlstr = re.sub(r'<PGMTime>.*</PGMTime>', '', xmlstr)
+    with open(notime, 'w') as f:
+        f.write(xmlstr)
+    try:
+        if os.path.isfile(dbfile):
+            os.remove(dbfile)
+
+        # Insert the files one at a time to get the reference answer
+        handler = AmplitudeHandler(install_path, data_path)
+        for xmlfile in xmlfiles:
+            handler.insertAmps(xmlfile)
+        info1 = handler.getStats()
+        del handler
+        os.remove(dbfile)
+
+        # Now do them in a batch (in both serial and parallel mode); also
+        # include a file that doesn't exist
+        for max_workers in (1, 2):
+            handler = AmplitudeHandler(install_path, data_path)
+            nloaded, failed = handler.insertAmpsBatch(
+                xmlfiles + [notime, 'not_a_file.xml'],
+                max_workers=max_workers)
+            assert nloaded == len(xmlfiles) + 1
+            assert len(failed) == 1
+            assert failed[0][0] == 'not_a_file.xml'
+            info2 = handler.getStats()
+            for key in ('stations', 'channels', 'pgms',
+                        'station_min', 'station_max'):
+                assert info1[key] == info2[key]
+
+            # Inserting the same files again shouldn't add anything
+            handler.insertAmpsBatch(xmlfiles, max_workers=max_workers)
+            info2 = handler.getStats()
+            for key in ('stations', 'channels', 'pgms'):
+                assert info1[key] == info2[key]
+
+            handler.insertEvent(event)
+            associated = handler.associateOne(event['id'])
+            assert associated == 30
+            del handler
+            os.remove(dbfile)
+            shutil.rmtree(os.path.join(data_path, event['id']))
+    finally:
+        if os.path.isfile(dbfile):
+            os.remove(dbfile)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
 if __name__ == '__main__':
     os.environ['CALLED_FROM_PYTEST'] = 'True'
     test_amps()
+    test_amps_batch()
@@ -201,6 +201,23 @@ def test_config():
     assert isinstance(res, list)
     assert res == [-20.0, -10.0, 20.0, 10.0]
     #
+    # chunk_list()
+    #
+    res = config.chunk_list('[]')
+    assert res == []
+    res = config.chunk_list([])
+    assert res == []
+    with pytest.raises(ValidateError):
+        res = config.chunk_list('256')
+    with pytest.raises(ValidateError):
+        res = config.chunk_list(['256', '256', '1'])
+    with pytest.raises(ValidateError):
+        res = config.chunk_list(['256', 'thing'])
+    with pytest.raises(ValidateError):
+        res = config.chunk_list(['256', '0'])
+    res = config.chunk_list(['256', '128'])
+    assert res == [256, 128]
+    #
     # file_type()
     #
     res = config.file_type('None')
@@ -6,8 +6,10 @@ import os.path
 import importlib.util
 from tempfile import mkstemp
 import shutil
+import tempfile
 from pathlib import Path
 
+import shakemap.utils.dependencies as dependencies
 from shakemap.utils.dependencies import (sha_sum,
                                          DepNode,
                                          CommandDatabase)
@@ -248,6 +250,14 @@ def test_command_database():
     status = cdb.getDependencyStatus('module2')
     assert status == []
 
+    # module2 depends on module1's target, so it has to wait for module1
+    graph = cdb.getCommandGraph(['module1', 'module2'])
+    assert graph == {'module1': set(), 'module2': {'module1'}}
+    # module1 has a glob pattern in its dependencies, so it waits for
+    # anything that comes before it
+    graph = cdb.getCommandGraph(['module2', 'module1'])
+    assert graph == {'module2': set(), 'module1': {'module2'}}
+
     # Remove a required dependency; maybe this should throw an exception?
     os.remove(os.path.join(eventdir, 'module1_dep1.txt'))
     os.remove(os.path.join(eventdir, 'module1_dep2.txt'))
@@ -260,6 +270,51 @@ def test_command_database():
     clear_files(datadir)
 
 
+def test_checksum_cache(monkeypatch):
+    nsums = []
+
+    def counting_sha_sum(fname):
+        nsums.append(fname)
+        return sha_sum(fname)
+
+    monkeypatch.setattr(dependencies, 'sha_sum', counting_sha_sum)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.makedirs(os.path.join(tmpdir, 'data'))
+        testfile = os.path.join(tmpdir, 'test.txt')
+        with open(testfile, 'w') as f:
+            f.write('Some data')
+        cdb = CommandDatabase({}, 'dummy_event', tmpdir, tmpdir)
+        checksum = cdb._CommandDatabase__checksum
+        csum = checksum(testfile)
+        assert csum == sha_sum(testfile)
+        assert nsums == [testfile]
+        # Unchanged: no need to hash it again
+        assert checksum(testfile) == csum
+        assert len(nsums) == 1
+        cdb.fconnect.commit()
+        cdb.close()
+        # The cache survives in the database
+        cdb = CommandDatabase({}, 'dummy_event', tmpdir, tmpdir)
+        checksum = cdb._CommandDatabase__checksum
+        assert checksum(testfile) == csum
+        assert len(nsums) == 1
+        # Change the file
+        with open(testfile, 'w') as f:
+            f.write('Some other data')
+        assert checksum(testfile) == sha_sum(testfile) != csum
+        assert len(nsums) == 2
+        # The checksums of files that are gone are pruned
+        otherfile = os.path.join(tmpdir, 'other.txt')
+        with open(otherfile, 'w') as f:
+            f.write('More data')
+        checksum(otherfile)
+        os.remove(testfile)
+        cdb._CommandDatabase__pruneChecksums()
+        cdb.fcursor.execute('SELECT file FROM stat_checksums')
+        assert cdb.fcursor.fetchall() == [(otherfile,)]
+        cdb.close()
+
+
 if __name__ == '__main__':
     test_sha256()
     test_depnode()
@@ -1,13 +1,21 @@
 #!/usr/bin/env python
 
+import glob
+import os
 import os.path
+import tempfile
 import pytest
 
 from configobj import ConfigObj
 import numpy as np
-from shapely.geometry import Point
+from openquake.hazardlib.geo.geodetic import min_distance_to_segment
+from shapely.geometry import Point, Polygon
+from shapely.ops import transform
+import shapely.wkt
 
+import shakemap.utils.layers as layers
 from shakemap.utils.layers import (get_layer_distances,
+                                   get_layer_index,
                                    dist_to_layer,
                                    update_config_regions,
                                    validate_config)
@@ -100,6 +108,104 @@ def test_layers():
     assert config['tectonic_regions']['scr']['gmpe'] == \
         ['stable_continental_nshmp2014_rlme', 'stable_continental_deep']
 
+
+def test_layer_index():
+    data_path = get_data_path()
+    layer_path = os.path.join(data_path, 'layers')
+    reference = get_layer_distances(-97.5, 36.5, layer_path)
+
+    layers._LAYER_INDEXES.clear()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, 'layer_index')
+        index = get_layer_index(layer_path, cache_dir=cache_dir)
+        assert index.getNames() == ['california', 'induced', 'japan',
+                                    'taiwan']
+        assert len(os.listdir(cache_dir)) == 1
+        # The index is kept in memory
+        assert get_layer_index(layer_path, cache_dir=cache_dir) is index
+        layers_equal(index.getDistances(-97.5, 36.5), reference)
+        assert index.getDistance('induced', -97.5, 36.5) == 0
+
+        # A new process would read the index from the cache directory
+        layers._LAYER_INDEXES.clear()
+        index2 = get_layer_index(layer_path, cache_dir=cache_dir)
+        assert index2 is not index
+        layers_equal(index2.getDistances(-97.5, 36.5), reference)
+        layers_equal(get_layer_distances(-97.5, 36.5, layer_path,
+                                         cache_dir=cache_dir), reference)
+    layers._LAYER_INDEXES.clear()
+
+
+def loop_nearest_edge(elon, elat, poly):
+    """The per-segment loop that nearest_edge() replaced.
+    """
+    elon_arr = np.array([elon])
+    elat_arr = np.array([elat])
+    x, y = poly.exterior.xy
+    nearest = 99999.
+    for ix in range(1, len(x) - 1):
+        dd = min_distance_to_segment(np.array(x[ix - 1:ix + 1]),
+                                     np.array(y[ix - 1:ix + 1]),
+                                     elon_arr, elat_arr)
+        if np.abs(dd[0]) < nearest:
+            nearest = dd[0]
+    return nearest
+
+
+def loop_layer_distances(elon, elat, layer_dir):
+    """get_layer_distances() as it was done with loop_nearest_edge().
+    """
+    project = layers.aeqd_projection(elon, elat)
+    ep = Point(0.0, 0.0)
+    dist_dict = {}
+    for file in glob.glob(os.path.join(layer_dir, '*.wkt')):
+        layer_name = os.path.splitext(os.path.basename(file))[0]
+        with open(file, 'r') as fd:
+            geom = shapely.wkt.loads(fd.read())
+        if isinstance(geom, Polygon):
+            plist = [geom]
+        else:
+            plist = list(geom.geoms)
+        min_dist = 99999.
+        for poly in plist:
+            nearest = loop_nearest_edge(elon, elat, poly)
+            if nearest < 5000:
+                nearest = ep.distance(transform(project, poly))
+            if nearest < min_dist:
+                min_dist = nearest
+            if min_dist == 0:
+                break
+        dist_dict[layer_name] = min_dist
+    return dist_dict
+
+
+def test_nearest_edge():
+    data_path = get_data_path()
+    layer_path = os.path.join(data_path, 'layers')
+    polys = []
+    for file in glob.glob(os.path.join(layer_path, '*.wkt')):
+        with open(file, 'r') as fd:
+            geom = shapely.wkt.loads(fd.read())
+        polys.extend(getattr(geom, 'geoms', [geom]))
+
+    layers._LAYER_INDEXES.clear()
+    np.random.seed(1234)
+    lons = np.random.uniform(-180.0, 180.0, 50)
+    lats = np.random.uniform(-80.0, 80.0, 50)
+    # Some points near the polygons, too
+    lons = np.concatenate((lons, np.random.uniform(-125.0, -95.0, 20),
+                           np.random.uniform(118.0, 145.0, 20)))
+    lats = np.concatenate((lats, np.random.uniform(30.0, 42.0, 20),
+                           np.random.uniform(20.0, 45.0, 20)))
+    for elon, elat in zip(lons, lats):
+        for poly in polys:
+            np.testing.assert_allclose(
+                layers.nearest_edge(elon, elat, poly),
+                loop_nearest_edge(elon, elat, poly), rtol=1e-10)
+        layers_equal(get_layer_distances(elon, elat, layer_path),
+                     loop_layer_distances(elon, elat, layer_path))
+    layers._LAYER_INDEXES.clear()
+
 # def test_get_probability():
 #     x1 = 0.0
 #     p1 = 0.9
@@ -224,3 +330,5 @@ def test_layers():
 
 if __name__ == '__main__':
     test_layers()
+    test_layer_index()
+    test_nearest_edge()
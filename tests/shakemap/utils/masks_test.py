@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+from mapio.geodict import GeoDict
+
+import shakemap.utils.masks as masks
+from shakemap.utils.masks import get_ocean_mask, rasterize_ocean
+
+homedir = os.path.dirname(os.path.abspath(__file__))
+oceanfile = os.path.join(homedir, '..', '..', 'data', 'install', 'data',
+                         'mapping', 'ne_50m_ocean.shp')
+
+
+def test_ocean_mask():
+    # A grid off the coast of southern California
+    geodict = GeoDict.createDictFromBox(-121.0, -116.0, 32.0, 36.0,
+                                        0.05, 0.05)
+    mask = rasterize_ocean(oceanfile, geodict)
+    assert mask.shape == (geodict.ny, geodict.nx)
+    assert mask.dtype == bool
+    # The southwest corner is in the Pacific; the northeast corner is
+    # in the Mojave
+    assert mask[-1, 0]
+    assert not mask[0, -1]
+
+    masks._MASK_CACHE.clear()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, 'ocean_masks')
+        mask1 = get_ocean_mask(oceanfile, geodict, cache_dir=cache_dir)
+        np.testing.assert_array_equal(mask1, mask)
+        assert len(os.listdir(cache_dir)) == 1
+
+        # Callers get a copy they can change
+        mask1[:] = False
+        mask2 = get_ocean_mask(oceanfile, geodict, cache_dir=cache_dir)
+        np.testing.assert_array_equal(mask2, mask)
+
+        # A new process would read the mask from the cache directory
+        masks._MASK_CACHE.clear()
+        mask3 = get_ocean_mask(oceanfile, geodict, cache_dir=cache_dir)
+        np.testing.assert_array_equal(mask3, mask)
+
+        # A different grid gets its own mask
+        geodict2 = GeoDict.createDictFromBox(-121.0, -116.0, 32.0, 36.0,
+                                             0.1, 0.1)
+        mask4 = get_ocean_mask(oceanfile, geodict2, cache_dir=cache_dir)
+        assert mask4.shape == (geodict2.ny, geodict2.nx)
+        assert len(os.listdir(cache_dir)) == 2
+    masks._MASK_CACHE.clear()
+
+
+if __name__ == '__main__':
+    test_ocean_mask()
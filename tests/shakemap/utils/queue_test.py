@@ -187,6 +187,106 @@ def test_reap_children():
     return
 
 
+def test_event_priority():
+    install_path, _ = get_config_paths()
+    config = queue.get_config(install_path)
+    dt = datetime.utcnow()
+    now = time.time()
+    # Bigger events have higher priority
+    ev1 = {'mag': 5.0, 'lon': -129.25, 'lat': 39.0,
+           'time': dt.strftime(queue.TIMEFMT)}
+    ev2 = {'mag': 6.0, 'lon': -129.25, 'lat': 39.0,
+           'time': dt.strftime(queue.TIMEFMT)}
+    assert queue.event_priority(ev2, config, now) > \
+        queue.event_priority(ev1, config, now)
+    # Metro box events get a bonus
+    ev3 = {'mag': 5.0, 'lon': -118.25, 'lat': 34.0,
+           'time': dt.strftime(queue.ALT_TIMEFMT)}
+    assert queue.event_priority(ev3, config, now) - \
+        queue.event_priority(ev1, config, now) == \
+        pytest.approx(queue.METRO_BOX_PRIORITY, abs=0.01)
+    # Older events have lower priority
+    ev4 = {'mag': 5.0, 'lon': -129.25, 'lat': 39.0,
+           'time': (dt - timedelta(days=2)).strftime(queue.TIMEFMT)}
+    assert queue.event_priority(ev4, config, now) < \
+        queue.event_priority(ev1, config, now)
+
+    assert queue.magnitude_threshold(-118.25, 34.0, config) == (3.5, True)
+    assert queue.magnitude_threshold(-129.25, 39.0, config) == (4.0, False)
+
+
+def test_event_scheduler():
+    logger, logstring = get_dummy_logger('test_event_scheduler')
+    children = {}
+    config = {'max_subprocesses': 1,
+              'max_process_time': 10}
+    scheduler = queue.EventScheduler(children, config, logger)
+    scheduler.submit('event1', 'test', 5.0)
+    assert 'event1' in children
+    assert len(scheduler) == 0
+    # These have to wait; event3 has the higher priority, and the
+    # second submission of event2 is merged with the first
+    scheduler.submit('event2', 'test', 4.0)
+    scheduler.submit('event3', 'test', 6.0)
+    scheduler.submit('event2', 'test', 4.5)
+    assert len(children) == 1
+    assert len(scheduler) == 2
+    assert 'event2' in scheduler
+    assert 'Event event2 is already queued' in logstring.getvalue()
+
+    children['event1']['popen'].wait()
+    scheduler.reap()
+    assert 'event3' in children
+    assert len(scheduler) == 1
+
+    # An event that is running waits in the queue until it is done
+    scheduler.submit('event3', 'test', 1.0)
+    children['event3']['popen'].wait()
+    scheduler.reap()
+    assert 'event2' in children
+    assert 'event3' in scheduler
+    children['event2']['popen'].wait()
+    scheduler.reap()
+    assert 'event3' in children
+    children['event3']['popen'].wait()
+    scheduler.reap()
+    assert len(children) == 0
+    assert len(scheduler) == 0
+    assert 'after waiting' in logstring.getvalue()
+    assert 'run time' in logstring.getvalue()
+
+    # With no limit, everything starts right away
+    config = {'max_subprocesses': 0,
+              'max_process_time': 10}
+    scheduler = queue.EventScheduler(children, config, logger)
+    for i in range(5):
+        scheduler.submit('event%d' % i, 'test', 1.0)
+    assert len(children) == 5
+    assert len(scheduler) == 0
+    for child in children.values():
+        child['popen'].wait()
+    scheduler.reap()
+    assert len(children) == 0
+
+    # When merging, the most recent action is used if either is a cancel
+    config = {'max_subprocesses': 1,
+              'max_process_time': 10}
+    scheduler = queue.EventScheduler(children, config, logger)
+    scheduler.submit('event1', 'test', 1.0)
+    scheduler.submit('event2', 'cancel', 1.0)
+    scheduler.submit('event2', 'origin', 1.0)
+    assert scheduler._pending['event2']['action'] == 'origin'
+    scheduler.submit('event3', 'origin', 1.0)
+    scheduler.submit('event3', 'cancel', 1.0)
+    assert scheduler._pending['event3']['action'] == 'cancel'
+    scheduler.submit('event4', 'origin', 1.0)
+    scheduler.submit('event4', 'test', 1.0)
+    assert scheduler._pending['event4']['action'] == 'origin'
+    children['event1']['popen'].wait()
+    del children['event1']
+    logstring.close()
+
+
 if __name__ == '__main__':
     os.environ['CALLED_FROM_PYTEST'] = 'True'
     test_send_queue()
@@ -197,3 +297,5 @@ if __name__ == '__main__':
     test_get_logger()
     test_dispatch_event()
     test_reap_children()
+    test_event_priority()
+    test_event_scheduler()
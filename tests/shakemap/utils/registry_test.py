@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import os.path
+import sys
+import json
+import tempfile
+
+from shakemap.utils.registry import get_command_registry, CommandSpec
+
+MODULE_A = '''
+from shakemap.coremods.base import CoreModule
+
+class ModuleA(CoreModule):
+    """
+    moda -- A test module.
+    """
+    command_name = 'moda'
+    targets = [r'a\\.txt']
+    dependencies = [('in.txt', True), ('*.conf', False)]
+    configs = ['moda.conf']
+
+    def execute(self):
+        pass
+
+class Helper(object):
+    pass
+'''
+
+# Not a literal, so the module has to be imported to find the targets
+MODULE_B = '''
+from shakemap.coremods.base import CoreModule
+
+TARGETS = [r'b\\.txt']
+
+class ModuleB(CoreModule):
+    """
+    modb -- Another test module.
+    """
+    command_name = 'modb'
+    targets = TARGETS
+
+    def execute(self):
+        pass
+'''
+
+
+def make_package(tmpdir, pkgname):
+    pkgdir = os.path.join(tmpdir, pkgname)
+    os.makedirs(pkgdir)
+    open(os.path.join(pkgdir, '__init__.py'), 'w').close()
+    with open(os.path.join(pkgdir, 'moda.py'), 'w') as f:
+        f.write(MODULE_A)
+    with open(os.path.join(pkgdir, 'modb.py'), 'w') as f:
+        f.write(MODULE_B)
+    return pkgdir
+
+
+def test_command_registry():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pkgname = 'registry_test_mods'
+        pkgdir = make_package(tmpdir, pkgname)
+        manifest = os.path.join(tmpdir, 'manifest.json')
+        sys.path.insert(0, tmpdir)
+        try:
+            classes = get_command_registry([pkgname], manifest)
+            assert list(classes.keys()) == ['moda', 'modb']
+            spec = classes['moda']['class']
+            assert isinstance(spec, CommandSpec)
+            assert spec.targets == [r'a\.txt']
+            assert spec.dependencies == [('in.txt', True),
+                                         ('*.conf', False)]
+            assert spec.configs == ['moda.conf']
+            assert spec.doc == 'moda -- A test module.'
+            assert classes['moda']['mfile'] == os.path.join(pkgdir,
+                                                            'moda.py')
+            # moda was only parsed; modb had to be imported
+            assert pkgname + '.moda' not in sys.modules
+            assert pkgname + '.modb' in sys.modules
+            assert classes['modb']['class'].targets == [r'b\.txt']
+            assert classes['modb']['class'].dependencies is None
+
+            # Only the parsed module goes in the manifest
+            with open(manifest) as f:
+                mdata = json.load(f)
+            assert list(mdata['modules'].keys()) == [pkgname + '.moda']
+
+            # The manifest is used if the module hasn't changed
+            mdata['modules'][pkgname + '.moda']['commands'][0]['doc'] = \
+                'from the manifest'
+            with open(manifest, 'w') as f:
+                json.dump(mdata, f)
+            classes = get_command_registry([pkgname], manifest)
+            assert classes['moda']['class'].doc == 'from the manifest'
+            assert classes['moda']['class'].dependencies == \
+                [('in.txt', True), ('*.conf', False)]
+
+            # ...and ignored if it has
+            with open(os.path.join(pkgdir, 'moda.py'), 'a') as f:
+                f.write('\n# A change\n')
+            classes = get_command_registry([pkgname], manifest)
+            assert classes['moda']['class'].doc == 'moda -- A test module.'
+
+            # Calling the spec imports the module and makes an instance
+            cls = classes['moda']['class'].load()
+            assert cls.__name__ == 'ModuleA'
+            assert pkgname + '.moda' in sys.modules
+        finally:
+            sys.path.remove(tmpdir)
+            for mod in list(sys.modules.keys()):
+                if mod.startswith(pkgname):
+                    del sys.modules[mod]
+
+
+def test_coremods_registry():
+    # The registry for the real coremods should match what importing
+    # them gives us
+    from shakemap.utils.registry import _inspect_module
+    classes = get_command_registry(['shakemap.coremods'])
+    for modname in ['shakemap.coremods.assemble',
+                    'shakemap.coremods.select',
+                    'shakemap.coremods.transfer']:
+        for spec in _inspect_module(modname):
+            cspec = classes[spec.command_name]['class']
+            assert cspec.class_name == spec.class_name
+            assert cspec.targets == spec.targets
+            assert cspec.dependencies == spec.dependencies
+            assert cspec.configs == spec.configs
+            assert cspec.doc == spec.doc
+
+
+if __name__ == '__main__':
+    test_command_registry()
+    test_coremods_registry()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import io
+import os
+import os.path
+import sys
+import logging
+import tempfile
+from collections import OrderedDict
+
+from shakemap.utils.runner import run_commands
+
+MODULES = '''
+import os.path
+import time
+import argparse
+
+from shakemap.coremods.base import CoreModule
+
+
+class WriterModule(CoreModule):
+    """
+    writer -- Write a file after a short wait.
+    """
+    command_name = 'writer'
+
+    def parseArgs(self, arglist):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-o', '--outfile')
+        parser.add_argument('rem', nargs=argparse.REMAINDER,
+                            help=argparse.SUPPRESS)
+        args = parser.parse_args(arglist)
+        self.outfile = args.outfile
+        return args.rem
+
+    def execute(self):
+        time.sleep(0.5)
+        self.logger.info('writing %s' % os.path.basename(self.outfile))
+        with open(self.outfile, 'w') as f:
+            f.write(str(time.time()))
+        # The contents depend on what this instance did
+        self.contents = {'writerFile': {
+            'title': 'Writer File',
+            'formats': [{'filename': os.path.basename(self.outfile),
+                         'type': 'text/plain'}]}}
+
+
+class FailModule(CoreModule):
+    """
+    fail -- Raise an exception.
+    """
+    command_name = 'fail'
+
+    def execute(self):
+        self.logger.info('about to fail')
+        raise ValueError('This module always fails')
+'''
+
+
+def get_dummy_logger():
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    log_capture_string = io.StringIO()
+    handler = logging.StreamHandler(log_capture_string)
+    handler.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger, handler, log_capture_string
+
+
+def test_run_commands():
+    logger, handler, log = get_dummy_logger()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'runner_test_mods.py'), 'w') as f:
+            f.write(MODULES)
+        sys.path.insert(0, tmpdir)
+        try:
+            import runner_test_mods as mods
+
+            # Two "writer" commands that can run at once
+            files = {name: os.path.join(tmpdir, name + '.txt')
+                     for name in ['w1', 'w2']}
+            cmd_list = OrderedDict()
+            cmd_args = {}
+            for name in ['w1', 'w2']:
+                cmd_list[name] = mods.WriterModule('dummy_event')
+                cmd_args[name] = ['-o', files[name]]
+                cmd_list[name].parseArgs(cmd_args[name])
+            finished = []
+            graph = {'w1': set(), 'w2': set()}
+
+            def finish(cmd):
+                # The parent's instance has the contents of the instance
+                # that ran the command
+                formats = cmd_list[cmd].contents['writerFile']['formats']
+                assert formats[0]['filename'] == cmd + '.txt'
+                finished.append(cmd)
+
+            result = run_commands(cmd_list, cmd_args, graph, 'dummy_event',
+                                  lambda cmd: 'run', finish, logger, 2)
+            assert result is None
+            assert sorted(finished) == ['w1', 'w2']
+            assert os.path.isfile(files['w1'])
+            assert os.path.isfile(files['w2'])
+            # The log messages from the modules come back to the parent
+            assert 'writing w1.txt' in log.getvalue()
+            assert 'writing w2.txt' in log.getvalue()
+
+            # A command that depends on a failed command doesn't run
+            os.remove(files['w2'])
+            cmd_list = OrderedDict()
+            cmd_list['fail'] = mods.FailModule('dummy_event')
+            cmd_list['w2'] = mods.WriterModule('dummy_event')
+            cmd_args = {'fail': [], 'w2': ['-o', files['w2']]}
+            graph = {'fail': set(), 'w2': {'fail'}}
+            finished = []
+            result = run_commands(cmd_list, cmd_args, graph, 'dummy_event',
+                                  lambda cmd: 'run', finished.append,
+                                  logger, 2)
+            assert 'This module always fails' in result
+            assert 'about to fail' in log.getvalue()
+            assert finished == []
+            assert not os.path.isfile(files['w2'])
+
+            # Skipped commands don't run, but their dependents do; a
+            # 'stop' stops everything
+            checks = {'w1': 'skip', 'w2': 'run'}
+            cmd_list = OrderedDict()
+            cmd_args = {}
+            for name in ['w1', 'w2']:
+                if os.path.isfile(files[name]):
+                    os.remove(files[name])
+                cmd_list[name] = mods.WriterModule('dummy_event')
+                cmd_args[name] = ['-o', files[name]]
+            graph = {'w1': set(), 'w2': {'w1'}}
+            finished = []
+            result = run_commands(cmd_list, cmd_args, graph, 'dummy_event',
+                                  checks.get, finished.append, logger, 2)
+            assert result is None
+            assert finished == ['w2']
+            assert not os.path.isfile(files['w1'])
+            checks = {'w1': 'stop', 'w2': 'run'}
+            finished = []
+            result = run_commands(cmd_list, cmd_args, graph, 'dummy_event',
+                                  checks.get, finished.append, logger, 2)
+            assert result == 'stop'
+            assert finished == []
+        finally:
+            sys.path.remove(tmpdir)
+            sys.modules.pop('runner_test_mods', None)
+            logger.removeHandler(handler)
+
+
+if __name__ == '__main__':
+    test_run_commands()
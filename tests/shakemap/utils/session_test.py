@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+from mapio.geodict import GeoDict
+from mapio.grid2d import Grid2D
+
+from shakelib.utils.containers import ShakeMapOutputContainer
+from shakemap.utils.session import (ContainerSession,
+                                    CachedOutputContainer,
+                                    open_output_container)
+
+
+def _write_container(datafile, value):
+    geodict = GeoDict({'xmin': 0.0, 'xmax': 9.0, 'ymin': 0.0, 'ymax': 9.0,
+                       'dx': 1.0, 'dy': 1.0, 'nx': 10, 'ny': 10})
+    container = ShakeMapOutputContainer.create(datafile)
+    for imt in ['PGA', 'MMI']:
+        mean = Grid2D(np.full((10, 10), value), geodict)
+        std = Grid2D(np.full((10, 10), value / 10), geodict.copy())
+        container.setIMTGrids(imt, mean, {'units': 'ln(g)'}, std,
+                              {'units': 'ln(g)'}, 'Larger')
+    container.close()
+
+
+def test_session():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datafile = os.path.join(tmpdir, 'shake_result.hdf')
+        _write_container(datafile, 1.0)
+
+        # Without a session, the container is simply loaded
+        container = open_output_container(datafile)
+        assert isinstance(container, ShakeMapOutputContainer)
+        container.close()
+
+        with ContainerSession() as session:
+            c1 = open_output_container(datafile)
+            assert isinstance(c1, CachedOutputContainer)
+            grids = c1.getIMTGrids('PGA', 'Larger')
+            assert c1.misses == 1 and c1.hits == 0
+            # Callers get a copy they can change
+            grids['mean'].getData()[:] = 99.0
+            c1.close()
+
+            c2 = open_output_container(datafile)
+            assert c2 is c1
+            grids = c2.getIMTGrids('PGA', 'Larger')
+            assert c2.hits == 1
+            assert np.all(grids['mean'].getData() == 1.0)
+            assert sorted(c2.getIMTs('Larger')) == ['MMI', 'PGA']
+
+            # The file is replaced, so it is reopened
+            newfile = os.path.join(tmpdir, 'new_result.hdf')
+            _write_container(newfile, 2.0)
+            os.replace(newfile, datafile)
+            c3 = open_output_container(datafile)
+            assert c3 is not c1
+            grids = c3.getIMTGrids('PGA', 'Larger')
+            assert np.all(grids['mean'].getData() == 2.0)
+
+            session.discard(datafile)
+            assert session.paths() == []
+
+        # Each pair of grids is 1600 bytes; a limit of 2000 bytes holds
+        # only one of them
+        with ContainerSession(max_mb=2000 / 1048576) as session:
+            c1 = open_output_container(datafile)
+            c1.getIMTGrids('PGA', 'Larger')
+            c1.getIMTGrids('MMI', 'Larger')
+            c1.getIMTGrids('MMI', 'Larger')
+            assert c1.hits == 1
+            c1.getIMTGrids('PGA', 'Larger')
+            assert c1.misses == 3
+        container = open_output_container(datafile)
+        assert isinstance(container, ShakeMapOutputContainer)
+        container.close()
+
+
+if __name__ == '__main__':
+    test_session()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import io
+import os.path
+import logging
+import tempfile
+import time
+
+from shakemap.utils.workers import WorkerPool
+import shakemap.utils.queue as queue
+
+FAKE_SHAKE = '''
+import sys
+import time
+import argparse
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('eventid')
+    parser.add_argument('outfile')
+    return parser
+
+def main(pargs):
+    if pargs.eventid == 'exit':
+        sys.exit(3)
+    if pargs.eventid == 'sleep':
+        time.sleep(60)
+    if pargs.eventid == 'error':
+        raise ValueError('bad event')
+    with open(pargs.outfile, 'a') as f:
+        f.write(pargs.eventid + '\\n')
+'''
+
+
+def get_dummy_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    log_capture_string = io.StringIO()
+    handler = logging.StreamHandler(log_capture_string)
+    handler.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger, log_capture_string
+
+
+def wait_for(job, timeout=30):
+    end = time.time() + timeout
+    while job.poll() is None and time.time() < end:
+        time.sleep(0.1)
+    return job.returncode
+
+
+def test_worker_pool():
+    logger, log = get_dummy_logger('test_worker_pool')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shake_path = os.path.join(tmpdir, 'shake')
+        with open(shake_path, 'w') as f:
+            f.write(FAKE_SHAKE)
+        outfile = os.path.join(tmpdir, 'out.txt')
+        config = {'shake_path': shake_path,
+                  'workers': 1,
+                  'worker_max_jobs': 3,
+                  'worker_max_memory': 0}
+        pool = WorkerPool(config, logger)
+        try:
+            assert len(pool) == 1
+            job = pool.submit(['event1', outfile])
+            assert job is not None
+            # The only worker is busy
+            assert pool.submit(['event2', outfile]) is None
+            assert wait_for(job) == 0
+            with open(outfile) as f:
+                assert f.read() == 'event1\n'
+            # sys.exit() and exceptions set the return code, and the
+            # worker carries on
+            job = pool.submit(['exit', outfile])
+            assert wait_for(job) == 3
+            job = pool.submit(['error', outfile])
+            assert wait_for(job) == 1
+            # The worker has run worker_max_jobs jobs, so it is replaced
+            job = pool.submit(['event2', outfile])
+            assert wait_for(job) == 0
+            assert 'ran 3 jobs' in log.getvalue()
+            with open(outfile) as f:
+                assert f.read() == 'event1\nevent2\n'
+            # Killing a job kills its worker, which is then replaced
+            job = pool.submit(['sleep', outfile])
+            job.kill()
+            assert job.poll() is not None and job.returncode != 0
+            assert pool.submit(['event3', outfile]) is not None
+            assert 'worker died' in log.getvalue()
+        finally:
+            pool.shutdown()
+        assert len(pool) == 0
+
+
+def test_dispatch_to_pool():
+    logger, log = get_dummy_logger('test_dispatch_to_pool')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shake_path = os.path.join(tmpdir, 'shake')
+        with open(shake_path, 'w') as f:
+            f.write(FAKE_SHAKE)
+        outfile = os.path.join(tmpdir, 'out.txt')
+        config = {'shake_path': shake_path,
+                  'shake_command': 'shake <EVID> ' + outfile,
+                  'cancel_command': 'shake <EVID> ' + outfile,
+                  'max_process_time': 600,
+                  'max_subprocesses': 0,
+                  'workers': 1,
+                  'worker_max_jobs': 50,
+                  'worker_max_memory': 0}
+        pool = WorkerPool(config, logger)
+        children = {}
+        try:
+            scheduler = queue.EventScheduler(children, config, logger,
+                                             pool=pool)
+            scheduler.submit('event1', 'origin', 5.0)
+            assert 'Sending job to shake worker' in log.getvalue()
+            end = time.time() + 30
+            while children and time.time() < end:
+                scheduler.reap()
+                time.sleep(0.1)
+            assert len(children) == 0
+            with open(outfile) as f:
+                assert f.read() == 'event1\n'
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    test_worker_pool()
+    test_dispatch_to_pool()